@@ -20,6 +20,11 @@ observe_df = pd.read_excel(observe_file)
 # ========== 加载基线模拟结果 ==========
 baseline_data = {}
 for var in all_variables:
+    # 优先使用模拟中在线聚合的周均值（main_20.py --aggregate-hours 168），否则由逐时序列分周求均值
+    weekly_path = os.path.join(baseline_dir, f"{var.upper()}_simulated_{hours_per_week}h_mean.npy")
+    if os.path.exists(weekly_path):
+        baseline_data[var] = np.load(weekly_path)
+        continue
     path = os.path.join(baseline_dir, f"{var.upper()}_simulated_test.npy")
     if not os.path.exists(path):
         print(f"[WARNING] 缺失基线文件：{path}")
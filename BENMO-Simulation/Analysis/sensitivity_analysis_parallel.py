@@ -6,6 +6,7 @@ import shutil
 import subprocess
 from multiprocessing import Pool
 from figure_plot import plot_with_fuzzy_matching
+from BENMO_20 import STATE_VARIABLES
 
 # === Configurations ===
 VARIABLES = ["NH4", "NO3", "ON", "PO4", "OP", "PP"]
@@ -13,6 +14,15 @@ PARAMETER_FILE = "parameters.json"
 BASELINE_DIR = "baseline_results"
 OUTPUT_DIR = "sensitivity_results_20"
 MAX_PROCESSES = 8  # Safe default
+CACHE_DIR = os.path.abspath("cache")  # Transport cache shared by all runs (hydrodynamics are identical)
+# Members warm-start from the baseline state cached under CACHE_DIR/spinup and run under their own parameters
+# from BENMO_20.REEQUILIBRATION_DAYS before this day, or from the last restocking when they change a DEB parameter.
+# Day 480 is 120 days after the fish restocking at day 360, so every member starts at day 360 or later. Warm starts
+# are used only after the SPINUP_PROBE member passes the convergence check (python main_20.py --spinup-check);
+# otherwise every member runs cold. 0 always runs cold
+SPINUP_DAYS = 480
+SPINUP_CHECK_DAYS = 30  # Days after SPINUP_DAYS over which the probe's convergence is checked
+SPINUP_PROBE = ("F_UP_N", 0.1)  # Parameter and relative change of the probe member (slowest to converge)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # === Load baseline simulation outputs ===
@@ -23,15 +33,16 @@ def load_baseline_outputs():
         baseline[var] = np.load(path)
     return baseline
 
-# === Compute absolute average error (used as R² delta proxy) ===
+# === Compute absolute average error (used as R² delta proxy) over the period after the spin-up ===
 def compute_difference(baseline, current):
+    start = SPINUP_DAYS * 24
     diff = {}
     for var in VARIABLES:
-        diff[var] = np.mean(np.abs(current[var] - baseline[var]))
+        diff[var] = np.mean(np.abs(current[var][start:] - baseline[var][start:]))
     return diff
 
-# === Run main_24.py in a temporary isolated directory ===
-def run_simulation(param, new_value, tag):
+# === Prepare an isolated run directory with the model and one perturbed parameter ===
+def prepare_run(param, new_value, tag):
     work_dir = os.path.join(OUTPUT_DIR, f"run_{tag}")
     os.makedirs(work_dir, exist_ok=True)
 
@@ -45,7 +56,7 @@ def run_simulation(param, new_value, tag):
     with open(PARAMETER_FILE, 'r') as f:
         parameters = json.load(f)
     if isinstance(parameters.get(param), list):
-        parameters[param] = [new_value] * 24
+        parameters[param] = [new_value] * len(parameters[param])  # one value per zone, as in the file
     else:
         parameters[param] = new_value
     with open(os.path.join(work_dir, "parameters.json"), 'w') as f:
@@ -53,20 +64,55 @@ def run_simulation(param, new_value, tag):
 
     # Create baseline_results/ inside work dir to match main_24.py save location
     os.makedirs(os.path.join(work_dir, "baseline_results"), exist_ok=True)
-
-    # Run simulation
-    result = subprocess.run(["python", "main_20.py"], cwd=work_dir,
+    return work_dir
+
+def spinup_arguments():
+    return ["--spinup-days", str(SPINUP_DAYS), "--spinup-params", os.path.abspath(PARAMETER_FILE)]
+
+def member_tag(param, delta):
+    return f"{param}_{'plus' if delta > 0 else 'minus'}"
+
+# === Check once that a perturbed warm start has converged; the probe's warm run is its member result ===
+def spinup_converged(params):
+    param, delta = SPINUP_PROBE
+    value = params[param]
+    base_value = value[0] if isinstance(value, list) else value
+    tag = member_tag(param, delta)
+    work_dir = prepare_run(param, base_value * (1 + delta), tag)
+    command = ["python", "main_20.py", "--no-gui", "--cache-dir", CACHE_DIR, "--checkpoint", "",
+               *spinup_arguments(), "--spinup-check", str(SPINUP_CHECK_DAYS)]
+    result = subprocess.run(command, cwd=work_dir,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            encoding="utf-8", errors="replace")
+    if result.returncode not in (0, 1):
+        print("STDERR:", result.stderr)
+        raise RuntimeError("预热收敛检验运行失败")
+    print("[INFO]", result.stdout.strip().splitlines()[-1])
+    return result.returncode == 0
+
+# === Run main_20.py in a temporary isolated directory ===
+def run_simulation(param, new_value, tag, use_spinup):
+    work_dir = prepare_run(param, new_value, tag)
+
+    # Run simulation (initial values are replaced by the spin-up state, so their perturbations run cold)
+    command = ["python", "main_20.py", "--no-gui", "--cache-dir", CACHE_DIR, "--checkpoint", ""]
+    if use_spinup and param not in STATE_VARIABLES:
+        command += spinup_arguments()
+    result = subprocess.run(command, cwd=work_dir,
                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                             encoding="utf-8", errors="replace")
+    return collect_outputs(work_dir, tag, result)
 
-    # Collect outputs
+# === Copy a run's outputs to OUTPUT_DIR ===
+def collect_outputs(work_dir, tag, result=None):
     sim_data = {}
     for var in VARIABLES:
         src = os.path.join(work_dir, "baseline_results", f"{var.upper()}_simulated_test.npy")
         if not os.path.exists(src):
             print(f"[ERROR] Missing output: {src}")
-            print("STDOUT:", result.stdout)
-            print("STDERR:", result.stderr)
+            if result is not None:
+                print("STDOUT:", result.stdout)
+                print("STDERR:", result.stderr)
             raise RuntimeError(f"模拟失败，输出文件缺失：{src}")
         dest = os.path.join(OUTPUT_DIR, f"{var.upper()}_{tag}.npy")
         shutil.copy(src, dest)
@@ -76,11 +122,14 @@ def run_simulation(param, new_value, tag):
 
 # === Task executed in parallel ===
 def sensitivity_task(args):
-    param, delta, base_value, baseline_outputs = args
-    tag = f"{param}_{'plus' if delta > 0 else 'minus'}"
+    param, delta, base_value, baseline_outputs, use_spinup = args
+    tag = member_tag(param, delta)
     new_value = base_value * (1 + delta)
-    print(f"[INFO] Running: {tag} = {new_value}")
-    result_data = run_simulation(param, new_value, tag)
+    if use_spinup and (param, delta) == SPINUP_PROBE:
+        result_data = collect_outputs(os.path.join(OUTPUT_DIR, f"run_{tag}"), tag)  # 收敛检验已运行该成员
+    else:
+        print(f"[INFO] Running: {tag} = {new_value}")
+        result_data = run_simulation(param, new_value, tag, use_spinup)
     plot_with_fuzzy_matching(result_data, "database/observe_data_20.xlsx", show_plot=False, save_plot=False)
     error_diff = compute_difference(baseline_outputs, result_data)
     return {"param": param, "change": delta, **error_diff}
@@ -91,12 +140,15 @@ def run_sensitivity_analysis():
         params = json.load(f)
 
     baseline_outputs = load_baseline_outputs()
+    use_spinup = bool(SPINUP_DAYS) and spinup_converged(params)
+    if SPINUP_DAYS and not use_spinup:
+        print("[WARN] 热启动未通过收敛检验，全部成员冷启动")
     tasks = []
 
     for param, value in params.items():
         base_val = value[0] if isinstance(value, list) else value
         for delta in [+0.1, -0.1]:
-            tasks.append((param, delta, base_val, baseline_outputs))
+            tasks.append((param, delta, base_val, baseline_outputs, use_spinup))
 
     with Pool(processes=min(MAX_PROCESSES, len(tasks))) as pool:
         results = pool.map(sensitivity_task, tasks)
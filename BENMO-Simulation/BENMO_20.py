@@ -8,6 +8,14 @@
 @time: 2025/6/9 下午6:41
 """
 
+import copy
+import functools
+import json
+import os
+import hashlib
+import tempfile
+import shutil
+import warnings
 import tkinter as tk
 from tkinter import ttk
 import numpy as np
@@ -16,6 +24,357 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from collections import defaultdict
 
+# Default parameter table shared by ParameterStore and the ParameterLoader editor.
+# Each tab lists (name, value, unit, description); series values are comma separated
+# strings with one entry per zone. A name defined in several tabs takes the last value.
+PARAMETER_TABS = [
+    # Initial Conditions tab with series input
+    ('Initial Conditions', [
+        ('PHY', '0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435', 'mgC/L', 'Initial phytoplankton biomass series'),
+        ('ZOO', '0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05', 'mgC/L', 'Initial zooplankton biomass series'),
+        ('NH4', '0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.005', 'mgN/L', 'Initial ammonium concentration series'),
+        ('NO3', '0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4', 'mgN/L', 'Initial nitrate concentration series'),
+        ('ON', '0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1', 'mgN/L', 'Initial organic nitrogen concentration series'),
+        ('PO4', '0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08', 'mgP/L', 'Initial phosphate concentration series'),
+        ('OP', '0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02', 'mgP/L', 'Initial organic phosphorus concentration series'),
+        ('PP', '0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05', 'mgP/L', 'Initial particulate phosphorus concentration series'),
+        ('C_SPM', '0.2, 0.05, 0.05, 0.1, 0.1, 0.1, 0.2, 0.1, 0.2, 0.2, 0.2, 0.1, 0.05, 0.05, 0.2, 0.2, 0.2, 0.2, 0.1, 0.2', 'kg/m³', 'Initial concentration of SPM in the water column'),
+        ('CBOD', '1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0', 'mgO2/L', 'Initial BCOD concentration series'),
+        ('DO', '6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29', 'mgO2/L', 'Initial dissolved oxygen concentration series'),
+        ('I', '705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539', 'lx/day', 'Initial surface light intensity series'),
+        ('H', '6.861743794,40.02595618,35.80033097,4.185279406,16.87358291,9.645099978,2.594711363,10.60004844,4.20606114,6.54189523,7.264580586,17.0592759,38.15586537,22.23773208,4.628117896,2.22255415,7.402312545,5.80439337,16.9039485,2.713267632', 'm', 'Initial water depth series'),
+        ('T', '20.04909, 22.73150, 22.99365, 23.83580, 23.85205, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365', '°C', 'Initial temperature series'),
+        ('MA', '0,0,20,20,20,20,20,20,20,20,20,20,20,20,20,20,20,0,20,20', 'gD/m²', 'Initial macroalgal biomass series'),
+        # ('MA', '0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0', 'gD/m²', 'Initial macroalgal biomass series'),
+        ('qN', '50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50', 'mgN/gD', 'Macroalgal cell quotas of nitrogen'),
+        ('qP', '5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5', 'mgP/gD', 'Macroalgal cell quotas of phosphorus'),
+        ('N_SH', '3785804.438, 0, 0, 126336979.3, 4183871.842, 0, 227012456.3, 55525559.94, 0, 377535149.1, 330634099.3, 0, 0, 3679995.239, 1215077545, 61342563.2, 2427940.471, 236319257.8, 18026278.35, 0', '-', 'Initial number of shellfish (individuals) series'),
+        ('V_SH', '0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6', 'cm³', 'Initial volume of shellfish series'),
+        ('E_SH', '40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40', 'J', 'Initial storage energy series'),
+        ('E_R_SH', '10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10', 'J', 'Initial reproductive energy storage'),
+        ('N_F', '0, 0, 36308132.92, 11246959.3, 79615100.35, 13866717.11, 1982687.219, 12612384.08, 8110870.655, 667060.6129, 119289.1572, 51539474.79, 73837822.43, 11257092.76, 9406260.351, 0, 11079676.28, 15923493.26, 19494348.39, 4090630.33', '-', 'Initial number of fishes (individuals) series'),
+        ('V_F', '5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0', 'cm³', 'Initial volume of fishes series'),
+        ('E_F', '42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000', 'J', 'Initial storage energy series'),
+        ('E_R_F', '6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000', 'J', 'Initial reproductive energy storage')
+    ]),
+    # Parameters for general biology
+    ('General Biology', [
+        ('A', '21254365.49, 40880593, 43273840.78, 45116392.4, 37734875.14, 34829187.59, 28953727.35, 37689715.86, 44219607.5, 32679776.13, 35679879.05, 43391698.09, 52025867.64, 37394565.25, 34486370.52, 30497248.42, 31422979.23, 25456718.08, 29143514.83, 47734812.71', 'm²', 'Initial area series'),
+        ('V', '145842010.5, 1636284824, 1549217822, 188824708, 636722544.2, 335930996.5, 75126565.36, 399512813.7, 185990372.7, 213787671.6, 259199356.6, 740230949.5, 1985092002, 831570323.3, 159606988.6, 67781786.04, 232602713.4, 147760805.7, 492640473.9, 129517322.2', 'm³', 'Initial volume series'),
+        ('A_max', '0, 0, 8233002.116, 2196936.866, 8642354.683, 7761237.243, 2156180.323, 4560401.726, 2898244.292, 12249866.43, 18319823.9, 2806045.515, 1921581.758, 6528759.683, 0, 67819.07301, 4290008.942, 0, 10337714.55, 4622971.222', 'm²', 'Maximum macroalgae carrying capacity series'),
+        ('S', '34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34', 'g/kg', 'Initial salinity series'),
+        ('K_T', 1.068, '-', 'Temperature constant'),
+        ('T_opt', 20, '°C', 'Optimal temperature value'),
+        ('I_s', 1200000, 'lx/d', 'Optical saturation constant of light intensity'),
+        ('K_E', 0.1, '1/m', 'Light extinction coefficient'),
+        ('FEED_NH3', 1.52, 'mgN/g', 'Ammonium added to the food web'),
+        ('FEED_NO3', 4.17, 'mgN/g', 'Nitrate added to the food web'),
+        ('FEED_ON', 45.8, 'mgN/g', 'Organic nitrogen added to the food web'),
+        ('FEED_PO4', 1.5, 'mgP/g', 'Phosphate added to the food web'),
+        ('FEED_OP', 1.49, 'mgP/g', 'Organic phosphorus added to the food web'),
+        ('FEED_PP', 4.5, 'mgP/g', 'Particulte phosphorus added to the food web'),
+        ('FEED_CBOD', 2.2, 'mgO2/g', 'BCOD added to the food web'),
+        ('W', '4.87, 5.02, 5.12, 4.89, 4.95, 4.87, 5.02, 5.12, 4.65, 5.34, 4.88, 5.21, 4.93, 5.47, 4.56, 5.05, 5.20, 4.79, 5.38, 4.62, 5.15, 4.98, 5.01', 'm/s', 'Wind speed series'),
+        ('v', '0.0395, 0.0425, 0.0385, 0.0365, 0.0395, 0.0365, 0.0395, 0.0425, 0.0385, 0.0365, 0.0395, 0.0405, 0.0435, 0.0375, 0.0395, 0.0385, 0.0405, 0.0415, 0.0435', 'm/s', 'Velocity series')
+    ]),
+    # Parameters for phytoplankton
+    ('Phytoplankton', [
+        ('KC_PHY', 2.88/24, '1/d', 'Phytoplankton growth rate constant'),
+        ('KN_PHY', 0.02, 'mgN/L', 'Nitrogen half saturation constant for phytoplankton growth'), # 0.05
+        ('KP_PHY', 0.08, 'mgP/L', 'Phosphorus half saturation constant for phytoplankton growth'), # 0.15
+        ('F_PO4', 0.9, '-', 'Fraction of dissolved inorganic phosphorus'),
+        ('kappa_1_PHY', 0.05, '-', 'Temperature sensitivity coefficient below the optimum temperature'),
+        ('kappa_2_PHY', 0.05, '-', 'Temperature sensitivity coefficient above the optimum temperature'),
+        ('KD_PHY', 0.12/24, '1/d', 'Phytoplankton death rate constant'),
+        ('M_max_PHY', 1.0, '-', 'Maximum death rate of phytoplankton'),
+        ('K_PHY', 0.8, 'mgC/L', 'Environmental load of phytoplankton'),
+        ('KR_PHY', 0.096/24, '1/d', 'Phytoplankton respiration rate constant')
+    ]),
+    # Parameters for zooplankton
+    ('Zooplankton', [
+        ('EFF', 0.5, '-', 'Grazing efficiency'),
+        ('K_GRZ', 1.5/24, '1/d', 'Grazing rate constant'),
+        ('K_PZ', 0.5, 'mgC/L', 'Half saturation constant for phytoplankton in grazing'),
+        ('K_DZ', 0.01/24, '1/d', 'Zooplankton death rate')
+    ]),
+    # Parameters for macroalgal
+    ('Macroalgal', [
+        ('KC_MA', 0.7/24, '1/d', 'Macroalgal growth rate constant'),
+        ('kappa_1_MA_T', 0.05, '-', 'Temperature sensitivity coefficient below the optimum temperature'),
+        ('kappa_2_MA_T', 0.05, '-', 'Temperature sensitivity coefficient above the optimum temperature'),
+        ('kappa_1_MA_S', 0.05, '-', 'Salinity sensitivity coefficient below the optimum salinity'),
+        ('kappa_2_MA_S', 0.05, '-', 'Salinity sensitivity coefficient above the optimum salinity'),
+        ('S_opt', 35, 'g/kg', 'Optimal salinity value'),
+        ('q_0N', 7.2, 'mgN/gD', 'Minimum cell quotas of nitrogen'),
+        ('q_0P', 1.0, 'mgP/gD', 'Minimum cell quotas of phosphorus'),
+        ('KN_MA', 0.025, 'mgN/L', 'Nitrogen half saturation constant for macroalgal growth'),
+        ('K_qN', 9.0, 'mgN/gD', 'half-saturation constants for intracellular nitrogen'),
+        ('KP', 0.01, 'mgP/L', 'Phosphorus half saturation constant for macroalgal growth'),
+        ('KE_MA', 0.09, '-', 'Algae cell excretion rate constant'),
+        ('KP_MA', 0.1, 'mgP/L', 'Phosphorus half saturation constant for macroalgal growth'),
+        ('K_qP', 1.3, 'mgP/gD', 'half-saturation constants for intracellular phosphorus'),
+        ('KD_MA', 0.01/24, '1/d', 'Macroalgal death rate constant'),
+        ('KR_MA', 0.21/24, '1/d', 'Macroalgal respiration rate constant'),
+        ('MA_max', 1500, 'gD/m²', 'Maximum macroalgal biomass'),
+        ('z', 5.0, 'm', 'Maximum depth of macroalgal growth'),
+        ('F_UP_N', 720/24, 'mgN/gD/d', 'Maximum uptake rate of nitrogen by macroalgal'),
+        ('F_UP_P', 50/24, 'mgP/gD/d', 'Maximum uptake rate of phosphorus by macroalgal'),
+    ]),
+    # Parameters for shellfish
+    ('Shellfish', [
+        ('DSH', 0.001/24, '1/d', 'Shellfish death rate constant'),
+        ('kappa_SH', 0.7, '-', 'Fraction of catabolic flux to growth and maintenance'),
+        ('[E_G_SH]', 2500, 'J/cm³', 'Volume-specific costs for structure'),
+        ('{p_A_SH}', 440/24, 'J/cm²/d', 'Maximum surface area-specific assimilation rate'),
+        ('T_0_SH', 288, 'K', 'Reference temperature'),
+        ('T_A_SH', 5530, 'K', 'Arrhenius temperature'),
+        ('T_AL_SH', 21000, 'K', 'Arrhenius temperature for the rate of decrease at lower boundary'),
+        ('T_AH_SH', 42000, 'K', 'Arrhenius temperature for the rate of increase at upper boundary'),
+        ('T_L_SH', 283, 'K', 'Lower boundary temperature of the tolerance range'),
+        ('T_H_SH', 296, 'K', 'Upper boundary temperature of the tolerance range'),
+        ('H_SH', 0.295, 'mgC/L', 'Half-saturation uptake of phytoplankton'),
+        ('[E_m_SH]', 2600, 'J/cm³', 'Maximum reserve density'),
+        ('V_p_SH', 0.36, 'cm³', 'Structural body volume at puberty'),
+        ('[p_M_SH]', 12.2/24, 'J/cm³/d', 'Volume-specific maintenance rate')
+    ]),
+    # Parameters for fish
+    ('Fish', [
+        ('DF', 0.001/24, '1/d', 'Fish death rate constant'),
+        ('kappa_F', 0.85, '-', 'Fraction of catabolic flux to growth and maintenance'),
+        ('[E_G_F]', 6200, 'J/cm³', 'Volume-specific costs for structure'),
+        ('{p_A_F}', 2250/24, 'J/cm²/d', 'Maximum surface area-specific assimilation rate'),
+        ('T_0_F', 283, 'K', 'Reference temperature'),
+        ('T_A_F', 6400, 'K', 'Arrhenius temperature'),
+        ('T_AL_F', 3200, 'K', 'Arrhenius temperature for the rate of decrease at lower boundary'),
+        ('T_AH_F', 32000, 'K', 'Arrhenius temperature for the rate of increase at upper boundary'),
+        ('T_L_F', 283, 'K', 'Lower boundary temperature of the tolerance range'),
+        ('T_H_F', 296, 'K', 'Upper boundary temperature of the tolerance range'),
+        ('H_F', 5, 'g', 'Half-saturation uptake'),
+        ('[E_m_F]', 11600, 'J/cm³', 'Maximum reserve density'),
+        ('V_p_F', 9, 'cm³', 'Structural body volume at puberty'),
+        ('[p_M_F]', 75.3/24, 'J/cm³/d', 'Volume-specific maintenance rate'),
+        ('FEED', '0, 0, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0, 0.15, 0.15, 0.15, 0.15', 'g/m²/d', 'Fish feeding constant'), # 存疑
+        ('M_F', 500, 'g', 'Fish mass when harvested'),
+        ('FCR_F', 3.5, '-', 'Feed conversion ratio of fishes')
+    ]),
+    # Parameters for nitrogen
+    ('Nitrogen', [
+        # Ammonium nitrogen
+        ('NC_PHY', 0.065, 'mgN/mgC', 'N/C ratio of phytoplankton'),
+        ('FON_PHY', 0.5, '-', 'Fraction of ON from phytoplankton death'),
+        ('KN_PHY', 0.05, 'mgN/L', 'Nitrogen half saturation constant for phytoplankton growth'),
+        ('NC_MA', 0.1, 'mgN/mgC', 'N/C ratio of macroalgal'),
+        ('DC_MA', 3.0, 'mgD/mgC', 'D/C ratio of macroalgal'),
+        ('KN_MA', 0.025, 'mgN/L', 'Nitrogen half saturation constant for macroalgal growth'),
+        ('kappa_R_SH', 0.8, '-', 'Fraction of reproductive reserves fixed in eggs for shellfish'),
+        ('mu_V_SH', 2700, 'J/gW', 'Structure energy content of shellfish'),
+        ('NC_SH', 0.183, 'mgN/mgC', 'N/C ratio of shellfish'),
+        ('mu_CJ', 48.8, 'J/mgC', 'Ratio of carbon to energy content'),
+        ('kappa_R_F', 0.8, '-', 'Fraction of reproductive reserves fixed in eggs for fishes'),
+        ('mu_V_F', 4400, 'J/gW', 'Structure energy content of fishes'),
+        ('NC_F', 0.18, 'mgN/mgC', 'N/C ratio of fishes'),
+        ('NC_FEED', 0.18, 'mgN/mgC', 'N/C ratio of fish feed'),
+        ('KC_nit', 0.05/24, '1/d', 'Nitrification rate constant'),
+        ('K_nit', 2.0, 'mgO2/L', 'Half-saturation constant for nitrification'),
+        ('KNC_min', 0.075/24, '1/d', 'Mineralisation of dissolved ON rate constant'),
+        # Nitrate nitrogen
+        ('KC_den', 0.09/24, '1/d', 'Denitrification rate constant'),
+        ('K_den', 0.1, 'mgO2/L', 'Half-saturation constant for denitrification'),
+        # Organic nitrogen
+        ('mu_ON_sink', 0.041, '-', 'Fraction of organic nitrogen sinking'),
+        ('U_SH', 0.045/24, 'm³/cm²/d', 'Shellfish maximum surface area-specific clearance'),
+        ('U_F', 380/24, 'mgC/cm²/d', 'Fish maximum surface area-specific clearance')
+    ]),
+    # Parameters for phosphorus
+    ('Phosphorus', [
+        # Inorganic phosphorus
+        ('PC_PHY', 0.025, 'mgP/mgC', 'P/C ratio of phytoplankton'),
+        ('FOP_PHY', 0.5, '-', 'Fraction of OP from phytoplankton death'),
+        ('PC_MA', 0.01, 'mgP/mgC', 'P/C ratio of macroalgal'),
+        ('KPC_min', 0.02/24, '1/d', 'Mineralisation of dissolved OP rate constant'),
+        # Organic phosphorus
+        ('mu_OP_sink', 0.05, '-', 'Fraction of organic phosphorus sinking'),
+        ('PC_SH', 0.0025, 'mgP/mgC', 'P/C ratio of shellfish'),
+        ('PC_F', 0.005, 'mgP/mgC', 'P/C ratio of fishes'),
+        # Particle phosphorus
+        ('f_fec', 0.4, '-', 'Fraction of fecal matter that is phosphorus'),
+        ('f_PP', 0.6, '-', 'Fraction of PP in fecal matter'),
+        ('K_ads', 0.002/24, 'mgP/d', 'Adsorption rate constant for PP'),
+        ('K_des', 0.15/24, 'mgP/L/d', 'Desorption rate constant for PP'),
+        ('V_set', 0.05/24, 'mgP/m/d', 'Settling rate constant for PP'),
+        ('K_resus', 0.3/24, 'mgP/L/d', 'Resuspension rate constant for PP'),
+        ('Q_max', 400, 'mgP/kg', 'Langmuir medium maximum capacity for PP')
+    ]),
+    # Parameters for CBOD
+    ('CBOD', [
+        ('OC', 1.42, 'mgO2/mgC', 'O2/C ratio'),
+        ('KDC', 0.18, '1/d', 'Oxidation of CBOD rate constant'),
+        ('K_BOD', 0.5, 'mgO2/L', 'CBOD half saturation constant for oxidation')
+    ]),
+    # Parameters for dissolved oxygen
+    ('Dissolved Oxygen', [
+        ('a', 3.863, '-', 'Parameter in APHA'),
+        ('b', 0.5, '-', 'Parameter in APHA'),
+        ('c', 0.5, '-', 'Parameter in APHA'),
+        ('d', 0.4, '-', 'Parameter in APHA'),
+        ('ROC_MA', 2.69, 'mgO2/mgC', 'Ratio of macroalgal use O2 to produce carbon'),
+        ('SOD', 2.0, 'mgO2/L/d·m', 'Sediment oxygen demand rate constant')
+    ])
+]
+
+SEA_AREAS = ['Area1', 'Area2', 'Area3', 'Area4', 'Area5', 'Area6', 'Area7', 'Area8', 'Area9', 'Area10',
+             'Area11', 'Area12', 'Area13', 'Area14', 'Area15', 'Area16', 'Area17', 'Area18', 'Area19',
+             'Area20']
+
+# Columns of the hourly water exchange file, in the order used by WaterExchange.load_exchange_data
+EXCHANGE_COLUMNS = [
+    '4_to_18', '6_to_10', '10_to_18', '9_to_18', '1_to_12', '9_to_10', '10_to_15', '2_to_12',
+    '6_to_15', '2_to_4', '4_to_9', '9_to_15', '2_to_16', '2_to_13', '13_to_16', '11_to_12',
+    '11_to_13', '7_to_13', '5_to_13', '5_to_7', '3_to_7', '11_to_19', '8_to_19', '5_to_8',
+    '7_to_17', '8_to_14', '0_to_17', '4_to_16', '5_to_14', '1_to_sea', '7_to_16'
+]
+
+# EXCHANGE_COLUMNS index feeding each of the first 31 edges; Edge k + 31 carries the reverse direction
+EDGE_EXCHANGE_COLUMNS = [26, 4, 29, 7, 13, 12, 9, 20, 27, 0, 10, 18, 28, 19, 23, 1, 8, 17, 30, 24, 25, 22, 5, 11,
+                         3, 6, 2, 15, 16, 21, 14]
+
+# Arrays stored in a WaterExchange transport cache directory (one .npy each, memory-mapped on load)
+TRANSPORT_CACHE_ARRAYS = ['transport_coefficients', 'volume_table', 'volume_before_start',
+                          'propagator_diagonal', 'propagator_edges']
+TRANSPORT_CACHE_VERSION = 5
+INPUT_CACHE_VERSION = 1
+CHECKPOINT_VERSION = 4
+
+# Zone series held in the shared SimulationState buffer
+STATE_VARIABLES = ['PHY', 'ZOO', 'MA', 'qN', 'qP',
+                   'N_SH', 'V_SH', 'E_SH', 'E_R_SH', 'N_F', 'V_F', 'E_F', 'E_R_F',
+                   'NH4', 'NO3', 'ON', 'PO4', 'OP', 'PP', 'CBOD', 'DO']
+FORCING_VARIABLES = ['T', 'I', 'H', 'S', 'C_SPM', 'A', 'V', 'A_max']
+# Forcing rows advanced by a run; the others are parameters kept by a warm start from another run's state
+DYNAMIC_FORCING = ['T', 'I', 'H']
+
+# External input sources; the first is time-varying, the rest are static per zone
+INPUT_SOURCES = ['river', 'point_source', 'groundwater', 'pond', 'atmosphere']
+STATIC_SOURCES = INPUT_SOURCES[1:]
+
+# Nutrient budgets kept by Simulation: nutrient -> (state variable, process terms)
+NUTRIENT_BUDGETS = {
+    'ammonia': ('NH4', ['external_input', 'phy_release', 'phy_absorption', 'ma_release', 'ma_absorption',
+                        'sh_excretion', 'f_excretion', 'nitrification', 'mineralization_NH4', 'feed']),
+    'nitrate': ('NO3', ['external_input', 'nitrification', 'phy_absorption', 'ma_absorption', 'denitrification',
+                        'feed']),
+    'organic_ammonia': ('ON', ['external_input', 'phy_release', 'zoo_release', 'ma_release', 'sh_release',
+                               'f_release', 'mineralization_ON', 'feed']),
+    'inorganic_phosphorus': ('PO4', ['external_input', 'phy_release', 'phy_absorption', 'ma_release',
+                                     'ma_absorption', 'mineralization_PO4', 'particulate_ads_des', 'feed']),
+    'organic_phosphorus': ('OP', ['external_input', 'phy_release', 'zoo_release', 'ma_release', 'sh_release',
+                                  'f_release', 'mineralization_OP', 'feed']),
+    'particulate_phosphorus': ('PP', ['zoo_release', 'sh_release', 'f_release', 'ads_des', 'set_resus', 'feed']),
+}
+# Oxygen-cycle terms evaluated with the nutrients (no outer-sea budget is kept for these)
+OXYGEN_BUDGETS = {
+    'cbod': ('CBOD', ['external_input', 'phy_release', 'zoo_release', 'ma_release', 'sh_release', 'f_release',
+                      'oxidation', 'denitrification', 'feed']),
+    'oxygen': ('DO', ['external_input', 'atmospheric_exchange', 'phy_production', 'ma_production',
+                      'phy_respiration', 'ma_respiration', 'sh_respiration', 'f_respiration', 'nitrification',
+                      'cbod_oxidation', 'sediment_demand']),
+}
+CYCLE_BUDGETS = {**NUTRIENT_BUDGETS, **OXYGEN_BUDGETS}
+RECORDED_BIOMASS = ['PHY', 'ZOO', 'MA', 'N_SH', 'V_SH', 'N_F', 'V_F']
+# Substances moved between zones by the transport kernel, in the order of Simulation's exchange call
+TRANSPORTED_SUBSTANCES = ['PHY', 'ZOO'] + [species for species, _ in NUTRIENT_BUDGETS.values()]
+# Bounds (mg/L) the hourly schemes clip transported concentrations to after the exchange; the adaptive
+# solvers hold a concentration at a bound instead of letting its derivative carry it across
+CONCENTRATION_BOUNDS = {'PHY': (0.005, 0.1), 'ZOO': (0.005, 0.1), 'NH4': (0.005, 0.2), 'NO3': (1E-12, 1.5),
+                        'ON': (1E-12, 0.5), 'PO4': (0.005, 0.15), 'OP': (0.005, 0.15), 'PP': (0.005, 0.15)}
+# State integrated by the adaptive reaction solver (stored zone-major: zone 0 variables, zone 1 variables, ...)
+REACTION_STATE = RECORDED_BIOMASS + [species for species, _ in CYCLE_BUDGETS.values()]
+# scipy.integrate solvers usable for config['integrator'] besides the hourly 'euler' update
+ADAPTIVE_INTEGRATORS = ('RK23', 'RK45', 'DOP853', 'BDF')
+# Signed biology terms of REACTION_STATE (variable, process), evaluated per hour by Simulation.reaction_terms
+BIOLOGY_TERMS = [('PHY', 'growth'), ('PHY', 'loss'), ('PHY', 'zoo_grazing'), ('PHY', 'sh_grazing'),
+                 ('ZOO', 'growth'), ('ZOO', 'loss'), ('ZOO', 'sh_grazing'), ('MA', 'growth'), ('MA', 'loss'),
+                 ('N_SH', 'mortality'), ('V_SH', 'growth'), ('N_F', 'mortality'), ('V_F', 'growth')]
+# Process pairs moving one element between two pools, ((budget, process) of the receiving row, the paying row);
+# the 'mprk' integrator updates each pair as a single transfer, so the pair conserves N or P exactly
+CONSERVATIVE_TRANSFERS = [
+    (('nitrate', 'nitrification'), ('ammonia', 'nitrification')),
+    (('ammonia', 'mineralization_NH4'), ('organic_ammonia', 'mineralization_ON')),
+    (('inorganic_phosphorus', 'mineralization_PO4'), ('organic_phosphorus', 'mineralization_OP')),
+    (('particulate_phosphorus', 'ads_des'), ('inorganic_phosphorus', 'particulate_ads_des')),
+]
+REACTION_INTEGRATORS = ('euler', 'mprk') + ADAPTIVE_INTEGRATORS
+# Largest 'mprk' time step (hours) whose nutrient concentrations stay within MPRK_DEVIATION (relative to the zone
+# mean) of the hourly run over the first three days, as checked by benchmark_20.py --only mprk; Simulation rejects
+# coarser steps. The deviation at coarser steps comes from sampling the forcing and transport less often, not from
+# the Patankar update itself
+MPRK_MAX_TIME_STEP = 2
+MPRK_DEVIATION = 0.1
+# Default config['substeps'] of the multi-rate splitting (1 h forcing step): the coarsest sub-steps whose nutrient
+# concentrations stay within SPLITTING_DEVIATION (relative to the zone mean) of the all-hourly splitting,
+# as checked by benchmark_20.py --only splitting
+SPLITTING_SUBSTEPS = {'kinetics': 1, 'deb': 24}
+SPLITTING_DEVIATION = 0.05
+# Slow DEB state advanced in its own group by the multi-rate splitting (config['substeps'])
+DEB_STATE = ['N_SH', 'V_SH', 'N_F', 'V_F']
+PATANKAR_FLOOR = 1e-30  # 分母下限：流出池浓度为 0 时该流量不起作用
+# Statistics accumulated per aggregation window by ResultsRecorder (variance is the population variance)
+AGGREGATE_STATISTICS = ['mean', 'min', 'max', 'variance']
+
+# Run settings for Simulation; override any key through its config argument
+SIMULATION_DEFAULTS = {
+    'sim_days': 365 * 3,  # 模拟天数
+    'time_step': 1,  # 时间步长（小时）；'mprk' 不超过 MPRK_MAX_TIME_STEP
+    'seed': None,  # None 时沿用 np.random 全局随机状态
+    'progress': False,  # 是否显示 tqdm 进度条
+    'integrator': 'euler',  # 'euler' 显式欧拉（原实现）、'mprk' 保正格式（成对转移守恒），或 ADAPTIVE_INTEGRATORS 中的自适应积分器
+    'rtol': 1e-4,  # 自适应积分相对误差（RK45 中位步长约 2 h；1e-6 时约 0.6 h，求值次数约为 3 倍）
+    'atol': 1e-9,  # 自适应积分绝对误差
+    'substeps': None,  # 多速率 Strang 分裂的各过程组子步长（小时），如 {'kinetics': 3, 'deb': 24}；None 为逐步整体更新
+    'checkpoint_path': None,  # 检查点文件（.npz）；None 时不写检查点
+    'checkpoint_interval': 24 * 30,  # 检查点间隔（小时）
+    'record_variables': None,  # 逐步记录的变量；None 为营养盐与 RECORDED_BIOMASS，'all' 为全部 STATE_VARIABLES
+    'record_memory_budget': 1 << 30,  # 结果序列的内存上限（字节），超出时分块写入 record_directory
+    'record_directory': None,  # 分块存储目录；None 时超出内存上限则使用新建的临时目录
+    'aggregation_windows': None,  # 运行中累积的聚合窗口（小时），如 {'weekly': 168}；None 为不聚合
+    'record_series': True,  # 是否保留逐步序列；False 时只输出聚合结果
+    'budget_window': None,  # 过程贡献与输运质量的快照间隔（小时），如 24 * 30 为逐月收支；None 为只保留累计值
+    'N_SH_initial': [3785804.438, 0, 0, 126336979.3, 4183871.842, 0, 227012456.3, 55525559.94, 0, 377535149.1,
+                     330634099.3, 0, 0, 3679995.239, 1215077545, 61342563.2, 2427940.471, 236319257.8,
+                     18026278.35, 0],
+    'V_SH_initial': 0.6,
+    'N_F_initial': [0, 0, 36308132.92, 11246959.3, 79615100.35, 13866717.11, 1982687.219, 12612384.08,
+                    8110870.655, 667060.6129, 119289.1572, 51539474.79, 73837822.43, 11257092.76, 9406260.351, 0,
+                    11079676.28, 15923493.26, 19494348.39, 4090630.33],
+    'V_F_initial': 5.0,
+}
+# Settings that may differ when a run is resumed from a checkpoint (all others must match)
+RESUMABLE_CONFIG_KEYS = ['sim_days', 'progress', 'checkpoint_path', 'checkpoint_interval', 'record_memory_budget',
+                         'record_directory']
+# A perturbed warm start (SpinupCache.convergence) may replace the cold run when its deviation from the cold run
+# stays within this fraction of the perturbation's own effect
+SPINUP_TOLERANCE = 0.1
+# Days before the equilibration day from which a perturbed warm start runs under its own parameters. A changed
+# shellfish or fish DEB parameter moves the start back to that species' last restocking, since the cohort carries the
+# perturbation until it is replaced (restocking periods in days, as in Simulation.harvest_and_restock)
+REEQUILIBRATION_DAYS = 120
+RESTOCKING_DAYS = {'shellfish': 180, 'fish': 360}
+LITERS_PER_M3 = 1000.0
+
+# DEB parameter sets: engine field -> parameter name (numbers are used as-is)
+DEB_FIELDS = ['p_A_max', 'p_M', 'kappa', 'E_m', 'E_G', 'V_p', 'D',
+              'T_0', 'T_A', 'T_AL', 'T_AH', 'T_L', 'T_H', 'catabolic_temperature']
+DEB_SPECIES = {
+    'shellfish': {'p_A_max': '{p_A_SH}', 'p_M': '[p_M_SH]', 'kappa': 'kappa_SH', 'E_m': '[E_m_SH]',
+                  'E_G': '[E_G_SH]', 'V_p': 'V_p_SH', 'D': 'DSH', 'T_0': 'T_0_SH', 'T_A': 'T_A_SH',
+                  'T_AL': 'T_AL_SH', 'T_AH': 'T_AH_SH', 'T_L': 'T_L_SH', 'T_H': 'T_H_SH',
+                  'catabolic_temperature': 0},
+    'fish': {'p_A_max': '{p_A_F}', 'p_M': '[p_M_F]', 'kappa': 'kappa_F', 'E_m': '[E_m_F]',
+             'E_G': '[E_G_F]', 'V_p': 'V_p_F', 'D': 'DF', 'T_0': 'T_0_F', 'T_A': 'T_A_F',
+             'T_AL': 'T_AL_F', 'T_AH': 'T_AH_F', 'T_L': 'T_L_F', 'T_H': 'T_H_F',
+             'catabolic_temperature': 1},
+}
+
 class ToolTip(object):
     def __init__(self, widget, text='widget info'):
         self.waittime = 500
@@ -64,220 +423,178 @@ class ToolTip(object):
         if tw:
             tw.destroy()
 
+class SimulationState:
+    """Struct-of-arrays model state shared by all process classes.
+
+    One contiguous float64 buffer of shape (n_state_vars + n_forcing_vars, n_zones)
+    holds the state block followed by the forcing block. Every variable is exposed
+    as a row view (state['NH4'] or state.NH4), so components that hold a view see
+    in-place writes without any copy or sync step, and the whole model state can be
+    checkpointed, shared or batched as a single array.
+    """
+    def __init__(self, n_zones, state_variables=STATE_VARIABLES, forcing_variables=FORCING_VARIABLES,
+                 buffer=None):
+        self.n_zones = n_zones
+        self.state_variables = list(state_variables)
+        self.forcing_variables = list(forcing_variables)
+        self.names = self.state_variables + self.forcing_variables
+        self.index = {name: i for i, name in enumerate(self.names)}
+        shape = (len(self.names), n_zones)
+        if buffer is None:
+            buffer = np.zeros(shape, dtype=np.float64)
+        elif buffer.shape != shape or buffer.dtype != np.float64:
+            raise ValueError(f"State buffer must be float64 with shape {shape}, got {buffer.dtype} {buffer.shape}")
+        self.buffer = buffer
+        self.state = self.buffer[:len(self.state_variables)]
+        self.forcing = self.buffer[len(self.state_variables):]
+
+    @classmethod
+    def from_values(cls, values, state_variables=STATE_VARIABLES, forcing_variables=FORCING_VARIABLES):
+        """Build a state from a name -> array mapping (e.g. ParameterStore.values)."""
+        n_zones = len(values[state_variables[0]])
+        state = cls(n_zones, state_variables, forcing_variables)
+        for name in state.names:
+            state[name] = values[name]
+        return state
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        return self.buffer[self.index[name]]
+
+    def __setitem__(self, name, values):
+        self.buffer[self.index[name]] = values
+
+    def __getattr__(self, name):
+        index = self.__dict__.get('index')
+        if index is not None and name in index:
+            return self.buffer[index[name]]
+        raise AttributeError(name)
+
+    def snapshot(self):
+        """Return a copy of the whole buffer (e.g. for checkpointing)."""
+        return self.buffer.copy()
+
+    def restore(self, snapshot):
+        """Write a snapshot back into the buffer in place, keeping all views valid."""
+        self.buffer[...] = snapshot
+
+class ParameterStore:
+    """Headless parameter store keeping every parameter as a float64 array.
+
+    Defaults come from PARAMETER_TABS and can be overridden by a parameters.json
+    file (name -> scalar or list). Values are parsed once, so get_parameter and
+    update_initial_values never go through strings during a run. Zone state and
+    forcing series live in a shared SimulationState; get_parameter returns their
+    row views and update_initial_values writes into them in place.
+    """
+    def __init__(self, param_file=None, tabs=PARAMETER_TABS):
+        self.tabs = tabs
+        self.sea_areas = list(SEA_AREAS)
+        self.values = {}
+        self.units = {}
+        self.descriptions = {}
+        self.load_defaults()
+        self.state = SimulationState.from_values(self.values)
+        for name in self.state.names:
+            self.values[name] = self.state[name]
+        if param_file is not None:
+            self.load_json(param_file)
+
+    @classmethod
+    def from_params(cls, params):
+        """The store for params: a ParameterStore itself, a parameters.json path, a mapping of overrides or None."""
+        if isinstance(params, ParameterStore):
+            return params
+        if isinstance(params, (str, os.PathLike)):
+            return cls(param_file=params)
+        store = cls()
+        store.set_parameters(params or {})
+        return store
+
+    @staticmethod
+    def parse_value(value):
+        """Convert a table entry, entry string or JSON value to a 1-D float64 array."""
+        if isinstance(value, str):
+            return np.array([float(v) for v in value.split(',')], dtype=np.float64)
+        return np.array(value, dtype=np.float64).reshape(-1)
+
+    def load_defaults(self):
+        for tab_name, parameters in self.tabs:
+            for name, value, unit, desc in parameters:
+                self.values[name] = self.parse_value(value)
+                self.units[name] = unit
+                self.descriptions[name] = desc
+
+    def load_json(self, param_file):
+        with open(param_file, 'r', encoding='utf-8') as f:
+            self.set_parameters(json.load(f))
+
+    def set_parameters(self, parameters):
+        for name, value in parameters.items():
+            self.set_parameter(name, value)
+
+    def save_json(self, param_file):
+        parameters = {name: (values.tolist() if len(values) > 1 else float(values[0]))
+                      for name, values in self.values.items()}
+        with open(param_file, 'w', encoding='utf-8') as f:
+            json.dump(parameters, f, indent=2, ensure_ascii=False)
+
+    def set_parameter(self, name, value):
+        """Set a parameter; a single value fills a zone series, any other length must match its default."""
+        values = self.parse_value(value)
+        default = self.values.get(name)
+        if default is not None and len(default) > 1:
+            if len(values) == 1:
+                values = np.full(len(default), values[0])
+            elif len(values) != len(default):
+                raise ValueError(f"{name} needs {len(default)} values (or a single value), got {len(values)}")
+        if name in self.state:
+            self.state[name] = values
+        else:
+            self.values[name] = values
+
+    def format_value(self, name):
+        return ', '.join(map(str, self.values[name].tolist()))
+
+    def fingerprint(self):
+        """Content hash of all current parameter values (zone state included)."""
+        digest = hashlib.sha256()
+        for name in sorted(self.values):
+            digest.update(name.encode('utf-8'))
+            digest.update(np.ascontiguousarray(self.values[name], dtype=np.float64).tobytes())
+        return digest.hexdigest()[:32]
+
+    def get_sea_areas(self):
+        return self.sea_areas
+
+    def get_parameter(self, name):
+        return self.values[name]
+
+    def update_initial_values(self, updated_concentrations):
+        for name, values in updated_concentrations.items():
+            if name in self.state:
+                # Exchanged series may carry a trailing OuterSea cell
+                self.state[name] = np.asarray(values, dtype=np.float64).reshape(-1)[:self.state.n_zones]
+            else:
+                self.values[name] = np.array(values, dtype=np.float64).reshape(-1)
+
 class ParameterLoader:
-    def __init__(self, master):
+    """Optional Tk editor for a ParameterStore; edits are written back on save."""
+    def __init__(self, master, store=None):
         self.master = master
         self.master.title("Parameter Loader")
+        self.store = store if store is not None else ParameterStore()
+        self.state = self.store.state
         self.entries = {}
         self.tab_control = ttk.Notebook(master)
 
-        # Initial Conditions tab with series input
-        self.add_tab('Initial Conditions', [
-            ('PHY', '0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435, 0.0435', 'mgC/L', 'Initial phytoplankton biomass series'),
-            ('ZOO', '0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05', 'mgC/L', 'Initial zooplankton biomass series'),
-            ('NH4', '0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.005', 'mgN/L', 'Initial ammonium concentration series'),
-            ('NO3', '0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4', 'mgN/L', 'Initial nitrate concentration series'),
-            ('ON', '0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1', 'mgN/L', 'Initial organic nitrogen concentration series'),
-            ('PO4', '0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08, 0.08', 'mgP/L', 'Initial phosphate concentration series'),
-            ('OP', '0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02', 'mgP/L', 'Initial organic phosphorus concentration series'),
-            ('PP', '0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05', 'mgP/L', 'Initial particulate phosphorus concentration series'),
-            ('C_SPM', '0.2, 0.05, 0.05, 0.1, 0.1, 0.1, 0.2, 0.1, 0.2, 0.2, 0.2, 0.1, 0.05, 0.05, 0.2, 0.2, 0.2, 0.2, 0.1, 0.2', 'kg/m³', 'Initial concentration of SPM in the water column'),
-            ('CBOD', '1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0', 'mgO2/L', 'Initial BCOD concentration series'),
-            ('DO', '6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29, 6.29', 'mgO2/L', 'Initial dissolved oxygen concentration series'),
-            ('I', '705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539, 705539', 'lx/day', 'Initial surface light intensity series'),
-            ('H', '6.861743794,40.02595618,35.80033097,4.185279406,16.87358291,9.645099978,2.594711363,10.60004844,4.20606114,6.54189523,7.264580586,17.0592759,38.15586537,22.23773208,4.628117896,2.22255415,7.402312545,5.80439337,16.9039485,2.713267632', 'm', 'Initial water depth series'),
-            ('T', '20.04909, 22.73150, 22.99365, 23.83580, 23.85205, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365, 22.99365', '°C', 'Initial temperature series'),
-            ('MA', '0,0,20,20,20,20,20,20,20,20,20,20,20,20,20,20,20,0,20,20', 'gD/m²', 'Initial macroalgal biomass series'),
-            # ('MA', '0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0', 'gD/m²', 'Initial macroalgal biomass series'),
-            ('qN', '50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50, 50', 'mgN/gD', 'Macroalgal cell quotas of nitrogen'),
-            ('qP', '5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5, 5', 'mgP/gD', 'Macroalgal cell quotas of phosphorus'),
-            ('N_SH', '3785804.438, 0, 0, 126336979.3, 4183871.842, 0, 227012456.3, 55525559.94, 0, 377535149.1, 330634099.3, 0, 0, 3679995.239, 1215077545, 61342563.2, 2427940.471, 236319257.8, 18026278.35, 0', '-', 'Initial number of shellfish (individuals) series'),
-            ('V_SH', '0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6', 'cm³', 'Initial volume of shellfish series'),
-            ('E_SH', '40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40, 40', 'J', 'Initial storage energy series'),
-            ('E_R_SH', '10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10', 'J', 'Initial reproductive energy storage'),
-            ('N_F', '0, 0, 36308132.92, 11246959.3, 79615100.35, 13866717.11, 1982687.219, 12612384.08, 8110870.655, 667060.6129, 119289.1572, 51539474.79, 73837822.43, 11257092.76, 9406260.351, 0, 11079676.28, 15923493.26, 19494348.39, 4090630.33', '-', 'Initial number of fishes (individuals) series'),
-            ('V_F', '5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0, 5.0', 'cm³', 'Initial volume of fishes series'),
-            ('E_F', '42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000, 42000', 'J', 'Initial storage energy series'),
-            ('E_R_F', '6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000, 6000', 'J', 'Initial reproductive energy storage')
-        ])
-
-        # Parameters for general biology
-        self.add_tab('General Biology', [
-            ('A', '21254365.49, 40880593, 43273840.78, 45116392.4, 37734875.14, 34829187.59, 28953727.35, 37689715.86, 44219607.5, 32679776.13, 35679879.05, 43391698.09, 52025867.64, 37394565.25, 34486370.52, 30497248.42, 31422979.23, 25456718.08, 29143514.83, 47734812.71', 'm²', 'Initial area series'),
-            ('V', '145842010.5, 1636284824, 1549217822, 188824708, 636722544.2, 335930996.5, 75126565.36, 399512813.7, 185990372.7, 213787671.6, 259199356.6, 740230949.5, 1985092002, 831570323.3, 159606988.6, 67781786.04, 232602713.4, 147760805.7, 492640473.9, 129517322.2', 'm³', 'Initial volume series'),
-            ('A_max', '0, 0, 8233002.116, 2196936.866, 8642354.683, 7761237.243, 2156180.323, 4560401.726, 2898244.292, 12249866.43, 18319823.9, 2806045.515, 1921581.758, 6528759.683, 0, 67819.07301, 4290008.942, 0, 10337714.55, 4622971.222', 'm²', 'Maximum macroalgae carrying capacity series'),
-            ('S', '34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34, 34', 'g/kg', 'Initial salinity series'),
-            ('K_T', 1.068, '-', 'Temperature constant'),
-            ('T_opt', 20, '°C', 'Optimal temperature value'),
-            ('I_s', 1200000, 'lx/d', 'Optical saturation constant of light intensity'),
-            ('K_E', 0.1, '1/m', 'Light extinction coefficient'),
-            ('FEED_NH3', 1.52, 'mgN/g', 'Ammonium added to the food web'),
-            ('FEED_NO3', 4.17, 'mgN/g', 'Nitrate added to the food web'),
-            ('FEED_ON', 45.8, 'mgN/g', 'Organic nitrogen added to the food web'),
-            ('FEED_PO4', 1.5, 'mgP/g', 'Phosphate added to the food web'),
-            ('FEED_OP', 1.49, 'mgP/g', 'Organic phosphorus added to the food web'),
-            ('FEED_PP', 4.5, 'mgP/g', 'Particulte phosphorus added to the food web'),
-            ('FEED_CBOD', 2.2, 'mgO2/g', 'BCOD added to the food web'),
-            ('W', '4.87, 5.02, 5.12, 4.89, 4.95, 4.87, 5.02, 5.12, 4.65, 5.34, 4.88, 5.21, 4.93, 5.47, 4.56, 5.05, 5.20, 4.79, 5.38, 4.62, 5.15, 4.98, 5.01', 'm/s', 'Wind speed series'),
-            ('v', '0.0395, 0.0425, 0.0385, 0.0365, 0.0395, 0.0365, 0.0395, 0.0425, 0.0385, 0.0365, 0.0395, 0.0405, 0.0435, 0.0375, 0.0395, 0.0385, 0.0405, 0.0415, 0.0435', 'm/s', 'Velocity series')
-        ])
-
-        # Parameters for phytoplankton
-        self.add_tab('Phytoplankton', [
-            ('KC_PHY', 2.88/24, '1/d', 'Phytoplankton growth rate constant'),
-            ('KN_PHY', 0.02, 'mgN/L', 'Nitrogen half saturation constant for phytoplankton growth'), # 0.05
-            ('KP_PHY', 0.08, 'mgP/L', 'Phosphorus half saturation constant for phytoplankton growth'), # 0.15
-            ('F_PO4', 0.9, '-', 'Fraction of dissolved inorganic phosphorus'),
-            ('kappa_1_PHY', 0.05, '-', 'Temperature sensitivity coefficient below the optimum temperature'),
-            ('kappa_2_PHY', 0.05, '-', 'Temperature sensitivity coefficient above the optimum temperature'),
-            ('KD_PHY', 0.12/24, '1/d', 'Phytoplankton death rate constant'),
-            ('M_max_PHY', 1.0, '-', 'Maximum death rate of phytoplankton'),
-            ('K_PHY', 0.8, 'mgC/L', 'Environmental load of phytoplankton'),
-            ('KR_PHY', 0.096/24, '1/d', 'Phytoplankton respiration rate constant')
-        ])
-
-        # Parameters for zooplankton
-        self.add_tab('Zooplankton', [
-            ('EFF', 0.5, '-', 'Grazing efficiency'),
-            ('K_GRZ', 1.5/24, '1/d', 'Grazing rate constant'),
-            ('K_PZ', 0.5, 'mgC/L', 'Half saturation constant for phytoplankton in grazing'),
-            ('K_DZ', 0.01/24, '1/d', 'Zooplankton death rate')
-        ])
-
-        # Parameters for macroalgal
-        self.add_tab('Macroalgal', [
-            ('KC_MA', 0.7/24, '1/d', 'Macroalgal growth rate constant'),
-            ('kappa_1_MA_T', 0.05, '-', 'Temperature sensitivity coefficient below the optimum temperature'),
-            ('kappa_2_MA_T', 0.05, '-', 'Temperature sensitivity coefficient above the optimum temperature'),
-            ('kappa_1_MA_S', 0.05, '-', 'Salinity sensitivity coefficient below the optimum salinity'),
-            ('kappa_2_MA_S', 0.05, '-', 'Salinity sensitivity coefficient above the optimum salinity'),
-            ('S_opt', 35, 'g/kg', 'Optimal salinity value'),
-            ('q_0N', 7.2, 'mgN/gD', 'Minimum cell quotas of nitrogen'),
-            ('q_0P', 1.0, 'mgP/gD', 'Minimum cell quotas of phosphorus'),
-            ('KN_MA', 0.025, 'mgN/L', 'Nitrogen half saturation constant for macroalgal growth'),
-            ('K_qN', 9.0, 'mgN/gD', 'half-saturation constants for intracellular nitrogen'),
-            ('KP', 0.01, 'mgP/L', 'Phosphorus half saturation constant for macroalgal growth'),
-            ('KE_MA', 0.09, '-', 'Algae cell excretion rate constant'),
-            ('KP_MA', 0.1, 'mgP/L', 'Phosphorus half saturation constant for macroalgal growth'),
-            ('K_qP', 1.3, 'mgP/gD', 'half-saturation constants for intracellular phosphorus'),
-            ('KD_MA', 0.01/24, '1/d', 'Macroalgal death rate constant'),
-            ('KR_MA', 0.21/24, '1/d', 'Macroalgal respiration rate constant'),
-            ('MA_max', 1500, 'gD/m²', 'Maximum macroalgal biomass'),
-            ('z', 5.0, 'm', 'Maximum depth of macroalgal growth'),
-            ('F_UP_N', 720/24, 'mgN/gD/d', 'Maximum uptake rate of nitrogen by macroalgal'),
-            ('F_UP_P', 50/24, 'mgP/gD/d', 'Maximum uptake rate of phosphorus by macroalgal'),
-        ])
-
-        # Parameters for shellfish
-        self.add_tab('Shellfish', [
-            ('DSH', 0.001/24, '1/d', 'Shellfish death rate constant'),
-            ('kappa_SH', 0.7, '-', 'Fraction of catabolic flux to growth and maintenance'),
-            ('[E_G_SH]', 2500, 'J/cm³', 'Volume-specific costs for structure'),
-            ('{p_A_SH}', 440/24, 'J/cm²/d', 'Maximum surface area-specific assimilation rate'),
-            ('T_0_SH', 288, 'K', 'Reference temperature'),
-            ('T_A_SH', 5530, 'K', 'Arrhenius temperature'),
-            ('T_AL_SH', 21000, 'K', 'Arrhenius temperature for the rate of decrease at lower boundary'),
-            ('T_AH_SH', 42000, 'K', 'Arrhenius temperature for the rate of increase at upper boundary'),
-            ('T_L_SH', 283, 'K', 'Lower boundary temperature of the tolerance range'),
-            ('T_H_SH', 296, 'K', 'Upper boundary temperature of the tolerance range'),
-            ('H_SH', 0.295, 'mgC/L', 'Half-saturation uptake of phytoplankton'),
-            ('[E_m_SH]', 2600, 'J/cm³', 'Maximum reserve density'),
-            ('V_p_SH', 0.36, 'cm³', 'Structural body volume at puberty'),
-            ('[p_M_SH]', 12.2/24, 'J/cm³/d', 'Volume-specific maintenance rate')
-        ])
-
-        # Parameters for fish
-        self.add_tab('Fish', [
-            ('DF', 0.001/24, '1/d', 'Fish death rate constant'),
-            ('kappa_F', 0.85, '-', 'Fraction of catabolic flux to growth and maintenance'),
-            ('[E_G_F]', 6200, 'J/cm³', 'Volume-specific costs for structure'),
-            ('{p_A_F}', 2250/24, 'J/cm²/d', 'Maximum surface area-specific assimilation rate'),
-            ('T_0_F', 283, 'K', 'Reference temperature'),
-            ('T_A_F', 6400, 'K', 'Arrhenius temperature'),
-            ('T_AL_F', 3200, 'K', 'Arrhenius temperature for the rate of decrease at lower boundary'),
-            ('T_AH_F', 32000, 'K', 'Arrhenius temperature for the rate of increase at upper boundary'),
-            ('T_L_F', 283, 'K', 'Lower boundary temperature of the tolerance range'),
-            ('T_H_F', 296, 'K', 'Upper boundary temperature of the tolerance range'),
-            ('H_F', 5, 'g', 'Half-saturation uptake'),
-            ('[E_m_F]', 11600, 'J/cm³', 'Maximum reserve density'),
-            ('V_p_F', 9, 'cm³', 'Structural body volume at puberty'),
-            ('[p_M_F]', 75.3/24, 'J/cm³/d', 'Volume-specific maintenance rate'),
-            ('FEED', '0, 0, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0.15, 0, 0.15, 0.15, 0.15, 0.15', 'g/m²/d', 'Fish feeding constant'), # 存疑
-            ('M_F', 500, 'g', 'Fish mass when harvested'),
-            ('FCR_F', 3.5, '-', 'Feed conversion ratio of fishes')
-        ])
-
-        # Parameters for nitrogen
-        self.add_tab('Nitrogen', [
-            # Ammonium nitrogen
-            ('NC_PHY', 0.065, 'mgN/mgC', 'N/C ratio of phytoplankton'),
-            ('FON_PHY', 0.5, '-', 'Fraction of ON from phytoplankton death'),
-            ('KN_PHY', 0.05, 'mgN/L', 'Nitrogen half saturation constant for phytoplankton growth'),
-            ('NC_MA', 0.1, 'mgN/mgC', 'N/C ratio of macroalgal'),
-            ('DC_MA', 3.0, 'mgD/mgC', 'D/C ratio of macroalgal'),
-            ('KN_MA', 0.025, 'mgN/L', 'Nitrogen half saturation constant for macroalgal growth'),
-            ('kappa_R_SH', 0.8, '-', 'Fraction of reproductive reserves fixed in eggs for shellfish'),
-            ('mu_V_SH', 2700, 'J/gW', 'Structure energy content of shellfish'),
-            ('NC_SH', 0.183, 'mgN/mgC', 'N/C ratio of shellfish'),
-            ('mu_CJ', 48.8, 'J/mgC', 'Ratio of carbon to energy content'),
-            ('kappa_R_F', 0.8, '-', 'Fraction of reproductive reserves fixed in eggs for fishes'),
-            ('mu_V_F', 4400, 'J/gW', 'Structure energy content of fishes'),
-            ('NC_F', 0.18, 'mgN/mgC', 'N/C ratio of fishes'),
-            ('NC_FEED', 0.18, 'mgN/mgC', 'N/C ratio of fish feed'),
-            ('KC_nit', 0.05/24, '1/d', 'Nitrification rate constant'),
-            ('K_nit', 2.0, 'mgO2/L', 'Half-saturation constant for nitrification'),
-            ('KNC_min', 0.075/24, '1/d', 'Mineralisation of dissolved ON rate constant'),
-            # Nitrate nitrogen
-            ('KC_den', 0.09/24, '1/d', 'Denitrification rate constant'),
-            ('K_den', 0.1, 'mgO2/L', 'Half-saturation constant for denitrification'),
-            # Organic nitrogen
-            ('mu_ON_sink', 0.041, '-', 'Fraction of organic nitrogen sinking'),
-            ('U_SH', 0.045/24, 'm³/cm²/d', 'Shellfish maximum surface area-specific clearance'),
-            ('U_F', 380/24, 'mgC/cm²/d', 'Fish maximum surface area-specific clearance')
-        ])
-
-        # Parameters for phosphorus
-        self.add_tab('Phosphorus', [
-            # Inorganic phosphorus
-            ('PC_PHY', 0.025, 'mgP/mgC', 'P/C ratio of phytoplankton'),
-            ('FOP_PHY', 0.5, '-', 'Fraction of OP from phytoplankton death'),
-            ('PC_MA', 0.01, 'mgP/mgC', 'P/C ratio of macroalgal'),
-            ('KPC_min', 0.02/24, '1/d', 'Mineralisation of dissolved OP rate constant'),
-            # Organic phosphorus
-            ('mu_OP_sink', 0.05, '-', 'Fraction of organic phosphorus sinking'),
-            ('PC_SH', 0.0025, 'mgP/mgC', 'P/C ratio of shellfish'),
-            ('PC_F', 0.005, 'mgP/mgC', 'P/C ratio of fishes'),
-            # Particle phosphorus
-            ('f_fec', 0.4, '-', 'Fraction of fecal matter that is phosphorus'),
-            ('f_PP', 0.6, '-', 'Fraction of PP in fecal matter'),
-            ('K_ads', 0.002/24, 'mgP/d', 'Adsorption rate constant for PP'),
-            ('K_des', 0.15/24, 'mgP/L/d', 'Desorption rate constant for PP'),
-            ('V_set', 0.05/24, 'mgP/m/d', 'Settling rate constant for PP'),
-            ('K_resus', 0.3/24, 'mgP/L/d', 'Resuspension rate constant for PP'),
-            ('Q_max', 400, 'mgP/kg', 'Langmuir medium maximum capacity for PP')
-        ])
-
-        # Parameters for CBOD
-        self.add_tab('CBOD', [
-            ('OC', 1.42, 'mgO2/mgC', 'O2/C ratio'),
-            ('KDC', 0.18, '1/d', 'Oxidation of CBOD rate constant'),
-            ('K_BOD', 0.5, 'mgO2/L', 'CBOD half saturation constant for oxidation')
-        ])
-
-        # Parameters for dissolved oxygen
-        self.add_tab('Dissolved Oxygen', [
-            ('a', 3.863, '-', 'Parameter in APHA'),
-            ('b', 0.5, '-', 'Parameter in APHA'),
-            ('c', 0.5, '-', 'Parameter in APHA'),
-            ('d', 0.4, '-', 'Parameter in APHA'),
-            ('ROC_MA', 2.69, 'mgO2/mgC', 'Ratio of macroalgal use O2 to produce carbon'),
-            ('SOD', 2.0, 'mgO2/L/d·m', 'Sediment oxygen demand rate constant')
-        ])
+        for tab_name, parameters in self.store.tabs:
+            self.add_tab(tab_name, parameters)
 
         # Parameters for waterexchange
-        self.sea_areas = ['Area1', 'Area2', 'Area3', 'Area4', 'Area5', 'Area6', 'Area7', 'Area8', 'Area9', 'Area10',
-                          'Area11', 'Area12', 'Area13', 'Area14', 'Area15', 'Area16', 'Area17', 'Area18', 'Area19',
-                          'Area20']
+        self.sea_areas = self.store.get_sea_areas()
 
         # Save button
         self.save_button = ttk.Button(master, text="Save Data and Continue", command=self.save_and_continue)
@@ -300,7 +617,7 @@ class ParameterLoader:
             label = ttk.Label(frame, text=name, width=13)
             label.pack(side=tk.LEFT)
             entry = ttk.Entry(frame, width=20)
-            entry.insert(0, str(value))
+            entry.insert(0, self.store.format_value(name))
             entry.pack(side=tk.LEFT, padx=10, fill=tk.X, expand=True)
             unit_label = ttk.Label(frame, text=unit, width=15)
             unit_label.pack(side=tk.LEFT)
@@ -308,24 +625,152 @@ class ParameterLoader:
             self.entries[name] = (entry, tab_name)
             ToolTip(label, desc)
 
+    def apply_entries(self):
+        """Parse the edited entries once and store them as arrays."""
+        for name, (entry, tab_name) in self.entries.items():
+            self.store.set_parameter(name, entry.get())
+
     def save_and_continue(self):
+        self.apply_entries()
         self.master.quit()  # Quit the main loop
 
     def get_parameter(self, name):
-        entry, tab_name = self.entries[name]
-        value_str = entry.get()
-        value_list = [float(v) for v in value_str.split(',')]
-        return value_list
+        return self.store.get_parameter(name)
 
     def update_initial_values(self, updated_concentrations):
-        for name, values in updated_concentrations.items():
-            entry, tab_name = self.entries[name]
-            new_value_str = ','.join(map(str, values))
-            entry.delete(0, tk.END)
-            entry.insert(0, new_value_str)
+        self.store.update_initial_values(updated_concentrations)
+
+class InputCache:
+    """Columnar binary cache for the CSV forcing files in database/.
+
+    Each CSV is parsed once and stored as one .npy file per column under
+    <cache_dir>/csv/<name>_<content hash>/; later loads memory-map those files
+    read-only. A small per-path stat record (size, mtime) lets unchanged files be
+    served without re-hashing; when the stat changes the content hash decides
+    whether the cached columns are still valid. With cache_dir=None the CSV is
+    parsed directly and nothing is written.
+    """
+    def __init__(self, cache_dir=None):
+        self.cache_dir = None if cache_dir is None else os.path.join(cache_dir, 'csv')
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def parse_csv(path):
+        # Numeric columns keep their dtype; text columns (dates, zone names) become fixed-width unicode
+        df = pd.read_csv(path)
+        columns = {}
+        for name in df.columns:
+            values = df[name].to_numpy()
+            columns[name] = values.astype(str) if values.dtype == object else values
+        return columns
+
+    def record_path(self, path):
+        key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, 'paths', f"{key}.json")
+
+    def read_record(self, path):
+        try:
+            with open(self.record_path(path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_record(self, path, record):
+        record_path = self.record_path(path)
+        os.makedirs(os.path.dirname(record_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(record_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
+
+    def digest(self, path):
+        """Content hash of a file, taken from the stat record when size and mtime are unchanged."""
+        if self.cache_dir is None:
+            return self.hash_file(path)
+        return self.lookup(path)['sha256']
+
+    def lookup(self, path):
+        stat = os.stat(path)
+        record = self.read_record(path)
+        if (record is not None and record.get('version') == INPUT_CACHE_VERSION
+                and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns):
+            return record
+        sha = self.hash_file(path)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        record = {'version': INPUT_CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                  'sha256': sha, 'entry': f"{stem}_{sha[:16]}"}
+        self.write_record(path, record)
+        return record
+
+    def load(self, path):
+        """Return the CSV as an ordered {column: array} mapping (memory-mapped when cached)."""
+        if self.cache_dir is None:
+            return self.parse_csv(path)
+        record = self.lookup(path)
+        entry_path = os.path.join(self.cache_dir, record['entry'])
+        if not os.path.isfile(os.path.join(entry_path, 'columns.json')):
+            self.save_entry(entry_path, self.parse_csv(path))
+        with open(os.path.join(entry_path, 'columns.json'), 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        return {name: np.load(os.path.join(entry_path, f"c{i}.npy"), mmap_mode='r') for i, name in enumerate(names)}
+
+    def save_entry(self, entry_path, columns):
+        # Written to a temporary directory and renamed, so concurrent first loads are safe
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_csv_')
+        try:
+            for i, values in enumerate(columns.values()):
+                np.save(os.path.join(tmp_path, f"c{i}.npy"), values)
+            with open(os.path.join(tmp_path, 'columns.json'), 'w', encoding='utf-8') as f:
+                json.dump(list(columns), f, ensure_ascii=False)
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            if not os.path.isdir(entry_path):
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+class HourlyIndex:
+    """Hourly record with its prefix sums, so the sum over any hour window [t0, t1) is one subtraction.
+
+    sum(t0, t1) accepts scalars or arrays of window bounds. step_sums(time_step)
+    gives the sums over consecutive steps of time_step hours; one-hour steps
+    return the record itself, so hourly runs carry no rounding from the
+    subtraction. A record whose length is not a multiple of the step loses its
+    incomplete tail with a warning.
+    """
+    def __init__(self, hourly, name):
+        self.hourly = np.asarray(hourly, dtype=np.float64)
+        self.name = name
+        self.cumulative = np.zeros((len(self.hourly) + 1,) + self.hourly.shape[1:])
+        np.cumsum(self.hourly, axis=0, out=self.cumulative[1:])
+
+    def __len__(self):
+        return len(self.hourly)
+
+    def sum(self, t0, t1):
+        return self.cumulative[t1] - self.cumulative[t0]
+
+    def step_sums(self, time_step):
+        num_steps, tail = divmod(len(self.hourly), time_step)
+        if tail:
+            warnings.warn(f"{self.name}记录 {len(self.hourly)} 小时不是时间步长 {time_step} 小时的整数倍，"
+                          f"舍去末尾不足一步的 {tail} 小时", stacklevel=3)
+        if time_step == 1:
+            return self.hourly
+        starts = np.arange(num_steps) * time_step
+        return self.sum(starts, starts + time_step)
 
 class WaterExchange:
-    def __init__(self, parameter_loader, exchange_data_file, outer_sea_conc_file, river_flow_file, outer_sea_scaling, time_step=1):
+    def __init__(self, parameter_loader, exchange_data_file, outer_sea_conc_file, river_flow_file, outer_sea_scaling, time_step=1,
+                 cache_dir=None):
         self.parameter_loader = parameter_loader
         self.exchange_data_file = exchange_data_file
         self.outer_sea_scaling = outer_sea_scaling or {
@@ -411,208 +856,308 @@ class WaterExchange:
         self.outer_sea_conc_file = outer_sea_conc_file
         self.river_flow_file = river_flow_file
         self.V = np.append(self.get_parameter('V'), 1e12)
+        self.cache_dir = cache_dir
+        self.input_cache = InputCache(cache_dir)
         self.outer_sea_concentrations = self.load_outer_sea_concentrations()
-        self.river_flow_data = self.load_river_flows()
+        self.outer_sea_tables = {}
 
-        # 初始化水交换矩阵
-        self.water_exchange_matrix = None
+        # 静态边索引：edge_from/edge_to 为各有向边的起止区域
+        self.build_edge_index()
+
+        # 水交换边通量 (T, n_edges)、对角线 (T, 21)、水量表 (T, 21) 与逐步输运传播子
+        # edge_flux 与 diagonal 是同一张系数表 transport_coefficients (T, n_edges + 21) 的列视图
+        self.transport_coefficients = None
+        self.edge_flux = None
+        self.diagonal = None
         self.num_time_points = None
+        self.volume_table = None
+        self.volume_before_start = None
+        self.propagator_diagonal = None
+        self.propagator_edges = None
+        self.exchange_index = None  # 逐时各边净交换量的前缀和索引（HourlyIndex），首次需要时读取
+        self.river_flow_index = None  # 逐时河流流量的前缀和索引
 
-        # 加载水交换数据并计算矩阵
-        self.load_exchange_data()
-        self.load_river_flows()
-        self.calculate_water_exchange_matrices()
-        self.calculate_volume()
+        self.build_transport()
 
     def get_parameter(self, name):
         return self.parameter_loader.get_parameter(name)
 
-    def load_exchange_data(self):
-        # 读取水交换数据文件
-        df_out_1d = pd.read_csv(self.exchange_data_file, index_col=0)
-        list_area_new = [
-            '4_to_18', '6_to_10', '10_to_18', '9_to_18', '1_to_12', '9_to_10', '10_to_15', '2_to_12',
-            '6_to_15', '2_to_4', '4_to_9', '9_to_15', '2_to_16', '2_to_13', '13_to_16', '11_to_12',
-            '11_to_13', '7_to_13', '5_to_13', '5_to_7', '3_to_7', '11_to_19', '8_to_19', '5_to_8',
-            '7_to_17', '8_to_14', '0_to_17', '4_to_16', '5_to_14', '1_to_sea', '7_to_16'
-        ]
+    def build_transport(self):
+        # 优先从缓存映射输运数据（集合模拟中各进程共享同一只读页面），否则由逐时记录计算并写入缓存
+        if not self.load_transport_cache():
+            self.river_flow = self.load_river_flows()
+            self.load_exchange_data()
+            self.calculate_water_exchange_matrices()
+            self.calculate_volume_table()
+            self.calculate_propagators()
+            self.save_transport_cache()
+
+    def load_hourly_indexes(self):
+        # 读取逐时水交换与河流流量（经二进制列缓存）并建立前缀和索引，只读取一次
+        if self.exchange_index is not None:
+            return
+        columns = self.input_cache.load(self.exchange_data_file)
 
         # 确保数据文件中包含所有所需列
-        missing_columns = [col for col in list_area_new if col not in df_out_1d.columns]
+        missing_columns = [col for col in EXCHANGE_COLUMNS if col not in columns]
         if missing_columns:
             raise ValueError(f"水交换数据中缺少以下列：{missing_columns}")
 
-        # 转换数据为 numpy 数组并重构形状
-        df_out_1d = df_out_1d[list_area_new].values
-        df_out_1d = df_out_1d.reshape(-1, int(self.time_step / 1), df_out_1d.shape[1])
-        df_xh = np.sum(df_out_1d, axis=1)
-
-        # 初始化水交换值数组
-        waterex = np.zeros((len(df_xh), len(self.edges)))
-
-        # 计算水交换矩阵的各个边的值
-        waterex[:, 0] = np.maximum(df_xh[:, 26], 0)
-        waterex[:, 1] = np.maximum(df_xh[:, 4], 0)
-        waterex[:, 2] = np.maximum(df_xh[:, 29], 0)
-        waterex[:, 3] = np.maximum(df_xh[:, 7], 0)
-        waterex[:, 4] = np.maximum(df_xh[:, 13], 0)
-        waterex[:, 5] = np.maximum(df_xh[:, 12], 0)
-        waterex[:, 6] = np.maximum(df_xh[:, 9], 0)
-        waterex[:, 7] = np.maximum(df_xh[:, 20], 0)
-        waterex[:, 8] = np.maximum(df_xh[:, 27], 0)
-        waterex[:, 9] = np.maximum(df_xh[:, 0], 0)
-        waterex[:, 10] = np.maximum(df_xh[:, 10], 0)
-        waterex[:, 11] = np.maximum(df_xh[:, 18], 0)
-        waterex[:, 12] = np.maximum(df_xh[:, 28], 0)
-        waterex[:, 13] = np.maximum(df_xh[:, 19], 0)
-        waterex[:, 14] = np.maximum(df_xh[:, 23], 0)
-        waterex[:, 15] = np.maximum(df_xh[:, 1], 0)
-        waterex[:, 16] = np.maximum(df_xh[:, 8], 0)
-        waterex[:, 17] = np.maximum(df_xh[:, 17], 0)
-        waterex[:, 18] = np.maximum(df_xh[:, 30], 0)
-        waterex[:, 19] = np.maximum(df_xh[:, 24], 0)
-        waterex[:, 20] = np.maximum(df_xh[:, 25], 0)
-        waterex[:, 21] = np.maximum(df_xh[:, 22], 0)
-        waterex[:, 22] = np.maximum(df_xh[:, 5], 0)
-        waterex[:, 23] = np.maximum(df_xh[:, 11], 0)
-        waterex[:, 24] = np.maximum(df_xh[:, 3], 0)
-        waterex[:, 25] = np.maximum(df_xh[:, 6], 0)
-        waterex[:, 26] = np.maximum(df_xh[:, 2], 0)
-        waterex[:, 27] = np.maximum(df_xh[:, 15], 0)
-        waterex[:, 28] = np.maximum(df_xh[:, 16], 0)
-        waterex[:, 29] = np.maximum(df_xh[:, 21], 0)
-        waterex[:, 30] = np.maximum(df_xh[:, 14], 0)
-
-        waterex[:, 31] = np.maximum(-df_xh[:, 26], 0)
-        waterex[:, 32] = np.maximum(-df_xh[:, 4], 0)
-        waterex[:, 33] = np.maximum(-df_xh[:, 29], 0)
-        waterex[:, 34] = np.maximum(-df_xh[:, 7], 0)
-        waterex[:, 35] = np.maximum(-df_xh[:, 13], 0)
-        waterex[:, 36] = np.maximum(-df_xh[:, 12], 0)
-        waterex[:, 37] = np.maximum(-df_xh[:, 9], 0)
-        waterex[:, 38] = np.maximum(-df_xh[:, 20], 0)
-        waterex[:, 39] = np.maximum(-df_xh[:, 27], 0)
-        waterex[:, 40] = np.maximum(-df_xh[:, 0], 0)
-        waterex[:, 41] = np.maximum(-df_xh[:, 10], 0)
-        waterex[:, 42] = np.maximum(-df_xh[:, 18], 0)
-        waterex[:, 43] = np.maximum(-df_xh[:, 28], 0)
-        waterex[:, 44] = np.maximum(-df_xh[:, 19], 0)
-        waterex[:, 45] = np.maximum(-df_xh[:, 23], 0)
-        waterex[:, 46] = np.maximum(-df_xh[:, 1], 0)
-        waterex[:, 47] = np.maximum(-df_xh[:, 8], 0)
-        waterex[:, 48] = np.maximum(-df_xh[:, 17], 0)
-        waterex[:, 49] = np.maximum(-df_xh[:, 30], 0)
-        waterex[:, 50] = np.maximum(-df_xh[:, 24], 0)
-        waterex[:, 51] = np.maximum(-df_xh[:, 25], 0)
-        waterex[:, 52] = np.maximum(-df_xh[:, 22], 0)
-        waterex[:, 53] = np.maximum(-df_xh[:, 5], 0)
-        waterex[:, 54] = np.maximum(-df_xh[:, 11], 0)
-        waterex[:, 55] = np.maximum(-df_xh[:, 3], 0)
-        waterex[:, 56] = np.maximum(-df_xh[:, 6], 0)
-        waterex[:, 57] = np.maximum(-df_xh[:, 2], 0)
-        waterex[:, 58] = np.maximum(-df_xh[:, 15], 0)
-        waterex[:, 59] = np.maximum(-df_xh[:, 16], 0)
-        waterex[:, 60] = np.maximum(-df_xh[:, 21], 0)
-        waterex[:, 61] = np.maximum(-df_xh[:, 14], 0)
+        hourly = np.column_stack([columns[col] for col in EXCHANGE_COLUMNS]).astype(np.float64)
+        self.exchange_index = HourlyIndex(hourly[:, EDGE_EXCHANGE_COLUMNS], '水交换')
+
+        # 第 2、3 列分别为汇入 Area15、Area1 的流量
+        columns = self.input_cache.load(self.river_flow_file)
+        names = list(columns)
+        self.river_flow_index = HourlyIndex(np.column_stack([columns[names[1]], columns[names[2]]]), '河流流量')
+
+    def load_exchange_data(self):
+        # 由前缀和索引按时间步长逐段求和；不足一步的尾部舍去并给出警告
+        self.load_hourly_indexes()
+        net = self.exchange_index.step_sums(self.time_step)
 
+        # 各边交换量：每步净通量按方向拆分为正、负两条边
+        waterex = np.maximum(np.concatenate([net, -net], axis=1), 0)
         self.num_time_points = len(waterex)
         self.water_exchange_values = {f'Edge{i + 1}': waterex[:, i] for i in range(len(self.edges))}
 
-    def calculate_water_exchange_matrices(self):
-        # 初始化水交换矩阵
-        self.water_exchange_matrix = np.zeros((self.num_areas, self.num_areas, self.num_time_points))
+    def window_exchange(self, t0, t1):
+        """[t0, t1) 小时窗口内各有向边的交换水量（前缀和相减，O(1)；t0、t1 可为等长数组）"""
+        self.load_hourly_indexes()
+        net = self.exchange_index.sum(t0, t1)
+        return np.maximum(np.concatenate([net, -net], axis=-1), 0)
+
+    def window_river_flow(self, t0, t1):
+        """[t0, t1) 小时窗口内汇入 Area15、Area1 的河流流量"""
+        self.load_hourly_indexes()
+        return self.river_flow_index.sum(t0, t1)
+
+    def with_time_step(self, time_step):
+        """同一逐时记录在另一时间步长下的水交换：各步之和由前缀和索引求出，不重新读取或逐时求和"""
+        self.load_hourly_indexes()
+        derived = copy.copy(self)
+        derived.time_step = time_step
+        derived.outer_sea_tables = {}
+        derived.propagator_buffer = np.zeros((self.num_areas, self.num_areas))
+        derived.build_transport()
+        return derived
+
+    def build_edge_index(self):
         area_index_map = {area: idx for idx, area in enumerate(self.sea_areas)}
         outer_sea_index = self.sea_areas.index('OuterSea')
+        self.edge_from = np.array([area_index_map[area_from] for area_from, _ in self.edges.values()], dtype=np.intp)
+        self.edge_to = np.array([area_index_map[area_to] for _, area_to in self.edges.values()], dtype=np.intp)
 
-        # 构建水交换矩阵
-        for edge_name, (area_from, area_to) in self.edges.items():
-            index_from = area_index_map[area_from]
-            index_to = area_index_map[area_to]
-            edge_data = self.water_exchange_values[edge_name]
+        self.outer_sea_index = outer_sea_index
 
-            # 赋值给水交换矩阵
-            self.water_exchange_matrix[index_from, index_to, :] = edge_data
+        # 传播子在展平 (21, 21) 矩阵中的边与对角线位置，exchange_batch 每步就地填入复用的矩阵
+        self.edge_flat_index = self.edge_from * self.num_areas + self.edge_to
+        self.diagonal_flat_index = np.arange(self.num_areas) * (self.num_areas + 1)
+        self.propagator_buffer = np.zeros((self.num_areas, self.num_areas))
 
-        # 保证质量守恒，设置对角线
-        for t in range(self.num_time_points):
-            for i in range(self.num_areas):
-                if i == outer_sea_index:
-                    continue  # 不对 OuterSea 行设置守恒
-                self.water_exchange_matrix[i, i, t] = -np.sum(self.water_exchange_matrix[i, :, t])
+        # 输运核的系数列表：各有向边之后接 21 条自环（对角线），与 transport_coefficients 的列一一对应
+        self.coefficient_from = np.concatenate([self.edge_from, np.arange(self.num_areas)])
+        self.coefficient_to = np.concatenate([self.edge_to, np.arange(self.num_areas)])
 
-        self.water_exchange_matrix *= 0.5
+        # 外海边界相关的边，供 outer_sea_fluxes 使用
+        self.edges_to_outer = np.flatnonzero(self.edge_to == outer_sea_index)
+        self.edges_from_outer = np.flatnonzero(self.edge_from == outer_sea_index)
 
-        return self.water_exchange_matrix
+    def calculate_water_exchange_matrices(self):
+        # 稀疏边列表表示：只存储 62 条有向边的通量 (T, n_edges)，内存随 边数×时间 增长
+        outer_sea_index = self.sea_areas.index('OuterSea')
+        num_edges = len(self.edges)
+        self.transport_coefficients = np.empty((self.num_time_points, num_edges + self.num_areas))
+        self.edge_flux = self.transport_coefficients[:, :num_edges]
+        self.diagonal = self.transport_coefficients[:, num_edges:]
+        self.edge_flux[:] = 0.5 * np.column_stack([self.water_exchange_values[name] for name in self.edges])
+
+        # 保证质量守恒，设置对角线：对所有时间步一次性 bincount 出各区域流出量（OuterSea 行不设置）
+        rows = (np.arange(self.num_time_points)[:, None] * self.num_areas + self.edge_from).ravel()
+        outflow = np.bincount(rows, weights=self.edge_flux.ravel(), minlength=self.num_time_points * self.num_areas)
+        self.diagonal[:] = -outflow.reshape(self.num_time_points, self.num_areas)
+        self.diagonal[:, outer_sea_index] = 0.0
+
+        return self.edge_flux
+
+    def net_exchange(self, current_time_step):
+        # 某一时间步各区域净交换量（原稠密矩阵按列求和）：对角线 + 流入该区域的边通量
+        inflow = np.bincount(self.edge_to, weights=self.edge_flux[current_time_step], minlength=self.num_areas)
+        return self.diagonal[current_time_step] + inflow
+
+    def transport(self, conc, current_time_step):
+        # 稀疏 gather/scatter 输运核：等价于 稠密矩阵 @ conc；对角线作为自环并入边列表，一次 bincount 完成
+        weighted = self.transport_coefficients[current_time_step] * conc[self.coefficient_to]
+        return np.bincount(self.coefficient_from, weights=weighted, minlength=self.num_areas)
+
+    def outer_sea_fluxes(self, current_time_step):
+        # 返回 (各区域流向外海的通量, 外海流入各区域的通量)，长度均为区域数（不含外海）
+        outer_sea_index = self.sea_areas.index('OuterSea')
+        flux = self.edge_flux[current_time_step]
+        flux_to_outer = np.bincount(self.edge_from[self.edges_to_outer], weights=flux[self.edges_to_outer],
+                                    minlength=self.num_areas)
+        flux_from_outer = np.bincount(self.edge_to[self.edges_from_outer], weights=flux[self.edges_from_outer],
+                                      minlength=self.num_areas)
+        return flux_to_outer[:outer_sea_index], flux_from_outer[:outer_sea_index]
 
     def load_river_flows(self):
-        # 读取流域流量输入数据
-        df_river = pd.read_csv(self.river_flow_file)
-        return df_river
+        # 每步河流流量 (T, 2)：汇入 Area15、Area1；与水交换数据一致，由前缀和索引按时间步长逐段求和
+        self.load_hourly_indexes()
+        return self.river_flow_index.step_sums(self.time_step)
+
+    def calculate_volume_table(self):
+        # 一次性计算所有时间步的水量：初始水量 + 净交换量 + 河流入流（Area15、Area1）
+        cols = (np.arange(self.num_time_points)[:, None] * self.num_areas + self.edge_to).ravel()
+        inflow = np.bincount(cols, weights=self.edge_flux.ravel(), minlength=self.num_time_points * self.num_areas)
+        water_volume_all = self.diagonal + inflow.reshape(self.num_time_points, self.num_areas)
+        num_steps = min(len(water_volume_all), len(self.river_flow))
+        river_flow = self.river_flow[:num_steps]
+        water_volume = water_volume_all[:num_steps].copy()
+        water_volume[:, 14] += river_flow[:, 0]
+        water_volume[:, 0] += river_flow[:, 1]
+        self.volume_table = self.V + water_volume
+        self.volume_table.flags.writeable = False  # 返回的是行视图，防止被调用方修改
+
+        # 第 0 步的“上一步”水量（t = -1）：与原实现一致，交换数据与河流数据各自从末尾回绕
+        water_volume = self.net_exchange(-1)
+        water_volume[14] += self.river_flow[-1, 0]
+        water_volume[0] += self.river_flow[-1, 1]
+        self.volume_before_start = self.V + water_volume
+        return self.volume_table
 
     def calculate_volume(self, current_time_step=0):
-        water_volume_all = np.sum(self.water_exchange_matrix, axis=0).T
-        water_volume = water_volume_all[current_time_step, :]
-        river_flow = self.river_flow_data.iloc[current_time_step, :]
-        water_volume[14] += river_flow.iloc[1]
-        water_volume[0] += river_flow.iloc[2]
-        water_volume_real = self.V + water_volume
-        return water_volume_real
+        # O(1) 查表，返回 (21,) 只读行视图
+        if current_time_step == -1:
+            return self.volume_before_start
+        return self.volume_table[current_time_step]
+
+    def calculate_propagators(self):
+        # 逐步输运传播子 P_t = (diag(V_{t-1}) + M_t) / V_t，使 C_t = P_t @ C_{t-1}
+        # 以稀疏形式存储：对角线 (T, 21) 与各边系数 (T, n_edges)
+        num_steps = len(self.volume_table)
+        V_array_old = np.vstack([self.volume_before_start, self.volume_table[:-1]])
+        V_array_new = self.volume_table
+        self.propagator_diagonal = (V_array_old + self.diagonal[:num_steps]) / V_array_new
+        self.propagator_edges = self.edge_flux[:num_steps] / V_array_new[:, self.edge_from]
+        return self.propagator_diagonal, self.propagator_edges
+
+    def transport_cache_key(self):
+        # 缓存键：水交换与河流流量文件内容、初始水量、时间步长及缓存格式版本
+        digest = hashlib.sha256()
+        for path in (self.exchange_data_file, self.river_flow_file):
+            digest.update(self.input_cache.digest(path).encode())
+        digest.update(np.ascontiguousarray(self.V, dtype=np.float64).tobytes())
+        digest.update(f"time_step={self.time_step};edges={len(self.edges)};version={TRANSPORT_CACHE_VERSION}".encode())
+        return digest.hexdigest()[:32]
+
+    def transport_cache_path(self):
+        return os.path.join(self.cache_dir, f"transport_{self.transport_cache_key()}")
+
+    def load_transport_cache(self):
+        # 以只读内存映射方式加载输运缓存；未启用缓存或缓存不存在时返回 False
+        if self.cache_dir is None:
+            return False
+        path = self.transport_cache_path()
+        if not os.path.isdir(path):
+            return False
+        for name in TRANSPORT_CACHE_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        self.volume_before_start = np.array(self.volume_before_start)
+        self.edge_flux = self.transport_coefficients[:, :len(self.edges)]
+        self.diagonal = self.transport_coefficients[:, len(self.edges):]
+        self.num_time_points = len(self.edge_flux)
+        return True
+
+    def save_transport_cache(self):
+        # 先写入临时目录再整体重命名，多个进程同时生成时只保留先完成的一份
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.transport_cache_path()
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_transport_')
+        try:
+            for name in TRANSPORT_CACHE_ARRAYS:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+            os.rename(tmp_path, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
 
     def load_outer_sea_concentrations(self):
-        # 读取外海浓度数据
-        df = pd.read_csv(self.outer_sea_conc_file)
-        substances = [col for col in df.columns if col != 'Time']
-        return {substance: df[substance].values for substance in substances}
-
-    def exchange(self, concentrations, current_time_step):
+        # 读取外海浓度数据（经二进制列缓存）
+        columns = self.input_cache.load(self.outer_sea_conc_file)
+        substances = [col for col in columns if col != 'Time']
+        return {substance: columns[substance] for substance in substances}
+
+    def outer_sea_boundary(self, substances, current_time_step):
+        # 当前步外海浓度（已乘外海缩放系数），取该步起始小时的一行，超限则取最后一行
+        key = tuple(substances)
+        table = self.outer_sea_tables.get(key)
+        if table is None:
+            # 按物质组合缓存缩放后的外海浓度表 (T_outer, n_substances)，较短的序列用末值补齐
+            columns = [np.asarray(self.outer_sea_concentrations.get(sub, [0.0]), dtype=np.float64) for sub in substances]
+            length = max(len(col) for col in columns)
+            table = np.column_stack([np.concatenate([col, np.full(length - len(col), col[-1])]) for col in columns])
+            table *= np.array([self.outer_sea_scaling.get(sub, 1.0) for sub in substances])
+            self.outer_sea_tables[key] = table
+        return table[min(current_time_step * self.time_step, len(table) - 1)]
+
+    def step_matrix(self, time_index):
+        # 由边列表组装该时间步的稠密 (21, 21) 输运矩阵
+        matrix = np.zeros((self.num_areas, self.num_areas))
+        matrix[self.edge_from, self.edge_to] = self.edge_flux[time_index]
+        matrix[np.diag_indices(self.num_areas)] = self.diagonal[time_index]
+        return matrix
+
+    def step_propagator(self, time_index, out=None):
+        # 由稀疏传播子组装该时间步的稠密 (21, 21) 矩阵 P_t；给定 out 时就地写入（非边位置须已为 0）
+        propagator = np.zeros((self.num_areas, self.num_areas)) if out is None else out
+        propagator.put(self.edge_flat_index, self.propagator_edges[time_index])
+        propagator.put(self.diagonal_flat_index, self.propagator_diagonal[time_index])
+        return propagator
+
+    def exchange_batch(self, C, current_time_step, substances=None, ledger=None):
+        """批量输运：C 为 (区域数+1, 物质数) 浓度矩阵，所有物质共用一次矩阵乘法。
+
+        给定 substances 时，OuterSea 行按外海浓度（含缩放）固定；否则沿用 C 中的 OuterSea 行。
+        给定 ledger（TransportLedger，物质顺序须与 substances 一致）时，同时累计本步各边搬运的质量。
+        返回新的 (区域数+1, 物质数) 数组。
+        """
         if current_time_step >= self.num_time_points:
             raise ValueError("时间步超出可用范围。")
-
-        current_matrix = self.water_exchange_matrix[:, :, current_time_step]
-        V_array_old = self.calculate_volume(current_time_step - 1)
-        V_array_new = self.calculate_volume(current_time_step)
-        outer_sea_index = self.sea_areas.index('OuterSea')
-        # current_matrix[outer_sea_index, :] = 0.0
-        updated_concentrations = {}
-
-        # 获取当前步外海浓度（按步长索引，如果超限则取最后）
-        outer_sea_current_conc = {}
-        for sub in concentrations.keys():
-            raw_conc = self.outer_sea_concentrations.get(sub, [0.0])
-            conc_value = raw_conc[min(current_time_step, len(raw_conc) - 1)]
-            scale = self.outer_sea_scaling.get(sub, 1.0)
-            outer_sea_current_conc[sub] = conc_value * scale
-        # outer_sea_current_conc = {
-        #     sub: self.outer_sea_concentrations.get(sub, [0.0])[
-        #         min(current_time_step, len(self.outer_sea_concentrations.get(sub, [0.0])) - 1)]
-        #     for sub in concentrations.keys()
-        # }
-
-        for substance, conc in concentrations.items():
-            conc_array = np.array(conc, dtype=np.float64)
-            if len(conc_array) == len(self.sea_areas) - 1:
-                conc_array = np.append(conc_array, outer_sea_current_conc[substance])
-
-            # new_conc = fast_exchange_step(
-            #     current_matrix,
-            #     conc_array.copy(),
-            #     V_array_old,
-            #     V_array_new,
-            #     outer_sea_index,
-            #     outer_sea_current_conc[substance]
-            # )
-
-            # 确保 OuterSea 的浓度固定
-            conc_array[outer_sea_index] = outer_sea_current_conc[substance]
-
-            # 总质量守恒公式：质量转移 + 稀释调整
-            exchanged_mass = np.dot(current_matrix, conc_array)
-            new_conc = (conc_array * V_array_old + exchanged_mass) / V_array_new
-            new_conc[outer_sea_index] = outer_sea_current_conc[substance]  # OuterSea 保持恒定
-
-            updated_concentrations[substance] = new_conc.tolist()
-
-        return updated_concentrations
+        C = np.asarray(C, dtype=np.float64)
+        if C.ndim != 2 or C.shape[0] != self.num_areas:
+            raise ValueError(f"浓度矩阵形状应为 ({self.num_areas}, 物质数)，实际为 {C.shape}。")
+
+        outer_sea_index = self.outer_sea_index
+        if substances is not None:
+            C = C.copy()
+            C[outer_sea_index] = self.outer_sea_boundary(substances, current_time_step)
+        if ledger is not None:
+            if list(substances or ()) != ledger.substances:
+                raise ValueError(f"物质 {substances} 与输运质量账户的物质 {ledger.substances} 不一致。")
+            ledger.accumulate(self.edge_flux[current_time_step], C)
+
+        # 总质量守恒公式：质量转移 + 稀释调整，合并为预计算的传播子（一次 GEMM 覆盖全部物质）
+        # 传播子填入复用的矩阵，避免每步分配并清零 (21, 21) 数组
+        new_C = self.step_propagator(current_time_step, out=self.propagator_buffer) @ C
+        new_C[outer_sea_index] = C[outer_sea_index]  # OuterSea 保持恒定
+        return new_C
+
+    def exchange(self, concentrations, current_time_step, ledger=None):
+        # 字典接口：{物质: 各区域浓度}，内部堆叠为矩阵后调用 exchange_batch，返回 {物质: ndarray}
+        # 按行填入 (物质数, 21) 数组再转置传入，逐行写入比逐列写入更省
+        substances = list(concentrations)
+        C = np.empty((len(substances), self.num_areas))
+        for j, sub in enumerate(substances):
+            conc = concentrations[sub]
+            if len(conc) not in (self.num_areas - 1, self.num_areas):
+                raise ValueError(f"{sub} 浓度长度应为 {self.num_areas - 1} 或 {self.num_areas}，实际为 {len(conc)}。")
+            C[j, :len(conc)] = conc
+        new_C = self.exchange_batch(C.T, current_time_step, substances, ledger)
+        return dict(zip(substances, new_C.T))
 
     def get_water_exchange_matrix(self, t):
         # 获取某个时间步长的水交换矩阵
@@ -623,13 +1168,189 @@ class WaterExchange:
         if time_index >= self.num_time_points:
             raise ValueError("错误: 超出可用的时间范围。")
 
-        return self.water_exchange_matrix[:, :, time_index]
+        return self.step_matrix(time_index)
+
+class ComputationGraph:
+    """Derived quantities of one model component, evaluated lazily from declared inputs.
+
+    Sources are plain values stored with set(name, value). Derived nodes are
+    declared with define(name, function, inputs), where inputs name sources or
+    other nodes and are passed to function in that order. A node is evaluated
+    on first access and reused until one of its inputs is set again, which
+    drops it and everything downstream; nodes defined with refresh=False keep
+    their first value until invalidate(name). hits and misses count reuses and
+    evaluations per node.
+    """
+    def __init__(self):
+        self.sources = {}
+        self.nodes = {}  # name -> (function, inputs, refresh)
+        self.dependents = defaultdict(list)  # input -> nodes reading it
+        self.values = {}
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def define(self, name, function, inputs=(), refresh=True):
+        self.nodes[name] = (function, tuple(inputs), refresh)
+        for source in inputs:
+            self.dependents[source].append(name)
+
+    def set(self, name, value):
+        self.sources[name] = value
+        self.invalidate(name, dependents_only=True)
+
+    def hold(self, name, value):
+        """Use value for a derived node until its inputs are set again (drops what depends on it)."""
+        self.values[name] = value
+        self.invalidate(name, dependents_only=True)
+
+    def invalidate(self, name, dependents_only=False):
+        """Drop a node (or only what depends on it) and everything downstream."""
+        stack = list(self.dependents[name]) if dependents_only else [name]
+        while stack:
+            node = stack.pop()
+            if node in self.values and (self.nodes[node][2] or node == name):
+                del self.values[node]
+                stack.extend(self.dependents[node])
+
+    def __getitem__(self, name):
+        if name in self.values:
+            self.hits[name] += 1
+            return self.values[name]
+        if name in self.sources:
+            return self.sources[name]
+        function, inputs, _ = self.nodes[name]
+        self.misses[name] += 1
+        value = self.values[name] = function(*[self[source] for source in inputs])
+        return value
+
+    def statistics(self):
+        """{node: (hits, misses)} for every node evaluated so far."""
+        return {name: (self.hits[name], self.misses[name]) for name in self.nodes if self.misses[name]}
+
+class GraphInput:
+    """Component attribute stored as a source of the component's ComputationGraph (assigning it invalidates)."""
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.graph.sources[self.name]
+
+    def __set__(self, instance, value):
+        instance.graph.set(self.name, value)
+
+class DerivedQuantity:
+    """Method declared with @derived: calling it reads the node of the same name from the instance's graph."""
+    def __init__(self, function, inputs, refresh):
+        self.function, self.inputs, self.refresh = function, inputs, refresh
+        self.__doc__ = function.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return functools.partial(instance.graph.__getitem__, self.name)
+
+def derived(*inputs, refresh=True):
+    """Declare a method as a derived quantity computed from inputs (sources or other derived quantities)."""
+    return lambda function: DerivedQuantity(function, inputs, refresh)
+
+def build_graph(component):
+    """Create component.graph with a node for every @derived method of its class (overrides excluded)."""
+    graph = ComputationGraph()
+    cls = type(component)
+    for name in dir(cls):
+        quantity = getattr(cls, name)
+        if isinstance(quantity, DerivedQuantity):
+            graph.define(name, functools.partial(quantity.function, component), quantity.inputs, quantity.refresh)
+    return graph
+
+class EnvironmentFactors:
+    """Temperature, light, salinity and reaeration factors of one step, shared by every process.
+
+    update() reads T, I, S and H from the shared state once per step and
+    fills factors with (zones,) arrays keyed by name (environment['theta_20'],
+    environment['arrhenius_fish'], ...). theta(coefficient, T_ref) is the
+    per-step lookup table of coefficient ** (T - T_ref): each distinct pair is
+    evaluated once however many processes use it, and the Arrhenius
+    corrections of all DEB_SPECIES rows come from one DEBEngine call.
+    """
+    def __init__(self, parameter_loader):
+        self.parameter_loader = parameter_loader
+        constant = lambda name: self.get_parameter(name)[0]
+        self.K_T = constant('K_T')
+        self.T_opt = constant('T_opt')
+        self.KE_P = constant('K_E')
+        self.KE_MA = 0.00  # 大型藻类对浮游植物光衰减的贡献（原实现取 0）
+        self.S_opt = constant('S_opt')
+        self.kappa_1_S = constant('kappa_1_MA_S')
+        self.kappa_2_S = constant('kappa_2_MA_S')
+        self.deb = DEBEngine(parameter_loader, list(DEB_SPECIES))
+        n = len(self.get_parameter('V'))
+        velocity = np.asarray(self.get_parameter('v'), dtype=np.float64)[:n]
+        self.velocity = np.pad(velocity, (0, n - len(velocity)), mode='edge')  # 流速序列短于海区数时沿用末值
+        self.theta_table = {}
+        self.factors = {}
+        self.update()
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def __getitem__(self, name):
+        return self.factors[name]
+
+    def theta(self, coefficient, T_ref):
+        """Temperature correction coefficient ** (T - T_ref), tabulated per step."""
+        key = (coefficient, T_ref)
+        if key not in self.theta_table:
+            self.theta_table[key] = coefficient ** (self.T - T_ref)
+        return self.theta_table[key]
+
+    def update(self):
+        """Re-evaluate every factor from the current state (once per step)."""
+        get = self.parameter_loader.get_parameter
+        self.T, self.I, self.S, self.H = get('T'), get('I'), get('S'), get('H')
+        self.theta_table = {}
+        factors = self.factors
+        factors['theta_20'] = self.theta(self.K_T, 20)
+        factors['theta_opt'] = self.theta(self.K_T, self.T_opt)
+
+        # 温度：浮游植物按 theta 校正，大型藻类为 logistic，DEB 为 Arrhenius（各物种一行）
+        factors['phy_temperature'] = factors['theta_opt']
+        factors['ma_temperature'] = 1 / (1 + np.exp(-self.K_T * (self.T - self.T_opt) / 1.5))
+        arrhenius = self.deb.temperature_effect(self.T + 273.15)
+        for row, species in enumerate(self.deb.species):
+            factors[f'arrhenius_{species}'] = arrhenius[row]
+
+        # 光照：水柱半深处（不超过 5 m）的浮游植物光限制
+        MA, A, V = get('MA'), get('A'), get('V')
+        KE = self.KE_P + self.KE_MA * np.sum(MA) * (np.sum(A) / np.sum(V))
+        light_factor = (self.I / 1200000) * np.exp(-KE * np.minimum(self.H / 2, 5))
+        factors['phy_light'] = light_factor * np.exp(1 - light_factor)
+
+        # 盐度：大型藻类分段高斯限制
+        dS = self.S - self.S_opt
+        factors['ma_salinity'] = np.where(self.S <= self.S_opt, np.exp(-self.kappa_1_S * dS ** 2),
+                                          np.exp(-self.kappa_2_S * dS ** 2))
+
+        # 复氧：饱和溶解氧与 O'Connor-Dobbins 复氧系数（逐时）
+        factors['oxygen_saturation'] = 14.621 * np.exp(-0.0134 * self.T) / (1 + 0.028 * self.S)
+        factors['reaeration'] = (3.93 * self.velocity ** 0.5 / np.minimum(5, self.H) ** 1.5) / 24 * \
+            self.theta(1.024, 20)
+        return self
 
 class Phytoplankton:
-    def __init__(self, parameter_loader):
+    NH4, NO3, PO4, PHY = GraphInput(), GraphInput(), GraphInput(), GraphInput()
+
+    def __init__(self, parameter_loader, environment=None):
         self.parameter_loader = parameter_loader
+        self.environment = EnvironmentFactors(parameter_loader) if environment is None else environment
+        self.owns_environment = environment is None  # 独立使用时自行刷新环境因子，模拟中由 Simulation 每步统一刷新
+        self.graph = build_graph(self)  # 派生量按声明的输入惰性计算，输入变化时自动失效
         self.reload_parameters()
-        self.cache = {}  # Cache for computed values
 
         # Growth-related constants from the 'Phytoplankton' tab
         self.KC_PHY = self.get_parameter('KC_PHY')[0]  # Scalar value
@@ -638,7 +1359,6 @@ class Phytoplankton:
         self.F_PO4 = self.get_parameter('F_PO4')[0]
         self.KT = self.get_parameter('K_T')[0]
         self.T_opt = self.get_parameter('T_opt')[0]
-        self.KE_P = self.get_parameter('K_E')[0]
         self.kappa_1 = self.get_parameter('kappa_1_PHY')[0]
         self.kappa_2 = self.get_parameter('kappa_2_PHY')[0]
         self.I_s = self.get_parameter('I_s')[0]
@@ -649,12 +1369,14 @@ class Phytoplankton:
         self.M_max_PHY = self.get_parameter('M_max_PHY')[0]
         self.K_PHY = self.get_parameter('K_PHY')[0]
         self.KR_T = self.get_parameter('K_T')[0]
-        self.KE_MA = 0.00
 
     def get_parameter(self, name):
         return self.parameter_loader.get_parameter(name)
 
     def reload_parameters(self):
+        if self.owns_environment:
+            self.environment.update()
+        self.graph.set('environment', self.environment)  # 本步环境因子已刷新
         get = self.parameter_loader.get_parameter
         self.T = get('T')
         self.I = get('I')
@@ -667,140 +1389,73 @@ class Phytoplankton:
         self.PO4 = get('PO4')
         self.MA = get('MA')
 
-    def nutrient_limitation(self):
-        NH4_NO3 = [max(nh4 + no3, 0) for nh4, no3 in zip(self.NH4, self.NO3)]
-        X_N = [min((nh4_no3) / (self.KN_PHY + nh4_no3), 1) for nh4_no3 in NH4_NO3]
-        PO4_non_neg = [max(po4, 0) for po4 in self.PO4]
-        X_P = [min(po4 / (self.KP_PHY / self.F_PO4 + po4), 1) for po4 in PO4_non_neg]
-        result = [min(max(min(xn, xp), 0), 1) for xn, xp in zip(X_N, X_P)]
-        self.cache['nutrient_limitation'] = result
-        return result
-
-    def temperature_limitation(self, method=1):
-        if 'temperature_limitation' in self.cache:
-            return self.cache['temperature_limitation']
-        if method == 1:
-            result = [self.KT ** (t - self.T_opt) for t in self.T]
-        else:
-            result = [math.exp(-self.kappa_1 * (t - self.T_opt) ** 2) if t <= self.T_opt
-                      else math.exp(-self.kappa_2 * (t - self.T_opt) ** 2) for t in self.T]
-        self.cache['temperature_limitation'] = result
-        return result
-
-    def light_limitation(self):
-        if 'light_limitation' in self.cache:
-            return self.cache['light_limitation']
-
-        KE = self.KE_P + self.KE_MA * sum(self.MA) * (sum(self.A) / sum(self.V))
-
-        # Adjust the h/2 value with the limit (Assume 5m is a reasonable limit)
-        adjusted_h = [min(h / 2, 5) for h in self.H]
-
-        # Calculate the light factor with the adjusted h values
-        light_factor = [(i / 1200000) * math.exp(-KE * adj_h) for i, adj_h in zip(self.I, adjusted_h)]
-
-        # Calculate the result and multiply by 2/adjusted_h
-        result = [lf * math.exp(1 - lf) for lf in light_factor]
-
-        self.cache['light_limitation'] = result
-
-        return result
-
-    def growth_rate(self):
-        phi_N_PHY = self.nutrient_limitation()
-        phi_T_PHY = self.temperature_limitation()
-        phi_L_PHY = self.light_limitation()
-
-        GP_PHY = [self.KC_PHY * min(pn, 1) * min(pt, 1) * min(pl, 1) for pn, pt, pl in
-                  zip(phi_N_PHY, phi_T_PHY, phi_L_PHY)]
-        result = [max(gp, 0) * phy for gp, phy in zip(GP_PHY, self.PHY)]
-        self.cache['growth_rate'] = result
-
-        return GP_PHY
-
-    def loss_rate(self):
-        """
-        Dynamically selects the best `loss_rate` calculation method for each region (each index),
-        based on the closest match to `growth_rate` at that index.
-        """
-        # Check if the result is already cached
-        if 'loss_rate' in self.cache and 'loss_rate_method' in self.cache:
-            return self.cache['loss_rate']
-
-        # Compute `growth_rate` for all regions
-        growth_rate = self.growth_rate()
-
+    @derived('NH4', 'NO3', 'PO4')
+    def nutrient_limitation(self, NH4, NO3, PO4):
+        NH4_NO3 = np.maximum(NH4 + NO3, 0)
+        X_N = np.minimum(NH4_NO3 / (self.KN_PHY + NH4_NO3), 1)
+        PO4_non_neg = np.maximum(PO4, 0)
+        X_P = np.minimum(PO4_non_neg / (self.KP_PHY / self.F_PO4 + PO4_non_neg), 1)
+        return np.clip(np.minimum(X_N, X_P), 0, 1)
+
+    @derived('environment')
+    def temperature_limitation(self, environment):
+        return environment.theta(self.KT, self.T_opt)
+
+    def gaussian_temperature_limitation(self):
+        """Alternative two-sided Gaussian temperature limitation (kappa_1 below T_opt, kappa_2 above)."""
+        dT = self.T - self.T_opt
+        return np.where(self.T <= self.T_opt, np.exp(-self.kappa_1 * dT ** 2), np.exp(-self.kappa_2 * dT ** 2))
+
+    @derived('environment')
+    def light_limitation(self, environment):
+        # Light factor at half depth (at most 5 m), shared through EnvironmentFactors
+        return environment['phy_light']
+
+    @derived('nutrient_limitation', 'temperature_limitation', 'light_limitation')
+    def growth_rate(self, phi_N_PHY, phi_T_PHY, phi_L_PHY):
+        """Specific growth rate GP_PHY (growth flux is GP_PHY * PHY)."""
+        return self.KC_PHY * np.minimum(phi_N_PHY, 1) * np.minimum(phi_T_PHY, 1) * np.minimum(phi_L_PHY, 1)
+
+    @derived('PHY', 'environment')
+    def loss_rates(self, PHY, environment):
+        """Specific loss rates of the simple and detailed methods."""
         # Pre-calculate RES_PHY (common to both methods)
-        RES_PHY = [self.KR_PHY * (self.KR_T ** (t - self.T_opt)) for t in self.T]
+        RES_PHY = self.KR_PHY * environment.theta(self.KR_T, self.T_opt)
 
         # Method 1: Simple
-        DPP_PHY_simple = self.KD_PHY
-        DP_PHY_simple = [res + DPP_PHY_simple for res in RES_PHY]
-        loss_rate_simple = [dp * phy for dp, phy in zip(DP_PHY_simple, self.PHY)]
+        DP_PHY_simple = RES_PHY + self.KD_PHY
 
         # Method 2: Detailed
-        DPP_PHY_detailed = [
-            self.KD_PHY + self.M_max_PHY / (1 + (self.K_PHY / max(phy, 1e-12)) ** (self.KC_PHY * 11)) for phy in self.PHY
-        ]
-        DP_PHY_detailed = [res + dpp for res, dpp in zip(RES_PHY, DPP_PHY_detailed)]
-        loss_rate_detailed = [dp * phy for dp, phy in zip(DP_PHY_detailed, self.PHY)]
-
-        # Initialize results and method tracking
-        selected_loss_rate = []
-        selected_methods = []
-
-        # Compare `growth_rate[i]` with `loss_rate_simple[i]` and `loss_rate_detailed[i]` for each region
-        for i in range(len(growth_rate)):
-            diff_simple = abs(loss_rate_simple[i] - growth_rate[i])
-            diff_detailed = abs(loss_rate_detailed[i] - growth_rate[i])
-
-            if diff_simple <= diff_detailed:
-                selected_loss_rate.append(loss_rate_simple[i])
-                selected_methods.append('simple')
-            else:
-                selected_loss_rate.append(loss_rate_detailed[i])
-                selected_methods.append('detailed')
-
-        # Cache the result and the selected methods for each region
-        self.cache['loss_rate'] = selected_loss_rate
-        self.cache['loss_rate_method'] = selected_methods
-
-        return DP_PHY_detailed
-
-    def update_PHY(self, GRZ, GRS_PHY):
-        GPP = self.growth_rate()
-        DPP = self.loss_rate()
-        adjusted_h = [min(h / 2, 5) for h in self.H]
-
-        dPHY_dt = [(gpp - dpp - grz - grs) * 2 * adj_h / h for gpp, dpp, grz, grs, adj_h, h in zip(GPP, DPP, GRZ, GRS_PHY, adjusted_h, self.H)]
+        DPP_PHY_detailed = self.KD_PHY + self.M_max_PHY / (1 + (self.K_PHY / np.maximum(PHY, 1e-12)) ** (self.KC_PHY * 11))
+        DP_PHY_detailed = RES_PHY + DPP_PHY_detailed
+        return DP_PHY_simple, DP_PHY_detailed
 
-        # Debugging
-        i = 4
-        print(f'zone {i+1}')
+    @derived('loss_rates')
+    def loss_rate(self, loss_rates):
+        """Specific loss rate of the detailed method."""
+        return loss_rates[1]
 
-        change = abs(GPP[i]) + abs(DPP[i]) + abs(GRZ[i]) + abs(GRS_PHY[i])
-        print(f"dPHY_dt: {dPHY_dt[i]}; change: {change}; GPP: {GPP[i] / change}; DPP: {DPP[i] / change}; GRZ: {GRZ[i] / change}; GRS_PHY: {GRS_PHY[i] / change}")
-
-        # print(f'GPP:{GPP}')
-        # print(f'DPP:{DPP}')
-
-        dPHY_dt = np.real_if_close(dPHY_dt, tol=1e-9)
-
-        self.PHY =[phy + dphy for phy, dphy in zip(self.PHY, dPHY_dt)]
-
-        self.PHY = [max(phy, 1e-12) for phy in self.PHY]
-
-        return self.PHY
+    @derived('loss_rates', 'growth_rate', 'PHY')
+    def loss_rate_selection(self, loss_rates, growth_rate, PHY):
+        """
+        Per region, the loss flux of the method whose loss is closest to `growth_rate`, and the
+        method names ('simple' / 'detailed').
+        """
+        loss_rate_simple = loss_rates[0] * PHY
+        loss_rate_detailed = loss_rates[1] * PHY
+        use_simple = np.abs(loss_rate_simple - growth_rate) <= np.abs(loss_rate_detailed - growth_rate)
+        return np.where(use_simple, loss_rate_simple, loss_rate_detailed), np.where(use_simple, 'simple', 'detailed')
 
-    def reset_cache(self):
-        """resets the cache"""
-        self.cache.clear()
+    def loss_rate_method(self):
+        return self.loss_rate_selection()[1]
 
 class Zooplankton:
+    PHY, ZOO = GraphInput(), GraphInput()
+
     def __init__(self, parameter_loader):
         self.parameter_loader = parameter_loader
+        self.graph = build_graph(self)
         self.reload_parameters()
-        self.cache = {}  # Cache for computed values
 
         # Grazing-related constants from the 'Zooplankton' tab
         self.EFF = self.get_parameter('EFF')[0]  # Grazing efficiency
@@ -816,62 +1471,30 @@ class Zooplankton:
         self.PHY = get("PHY")
         self.ZOO = get("ZOO")
 
-    def grazing_rate(self):
+    @derived('PHY')
+    def grazing_rate(self, PHY):
         """Calculate the grazing rate of zooplankton."""
-        if 'grazing_rate' in self.cache:
-            return self.cache['grazing_rate']
-
-        grazing_rate = [self.K_GRZ * (phy / (phy + self.K_PZ)) for phy in self.PHY]
-
-        self.cache['grazing_rate'] = grazing_rate
-
-        return grazing_rate
+        return self.K_GRZ * (PHY / (PHY + self.K_PZ))
 
-    def growth_rate(self):
+    @derived('grazing_rate')
+    def growth_rate(self, GRZ):
         """Calculate the growth rate of zooplankton based on grazing efficiency."""
-        if 'growth_rate' in self.cache:
-            return self.cache['growth_rate']
-
-        GRZ = self.grazing_rate()
-        growth_rate = [self.EFF * grz for grz in GRZ]
-        self.cache['growth_rate'] = growth_rate
-        return growth_rate
-
-    def loss_rate(self):
-        """Calculate the loss rate of zooplankton (death rate)."""
-        if 'loss_rate' in self.cache:
-            return self.cache['loss_rate']
-
-        loss_rate = [self.K_DZ * zoo for zoo in self.ZOO]
-        self.cache['loss_rate'] = loss_rate
-        return [loss_rate/zoo for loss_rate, zoo in zip(loss_rate, self.ZOO)]
+        return self.EFF * GRZ
 
-    def update_ZOO(self):
-        """Update the zooplankton population based on growth and loss rates."""
-        if 'update_ZOO' in self.cache:
-            return self.cache['update_ZOO']
-
-        GZ = self.growth_rate()
-        DZ = self.loss_rate()
-        dZOO_dt = [gz - dz for gz, dz in zip(GZ, DZ)]
-        self.ZOO = [zoo + dzoo for zoo, dzoo in zip(self.ZOO, dZOO_dt)]
-
-        i = 4
-        change = abs(GZ[i]) + abs(DZ[i])
-        print(f"dZOO_dt: {dZOO_dt[i]}; change: {change}; GZ: {GZ[i] / change}; DZ: {DZ[i] / change}")
-
-        self.cache['update_ZOO'] = self.ZOO
-        return self.ZOO
-
-    def reset_cache(self):
-        """Reset the cache"""
-        self.cache.clear()
+    @derived('ZOO')
+    def loss_rate(self, ZOO):
+        """Calculate the specific loss rate of zooplankton (death rate)."""
+        return self.K_DZ * ZOO / ZOO
 
 class Macroalgal:
-    def __init__(self, parameter_loader):
+    MA, q_N, q_P, NH4, NO3, PO4 = GraphInput(), GraphInput(), GraphInput(), GraphInput(), GraphInput(), GraphInput()
+
+    def __init__(self, parameter_loader, environment=None):
         self.parameter_loader = parameter_loader
+        self.environment = EnvironmentFactors(parameter_loader) if environment is None else environment
+        self.owns_environment = environment is None  # 独立使用时自行刷新环境因子，模拟中由 Simulation 每步统一刷新
+        self.graph = build_graph(self)
         self.reload_parameters()
-        self.cache = {}  # Cache for computed values
 
         # Growth-related constants
         self.KC_MA = self.get_parameter('KC_MA')[0]  # Constant growth rate
@@ -903,13 +1526,13 @@ class Macroalgal:
         # Environmental conditions as lists
         self.z = self.get_parameter('z')[0]
 
-        # Cache for internal quotas to avoid recalculating in the same timestep
-        self.internal_quotas_cache = None
-
     def get_parameter(self, name):
         return self.parameter_loader.get_parameter(name)
 
     def reload_parameters(self):
+        if self.owns_environment:
+            self.environment.update()
+        self.graph.set('environment', self.environment)  # 本步环境因子已刷新
         get = self.parameter_loader.get_parameter
         self.T = get("T")
         self.S = get("S")
@@ -919,2067 +1542,2027 @@ class Macroalgal:
         self.q_N = get("qN")
         self.q_P = get("qP")
         self.A = get("A")
-        self.A_MA = [a * 0.01 for a in self.A]
+        self.A_MA = self.A * 0.01
         self.V = get("V")
         self.NH4 = get("NH4")
         self.NO3 = get("NO3")
         self.PO4 = get("PO4")
 
-    def temperature_limitation(self, method=1):
-        """Temperature limitation function with optional method selection."""
-        if 'temperature_limitation' in self.cache:
-            return self.cache['temperature_limitation']
-
-        if method == 1:
-            result = [1 / (1 + math.exp(-self.KT * (t - self.T_opt) / 1.5)) for t in self.T]
-        else:
-            result = [math.exp(-self.kappa_1 * (t - self.T_opt) ** 2) if t <= self.T_opt
-                      else math.exp(-self.kappa_2 * (t - self.T_opt) ** 2) for t in self.T]
+    @derived('environment')
+    def temperature_limitation(self, environment):
+        """Temperature limitation function (logistic around T_opt)."""
+        return environment['ma_temperature']
 
-        self.cache['temperature_limitation'] = result
-        return result
+    def gaussian_temperature_limitation(self):
+        """Alternative two-sided Gaussian temperature limitation (kappa_1 below T_opt, kappa_2 above)."""
+        dT = self.T - self.T_opt
+        return np.where(self.T <= self.T_opt, np.exp(-self.kappa_1 * dT ** 2), np.exp(-self.kappa_2 * dT ** 2))
 
-    def light_limitation(self):
+    @derived('MA', 'environment')
+    def light_limitation(self, MA, environment):
         """Light limitation function."""
-        if 'light_limitation' in self.cache:
-            return self.cache['light_limitation']
-
         # 确保初始 MA 只在第一次读取后存储
         if not hasattr(self, 'initial_MA'):
-            self.initial_MA = self.get_parameter('MA')  # 存储初始生物量列表
+            self.initial_MA = self.get_parameter('MA').copy()  # 存储初始生物量列表（MA 为共享状态视图，需拷贝）
 
         H_0 = 0.2  # 初始基础深度
         k = 0.005  # 与生物量相关的比例因子
 
         # 动态计算深度，基于 MA 和初始值
-        dynamic_H = [H_0 + k * (ma - ma_0) for ma, ma_0 in zip(self.MA, self.initial_MA)]
-
-        K_MA = [self.K_E + 0.0004 * (max(h / self.z, 1) / min(h, self.z)) for h in dynamic_H]
-
-        light_factor = []
-        for i, h, ma, initial_ma, k_ma in zip(self.I, dynamic_H, self.MA, self.initial_MA, K_MA):
-            # 确保初始光照限制因子为1，生物量和深度增加导致限制逐渐降低
-            if ma <= initial_ma:
-                lf = 1.0  # 初始因子为 1
-            else:
-                lf = (math.e / (k_ma * h)) * (math.exp(-i * math.exp(-k_ma * h) / self.I_s) - math.exp(-i / self.I_s))
+        dynamic_H = H_0 + k * (MA - self.initial_MA)
 
-            light_factor.append(lf)
+        K_MA = self.K_E + 0.0004 * (np.maximum(dynamic_H / self.z, 1) / np.minimum(dynamic_H, self.z))
 
-        self.cache['light_limitation'] = light_factor
-        return light_factor
+        # 确保初始光照限制因子为1（生物量未超过初始值时），生物量和深度增加导致限制逐渐降低
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            lf = (np.e / (K_MA * dynamic_H)) * (np.exp(-self.I * np.exp(-K_MA * dynamic_H) / self.I_s) - np.exp(-self.I / self.I_s))
+        return np.where(MA <= self.initial_MA, 1.0, lf)
 
-    def space_limitation(self):
+    @derived('MA')
+    def space_limitation(self, MA):
         """Space limitation function based on maximum macroalgal capacity."""
-        if 'space_limitation' in self.cache:
-            return self.cache['space_limitation']
+        return 1 - (MA / self.MA_max) ** 2
 
-        result = [1 - (ma / self.MA_max) ** 2 for ma in self.MA]
-        self.cache['space_limitation'] = result
-        return result
+    @derived('environment')
+    def salinity_limitation(self, environment):
+        """Salinity limitation function (two-sided Gaussian around S_opt)."""
+        return environment['ma_salinity']
 
-    def salinity_limitation(self, S_opt):
-        """Salinity limitation function."""
-        if 'salinity_limitation' in self.cache:
-            return self.cache['salinity_limitation']
-
-        result = [math.exp(-self.kappa_1_S * (s - S_opt) ** 2) if s <= S_opt
-                  else math.exp(-self.kappa_2_S * (s - S_opt) ** 2) for s in self.S]
-
-        self.cache['salinity_limitation'] = result
-        return result
-
-    def nutrient_limitation(self):
+    @derived('q_N', 'q_P')
+    def nutrient_limitation(self, q_N, q_P):
         """Nutrient limitation function based on nitrogen and phosphorus quotas."""
-        if 'nutrient_limitation' in self.cache:
-            return self.cache['nutrient_limitation']
-
-        result = [min(1 - self.q0_N / qn, 1 - self.q0_P / qp) for qn, qp in zip(self.q_N, self.q_P)]
-        self.cache['nutrient_limitation'] = result
-        return result
-
-    def update_internal_quotas(self):
-        """Update the internal quotas for nitrogen and phosphorus."""
-        if self.internal_quotas_cache is not None:
-            return self.internal_quotas_cache
+        return np.minimum(1 - self.q0_N / q_N, 1 - self.q0_P / q_P)
 
+    # 原实现的配额缓存在模拟中从未重置：配额通量取首次计算的值并沿用（refresh=False），
+    # 需要逐步更新时调用 reset_internal_quotas_cache()
+    @derived('NH4', 'NO3', 'PO4', 'MA', 'q_N', 'q_P', 'calculate_DMA', 'environment', refresh=False)
+    def update_internal_quotas(self, NH4, NO3, PO4, MA, q_N, q_P, DMA, environment):
+        """Quota fluxes and updated quotas (F_UN, F_EN, F_DN, q_N, F_UP, F_EP, F_DP, q_P)."""
         # Nitrogen quotas
-        F_UN_MA = [10**-3 * self.F_UP_N * ((nh4 + no3) / (self.KN_MA + nh4 + no3)) *
-                   (self.Kq_N / (self.Kq_N + (q_n - self.q0_N))) * ma
-                   for nh4, no3, q_n, ma in zip(self.NH4, self.NO3, self.q_N, self.MA)]
-        F_EN_MA = [10**-3 * self.K_E_MA_20 * (self.theta_E_MA ** (t - 20)) * q_n * ma
-                   for q_n, ma, t in zip(self.q_N, self.MA, self.T)]
-        F_DN_MA = [10**-3 * dma * q_n for dma, q_n in zip(self.calculate_DMA(), self.q_N)]
-        dq_N_dt = [fun - fen - fdn for fun, fen, fdn in zip(F_UN_MA, F_EN_MA, F_DN_MA)]
-
-        self.q_N = [max(0, qn + dq) for qn, dq in zip(self.q_N, dq_N_dt)]  # Ensure non-negative quotas
+        F_UN_MA = (10**-3 * self.F_UP_N * ((NH4 + NO3) / (self.KN_MA + NH4 + NO3)) *
+                   (self.Kq_N / (self.Kq_N + (q_N - self.q0_N))) * MA)
+        F_EN_MA = 10**-3 * self.K_E_MA_20 * environment.theta(self.theta_E_MA, 20) * q_N * MA
+        F_DN_MA = 10**-3 * np.asarray(DMA) * q_N
+        dq_N_dt = F_UN_MA - F_EN_MA - F_DN_MA
+        new_q_N = np.maximum(0, q_N + dq_N_dt)  # Ensure non-negative quotas
 
         # i = 4
         # change = abs(F_UN_MA[i]) + abs(F_EN_MA[i]) + abs(F_DN_MA[i])
-        # print(f"q_N: {self.q_N[i]}; dq_N_dt: {dq_N_dt[i]}; change: {change}; F_UN_MA: {F_UN_MA[i] / change}; F_EN_MA: {F_EN_MA[i] / change}; F_DN_MA: {F_DN_MA[i] / change}")
+        # print(f"q_N: {new_q_N[i]}; dq_N_dt: {dq_N_dt[i]}; change: {change}; F_UN_MA: {F_UN_MA[i] / change}; F_EN_MA: {F_EN_MA[i] / change}; F_DN_MA: {F_DN_MA[i] / change}")
 
         # Phosphorus quotas
-        F_UP_MA = [10**-3 * self.F_UP_P * ((po4) / (self.KP + po4)) *
-                   (self.Kq_P / (self.Kq_P + (q_p - self.q0_P))) * ma
-                   for po4, q_p, ma in zip(self.PO4, self.q_P, self.MA)]
-        F_EP_MA = [10**-3 * self.K_E_MA_20 * (self.theta_E_MA ** (t - 20)) * q_p * ma
-                   for q_p, ma, t in zip(self.q_P, self.MA, self.T)]
-        F_DP_MA = [10**-3 * dma * q_p for dma, q_p in zip(self.calculate_DMA(), self.q_P)]
-        dq_P_dt = [fup - fep - fdp for fup, fep, fdp in zip(F_UP_MA, F_EP_MA, F_DP_MA)]
+        F_UP_MA = (10**-3 * self.F_UP_P * (PO4 / (self.KP + PO4)) *
+                   (self.Kq_P / (self.Kq_P + (q_P - self.q0_P))) * MA)
+        F_EP_MA = 10**-3 * self.K_E_MA_20 * environment.theta(self.theta_E_MA, 20) * q_P * MA
+        F_DP_MA = 10**-3 * np.asarray(DMA) * q_P
+        dq_P_dt = F_UP_MA - F_EP_MA - F_DP_MA
+        new_q_P = np.maximum(0, q_P + dq_P_dt)  # Ensure non-negative quotas
 
-        self.q_P = [max(0, qp + dq) for qp, dq in zip(self.q_P, dq_P_dt)]  # Ensure non-negative quotas
-
-        self.internal_quotas_cache = (F_UN_MA, F_EN_MA, F_DN_MA, self.q_N, F_UP_MA, F_EP_MA, F_DP_MA, self.q_P)
-        return self.internal_quotas_cache
+        return (F_UN_MA, F_EN_MA, F_DN_MA, new_q_N, F_UP_MA, F_EP_MA, F_DP_MA, new_q_P)
 
     def reset_internal_quotas_cache(self):
-        """Reset the cache for internal quotas."""
-        self.internal_quotas_cache = None
-
-    def calculate_GMA(self):
-        """Calculate the growth of macroalgae."""
-        if 'calculate_GMA' in self.cache:
-            return self.cache['calculate_GMA']
-
-        phi_T_MA = self.temperature_limitation()
-        phi_L_MA = self.light_limitation()
-        phi_S_MA = self.space_limitation()
-        phi_Sal_MA = self.salinity_limitation(S_opt=self.get_parameter('S_opt')[0])
-        self.update_internal_quotas()
-        phi_N_MA = self.nutrient_limitation()
-
-        GP_MA = [self.KC_MA * phi_t * phi_l * phi_s * phi_sal * phi_n
-                 for phi_t, phi_l, phi_s, phi_sal, phi_n in zip(phi_T_MA, phi_L_MA, phi_S_MA, phi_Sal_MA, phi_N_MA)]
+        """Recompute the internal quotas from the current state on next use."""
+        self.graph.invalidate('update_internal_quotas')
 
+    @derived('temperature_limitation', 'light_limitation', 'space_limitation', 'salinity_limitation',
+             'nutrient_limitation')
+    def calculate_GMA(self, phi_T_MA, phi_L_MA, phi_S_MA, phi_Sal_MA, phi_N_MA):
+        """Specific growth rate of macroalgae (growth flux is GP_MA * MA)."""
         # i = 4
         # print(f"phi_T_MA: {phi_T_MA[i]}, phi_L_MA: {phi_L_MA[i]}, phi_S_MA: {phi_S_MA[i]}, phi_Sal_MA: {phi_Sal_MA[i]}, phi_N_MA: {phi_N_MA[i]}")
-
-        result = [gp * ma for gp, ma in zip(GP_MA, self.MA)]
-
-        self.cache['calculate_GMA'] = result
-        return GP_MA
-
-    def calculate_DMA(self):
-        """Calculate the death rate of macroalgae."""
-        if 'calculate_DMA' in self.cache:
-            return self.cache['calculate_DMA']
-
-        DEA_MA = [self.KD_MA * (self.KR_T ** (t - self.T_opt)) for t in self.T]
-
-        result = [dp * ma for dp, ma in zip(DEA_MA, self.MA)]
-
-        self.cache['calculate_DMA'] = result
-        return result
-
-    def calculate_loss_rate(self):
-        """Calculate the loss rate of macroalgae (mortality rate)."""
-        if 'loss_rate' in self.cache:
-            return self.cache['loss_rate']
-
-        RES_MA = [self.KR_MA * (self.KR_T ** (t - self.T_opt)) for t in self.T]
-        DEA_MA = [self.KD_MA * (self.KR_T ** (t - self.T_opt)) for t in self.T]
-        loss_rate = [res + dea for res, dea in zip(RES_MA, DEA_MA)]
-
-        result = [dp * ma for dp, ma in zip(loss_rate, self.MA)]
-        self.cache['loss_rate'] = result
-        return loss_rate
-
-    def update_MA(self, MAS, HMA):
-        """Update the macroalgae biomass based on growth, death, and harvest."""
-        if 'update_MA' in self.cache:
-            return self.cache['update_MA']
-
-        GMA = self.calculate_GMA()
-        DMA = self.calculate_loss_rate()
-        HMA_all = [hma * ma for hma, ma in zip(HMA, self.MA)]
-
-        self.dMA = [mas + gma - dma - hma_all for mas, gma, dma, hma_all in zip(MAS, GMA, DMA, HMA_all)]
-        self.MA = [ma + dma for ma, dma in zip(self.MA, self.dMA)]
-
-        i = 4
-        change = abs(GMA[i]) + abs(DMA[i]) + abs(HMA[i])
-        print(f'dMA:{self.dMA[i]}; change:{change}; GMA:{GMA[i]/change}; DMA:{DMA[i]/change}; HMA:{HMA[i]/change}')
-
-        self.cache['update_MA'] = self.MA
-
-        return self.MA
-
-    def reset_cache(self):
-        """Reset the cache"""
-        self.cache.clear()
-
-class Shellfish:
-    def __init__(self, parameter_loader):
+        return self.KC_MA * phi_T_MA * phi_L_MA * phi_S_MA * phi_Sal_MA * phi_N_MA
+
+    @derived('MA', 'environment')
+    def calculate_DMA(self, MA, environment):
+        """Death flux of macroalgae."""
+        DEA_MA = self.KD_MA * environment.theta(self.KR_T, self.T_opt)
+        return DEA_MA * MA
+
+    @derived('environment')
+    def calculate_loss_rate(self, environment):
+        """Specific loss rate of macroalgae (respiration + mortality; loss flux is rate * MA)."""
+        theta_T = environment.theta(self.KR_T, self.T_opt)
+        return self.KR_MA * theta_T + self.KD_MA * theta_T
+
+class DEBEngine:
+    """Vectorised Dynamic Energy Budget (DEB) kernel shared by Shellfish and Fish.
+
+    Each row is one species or cohort described by a DEB_SPECIES entry, so the
+    parameters are (rows, 1) columns. Rates take zone state arrays that
+    broadcast against them, shape (zones,) or (rows, zones), and evaluate
+    every row in the same NumPy call.
+    """
+    def __init__(self, parameter_loader, species):
+        self.species = list(species)
+        for field in DEB_FIELDS:
+            values = []
+            for name in self.species:
+                entry = DEB_SPECIES[name][field]
+                values.append(parameter_loader.get_parameter(entry)[0] if isinstance(entry, str) else entry)
+            setattr(self, field, np.array(values, dtype=np.float64).reshape(-1, 1))
+
+    def temperature_effect(self, T):
+        """Arrhenius temperature correction with lower and upper tolerance limits (T in K)."""
+        return (np.exp(self.T_A / self.T_0 - self.T_A / T) /
+                (1 + np.exp(self.T_AL / T - self.T_AL / self.T_L) +
+                 np.exp(self.T_AH / self.T_H - self.T_AH / T)))
+
+    def assimilation_rate(self, k_T, f, V):
+        return k_T * f * self.p_A_max * V ** (2 / 3)
+
+    def maintenance_rate(self, k_T, V):
+        return k_T * self.p_M * V
+
+    def maturity_maintenance_rate(self, V):
+        return np.minimum(V, self.V_p) * self.p_M * (1 - self.kappa) / self.kappa
+
+    def catabolic_rate(self, k_T, E, V):
+        # 鱼类的分解代谢率整体再乘一次温度校正（catabolic_temperature = 1）
+        E_per_V = E / V
+        scale = np.where(self.catabolic_temperature > 0, k_T, 1.0)
+        return (scale * (E_per_V / (self.E_G + self.kappa * E_per_V)) *
+                (self.E_G * self.p_A_max * V ** (2 / 3) / self.E_m + self.maintenance_rate(k_T, V)))
+
+    def growth_rate(self, p_C, p_M):
+        return np.maximum((self.kappa * p_C - p_M) / self.E_G, 0)
+
+    def reproduction_rate(self, p_C, p_J):
+        return (1 - self.kappa) * p_C - p_J
+
+    def mortality_rate(self, N, harvest):
+        return -self.D * N - harvest * N
+
+    def rates(self, k_T, f, V, E):
+        """All DEB fluxes of every row at once; k_T from temperature_effect(), all inputs (rows, zones)."""
+        p_A = self.assimilation_rate(k_T, f, V)
+        p_M = self.maintenance_rate(k_T, V)
+        p_J = self.maturity_maintenance_rate(V)
+        p_C = self.catabolic_rate(k_T, E, V)
+        return {'k_T': k_T, 'p_A': p_A, 'p_M': p_M, 'p_J': p_J, 'p_C': p_C,
+                'dV': self.growth_rate(p_C, p_M), 'dE': p_A - p_C, 'dE_R': self.reproduction_rate(p_C, p_J)}
+
+class DEBCommunity:
+    """The DEB populations of one model as the rows of a single DEBEngine.
+
+    Each DEBPopulation registers its species row with add(). rates(row)
+    stacks the Arrhenius correction, functional response, structural volume
+    and reserve of every member into (rows, zones) arrays and evaluates all
+    species in one DEBEngine.rates() call, with each zone at its own
+    temperature. The result is reused until a member marks its row stale by
+    assigning its food, volume, reserve or environment, so a step whose
+    members are read at one state costs one engine call for all species.
+    """
+    def __init__(self, parameter_loader, environment, species=None):
+        self.environment = environment
+        self.engine = DEBEngine(parameter_loader, list(DEB_SPECIES) if species is None else species)
+        self.members = [None] * len(self.engine.species)
+        self.stale = set(range(len(self.members)))
+        self.rows = None
+        self.evaluations = 0
+
+    def add(self, population):
+        """Register a population as the row of its species and return the row index."""
+        row = self.engine.species.index(population.species)
+        self.members[row] = population
+        self.stale.add(row)
+        return row
+
+    def rates(self, row):
+        """{flux: (zones,) array} of one row; every row is re-evaluated together when that row is stale."""
+        if row in self.stale:
+            missing = [species for species, member in zip(self.engine.species, self.members) if member is None]
+            if missing:
+                raise ValueError(f"DEB species without a population: {missing}")
+            members = self.members
+            k_T = np.stack([self.environment[f'arrhenius_{member.species}'] for member in members])
+            f = np.stack([member.functional_response() for member in members])
+            V = np.stack([member.volume for member in members])
+            E = np.stack([member.reserve for member in members])
+            values = self.engine.rates(k_T, f, V, E)
+            self.rows = [{name: value[i] for name, value in values.items()} for i in range(len(members))]
+            self.stale.clear()
+            self.evaluations += 1
+        return self.rows[row]
+
+class DEBInput(GraphInput):
+    """GraphInput of a DEBPopulation that the DEB fluxes read: assigning it also marks the row stale."""
+    def __set__(self, instance, value):
+        instance.graph.set(self.name, value)
+        instance.community.stale.add(instance.row)
+
+def deb_alias(name):
+    """Expose a generic DEBPopulation attribute under its species-specific name (e.g. V_SH)."""
+    return property(lambda self: getattr(self, name), lambda self, value: setattr(self, name, value))
+
+class DEBPopulation:
+    """Zone population of one DEB species: one row of a DEBCommunity.
+
+    Subclasses name the species, the state series holding abundance,
+    structural volume, reserve energy and reproduction buffer, and supply the
+    functional response. The DEB fluxes are this species' row of the
+    community evaluation, with the temperature correction of each zone. The
+    rates are derived quantities of the current state: updating abundance,
+    volume, reserve or reproduction makes the rates that read it recompute.
+    Without a community the population gets one of its own (a single row).
+    """
+    species = None
+    state_names = {}  # abundance / volume / reserve / reproduction -> state variable
+    abundance, volume, reserve, reproduction = GraphInput(), DEBInput(), DEBInput(), GraphInput()
+    PHY, ZOO = DEBInput(), DEBInput()
+
+    def __init__(self, parameter_loader, environment=None, community=None):
         self.parameter_loader = parameter_loader
+        self.environment = EnvironmentFactors(parameter_loader) if environment is None else environment
+        self.owns_environment = environment is None  # 独立使用时自行刷新环境因子，模拟中由 Simulation 每步统一刷新
+        if community is None:
+            community = DEBCommunity(parameter_loader, self.environment, [self.species])
+        self.community = community
+        self.row = community.add(self)
+        self.graph = build_graph(self)
         self.reload_parameters()
-        self.cache = {}  # Cache for computed values
-
-        # Biological constants from the 'Shellfish' tab
-        self.DSH = float(self.get_parameter('DSH')[0])  # Mortality rate (1/day)
-        self.U_SH = self.get_parameter('U_SH')[0]  # Maximum specific surface area feeding rate (m³/cm²/day)
-        self.kappa_SH = self.get_parameter('kappa_SH')[0]  # Energy allocation to growth and maintenance
-        self.E_m_SH = self.get_parameter('[E_m_SH]')[0]  # Maximum storage energy per unit volume (J/cm³)
-        self.E_G_SH = self.get_parameter('[E_G_SH]')[0]  # Energy cost per unit volume for growth (J/cm³)
-        self.V_p_SH = self.get_parameter('V_p_SH')[0]  # Volume at maturity (cm³)
-        self.H_SH = self.get_parameter('H_SH')[0]  # Half-saturation constant for feeding (mgC/m³)
-        self.p_A_SH_max = self.get_parameter('{p_A_SH}')[0]  # Maximum specific assimilation rate (J/cm²/day)
-        self.p_M_SH_param = self.get_parameter('[p_M_SH]')[0]
-
-        # Temperature-related constants
-        self.T_SH_0 = self.get_parameter('T_0_SH')[0]
-        self.T_SH_A = self.get_parameter('T_A_SH')[0]
-        self.T_SH_AL = self.get_parameter('T_AL_SH')[0]
-        self.T_SH_AH = self.get_parameter('T_AH_SH')[0]
-        self.T_SH_L = self.get_parameter('T_L_SH')[0]
-        self.T_SH_H = self.get_parameter('T_H_SH')[0]
+        self.D = float(community.engine.D[self.row, 0])  # Mortality rate
 
     def get_parameter(self, name):
         return self.parameter_loader.get_parameter(name)
 
     def reload_parameters(self):
+        if self.owns_environment:
+            self.environment.update()
+        self.graph.set('environment', self.environment)  # 本步环境因子已刷新
+        self.community.stale.add(self.row)
         get = self.parameter_loader.get_parameter
-        self.T = [t + 273.15 for t in get('T')]
+        self.T = get('T') + 273.15
         self.PHY = get("PHY")
         self.ZOO = get("ZOO")
         self.V = get("V")
         self.H = get("H")
-        self.N_SH = np.array(get("N_SH"))
-        self.V_SH = np.array(get("V_SH"))
-        self.E_SH = get("E_SH")
-        self.E_R_SH = get("E_R_SH")
-
-    def temperature_effect(self):
-        """Calculate the temperature effect on shellfish metabolic processes."""
-        if 'temperature_effect' in self.cache:
-            return self.cache['temperature_effect']
-
-        T = self.T[0]  # Assume a constant temperature for simplicity
-        k_SH_T = (math.exp(self.T_SH_A / self.T_SH_0 - self.T_SH_A / T) /
-                  (1 + math.exp(self.T_SH_AL / T - self.T_SH_AL / self.T_SH_L) +
-                   math.exp(self.T_SH_AH / self.T_SH_H - self.T_SH_AH / T)))
-
-        self.cache['temperature_effect'] = k_SH_T
-        return k_SH_T
+        for attribute, name in self.state_names.items():
+            setattr(self, attribute, get(name))
 
     def functional_response(self):
-        """Calculate the functional response for shellfish feeding."""
-        if 'functional_response' in self.cache:
-            return self.cache['functional_response']
-
-        f_SH = [phy + zoo / (phy + zoo + self.H_SH) for phy, zoo in zip(self.PHY, self.ZOO)]
-        self.cache['functional_response'] = f_SH
-        return f_SH
-
-    def energy_assimilation_rate(self):
-        """Calculate the energy assimilation rate for shellfish."""
-        if 'energy_assimilation_rate' in self.cache:
-            return self.cache['energy_assimilation_rate']
-
-        k_SH_T = self.temperature_effect()
-        f_SH = self.functional_response()
-        p_A_SH = [k_SH_T * f * self.p_A_SH_max * v_sh ** (2 / 3) for f, v_sh in zip(f_SH, self.V_SH)]
-
-        self.cache['energy_assimilation_rate'] = p_A_SH
-        return p_A_SH
-
-    def maintenance_rate(self):
-        """Calculate the maintenance rate for shellfish."""
-        if 'maintenance_rate' in self.cache:
-            return self.cache['maintenance_rate']
-
-        k_SH_T = self.temperature_effect()
-        p_M_SH = [k_SH_T * self.p_M_SH_param * v_sh for v_sh in self.V_SH]
-
-        self.cache['maintenance_rate'] = p_M_SH
-        return p_M_SH
-
-    def maturity_maintenance_rate(self):
-        """Calculate the maturity maintenance rate for shellfish."""
-        if 'maturity_maintenance_rate' in self.cache:
-            return self.cache['maturity_maintenance_rate']
-
-        p_J_SH = [min(v_sh, self.V_p_SH) * self.p_M_SH_param * (1 - self.kappa_SH) / self.kappa_SH for v_sh in self.V_SH]
-
-        self.cache['maturity_maintenance_rate'] = p_J_SH
-        return p_J_SH
-
-    def catabolic_rate(self):
-        """Calculate the catabolic rate for shellfish."""
-        if 'catabolic_rate' in self.cache:
-            return self.cache['catabolic_rate']
-
-        k_SH_T = self.temperature_effect()
-        E_SH_per_V_SH = [e_sh / v_sh for e_sh, v_sh in zip(self.E_SH, self.V_SH)]
-        p_C_SH = [(e_sh_v / (self.E_G_SH + self.kappa_SH * e_sh_v)) *
-                  (self.E_G_SH * self.p_A_SH_max * v_sh ** (2 / 3) / self.E_m_SH + k_SH_T * self.p_M_SH_param * v_sh)
-                  for e_sh_v, v_sh in zip(E_SH_per_V_SH, self.V_SH)]
-
-        self.cache['catabolic_rate'] = p_C_SH
-        return p_C_SH
-
-    def reproductive_energy_storage_rate(self):
-        """Calculate the reproductive energy storage rate for shellfish."""
-        if 'reproductive_energy_storage_rate' in self.cache:
-            return self.cache['reproductive_energy_storage_rate']
-
-        p_C_SH = self.catabolic_rate()
-        p_J_SH = self.maturity_maintenance_rate()
-        dE_R_SH_dt = [(1 - self.kappa_SH) * p_c - p_j for p_c, p_j in zip(p_C_SH, p_J_SH)]
-        self.E_R_SH = [e_r_sh + de_r_sh for e_r_sh, de_r_sh in zip(self.E_R_SH, dE_R_SH_dt)]
-
-        self.cache['reproductive_energy_storage_rate'] = (self.E_R_SH, dE_R_SH_dt)
-        return self.E_R_SH, dE_R_SH_dt
-
-    def growth_volume(self):
-        """Calculate the growth in volume for shellfish."""
-        if 'growth_volume' in self.cache:
-            return self.cache['growth_volume']
-
-        p_C_SH = self.catabolic_rate()
-        p_M_SH = self.maintenance_rate()
-
-        dV_SH_dt = [max((self.kappa_SH * p_c - p_m) / self.E_G_SH, 0) for p_c, p_m in zip(p_C_SH, p_M_SH)]
-        self.V_SH = [v_sh + dv_sh for v_sh, dv_sh in zip(self.V_SH, dV_SH_dt)]
-
-        self.cache['growth_volume'] = (self.V_SH, dV_SH_dt)
-        return dV_SH_dt
-
-    def population_dynamics(self, HSH):
-        """Update shellfish population dynamics."""
-        if 'population_dynamics' in self.cache:
-            return self.cache['population_dynamics']
-
-        dN_SH_dt = [-self.DSH * n_sh - h_sh * n_sh for n_sh, h_sh in zip(self.N_SH, HSH)]
-        self.N_SH = [n_sh + dn_sh for n_sh, dn_sh in zip(self.N_SH, dN_SH_dt)]
-
-        self.cache['population_dynamics'] = self.N_SH
-        return dN_SH_dt
-
-    def storage_energy(self):
-        """Update shellfish storage energy."""
-        if 'storage_energy' in self.cache:
-            return self.cache['storage_energy']
-
-        p_A_SH = self.energy_assimilation_rate()
-        p_C_SH = self.catabolic_rate()
-        dE_SH = [p_a - p_c for p_a, p_c in zip(p_A_SH, p_C_SH)]
-        self.E_SH = [e_sh + de_sh for e_sh, de_sh in zip(self.E_SH, dE_SH)]
+        raise NotImplementedError
+
+    @derived('environment')
+    def temperature_effect(self, environment):
+        """Calculate the temperature effect on metabolic processes (one value per zone)."""
+        return environment[f'arrhenius_{self.species}']
+
+    @derived('environment', 'functional_response', 'volume', 'reserve')
+    def deb_rates(self, environment, f, volume, reserve):
+        """This species' row of the community DEB fluxes (p_A, p_M, p_J, p_C, dV, dE, dE_R)."""
+        return self.community.rates(self.row)
+
+    @derived('deb_rates')
+    def energy_assimilation_rate(self, rates):
+        """Calculate the energy assimilation rate."""
+        return rates['p_A']
+
+    @derived('deb_rates')
+    def maintenance_rate(self, rates):
+        """Calculate the maintenance rate."""
+        return rates['p_M']
+
+    @derived('deb_rates')
+    def maturity_maintenance_rate(self, rates):
+        """Calculate the maturity maintenance rate."""
+        return rates['p_J']
+
+    @derived('deb_rates')
+    def catabolic_rate(self, rates):
+        """Calculate the catabolic rate."""
+        return rates['p_C']
+
+    @derived('deb_rates', 'reproduction')
+    def reproductive_energy_storage_rate(self, rates, reproduction):
+        """Reproduction buffer after this step's allocation and the allocation rate (E_R + dE_R, dE_R)."""
+        return reproduction + rates['dE_R'], rates['dE_R']
+
+    @derived('deb_rates')
+    def growth_volume(self, rates):
+        """Calculate the growth in structural volume."""
+        return rates['dV']
+
+    @derived('deb_rates', 'reserve')
+    def storage_energy(self, rates, reserve):
+        """Reserve energy after this step's assimilation and catabolism."""
+        return reserve + rates['dE']
+
+    def population_dynamics(self, harvest):
+        """Update the population and return its change."""
+        dN_dt = self.community.engine.mortality_rate(self.abundance, np.asarray(harvest, dtype=np.float64))[self.row]
+        self.abundance = self.abundance + dN_dt
+        return dN_dt
+
+    def update_state(self, harvest):
+        """Advance abundance, volume, reserve and reproduction buffer by one step from the current rates."""
+        dV_dt = self.growth_volume()
+        reserve = self.storage_energy()
+        reproduction, _ = self.reproductive_energy_storage_rate()
+        self.population_dynamics(harvest)
+        self.volume = self.volume + dV_dt
+        self.reserve = reserve
+        self.reproduction = reproduction
+
+class Shellfish(DEBPopulation):
+    species = 'shellfish'
+    state_names = {'abundance': 'N_SH', 'volume': 'V_SH', 'reserve': 'E_SH', 'reproduction': 'E_R_SH'}
+    N_SH = deb_alias('abundance')
+    V_SH = deb_alias('volume')
+    E_SH = deb_alias('reserve')
+    E_R_SH = deb_alias('reproduction')
+    DSH = deb_alias('D')
+
+    def __init__(self, parameter_loader, environment=None, community=None):
+        super().__init__(parameter_loader, environment, community)
+        self.U_SH = self.get_parameter('U_SH')[0]  # Maximum specific surface area feeding rate (m³/cm²/day)
+        self.H_SH = self.get_parameter('H_SH')[0]  # Half-saturation constant for feeding (mgC/m³)
 
-        self.cache['storage_energy'] = self.E_SH
-        return self.E_SH
+    @derived('PHY', 'ZOO')
+    def functional_response(self, PHY, ZOO):
+        """Calculate the functional response for shellfish feeding."""
+        return PHY + ZOO / (PHY + ZOO + self.H_SH)
 
-    def GRS_PHY(self):
+    @derived('temperature_effect', 'volume', 'abundance')
+    def GRS_PHY(self, k_T, volume, abundance):
         """Calculate the grazing rate of phytoplankton by shellfish."""
-        if 'GRS_PHY' in self.cache:
-            return self.cache['GRS_PHY']
-
-        k_SH_T = self.temperature_effect()
-        N_SH = self.N_SH
-        GRS_PHY = [k_SH_T * self.U_SH * v_sh ** (2 / 3) * n_sh / V for v_sh, n_sh, V in zip(self.V_SH, N_SH, self.V)]
-
-        self.cache['GRS_PHY'] = GRS_PHY
-        return GRS_PHY
+        return k_T * self.U_SH * volume ** (2 / 3) * abundance / self.V
 
     def update_shellfish(self, HSH):
         """Update the shellfish biomass, energy, and population."""
-        if 'update_shellfish' in self.cache:
-            return self.cache['update_shellfish']
-
-        self.population_dynamics(HSH)
-        self.V_SH, _ = self.growth_volume()
-        self.storage_energy()
-        self.E_R_SH, _ = self.reproductive_energy_storage_rate()
         grs_phy = [self.GRS_PHY() * phy for phy in self.PHY]
-
-        self.cache['update_shellfish'] = (self.N_SH, self.V_SH, self.E_SH, self.E_R_SH, grs_phy)
-
+        self.update_state(HSH)
         return self.N_SH, self.V_SH, self.E_SH, self.E_R_SH, grs_phy
 
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep."""
-        self.cache.clear()
-
-class Fish:
-    def __init__(self, parameter_loader):
-        self.parameter_loader = parameter_loader
-        self.reload_parameters()
-        self.cache = {}  # Cache for computed values
-
-        # Biological constants from the 'Fish' tab
-        self.DF = float(self.get_parameter('DF')[0])
-        self.kappa_F = self.get_parameter('kappa_F')[0]
-        self.E_m_F = self.get_parameter('[E_m_F]')[0]
-        self.E_G_F = self.get_parameter('[E_G_F]')[0]
-        self.V_p_F = self.get_parameter('V_p_F')[0]
+class Fish(DEBPopulation):
+    species = 'fish'
+    state_names = {'abundance': 'N_F', 'volume': 'V_F', 'reserve': 'E_F', 'reproduction': 'E_R_F'}
+    N_F = deb_alias('abundance')
+    V_F = deb_alias('volume')
+    E_F = deb_alias('reserve')
+    E_R_F = deb_alias('reproduction')
+    DF = deb_alias('D')
+    FEED = DEBInput()
+
+    def __init__(self, parameter_loader, environment=None, community=None):
+        super().__init__(parameter_loader, environment, community)
         self.H_F = self.get_parameter('H_F')[0]
-        self.p_A_F_max = self.get_parameter('{p_A_F}')[0]
-        self.p_M_F_param = self.get_parameter('[p_M_F]')[0]
-
-        # Temperature-related constants
-        self.T_F_0 = self.get_parameter('T_0_F')[0]
-        self.T_F_A = self.get_parameter('T_A_F')[0]
-        self.T_F_AL = self.get_parameter('T_AL_F')[0]
-        self.T_F_AH = self.get_parameter('T_AH_F')[0]
-        self.T_F_L = self.get_parameter('T_L_F')[0]
-        self.T_F_H = self.get_parameter('T_H_F')[0]
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
 
     def reload_parameters(self):
+        super().reload_parameters()
         get = self.parameter_loader.get_parameter
-        self.T = [t + 273.15 for t in get('T')]
-        self.PHY = get("PHY")
-        self.ZOO = get("ZOO")
         self.A = get("A")
-        self.V = get("V")
-        self.H = get("H")
-        self.N_F = np.array(get("N_F"))
-        self.V_F = np.array(get("V_F"))
-        self.E_F = get("E_F")
-        self.E_R_F = get("E_R_F")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] / 365 * 24 for nf in
-                     get('N_F')]
-
-    def temperature_effect(self):
-        """Calculate the temperature effect on fish metabolic processes."""
-        if 'temperature_effect' in self.cache:
-            return self.cache['temperature_effect']
-
-        T = self.T[0]  # Assume a constant temperature for simplicity
-        k_F_T = (math.exp(self.T_F_A / self.T_F_0 - self.T_F_A / T) /
-                 (1 + math.exp(self.T_F_AL / T - self.T_F_AL / self.T_F_L) +
-                  math.exp(self.T_F_AH / self.T_F_H - self.T_F_AH / T)))
-
-        self.cache['temperature_effect'] = k_F_T
-        return k_F_T
+        self.FEED = get('N_F') * get('M_F')[0] * get('FCR_F')[0] / 365 * 24
 
-    def functional_response(self):
+    @derived('FEED')
+    def functional_response(self, FEED):
         """Calculate the functional response for fish feeding."""
-        if 'functional_response' in self.cache:
-            return self.cache['functional_response']
-
-        f_F = [feed / (feed + self.H_F) for feed in self.FEED]
-        self.cache['functional_response'] = f_F
-        return f_F
-
-    def energy_assimilation_rate(self):
-        """Calculate the energy assimilation rate for fish."""
-        if 'energy_assimilation_rate' in self.cache:
-            return self.cache['energy_assimilation_rate']
-
-        k_F_T = self.temperature_effect()
-        f_F = self.functional_response()
-        p_A_F = [k_F_T * f * self.p_A_F_max * v_f ** (2 / 3) for f, v_f in zip(f_F, self.V_F)]
-
-        self.cache['energy_assimilation_rate'] = p_A_F
-        return p_A_F
-
-    def maintenance_rate(self):
-        """Calculate the maintenance rate for fish."""
-        if 'maintenance_rate' in self.cache:
-            return self.cache['maintenance_rate']
-
-        k_F_T = self.temperature_effect()
-        p_M_F = [k_F_T * self.p_M_F_param * v_f for v_f in self.V_F]
-
-        self.cache['maintenance_rate'] = p_M_F
-        return p_M_F
-
-    def maturity_maintenance_rate(self):
-        """Calculate the maturity maintenance rate for fish."""
-        if 'maturity_maintenance_rate' in self.cache:
-            return self.cache['maturity_maintenance_rate']
-
-        p_J_F = [min(v_f, self.V_p_F) * self.p_M_F_param * (1 - self.kappa_F) / self.kappa_F for v_f in self.V_F]
-
-        self.cache['maturity_maintenance_rate'] = p_J_F
-        return p_J_F
-
-    def catabolic_rate(self):
-        """Calculate the catabolic rate for fish."""
-        if 'catabolic_rate' in self.cache:
-            return self.cache['catabolic_rate']
-
-        k_F_T = self.temperature_effect()
-        p_M_F = self.maintenance_rate()
-        E_F_per_V_F = [e_f / v_f for e_f, v_f in zip(self.E_F, self.V_F)]
-        p_C_F = [k_F_T * (e_f_v / (self.E_G_F + self.kappa_F * e_f_v)) *
-                 (self.E_G_F * self.p_A_F_max * v_f ** (2 / 3) / self.E_m_F + p_m)
-                 for e_f_v, v_f, p_m in zip(E_F_per_V_F, self.V_F, p_M_F)]
-
-        self.cache['catabolic_rate'] = p_C_F
-        return p_C_F
-
-    def reproductive_energy_storage_rate(self):
-        """Calculate the reproductive energy storage rate for fish."""
-        if 'reproductive_energy_storage_rate' in self.cache:
-            return self.cache['reproductive_energy_storage_rate']
-
-        p_C_F = self.catabolic_rate()
-        p_J_F = self.maturity_maintenance_rate()
-        dE_R_F_dt = [(1 - self.kappa_F) * p_c - p_j for p_c, p_j in zip(p_C_F, p_J_F)]
-        self.E_R_F = [e_r_f + de_r_f for e_r_f, de_r_f in zip(self.E_R_F, dE_R_F_dt)]
-
-        self.cache['reproductive_energy_storage_rate'] = (self.E_R_F, dE_R_F_dt)
-        return self.E_R_F, dE_R_F_dt
-
-    def growth_volume(self):
-        """Calculate the growth in volume for fish."""
-        if 'growth_volume' in self.cache:
-            return self.cache['growth_volume']
-
-        p_C_F = self.catabolic_rate()
-        p_M_F = self.maintenance_rate()
-        dV_F_dt = [max((self.kappa_F * p_c - p_m) / self.E_G_F, 0) for p_c, p_m in zip(p_C_F, p_M_F)]
-        self.V_F = [v_f + dv_f for v_f, dv_f in zip(self.V_F, dV_F_dt)]
-
-        self.cache['growth_volume'] = (self.V_F, dV_F_dt)
-        return dV_F_dt
+        return FEED / (FEED + self.H_F)
 
     def population_dynamics(self, HF):
         """Update fish population dynamics."""
-        if 'population_dynamics' in self.cache:
-            return self.cache['population_dynamics']
-
-        dN_F_dt = [-self.DF * n_f - hf * n_f for n_f, hf in zip(self.N_F, HF)]
-        self.N_F = [n_f + dn_f for n_f, dn_f in zip(self.N_F, dN_F_dt)]
-
-        self.cache['population_dynamics'] = self.N_F
+        super().population_dynamics(HF)
         return self.N_F
 
-    def storage_energy(self):
-        """Update fish storage energy."""
-        if 'storage_energy' in self.cache:
-            return self.cache['storage_energy']
-
-        p_A_F = self.energy_assimilation_rate()
-        p_C_F = self.catabolic_rate()
-        dE_F = [p_a - p_c for p_a, p_c in zip(p_A_F, p_C_F)]
-        self.E_F = [e_f + de_f for e_f, de_f in zip(self.E_F, dE_F)]
-
-        self.cache['storage_energy'] = self.E_F
-        return self.E_F
-
     def update_fish(self, HF):
         """Update the fish biomass, energy, and population."""
-        if 'update_fish' in self.cache:
-            return self.cache['update_fish']
-
-        self.population_dynamics(HF)
-        self.V_F, _ = self.growth_volume()
-        self.storage_energy()
-        self.E_R_F, _ = self.reproductive_energy_storage_rate()
-
-        self.cache['update_fish'] = (self.N_F, self.V_F, self.E_F, self.E_R_F)
-
+        self.update_state(HF)
         return self.N_F, self.V_F, self.E_F, self.E_R_F
 
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep."""
-        self.cache.clear()
-
-
 class ExternalInput:
-    def __init__(self, parameter_loader, waterexchange, input_files, input_multipliers):
+    def __init__(self, parameter_loader, waterexchange, input_files, input_multipliers=None, cache_dir=None):
         self.parameter_loader = parameter_loader
         self.input_files = input_files
         self.waterexchange = waterexchange
+        self.input_cache = InputCache(cache_dir)
         self.substances = ['NH4', 'NO3', 'ON', 'PO4', 'OP', 'CBOD', 'DO']
         self.num_zones = len(self.get_parameter('V'))
 
-        self.input_multipliers = input_multipliers or {
-            src: {sub: 1.0 for sub in self.substances}
-            for src in ['river', 'groundwater', 'point_source', 'pond', 'atmosphere']
-        }
-
-        self.river_data = self.read_river_data(input_files['river'])
-        self.static_inputs = self.read_static_inputs([
-            input_files['point_source'],
-            input_files['groundwater'],
-            input_files['pond'],
-            input_files['atmosphere']
-        ])
+        # 原始（未乘倍率）的逐时分源质量：河流 (小时数, 区域数, 物质数) 的前缀和索引，静态源 (源数, 区域数, 物质数)
+        self.river_index = HourlyIndex(self.read_river_data(input_files['river']), '河流输入')
+        self.hourly_static_data = np.stack([self.read_static_input(input_files[source]) for source in STATIC_SOURCES])
+        self.aggregate()
+        self.set_multipliers(input_multipliers)
 
     def get_parameter(self, name):
         return self.parameter_loader.get_parameter(name)
 
+    def aggregate(self):
+        # 按水交换的时间步长换算为每步质量（河流由前缀和逐段求和，静态源乘以步长）
+        # 只读数组，多个倍率情景（包括 fork 出的工作进程）共享同一份数据
+        time_step = self.waterexchange.time_step
+        self.river_data = self.river_index.step_sums(time_step)
+        self.static_data = self.hourly_static_data * time_step
+        self.river_data.flags.writeable = False
+        self.static_data.flags.writeable = False
+
+    def with_time_step(self, waterexchange):
+        # 返回按另一水交换（with_time_step 得到）的时间步长聚合的同一输入，不重新读取 CSV
+        derived = copy.copy(self)
+        derived.waterexchange = waterexchange
+        derived.aggregate()
+        return derived.set_multipliers(self.input_multipliers)
+
+    def set_multipliers(self, input_multipliers=None):
+        # 倍率在查询时以 (源数, 物质数) 权重收缩施加，切换情景无需重新读取 CSV
+        self.input_multipliers = input_multipliers or {
+            src: {sub: 1.0 for sub in self.substances} for src in INPUT_SOURCES
+        }
+        self.weights = np.array([[self.input_multipliers.get(src, {}).get(sub, 1.0) for sub in self.substances]
+                                 for src in INPUT_SOURCES])
+        # 静态源不随时间变化，收缩结果按情景预先求出
+        self.static_inputs = np.einsum('sk,szk->zk', self.weights[1:], self.static_data)
+        return self
+
+    def with_multipliers(self, input_multipliers):
+        # 返回共享原始数据、仅权重不同的新情景
+        scenario = copy.copy(self)
+        return scenario.set_multipliers(input_multipliers)
+
+    def read_source_table(self, file_path):
+        # 读取一个输入源：返回 (列数据, 区域索引, (行数, 物质数) 原始质量, 有效区域掩码)
+        columns = self.input_cache.load(file_path)
+        zone_index = pd.Series(columns['Zone']).str.slice(4).astype(int).to_numpy() - 1
+        values = np.column_stack([columns[sub] for sub in self.substances]).astype(np.float64)
+        valid = (zone_index >= 0) & (zone_index < self.num_zones)
+        return columns, zone_index, values, valid
+
     def read_river_data(self, file_path):
-        df = pd.read_csv(file_path)
-        df['date'] = pd.to_datetime(df['date'])
-        unique_times = sorted(df['date'].unique())
-        time_map = {t: i for i, t in enumerate(unique_times)}
-        df['timestep'] = df['date'].map(time_map)
-
-        river_inputs = defaultdict(lambda: defaultdict(lambda: {sub: 0.0 for sub in self.substances}))
-        for _, row in df.iterrows():
-            t = row['timestep']
-            zone = row['Zone']
-            zone_index = int(zone[4:]) - 1
-            if 0 <= zone_index < self.num_zones:
-                for sub in self.substances:
-                    multiplier = self.input_multipliers['river'].get(sub, 1.0)
-                    river_inputs[t][zone][sub] += multiplier * row[sub]
+        # 按 (时间步, 区域) 散点累加，同一时刻同一区域的多行按文件顺序求和
+        columns, zone_index, values, valid = self.read_source_table(file_path)
+        unique_times, time_index = np.unique(pd.to_datetime(columns['date']).to_numpy(), return_inverse=True)
+        river_inputs = np.zeros((len(unique_times), self.num_zones, len(self.substances)))
+        np.add.at(river_inputs, (time_index[valid], zone_index[valid]), values[valid])
         return river_inputs
 
-    def read_static_inputs(self, file_paths):
-        combined = {}
-        for sub in self.substances:
-            combined[sub] = np.zeros(self.num_zones)
-
-        for path, source in zip(file_paths, ['point_source', 'groundwater', 'pond', 'atmosphere']):
-            df = pd.read_csv(path)
-            for _, row in df.iterrows():
-                zone_index = int(row['Zone'][4:]) - 1
-                if 0 <= zone_index < self.num_zones:
-                    for sub in self.substances:
-                        multiplier = self.input_multipliers[source].get(sub, 1.0)
-                        combined[sub][zone_index] += multiplier * row[sub]
-        return combined
+    def read_static_input(self, file_path):
+        _, zone_index, values, valid = self.read_source_table(file_path)
+        static_input = np.zeros((self.num_zones, len(self.substances)))
+        np.add.at(static_input, zone_index[valid], values[valid])
+        return static_input
 
     def get_external_inputs(self, current_time_step):
-        V_sea = self.waterexchange.calculate_volume(current_time_step)
-        total_mass = {sub: np.zeros(self.num_zones) for sub in self.substances}
-
-        if current_time_step in self.river_data:
-            for zone, values in self.river_data[current_time_step].items():
-                zone_index = int(zone[4:]) - 1
-                if 0 <= zone_index < self.num_zones:
-                    for sub in self.substances:
-                        total_mass[sub][zone_index] += values[sub]
-
-        for sub in self.substances:
-            total_mass[sub] += self.static_inputs[sub]
-
-        total_inputs = {
-            sub: [mass / vol if vol > 0 else 0.0 for mass, vol in zip(total_mass[sub], V_sea[:self.num_zones])]
-            for sub in self.substances
-        }
-        return total_inputs
-
-class AmmoniumNitrogen:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish):
+        # (源数 × 物质数) 权重收缩得到当前步质量，除以预计算的水量行，返回 {物质: (区域数,) 浓度数组}
+        V_sea = self.waterexchange.calculate_volume(current_time_step)[:self.num_zones, None]
+        if 0 <= current_time_step < len(self.river_data):
+            total_mass = self.river_data[current_time_step] * self.weights[0] + self.static_inputs
+        else:
+            total_mass = self.static_inputs
+        with np.errstate(divide='ignore', invalid='ignore'):
+            total_inputs = np.where(V_sea > 0, total_mass / V_sea, 0.0)
+        return {sub: total_inputs[:, j] for j, sub in enumerate(self.substances)}
+
+class FluxTable:
+    """Signed process rates of one step, shape (process, zone), in concentration per step.
+
+    Rows follow CYCLE_BUDGETS: terms(budget) is the (processes, zones) block of
+    one budget in the listed process order, net(budget) its summed rate of
+    change, and table[budget, process] a single row.
+    """
+    def __init__(self, n_zones, budgets=CYCLE_BUDGETS):
+        self.labels = [(budget, process) for budget, (_, processes) in budgets.items() for process in processes]
+        self.index = {label: row for row, label in enumerate(self.labels)}
+        self.blocks = {}
+        for budget, (_, processes) in budgets.items():
+            start = self.index[budget, processes[0]]
+            self.blocks[budget] = slice(start, start + len(processes))
+        self.values = np.zeros((len(self.labels), n_zones))
+
+    def __getitem__(self, label):
+        return self.values[self.index[label]]
+
+    def __setitem__(self, label, rates):
+        self.values[self.index[label]] = rates
+
+    def terms(self, budget):
+        return self.values[self.blocks[budget]]
+
+    def net(self, budget):
+        return self.terms(budget).sum(axis=0)
+
+class WindowSnapshots:
+    """Cumulative totals (self.values) kept at every window boundary of a run.
+
+    window is the snapshot interval in steps (None keeps no snapshots);
+    snapshot() stores the current totals and window_totals() turns them into
+    per-window amounts of shape (windows,) + values.shape.
+    """
+    def init_snapshots(self, num_steps, window):
+        self.window = window
+        self.snapshots = np.zeros((num_steps // window if window else 0,) + self.values.shape)
+        self.count = 0  # 已保存的快照数
+
+    def snapshot(self, replace=False):
+        """保存当前累计值作为一个窗口边界；replace=True 时改写最近一次快照"""
+        if not replace:
+            self.count += 1
+        self.snapshots[self.count - 1] = self.values
+
+    def window_totals(self):
+        """各完整窗口内的累计量，形状 (窗口数,) + values.shape"""
+        return np.diff(self.snapshots[:self.count], axis=0, prepend=np.zeros((1,) + self.values.shape))
+
+class ContributionLedger(FluxTable, WindowSnapshots):
+    """Cumulative process contributions in mg, shape (process, zone), over NUTRIENT_BUDGETS.
+
+    The rows are the leading rows of a CYCLE_BUDGETS FluxTable in the same
+    order, so accumulate() books every nutrient and process of a step with one
+    multiply-add of the step's change magnitudes by the zone volumes in litres.
+    Window snapshots give per-window budgets (e.g. monthly); table() gives the
+    cumulative_contributions_3y.csv layout.
+    """
+    def __init__(self, n_zones, num_steps=0, window=None):
+        super().__init__(n_zones, NUTRIENT_BUDGETS)
+        self.init_snapshots(num_steps, window)
+        self.scratch = np.empty_like(self.values)
+
+    def accumulate(self, magnitudes, volume):
+        """由本步过程变化量（CYCLE_BUDGETS 通量表，mg/L）与海区水量（m³）累计全部营养盐的过程贡献（mg）"""
+        np.multiply(magnitudes.values[:len(self.labels)], volume * LITERS_PER_M3, out=self.scratch)
+        self.values += self.scratch
+
+    def as_dict(self):
+        """{营养盐: {过程: 各海区累计贡献}}，数组为 values 的行视图"""
+        return {nutrient: dict(zip(processes, self.terms(nutrient)))
+                for nutrient, (_, processes) in NUTRIENT_BUDGETS.items()}
+
+    def table(self, sea_areas, values=None):
+        """累计贡献（或给定的同形状数组）按 cumulative_contributions_3y.csv 的布局：营养盐、过程、各海区"""
+        frame = pd.DataFrame(self.values if values is None else values, columns=list(sea_areas))
+        frame.insert(0, 'Process', [process for _, process in self.labels])
+        frame.insert(0, 'Nutrient', [nutrient for nutrient, _ in self.labels])
+        return frame
+
+class TransportLedger(WindowSnapshots):
+    """Mass moved by the transport kernel along each edge, in mg per (edge, substance).
+
+    Edge e of WaterExchange.edges exchanges edge_flux[e] of water between
+    edge_from[e] and edge_to[e]: the kernel takes flux x C[from] out of the
+    from-zone and brings flux x C[to] into it. values[0] and values[1]
+    accumulate these outgoing and incoming masses and net() their difference,
+    the mass carried from edge_from to edge_to. OuterSea is held at its
+    boundary concentration, so edges leaving it carry nothing; the edges into
+    OuterSea give the exact outer-sea exchange (outer_exchange()).
+    """
+    def __init__(self, water_exchange, substances, num_steps=0, window=None):
+        outer_sea_index = water_exchange.sea_areas.index('OuterSea')
+        self.edges = list(water_exchange.edges)
+        self.edge_areas = list(water_exchange.edges.values())
+        self.edge_from, self.edge_to = water_exchange.edge_from, water_exchange.edge_to
+        self.substances = list(substances)
+        # 每 m³ 交换水量对应的升数；外海出发的边不改变任何海区，记为 0
+        self.liters = np.where(self.edge_from == outer_sea_index, 0.0, LITERS_PER_M3)[:, None]
+        self.edges_to_outer = np.flatnonzero(self.edge_to == outer_sea_index)
+        self.values = np.zeros((2, len(self.edges), len(self.substances)))
+        self.scratch = np.empty(self.values.shape[1:])
+        self.init_snapshots(num_steps, window)
+
+    def accumulate(self, edge_flux, C):
+        """由本步各边交换水量（m³）与输运前的浓度矩阵 C（区域数+1, 物质数；mg/L）累计各边搬运的质量（mg）"""
+        flux = edge_flux[:, None] * self.liters
+        np.multiply(flux, C[self.edge_from], out=self.scratch)
+        self.values[0] += self.scratch
+        np.multiply(flux, C[self.edge_to], out=self.scratch)
+        self.values[1] += self.scratch
+
+    def net(self, values=None):
+        """各边由起点区域搬运到终点区域的净质量（mg），形状 (边数, 物质数)；values 可为 window_totals() 的一项"""
+        values = self.values if values is None else values
+        return values[0] - values[1]
+
+    def outer_exchange(self):
+        """与外海交换的质量（mg）：(各物质流出外海, 各物质由外海流入)"""
+        return self.values[0, self.edges_to_outer].sum(axis=0), self.values[1, self.edges_to_outer].sum(axis=0)
+
+    def table(self, values=None):
+        """各边净搬运质量的表格：边、起点、终点、各物质（mg）"""
+        frame = pd.DataFrame(self.net(values), columns=self.substances)
+        frame.insert(0, 'To', [area_to for _, area_to in self.edge_areas])
+        frame.insert(0, 'From', [area_from for area_from, _ in self.edge_areas])
+        frame.insert(0, 'Edge', self.edges)
+        return frame
+
+class PatankarSystem:
+    """Second-order modified Patankar-Runge-Kutta (MPRK22) step of a production-destruction system.
+
+    The state is (variables, zones) and term k is a signed rate acting on
+    variable target[k]. A term with a partner source[k] >= 0 moves mass between
+    the two pools (positive: source -> target, negative: target -> source); a
+    term without one is an external source or sink. Terms with mirror[k] >= 0
+    are the paying side of a transfer already described by term mirror[k] and
+    their values are ignored. Every flow out of a pool is weighted by the ratio
+    of its new to its old concentration, which makes each stage a linear
+    system per zone with an M-matrix: the update stays non-negative for any
+    step size and every transfer pair conserves its total exactly.
+    """
+    def __init__(self, n_variables, target, source, mirror):
+        self.n_variables = n_variables
+        self.target = np.asarray(target, dtype=np.intp)
+        self.source = np.asarray(source, dtype=np.intp)
+        self.mirror = np.asarray(mirror, dtype=np.intp)
+        active = np.flatnonzero(self.mirror < 0)
+        self.coupled = active[self.source[active] >= 0]  # 正向部分为两池之间的转移
+        self.produced = active[self.source[active] < 0]  # 正向部分为外部源（显式处理）
+        self.mirrored = np.flatnonzero(self.mirror >= 0)
+        self.active = active
+        # 流出流量：负向部分由 target 流向 source（或汇），耦合项的正向部分由 source 流向 target
+        self.donor = np.concatenate([self.target[active], self.source[self.coupled]])
+        self.receiver = np.concatenate([self.source[active], self.target[self.coupled]])
+        self.transfers = self.receiver >= 0
+
+    def flows(self, rates):
+        """Split signed term rates (terms, zones) into outflow and production magnitudes."""
+        outflow = np.concatenate([np.maximum(-rates[self.active], 0), np.maximum(rates[self.coupled], 0)])
+        return outflow, np.maximum(rates[self.produced], 0)
+
+    def solve(self, y, weights, outflow, production, dt):
+        """One Patankar stage: solve (I + dt * D / weights) y_new = y + dt * production zone by zone."""
+        n_zones = y.shape[1]
+        coefficient = dt * outflow / np.maximum(weights, PATANKAR_FLOOR)[self.donor]
+        matrix = np.zeros((n_zones, self.n_variables, self.n_variables))
+        matrix[:, np.arange(self.n_variables), np.arange(self.n_variables)] = 1.0
+        zones = np.arange(n_zones)[:, None]
+        np.add.at(matrix, (zones, self.donor, self.donor), coefficient.T)
+        np.add.at(matrix, (zones, self.receiver[self.transfers], self.donor[self.transfers]),
+                  -coefficient[self.transfers].T)
+        rhs = y.copy()
+        np.add.at(rhs, self.target[self.produced], dt * production)
+        return np.linalg.solve(matrix, rhs.T[:, :, None])[:, :, 0].T
+
+    def step(self, y, rates, dt):
+        """Advance y by dt; rates(y) returns the signed term rates.
+
+        Returns the new state and the change each term caused over the step,
+        so that the changes of one variable's terms sum to its update.
+        """
+        outflow, production = self.flows(rates(y))
+        y1 = self.solve(y, y, outflow, production, dt)
+        outflow_1, production_1 = self.flows(rates(y1))
+        outflow, production = (outflow + outflow_1) / 2, (production + production_1) / 2
+        y_new = self.solve(y, y1, outflow, production, dt)
+
+        moved = dt * outflow * y_new[self.donor] / np.maximum(y1, PATANKAR_FLOOR)[self.donor]
+        changes = np.zeros((len(self.target), y.shape[1]))
+        changes[self.active] -= moved[:len(self.active)]
+        changes[self.coupled] += moved[len(self.active):]
+        changes[self.produced] += dt * production
+        changes[self.mirrored] = -changes[self.mirror[self.mirrored]]
+        return y_new, changes
+
+class BiogeochemistryEngine:
+    """Nitrogen, phosphorus, CBOD and dissolved-oxygen source/sink terms in one vectorised pass.
+
+    Constants are bound once at construction and the zone state is rebound by
+    reload_parameters() each step; fluxes() evaluates every process of
+    CYCLE_BUDGETS from the plankton rates of the current step and returns the
+    FluxTable consumed by both the state update and the budget accounting.
+    """
+    def __init__(self, parameter_loader, phytoplankton, zooplankton, macroalgal, shellfish, fish, environment=None):
         self.parameter_loader = parameter_loader
-        self.reload_parameters()
-        self.cache = {}  # Cache for computed values
-
-        # Biological constants from the 'Ammonium Nitrogen' tab
-        self.KC_nit = self.get_parameter('KC_nit')[0]
-        self.KT_nit = self.get_parameter('K_T')[0]
-        self.K_nit = self.get_parameter('K_nit')[0]
-        self.KNC_min = self.get_parameter('KNC_min')[0]
-        self.KNT_min = self.get_parameter('K_T')[0]
-
-        # Model components
+        self.environment = EnvironmentFactors(parameter_loader) if environment is None else environment
+        self.owns_environment = environment is None  # 独立使用时自行刷新环境因子，模拟中由 Simulation 每步统一刷新
         self.phytoplankton = phytoplankton
-        self.macroalgal = macroalgal
         self.zooplankton = zooplankton
-        self.shellfish = shellfish
-        self.fish = fish
-
-        # External inputs
-        self.external_NH4_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def reload_parameters(self):
-        get = self.parameter_loader.get_parameter
-        self.T = get("T")
-        self.A = get("A")
-        self.V = get("V")
-        self.H = get("H")
-        self.NH4 = get("NH4")
-        self.NO3 = get("NO3")
-        self.ON = get("ON")
-        self.DO = get("DO")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf in get('N_F')]
-        self.FEED_NH3 = [0.2 * get('FEED_NH3')[0] * m / (v * 1000) for m, a, v in
-                         zip(self.FEED, get('A'), get('V'))]
-
-    def set_external_input(self, external_input):
-        self.external_input = external_input
-        return self.external_input
-
-    def phytoplankton_ammonium_release(self):
-        """Calculate N1_PHY: Phytoplankton death ammonium release"""
-        if 'phytoplankton_ammonium_release' in self.cache:
-            return self.cache['phytoplankton_ammonium_release']
-
-        NC_PHY = self.get_parameter('NC_PHY')[0]
-        FON_PHY = self.get_parameter('FON_PHY')[0]
-        # DPP = self.phytoplankton.loss_rate()
-        # N1_PHY = [NC_PHY * dpp * (1 - FON_PHY) for dpp in DPP]
-        # self.cache['phytoplankton_ammonium_release'] = N1_PHY
-        return [NC_PHY * (1 - FON_PHY)] * 20
-
-    def phytoplankton_ammonium_absorption(self):
-        """Calculate Abs1_PHY: Phytoplankton ammonium absorption"""
-        if 'phytoplankton_ammonium_absorption' in self.cache:
-            return self.cache['phytoplankton_ammonium_absorption']
-
-        NC_PHY = self.get_parameter('NC_PHY')[0]
-        KN_PHY = self.get_parameter('KN_PHY')[0]
-        GPP = self.phytoplankton.growth_rate()
-        PN_PHY = [(nh4 * no3) / ((nh4 + KN_PHY) * (no3 + KN_PHY)) + (nh4 * KN_PHY) / ((nh4 + KN_PHY) * (no3 + KN_PHY))
-                  for nh4, no3 in zip(self.NH4, self.NO3)]
-        Abs1_PHY = [gpp * pn * NC_PHY for gpp, pn in zip(GPP, PN_PHY)]
-
-        self.cache['phytoplankton_ammonium_absorption'] = Abs1_PHY
-        return [pn * NC_PHY for pn in PN_PHY], PN_PHY
-
-    def macroalgal_ammonium_release(self):
-        """Calculate N1_MA: Macroalgal death ammonium release"""
-        if 'macroalgal_ammonium_release' in self.cache:
-            return self.cache['macroalgal_ammonium_release']
-
-        NC_MA = self.get_parameter('NC_MA')[0]
-        DC_MA = self.get_parameter('DC_MA')[0]
-        F_EN_MA = self.macroalgal.update_internal_quotas()[1]
-        F_DN_MA = self.macroalgal.update_internal_quotas()[2]
-        q_N_MA = self.macroalgal.update_internal_quotas()[3]
-        f_ON_MA = [min(1,(NC_MA / DC_MA) / (q_n_ma / 1000)) for q_n_ma in q_N_MA]
-        A_MA = [a * 0.01 for a in self.get_parameter('A')]
-        N1_MA = [((f_en + f_dn) * (1 - f_on_ma) * a_ma ) / v
-                 for f_en, f_dn, f_on_ma, a_ma, v in zip(F_EN_MA, F_DN_MA, f_ON_MA, A_MA, self.V)]
-
-        # i = 4
-        # print(f'N1_MA: {N1_MA[i]}, F_EN_MA: {F_EN_MA[i]}, F_DN_MA: {F_DN_MA[i]}, f_ON_MA: {f_ON_MA[i]}')
-
-        self.cache['macroalgal_ammonium_release'] = N1_MA
-        return N1_MA
-
-    def macroalgal_ammonium_absorption(self):
-        """Calculate Abs1_MA: Macroalgal ammonium absorption"""
-        if 'macroalgal_ammonium_absorption' in self.cache:
-            return self.cache['macroalgal_ammonium_absorption']
-
-        KN_MA = self.get_parameter('KN_MA')[0]
-        F_UN_MA, _, _, _, _, _, _, _ = self.macroalgal.update_internal_quotas()
-        PN_MA = [(nh4 * no3) / ((nh4 + KN_MA) * (no3 + KN_MA)) + (nh4 * KN_MA) / ((nh4 + KN_MA) * (no3 + KN_MA))
-                 for nh4, no3 in zip(self.NH4, self.NO3)]
-        A_MA = [a * 0.01 for a in self.get_parameter('A')]
-        Abs1_MA = [f_un * pn * a_ma / v  for f_un, pn, a_ma, v in zip(F_UN_MA, PN_MA, A_MA, self.V)]
-
-        # i = 4
-        # print(f'Abs1_MA: {Abs1_MA[i]}, F_UN_MA: {F_UN_MA[i]}, PN_MA: {PN_MA[i]}, A_MA: {A_MA[i]}, V: {self.V[i]}')
-
-        self.cache['macroalgal_ammonium_absorption'] = Abs1_MA
-        return Abs1_MA, PN_MA
-
-    def shellfish_ammonium_excretion(self):
-        """Calculate Ex1_SH: Shellfish ammonium excretion"""
-        if 'shellfish_ammonium_excretion' in self.cache:
-            return self.cache['shellfish_ammonium_excretion']
-
-        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
-        mu_V_SH = self.get_parameter('mu_V_SH')[0]
-        NC_PHY = self.get_parameter('NC_PHY')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        NC_SH = self.get_parameter('NC_SH')[0]
-
-        p_C_SH = self.shellfish.catabolic_rate()
-        p_A_SH = self.shellfish.energy_assimilation_rate()
-        _, dE_R_SH_dt = self.shellfish.reproductive_energy_storage_rate()
-        _, dV_SH_dt = self.shellfish.growth_volume()
-
-        Excr_SH = [
-            ((p_c - (1 - kappa_R_SH) * de_r_sh - mu_V_SH * dv_sh) * NC_SH + p_a * max(NC_PHY - NC_SH, 0)) / mu_CJ
-            for p_c, p_a, de_r_sh, dv_sh in zip(p_C_SH, p_A_SH, dE_R_SH_dt, dV_SH_dt)
-        ]
-
-        Ex1_SH = [n_sh * excr_sh / (v * 1000) for n_sh, excr_sh, v in zip(self.shellfish.N_SH, Excr_SH, self.V)]
-        self.cache['shellfish_ammonium_excretion'] = Ex1_SH
-        return Excr_SH
-
-    def fish_ammonium_excretion(self):
-        """Calculate Ex1_F: Fish ammonium excretion"""
-        if 'fish_ammonium_excretion' in self.cache:
-            return self.cache['fish_ammonium_excretion']
-
-        kappa_R_F = self.get_parameter('kappa_R_F')[0]
-        mu_V_F = self.get_parameter('mu_V_F')[0]
-        NC_F = self.get_parameter('NC_F')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        NC_FEED = self.get_parameter('NC_FEED')[0]
-
-        p_C_F = self.fish.catabolic_rate()
-        p_A_F = self.fish.energy_assimilation_rate()
-        _, dE_R_F_dt = self.fish.reproductive_energy_storage_rate()
-        _, dV_F_dt = self.fish.growth_volume()
-
-        Excr_F = [
-            ((p_c - (1 - kappa_R_F) * de_r_f - mu_V_F * dv_f) * NC_F + p_a * max(NC_FEED - NC_F, 0)) / mu_CJ
-            for p_c, p_a, de_r_f, dv_f in zip(p_C_F, p_A_F, dE_R_F_dt, dV_F_dt)
-        ]
-
-        Ex1_F = [n_f * excr_f / (v * 1000) for n_f, excr_f, v in zip(self.fish.N_F, Excr_F, self.V)]
-        self.cache['fish_ammonium_excretion'] = Ex1_F
-        return Excr_F
-
-    def nitrification(self):
-        """Calculate NitN: Ammonium nitrification"""
-        if 'nitrification' in self.cache:
-            return self.cache['nitrification']
-
-        NitN = [self.KC_nit * (self.KT_nit ** (t - 20)) * nh4 * (do / (do + self.K_nit))
-                for nh4, do, t in zip(self.NH4, self.DO, self.T)]
-
-        self.cache['nitrification'] = NitN
-        return NitN
-
-    def mineralization(self):
-        """Calculate MinN: Organic nitrogen mineralization"""
-        if 'mineralization' in self.cache:
-            return self.cache['mineralization']
-
-        MinN = [self.KNC_min * (self.KNT_min ** (t - 20)) * on for on, t in zip(self.ON, self.T)]
-
-        self.cache['mineralization'] = MinN
-        return MinN
-
-    def update_NH4(self):
-        """Calculate the ammonium concentration change in the water"""
-        if 'update_NH4' in self.cache:
-            return self.cache['update_NH4']
-
-        N1_PHY = self.phytoplankton_ammonium_release()
-        N1_MA = self.macroalgal_ammonium_release()
-        Ex1_SH = self.shellfish_ammonium_excretion()
-        Ex1_F = self.fish_ammonium_excretion()
-        MinN = self.mineralization()
-        NitN = self.nitrification()
-        Abs1_PHY = self.phytoplankton_ammonium_absorption()[0]
-        Abs1_MA = self.macroalgal_ammonium_absorption()[0]
-
-        dNH4_dt = [n1_phy + n1_ma + ex1_sh + ex1_f + min_n + feed_nh3 - nit_n - abs1_phy - abs1_ma + ex_nh4
-                   for n1_phy, n1_ma, ex1_sh, ex1_f, min_n, feed_nh3, nit_n, abs1_phy, abs1_ma, ex_nh4 in
-                   zip(N1_PHY, N1_MA, Ex1_SH, Ex1_F, MinN, self.FEED_NH3, NitN, Abs1_PHY, Abs1_MA, self.external_NH4_input)]
-
-        # # Debugging
-        # i = 4
-        # change = abs(N1_PHY[i]) + abs(N1_MA[i]) + abs(Ex1_SH[i]) + abs(Ex1_F[i]) + abs(MinN[i]) + abs(self.FEED_NH3[i]) + abs(NitN[i])+ abs(Abs1_PHY[i]) + abs(Abs1_MA[i]) + abs(self.external_NH4_input[i])
-        # print(f"dNH4_dt: {dNH4_dt[i]}; change: {change}; n1_phy: {N1_PHY[i] / change}; n1_ma: {N1_MA[i] / change}; ex1_sh: {Ex1_SH[i] / change}; ex1_f: {Ex1_F[i] / change}; min_n: {MinN[i] / change}; feed: {self.FEED_NH3[i] / change}; Abs1_PHY: {Abs1_PHY[i] / change}; Abs1_MA: {Abs1_MA[i] / change}; NitN: {NitN[i] / change}; ex_nh4: {self.external_NH4_input[i]/ change}")
-
-        dNH4_dt = np.real_if_close(dNH4_dt, tol=1e-9)
-
-        self.NH4 = [max(0, nh4 + dnh4) for nh4, dnh4 in zip(self.NH4, dNH4_dt)]
-
-        self.cache['update_NH4'] = self.NH4
-        return self.NH4
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep."""
-        self.cache.clear()
-
-class NitrateNitrogen:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal):
-        self.parameter_loader = parameter_loader
-        self.reload_parameters()
-        self.cache = {}  # Cache dictionary to store calculated results
-
-        # Biological constants from the 'Nitrogen' tab
-        self.KC_den = self.get_parameter('KC_den')[0]
-        self.KT_den = self.get_parameter('K_T')[0]
-        self.K_den = self.get_parameter('K_den')[0]
-
-        # Model components
-        self.phytoplankton = phytoplankton
-        self.macroalgal = macroalgal
-
-        # External inputs
-        self.external_NO3_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def reload_parameters(self):
-        get = self.parameter_loader.get_parameter
-        self.T = get("T")
-        self.A = get("A")
-        self.V = get("V")
-        self.H = get("H")
-        self.NO3 = get("NO3")
-        self.NH4 = get("NH4")
-        self.DO = get("DO")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in zip(get('N_F'), self.A)]
-        self.FEED_NO3 = [0.2 * get('FEED_NO3')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
-                         zip(self.FEED, self.A, self.V)]
-
-    def set_external_input(self, external_input):
-        self.external_input = external_input
-        return self.external_input
-
-    def phytoplankton_nitrate_absorption(self):
-        """Calculate Abs2_PHY: Phytoplankton nitrate absorption"""
-        if 'phytoplankton_nitrate_absorption' in self.cache:
-            return self.cache['phytoplankton_nitrate_absorption']
-
-        NC_PHY = self.get_parameter('NC_PHY')[0]
-        # GPP = self.phytoplankton.phy_growth_rate()
-        KN_PHY = self.get_parameter('KN_PHY')[0]
-        PN_PHY = [(nh4 * no3) / ((nh4 + KN_PHY) * (no3 + KN_PHY)) + (nh4 * KN_PHY) / ((nh4 + KN_PHY) * (no3 + KN_PHY))
-                  for nh4, no3 in zip(self.NH4, self.NO3)]
-        # Abs2_PHY = [gpp * (1 - pn) * NC_PHY for gpp, pn in zip(GPP, PN_PHY)]
-
-        # self.cache['phytoplankton_nitrate_absorption'] = Abs2_PHY
-        return [(1 - pn) * NC_PHY for pn in PN_PHY]
-
-    def macroalgal_nitrate_absorption(self):
-        """Calculate Abs2_MA: Macroalgal nitrate absorption"""
-        if 'macroalgal_nitrate_absorption' in self.cache:
-            return self.cache['macroalgal_nitrate_absorption']
-
-        KN_MA = self.get_parameter('KN_MA')[0]
-        F_UN_MA = self.macroalgal.update_internal_quotas()[0]
-        PN_MA = [(nh4 * no3) / ((nh4 + KN_MA) * (no3 + KN_MA)) + (nh4 * KN_MA) / ((nh4 + KN_MA) * (no3 + KN_MA))
-                 for nh4, no3 in zip(self.NH4, self.NO3)]
-        A_MA = [a * 0.01 for a in self.get_parameter('A')]
-        V = self.get_parameter('V')
-        Abs2_MA = [f_un * (1 - pn) * a_ma / v for f_un, pn, a_ma, v in zip(F_UN_MA, PN_MA, A_MA, V)]
-
-        self.cache['macroalgal_nitrate_absorption'] = Abs2_MA
-        return Abs2_MA
-
-    def denitrification(self):
-        """Calculate DenN: Denitrification"""
-        if 'denitrification' in self.cache:
-            return self.cache['denitrification']
-
-        DenN = [self.KC_den * (self.KT_den ** (t - 20)) * no3 * (self.K_den / (do + self.K_den))
-                for no3, do, t in zip(self.NO3, self.DO, self.T)]
-
-        self.cache['denitrification'] = DenN
-        return DenN
-
-    def update_NO3(self):
-        """Calculate the nitrate concentration change in the water"""
-        if 'update_NO3' in self.cache:
-            return self.cache['update_NO3']
-
-        NitN = ammonium.nitrification()  # Use the nitrification rate from AmmoniumNitrogen class
-        Abs2_PHY = self.phytoplankton_nitrate_absorption()
-        Abs2_MA = self.macroalgal_nitrate_absorption()
-        DenN = self.denitrification()
-
-        dNO3_dt = [nit_n + feed_no3 - abs2_phy - abs2_ma - den_n + ex_no3
-                   for nit_n, feed_no3, abs2_phy, abs2_ma, den_n, ex_no3 in zip(NitN, self.FEED_NO3, Abs2_PHY, Abs2_MA, DenN, self.external_NO3_input)]
-
-        # Debugging
-        i = 8
-        change = abs(NitN[i]) + abs(self.FEED_NO3[i]) + abs(Abs2_PHY[i]) + abs(Abs2_MA[i]) + abs(DenN[i]) + abs(self.external_NO3_input[i])
-        print(f"dNO3_dt: {dNO3_dt[i]}; change: {change}; NitN: {NitN[i] / change}; feed: {self.FEED_NO3[i] / change}; Abs2_PHY: {Abs2_PHY[i] / change}; Abs2_MA: {Abs2_MA[i] / change}; DenN: {DenN[i] / change}; ex_no3: {self.external_NO3_input[i]  / change}")
-
-        self.NO3 = [max(1e-12, no3 + dno3) for no3, dno3 in zip(self.NO3, dNO3_dt)]
-
-        self.cache['update_NO3'] = self.NO3
-        return self.NO3
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
-
-class OrganicNitrogen:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish):
-        self.parameter_loader = parameter_loader
-        self.reload_parameters()
-        self.cache = {}  # Cache dictionary to store calculated results
-
-        # Biological constants for mineralization
-        self.KNC_min = self.get_parameter('KNC_min')[0]
-        self.KNT_min = self.get_parameter('K_T')[0]
-
-        # Model components
-        self.phytoplankton = phytoplankton
         self.macroalgal = macroalgal
-        self.zooplankton = zooplankton
         self.shellfish = shellfish
         self.fish = fish
-
-        # External inputs
-        self.external_ON_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def reload_parameters(self):
-        get = self.parameter_loader.get_parameter
-        self.A = get("A")
-        self.V = get("V")
-        self.H = get("H")
-        self.ON = get("ON")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
-                     zip(get('N_F'), get('A'))]
-        self.FEED_ON = [0.2 * get('FEED_ON')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
-                        zip(self.FEED, get('A'), get('V'))]
-
-    def set_external_input(self, external_input):
-        self.external_input = external_input
-        return self.external_input
-
-    def phytoplankton_on_release(self):
-        """Calculate N2_PHY: Phytoplankton death organic nitrogen release"""
-        if 'phytoplankton_on_release' in self.cache:
-            return self.cache['phytoplankton_on_release']
-
-        NC_PHY = self.get_parameter('NC_PHY')[0]
-        FON_PHY = self.get_parameter('FON_PHY')[0]
-        # DPP = self.phytoplankton.phy_loss_rate()
-        # N2_PHY = [NC_PHY * dpp * FON_PHY for dpp in DPP]
-
-        # self.cache['phytoplankton_on_release'] = N2_PHY
-        return [NC_PHY * FON_PHY] * 20
-
-    def macroalgal_on_release(self):
-        """Calculate N2_MA: Macroalgal death and metabolism organic nitrogen release"""
-        if 'macroalgal_on_release' in self.cache:
-            return self.cache['macroalgal_on_release']
-
-        F_DN_MA = self.macroalgal.update_internal_quotas()[2]
-        F_EN_MA = self.macroalgal.update_internal_quotas()[1]
-        A_MA = self.macroalgal.A_MA
-        f_ON_MA = [max(1, (self.get_parameter('NC_MA')[0] / self.get_parameter('DC_MA')[0]) /
-                   (q_n_ma / 1000)) for q_n_ma in self.macroalgal.q_N]
-        mu_sink = self.get_parameter('mu_ON_sink')[0]
-
-        N2_MA = [(f_dn + f_en) * a_ma * f_on_ma * (1 - mu_sink) / v
-                 for f_dn, f_en, f_on_ma, a_ma, v in zip(F_DN_MA, F_EN_MA, f_ON_MA, A_MA, self.V)]
-
-        self.cache['macroalgal_on_release'] = N2_MA
-        return N2_MA
-
-    def zooplankton_on_release(self):
-        """Calculate N2_ZOO: Zooplankton metabolism and death organic nitrogen release"""
-        if 'zooplankton_on_release' in self.cache:
-            return self.cache['zooplankton_on_release']
-
-        NC_PHY = self.get_parameter('NC_PHY')[0]
-        EFF = self.get_parameter('EFF')[0]
-        GRZ = self.zooplankton.grazing_rate()
-        DZ = self.zooplankton.phy_loss_rate()
-        N2_ZOO = [(1 - EFF) * grz + dz * NC_PHY for grz, dz in zip(GRZ, DZ)]
-
-        self.cache['zooplankton_on_release'] = N2_ZOO
-        return N2_ZOO
-
-    def shellfish_on_release(self):
-        """Calculate N2_SH: Shellfish metabolism and death organic nitrogen release"""
-        if 'shellfish_on_release' in self.cache:
-            return self.cache['shellfish_on_release']
-
-        DSH = self.shellfish.DSH
-        N_SH = self.shellfish.N_SH
-        mu_V_SH = self.get_parameter('mu_V_SH')[0]
-        V_SH = self.shellfish.V_SH
-        E_SH = self.shellfish.E_SH
-        E_R_SH = self.shellfish.E_R_SH
-        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
-        NC_SH = self.get_parameter('NC_SH')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        PHY = self.get_parameter('PHY')
-        k_SH_T = self.shellfish.temperature_effect()
-        U_SH = self.get_parameter('U_SH')[0]
-        p_A_SH = self.shellfish.energy_assimilation_rate()
-        mu_sink = self.get_parameter('mu_ON_sink')[0]
-
-        # Death nitrogen loss
-        DN2_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * NC_SH / mu_CJ
-                  for n_sh, v_sh, e_sh, e_r_sh in zip(N_SH, V_SH, E_SH, E_R_SH)]
-
-        # Fecal nitrogen loss
-        FaeceN_SH = [NC_SH * ((k_SH_T * U_SH * phy * v_sh ** (2 / 3)) - p_a_sh / mu_CJ) * n_sh / v_sh
-                     for phy, v_sh, p_a_sh, n_sh in zip(PHY, V_SH, p_A_SH, N_SH)]
-
-        N2_SH = [(dn2_sh + faece_n_sh) * (1 - mu_sink) / (v * 1000)
-                 for dn2_sh, faece_n_sh, v in zip(DN2_SH, FaeceN_SH, self.V)]
-
-        self.cache['shellfish_on_release'] = N2_SH
-        return N2_SH
-
-    def fish_on_release(self):
-        """Calculate N2_F: Fish metabolism and death organic nitrogen release"""
-        if 'fish_on_release' in self.cache:
-            return self.cache['fish_on_release']
-
-        DF = self.get_parameter('DF')[0]
-        N_F = self.fish.N_F
-        mu_V_F = self.get_parameter('mu_V_F')[0]
-        V_F = self.fish.V_F
-        E_F = self.fish.E_F
-        E_R_F = self.fish.E_R_F
-        kappa_R_F = self.get_parameter('kappa_R_F')[0]
-        Q_N_F = self.get_parameter('NC_F')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        k_F_T = self.fish.temperature_effect()
-        U_F = self.get_parameter('U_F')[0]
-        p_A_F = self.fish.energy_assimilation_rate()
-        mu_sink = self.get_parameter('mu_ON_sink')[0]
-
-        # Death nitrogen loss
-        DN2_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * Q_N_F / mu_CJ
-                 for n_f, v_f, e_f, e_r_f in zip(N_F, V_F, E_F, E_R_F)]
-
-        # Fecal nitrogen loss
-        FaeceN_F = [Q_N_F * ((k_F_T * U_F * v_f ** (2 / 3)) - p_a_f / mu_CJ) * n_f / v_f
-                    for v_f, p_a_f, n_f in zip(V_F, p_A_F, N_F)]
-
-        N2_F = [(dn2_f + faece_n_f) * (1 - mu_sink) / (v * 1000)
-                for dn2_f, faece_n_f, v in zip(DN2_F, FaeceN_F, self.V)]
-
-        self.cache['fish_on_release'] = N2_F
-        return N2_F
-
-    def mineralization(self):
-        """Calculate MinN: Organic nitrogen mineralization"""
-        if 'mineralization' in self.cache:
-            return self.cache['mineralization']
-
-        MinN = [self.KNC_min * (self.KNT_min ** (t - 20)) * on for on, t in zip(self.ON, self.macroalgal.T)]
-        self.cache['mineralization'] = MinN
-        return MinN
-
-    def update_ON(self):
-        """Calculate the organic nitrogen concentration change in the water"""
-        if 'update_ON' in self.cache:
-            return self.cache['update_ON']
-
-        N2_PHY = self.phytoplankton_on_release()
-        N2_MA = self.macroalgal_on_release()
-        N2_ZOO = self.zooplankton_on_release()
-        N2_SH = self.shellfish_on_release()
-        N2_F = self.fish_on_release()
-        MinN = self.mineralization()
-
-        dON_dt = [n2_phy + n2_ma + n2_zoo + n2_sh + n2_f + feed_on - min_n + ex_on
-                  for n2_phy, n2_ma, n2_zoo, n2_sh, n2_f, feed_on, min_n, ex_on in zip(N2_PHY, N2_MA, N2_ZOO, N2_SH, N2_F, self.FEED_ON, MinN, self.external_ON_input)]
-
-        i = 4
-        change = abs(N2_PHY[i]) + abs(N2_MA[i]) + abs(N2_ZOO[i]) + abs(N2_SH[i]) + abs(N2_F[i]) + abs(self.FEED_ON[i]) + abs(MinN[i]) + abs(self.external_ON_input[i])
-        print(f"dON_dt: {dON_dt[i]}; change: {change}; N2_PHY: {N2_PHY[i] / change}; N2_MA: {N2_MA[i] / change}; N2_ZOO: {N2_ZOO[i] / change}; N2_SH: {N2_SH[i] / change}; N2_F: {N2_F[i] / change}; feed_on: {self.FEED_ON[i] / change}; MinN: {MinN[i] / change}; ex_on: {self.external_ON_input[i] / change}")
-
-        dON_dt = np.real_if_close(dON_dt, tol=1e-9)
-
-        self.ON = [max(0, on + don) for on, don in zip(self.ON, dON_dt)]
-
-        self.cache['update_ON'] = self.ON
-        return self.ON
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
-
-class InorganicPhosphorus:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal):
-        self.parameter_loader = parameter_loader
         self.reload_parameters()
-        self.cache = {}  # Cache to store computed values
-
-        # Biological constants for mineralization
-        self.KPC_min = self.get_parameter('KPC_min')[0]
-        self.KPT_min = self.get_parameter('K_T')[0]
-        self.KT_ads = self.get_parameter('K_T')[0]
-        self.KT_des = self.get_parameter('K_T')[0]
-        self.K_des = self.get_parameter('K_des')[0]
-        self.K_ads = self.get_parameter('K_ads')[0]
-        self.Q_max = self.get_parameter('Q_max')[0]
-
-        # Phytoplankton and macroalgal components
-        self.phytoplankton = phytoplankton
-        self.macroalgal = macroalgal
-
-        # External inputs
-        self.external_PO4_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def reload_parameters(self):
-        get = self.parameter_loader.get_parameter
-        self.T = get("T")
-        self.A = get("A")
-        self.V = get("V")
-        self.H = get("H")
-        self.PO4 = get("PO4")
-        self.OP = get("OP")
-        self.DO = get("DO")
-        self.PP = get("PP")
-        self.C_SPM = get("C_SPM")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
-                     zip(get('N_F'), self.A)]
-        self.FEED_PO4 = [0.2 * get('FEED_PO4')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
-                         zip(self.FEED, get('A'), get('V'))]
-
-
-    def set_external_input(self, external_input):
-        self.external_input = external_input
-        return self.external_input
-
-    def phytoplankton_phosphate_release(self):
-        """Calculate P1_PHY: Phytoplankton death releasing inorganic phosphorus"""
-        if 'phytoplankton_phosphate_release' in self.cache:
-            return self.cache['phytoplankton_phosphate_release']
-
-        PC = self.get_parameter('PC_PHY')[0]
-        FOP = self.get_parameter('FOP_PHY')[0]
-        # DPP = self.phytoplankton.phy_loss_rate()
-        # P1_PHY = [PC * dpp * (1 - FOP) for dpp in DPP]
-        #
-        # self.cache['phytoplankton_phosphate_release'] = P1_PHY
-        return [PC * (1 - FOP)] * 20
-
-    def macroalgal_phosphate_release(self):
-        """Calculate P1_MA: Macroalgal metabolism and death releasing inorganic phosphorus"""
-        if 'macroalgal_phosphate_release' in self.cache:
-            return self.cache['macroalgal_phosphate_release']
-
-        F_EP_MA = self.macroalgal.update_internal_quotas()[1]
-        F_DP_MA = self.macroalgal.update_internal_quotas()[2]
-        f_OP_MA = [(self.get_parameter('PC_MA')[0] / self.get_parameter('DC_MA')[0]) / (q_p * 1e-3)
-                   for q_p in self.macroalgal.q_P]
-        A_MA = self.macroalgal.A_MA
-        P1_MA = [(f_ep_ma + f_dp_ma) * (1 - f_op_ma) * a_ma / v
-                 for f_ep_ma, f_dp_ma, f_op_ma, a_ma, v in zip(F_EP_MA, F_DP_MA, f_OP_MA, A_MA, self.V)]
-
-        self.cache['macroalgal_phosphate_release'] = P1_MA
-        return P1_MA
-
-    def phosphate_mineralization(self):
-        """Calculate MinP: Organic phosphorus mineralization"""
-        if 'phosphate_mineralization' in self.cache:
-            return self.cache['phosphate_mineralization']
-
-        MinP = [self.KPC_min * (self.KPT_min ** (t - 20)) * op for op, t in zip(self.OP, self.macroalgal.T)]
-
-        self.cache['phosphate_mineralization'] = MinP
-        return MinP
-
-    def phytoplankton_phosphate_absorption(self):
-        """Calculate Abs3_PHY: Phytoplankton absorbing inorganic phosphorus"""
-        if 'phytoplankton_phosphate_absorption' in self.cache:
-            return self.cache['phytoplankton_phosphate_absorption']
-
-        PC = self.get_parameter('PC_PHY')[0]
-        GPP = self.phytoplankton.phy_growth_rate()
-        Abs3_PHY = [gpp * PC for gpp in GPP]
-
-        self.cache['phytoplankton_phosphate_absorption'] = Abs3_PHY
-        return Abs3_PHY
-
-    def macroalgal_phosphate_absorption(self):
-        """Calculate Abs3_MA: Macroalgal absorbing inorganic phosphorus"""
-        if 'macroalgal_phosphate_absorption' in self.cache:
-            return self.cache['macroalgal_phosphate_absorption']
-
-        F_UP_MA = self.macroalgal.update_internal_quotas()[0]  # Phosphorus absorption rate (gP/m²/day)
-        A_MA = self.macroalgal.A_MA  # Area of macroalgal cultivation (m²)
-        Abs3_MA = [f_up_ma * a_ma / v for f_up_ma, a_ma, v in zip(F_UP_MA, A_MA, self.V)]
-
-        self.cache['macroalgal_phosphate_absorption'] = Abs3_MA
-        return Abs3_MA
-
-    def particle_phosphorus_adsorption_desorption(self):
-        if 'particle_phosphorus_adsorption_desorption' in self.cache:
-            return self.cache['particle_phosphorus_adsorption_desorption']
-
-        # PP_ads = [self.K_ads * (self.KT_ads ** (t - 20)) * po4 for t, po4 in zip(self.T, self.PO4)]
-        PP_ads = [self.K_ads * c_spm * (self.KT_ads ** (t - 20)) * (1 - pp / (self.Q_max * c_spm)) * po4 for
-                  c_spm, t, pp, po4 in zip(self.C_SPM, self.T, self.PP, self.PO4)]
-        PP_des = [self.K_des * (self.KT_des ** (t - 20)) * pp for t, pp in zip(self.T, self.PP)]
-
-        PP_ads_des = [pp_ads - pp_des for pp_ads, pp_des in zip(PP_ads, PP_des)]
-
-        self.cache['particle_phosphorus_desorption'] = PP_ads_des
-        return PP_ads_des
-
-    def update_PO4(self):
-        """Calculate the phosphate concentration change in the water"""
-        if 'update_PO4' in self.cache:
-            return self.cache['update_PO4']
-
-        MinP = self.phosphate_mineralization()
-        P1_PHY = self.phytoplankton_phosphate_release()
-        P1_MA = self.macroalgal_phosphate_release()
-        Abs3_PHY = self.phytoplankton_phosphate_absorption()
-        Abs3_MA = self.macroalgal_phosphate_absorption()
-        PP_ads_des = self.particle_phosphorus_adsorption_desorption()
-
-        dPO4_dt = [minp + p1_phy + p1_ma + feed_po4 - abs3_phy - abs3_ma + ex_po4 - pp_ads_des
-                   for minp, p1_phy, p1_ma, feed_po4, abs3_phy, abs3_ma, ex_po4, pp_ads_des in zip(MinP, P1_PHY, P1_MA, self.FEED_PO4, Abs3_PHY, Abs3_MA, self.external_PO4_input, PP_ads_des)]
-
-        self.PO4 = [po4 + dpo4 for po4, dpo4 in zip(self.PO4, dPO4_dt)]
-
-        self.cache['update_PO4'] = self.PO4
-        return self.PO4
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
-
-class OrganicPhosphorus:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish, inorganic_phosphorus):
-        self.parameter_loader = parameter_loader
-        self.reload_parameters()
-        self.cache = {}  # Cache to store computed values
-
-        # Model components
-        self.phytoplankton = phytoplankton
-        self.macroalgal = macroalgal
-        self.zooplankton = zooplankton
-        self.shellfish = shellfish
-        self.fish = fish
-        self.inorganic_phosphorus = inorganic_phosphorus
-
-        # External inputs
-        self.external_OP_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def reload_parameters(self):
-        get = self.parameter_loader.get_parameter
-        self.A = get("A")
-        self.V = get("V")
-        self.H = get("H")
-        self.OP = get("OP")
-        self.DO = get("DO")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
-                     zip(get('N_F'), self.A)]
-        self.FEED_OP = [0.2 * get('FEED_OP')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
-                        zip(self.FEED, self.A, get('V'))]
-
-    def set_external_input(self, external_input):
-        self.external_input = external_input
-        return self.external_input
-
-    def phytoplankton_op_release(self):
-        """Calculate P2_PHY: Phytoplankton death releasing organic phosphorus"""
-        if 'phytoplankton_op_release' in self.cache:
-            return self.cache['phytoplankton_op_release']
-
-        PC = self.get_parameter('PC_PHY')[0]
-        FOP = self.get_parameter('FOP_PHY')[0]
-        # DPP = self.phytoplankton.phy_loss_rate()
-        # P2_PHY = [PC * dpp * FOP for dpp in DPP]
-        #
-        # self.cache['phytoplankton_op_release'] = P2_PHY
-        return [PC * FOP] * 20
-
-    def macroalgal_op_release(self):
-        """Calculate P2_MA: Macroalgal metabolism and death releasing organic phosphorus"""
-        if 'macroalgal_op_release' in self.cache:
-            return self.cache['macroalgal_op_release']
-
-        F_DP_MA = self.macroalgal.update_internal_quotas()[2]
-        F_EP_MA = self.macroalgal.update_internal_quotas()[1]
-        f_OP_MA = [(self.get_parameter('PC_MA')[0] / self.get_parameter('DC_MA')[0]) / (q_p * 1e-3)
-                   for q_p in self.macroalgal.q_P]
-        A_MA = self.macroalgal.A_MA
-        mu_sink = self.get_parameter('mu_OP_sink')[0]
-
-        P2_MA = [(f_dp_ma * (1 - mu_sink) + f_ep_ma) * a_ma * f_op_ma / v
-                 for f_dp_ma, f_ep_ma, f_op_ma, a_ma, v in zip(F_DP_MA, F_EP_MA, f_OP_MA, A_MA, self.V)]
-
-        self.cache['macroalgal_op_release'] = P2_MA
-        return P2_MA
-
-    def zooplankton_op_release(self):
-        """Calculate P2_ZOO: Zooplankton metabolism and death releasing organic phosphorus"""
-        if 'zooplankton_op_release' in self.cache:
-            return self.cache['zooplankton_op_release']
-
-        PC = self.get_parameter('PC_PHY')[0]
-        EFF = self.get_parameter('EFF')[0]
-        GRZ = self.zooplankton.grazing_rate()
-        DZ = self.zooplankton.phy_loss_rate()
-        f_fec = self.get_parameter('f_fec')[0]
-
-        P2_ZOO = [((1 - EFF) * grz * PC + dz * PC) * (1 - f_fec) for grz, dz in zip(GRZ, DZ)]
-
-        self.cache['zooplankton_op_release'] = P2_ZOO
-        return P2_ZOO
-
-    def shellfish_op_release(self):
-        """Calculate P2_SH: Shellfish metabolism and death releasing organic phosphorus"""
-        if 'shellfish_op_release' in self.cache:
-            return self.cache['shellfish_op_release']
-
-        DSH = self.shellfish.DSH
-        N_SH = self.shellfish.N_SH
-        mu_V_SH = self.get_parameter('mu_V_SH')[0]
-        E_SH = self.shellfish.E_SH
-        E_R_SH = self.shellfish.E_R_SH
-        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
-        V_SH = self.shellfish.V_SH
-        QP_SH = self.get_parameter('PC_SH')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        f_PP = self.get_parameter('PC')[0]
-
-        # Death phosphorus loss (mgP/L)
-        DP2_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * QP_SH / mu_CJ /v
-                  for n_sh, v_sh, e_sh, e_r_sh, v in zip(N_SH, V_SH, E_SH, E_R_SH, self.V)]
-
-        # Feces phosphorus loss (mgP/L)
-        PC = self.get_parameter('PC_PHY')[0]
-        k_SH_T = self.shellfish.temperature_effect()
-        U_SH = self.get_parameter('U_SH')[0]
-        PHY = self.shellfish.PHY
-        p_A_SH = self.shellfish.energy_assimilation_rate()
-
-        FaeceP_SH = [PC * (k_SH_T * U_SH * phy * v_sh ** (2 / 3) - p_a_sh / mu_CJ) * n_sh / v_sh / v
-                     for phy, v_sh, p_a_sh, n_sh, v in zip(PHY, V_SH, p_A_SH, N_SH, self.V)]
-
-        P2_SH = [(dp2_sh + faecep_sh) * (1 - f_PP) for dp2_sh, faecep_sh in zip(DP2_SH, FaeceP_SH)]
-
-        self.cache['shellfish_op_release'] = P2_SH
-        return P2_SH
-
-    def fish_op_release(self):
-        """Calculate P2_F: Fish metabolism and death releasing organic phosphorus"""
-        if 'fish_op_release' in self.cache:
-            return self.cache['fish_op_release']
-
-        DF = self.fish.DF
-        N_F = self.fish.N_F
-        mu_V_F = self.get_parameter('mu_V_F')[0]
-        E_F = self.fish.E_F
-        E_R_F = self.fish.E_R_F
-        kappa_R_F = self.get_parameter('kappa_R_F')[0]
-        V_F = self.fish.V_F
-        QP_F = self.get_parameter('PC_F')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        f_PP = self.get_parameter('f_PP')[0]
-
-        # Death phosphorus loss (mgP/L)
-        DP2_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * QP_F / mu_CJ / v
-                 for n_f, v_f, e_f, e_r_f, v in zip(N_F, V_F, E_F, E_R_F, self.V)]
-
-        # Feces phosphorus loss (mgP/L)
-        k_F_T = self.fish.temperature_effect()
-        U_F = self.get_parameter('U_F')[0]
-        p_A_F = self.fish.energy_assimilation_rate()
-
-        FaeceP_F = [QP_F * (k_F_T * U_F * v_f ** (2 / 3) - p_a_f / mu_CJ) * n_f / v_f / v
-                    for v_f, p_a_f, n_f, v in zip(V_F, p_A_F, N_F, self.V)]
-
-        P2_F = [(dp2_f + faecep_f) * (1 - f_PP) for dp2_f, faecep_f in zip(DP2_F, FaeceP_F)]
-
-        self.cache['fish_op_release'] = P2_F
-        return P2_F
-
-    def phosphate_mineralization(self):
-        """Calculate MinP: Organic phosphorus mineralization"""
-        if 'phosphate_mineralization' in self.cache:
-            return self.cache['phosphate_mineralization']
-
-        MinP = self.inorganic_phosphorus.phosphate_mineralization()
-
-        self.cache['phosphate_mineralization'] = MinP
-        return MinP
-
-    def update_OP(self):
-        """Update the organic phosphorus concentration in water"""
-        if 'update_OP' in self.cache:
-            return self.cache['update_OP']
-
-        P2_PHY = self.phytoplankton_op_release()
-        P2_MA = self.macroalgal_op_release()
-        P2_ZOO = self.zooplankton_op_release()
-        P2_SH = self.shellfish_op_release()
-        P2_F = self.fish_op_release()
-        MinP = self.phosphate_mineralization()
-
-        dOP_dt = [p2_phy + p2_ma + p2_zoo + p2_sh + p2_f + feed_op - min_p + ex_op
-                  for p2_phy, p2_ma, p2_zoo, p2_sh, p2_f, feed_op, min_p, ex_op in zip(P2_PHY, P2_MA, P2_ZOO, P2_SH, P2_F, self.FEED_OP, MinP, self.external_OP_input)]
-
-        self.OP = [op + dop for op, dop in zip(self.OP, dOP_dt)]
-
-        self.cache['update_OP'] = self.OP
-        return self.OP
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
-
-class ParticulatePhosphorus:
-    def __init__(self, parameter_loader, phytoplankton, zooplankton, shellfish, fish):
-        self.parameter_loader = parameter_loader
-        self.cache = {}  # Cache for computed values
-
-        # Model components
-        self.phytoplankton = phytoplankton
-        self.zooplankton = zooplankton
-        self.shellfish = shellfish
-        self.fish = fish
-
-        # External inputs
-        self.external_PP_input = None
-
-        # Constants for PP
-        self.K_ads = self.get_parameter('K_ads')[0]  # Adsorption constant for PP
-        self.K_des = self.get_parameter('K_des')[0]  # Desorption constant for PP
-        self.V_set  = self.get_parameter('V_set')[0]  # Settling velocity for PP
-        self.K_resus = self.get_parameter('K_resus')[0]  # Resuspension constant for PP
-        self.KT_ads = self.get_parameter('K_T')[0]  # Temperature effect on adsorption for PP
-        self.KT_des = self.get_parameter('K_T')[0]  # Temperature effect on desorption for PP
-        self.Q_max = self.get_parameter('Q_max')[0]  # Maximum adsorbed quantity for PP
+        self.table = FluxTable(len(self.V))
+        self.lagged_ads_des = None  # 上一步的颗粒磷吸附/解吸通量，无机磷收支沿用（与原实现一致）
+        constant = lambda name: self.get_parameter(name)[0]
+
+        # Stoichiometry and plankton fractions
+        self.NC_PHY, self.PC_PHY = constant('NC_PHY'), constant('PC_PHY')
+        self.FON_PHY, self.FOP_PHY = constant('FON_PHY'), constant('FOP_PHY')
+        self.KN_PHY, self.KN_MA = constant('KN_PHY'), constant('KN_MA')
+        self.NC_MA, self.PC_MA, self.DC_MA = constant('NC_MA'), constant('PC_MA'), constant('DC_MA')
+        self.EFF, self.f_fec, self.f_PP = constant('EFF'), constant('f_fec'), constant('f_PP')
+        self.mu_ON_sink, self.mu_OP_sink = constant('mu_ON_sink'), constant('mu_OP_sink')
+        self.mu_CJ, self.NC_FEED = constant('mu_CJ'), constant('NC_FEED')
+        self.OC, self.ROC_MA = constant('OC'), constant('ROC_MA')
+        self.KR_PHY, self.KR_MA = constant('KR_PHY'), constant('KR_MA')
+
+        # Transformation rates (one temperature coefficient K_T for all of them)
+        self.K_T = constant('K_T')
+        self.KC_nit, self.K_nit = constant('KC_nit'), constant('K_nit')
+        self.KC_den, self.K_den = constant('KC_den'), constant('K_den')
+        self.KNC_min, self.KPC_min = constant('KNC_min'), constant('KPC_min')
+        self.K_ads, self.K_des, self.Q_max = constant('K_ads'), constant('K_des'), constant('Q_max')
+        self.V_set, self.K_resus = constant('V_set'), constant('K_resus')
+        self.KDC, self.K_BOD, self.SOD = constant('KDC'), constant('K_BOD'), constant('SOD')
+
+        # Feed loads and per-species DEB release constants
+        self.M_F, self.FCR_F = constant('M_F'), constant('FCR_F')
+        self.FEED_FRACTIONS = {sub: constant(f'FEED_{sub}') for sub in ['NH3', 'NO3', 'ON', 'PO4', 'OP', 'PP', 'CBOD']}
+        self.release = {
+            population: {'mu_V': constant(f'mu_V_{suffix}'), 'kappa_R': constant(f'kappa_R_{suffix}'),
+                         'U': constant(f'U_{suffix}'), 'NC': constant(f'NC_{suffix}'),
+                         'PC': constant(f'PC_{suffix}')}
+            for population, suffix in [(shellfish, 'SH'), (fish, 'F')]
+        }
 
     def get_parameter(self, name):
         return self.parameter_loader.get_parameter(name)
 
     def reload_parameters(self):
+        if self.owns_environment:
+            self.environment.update()
         get = self.parameter_loader.get_parameter
-        self.T = get("T")
-        self.V = get("V")
-        self.A = get("A")
-        self.H = [v / a for v, a in zip(self.V, self.A)]
-        self.PO4 = get("PO4")
-        self.PP = get("PP")
-        self.C_SPM = get("C_SPM")
-        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
-                     zip(get('N_F'), self.A)]
-        self.FEED_PP = [0.2 * get('FEED_PP')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
-                         zip(self.FEED, get('A'), get('V'))]
-
-    def zooplankton_pp_release(self):
-        if 'zooplankton_op_release' in self.cache:
-            return self.cache['zooplankton_op_release']
-
-        PC = self.get_parameter('PC_PHY')[0]
-        EFF = self.get_parameter('EFF')[0]
-        GRZ = self.zooplankton.grazing_rate()
-        DZ = self.zooplankton.loss_rate()
-        f_fec = self.get_parameter('f_fec')[0]
-
-        PP_ZOO = [((1 - EFF) * grz * PC + dz * PC) * f_fec for grz, dz in zip(GRZ, DZ)]
-
-        self.cache['zooplankton_op_release'] = PP_ZOO
-        return PP_ZOO
-
-    def shellfish_pp_release(self):
-        if 'shellfish_op_release' in self.cache:
-            return self.cache['shellfish_op_release']
-
-        DSH = self.shellfish.DSH
-        N_SH = self.shellfish.N_SH
-        mu_V_SH = self.get_parameter('mu_V_SH')[0]
-        E_SH = self.shellfish.E_SH
-        E_R_SH = self.shellfish.E_R_SH
-        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
-        V_SH = self.shellfish.V_SH
-        QP_SH = self.get_parameter('PC_SH')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        f_PP = self.get_parameter('f_PP')[0]
-
-        # Death phosphorus loss (mgP/L)
-        DP2_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * QP_SH / mu_CJ /v
-                  for n_sh, v_sh, e_sh, e_r_sh, v in zip(N_SH, V_SH, E_SH, E_R_SH, self.V)]
-
-        # Feces phosphorus loss (mgP/L)
-        PC = self.get_parameter('PC_PHY')[0]
-        k_SH_T = self.shellfish.temperature_effect()
-        U_SH = self.get_parameter('U_SH')[0]
-        PHY = self.shellfish.PHY
-        p_A_SH = self.shellfish.energy_assimilation_rate()
-
-        FaeceP_SH = [PC * (k_SH_T * U_SH * phy * v_sh ** (2 / 3) - p_a_sh / mu_CJ) * n_sh / v_sh / v
-                     for phy, v_sh, p_a_sh, n_sh, v in zip(PHY, V_SH, p_A_SH, N_SH, self.V)]
-
-        PP_SH = [(dp2_sh + faecep_sh) * f_PP for dp2_sh, faecep_sh in zip(DP2_SH, FaeceP_SH)]
-
-        self.cache['shellfish_op_release'] = PP_SH
-        return PP_SH
-
-    def fish_pp_release(self):
-        if 'fish_op_release' in self.cache:
-            return self.cache['fish_op_release']
-
-        DF = self.fish.DF
-        N_F = self.fish.N_F
-        mu_V_F = self.get_parameter('mu_V_F')[0]
-        E_F = self.fish.E_F
-        E_R_F = self.fish.E_R_F
-        kappa_R_F = self.get_parameter('kappa_R_F')[0]
-        V_F = self.fish.V_F
-        QP_F = self.get_parameter('PC_F')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-        f_PP = self.get_parameter('f_PP')[0]
-
-        # Death phosphorus loss (mgP/L)
-        DP2_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * QP_F / mu_CJ / v
-                 for n_f, v_f, e_f, e_r_f, v in zip(N_F, V_F, E_F, E_R_F, self.V)]
-
-        # Feces phosphorus loss (mgP/L)
-        k_F_T = self.fish.temperature_effect()
-        U_F = self.get_parameter('U_F')[0]
-        p_A_F = self.fish.energy_assimilation_rate()
-
-        FaeceP_F = [QP_F * (k_F_T * U_F * v_f ** (2 / 3) - p_a_f / mu_CJ) * n_f / v_f / v
-                    for v_f, p_a_f, n_f, v in zip(V_F, p_A_F, N_F, self.V)]
-
-        PP_F = [(dp2_f + faecep_f) * f_PP for dp2_f, faecep_f in zip(DP2_F, FaeceP_F)]
-
-        self.cache['fish_op_release'] = PP_F
-        return PP_F
-
-    def adsorption_and_desorption(self):
-        if 'adsorption_and_desorption' in self.cache:
-            return self.cache['adsorption_and_desorption']
-
-        # PP_ads = [self.K_ads * (self.KT_ads ** (t - 20)) * po4 for t, po4 in zip(self.T, self.PO4)]
-        PP_ads = [self.K_ads * c_spm * (self.KT_ads ** (t - 20)) * (1 - pp / (self.Q_max * c_spm)) * po4 for c_spm, t, pp, po4 in zip(self.C_SPM, self.T, self.PP, self.PO4)]
-        PP_des = [self.K_des * (self.KT_des ** (t - 20)) * pp for t, pp in zip(self.T, self.PP)]
-
-        PP_ads_des = [pp_ads - pp_des for pp_ads, pp_des in zip(PP_ads, PP_des)]
-
-        self.cache['adsorption_and_desorption'] = PP_ads_des
-        return PP_ads_des
-
-    def sink_and_resuspension(self):
-        if 'PP_sink_and_resuspension' in self.cache:
-            return self.cache['PP_sink_and_resuspension']
-
-        PP_set = [self.V_set * pp / h for pp, h in zip(self.PP, self.H)]
-        PP_resus = [pp * self.K_resus for pp in self.PP]
-
-        PP_set_resus = [pp_set - pp_resus for pp_set, pp_resus in zip(PP_set, PP_resus)]
-
-        self.cache['PP_sink_and_resuspension'] = PP_set_resus
-        return PP_set_resus
-
-    def update_PP(self):
-        """Update the particulate phosphorus concentration in water"""
-        if 'update_PP' in self.cache:
-            return self.cache['update_PP']
-
-        PP_ZOO = self.zooplankton_pp_release()
-        PP_SH = self.shellfish_pp_release()
-        PP_F = self.fish_pp_release()
-        PP_ads_des = self.adsorption_and_desorption()
-        PP_set_resus = self.sink_and_resuspension()
-
-        dPP_dt = [pp_zoo + pp_sh + pp_f + pp_ads_des - pp_set_resus
-                  for pp_zoo, pp_sh, pp_f, pp_ads_des, pp_set_resus in zip(PP_ZOO, PP_SH, PP_F, PP_ads_des, PP_set_resus)]
-
-        self.PP = [pp + dp for pp, dp in zip(self.PP, dPP_dt)]
-
-        self.cache['update_PP'] = self.PP
-        return self.PP
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
-
-class CBOD:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish, nitrate):
-        self.parameter_loader = parameter_loader
-        self.cache = {}  # Cache for computed values
-
-        # Load initial CBOD concentration from 'Initial Conditions' tab
-        self.CBOD = self.get_parameter('CBOD')
-        self.DO = self.get_parameter('DO')
-        self.FEED = [nf * self.get_parameter('M_F')[0] * self.get_parameter('FCR_F')[0] / a for nf, a in
-                     zip(self.get_parameter('N_F'), self.get_parameter('A'))]
-        self.FEED_CBOD = [0.2 * self.get_parameter('FEED_CBOD')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
-                        zip(self.FEED, self.get_parameter('A'), self.get_parameter('V'))]
-        self.V = self.get_parameter('V')
-
-        # Constants for CBOD oxidation
-        self.KDC = self.get_parameter('KDC')[0]  # Constant oxidation rate
-        self.KDT = self.get_parameter('K_T')[0]  # Temperature constant for CBOD oxidation
-        self.KBOD = self.get_parameter('K_BOD')[0]  # Half-saturation constant for CBOD oxidation
-
-        # Model components
-        self.phytoplankton = phytoplankton
-        self.macroalgal = macroalgal
-        self.zooplankton = zooplankton
-        self.shellfish = shellfish
-        self.fish = fish
-        self.nitrate = nitrate
-
-        # External inputs
-        self.external_CBOD_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def set_external_input(self, external_CBOD_input):
-        self.external_CBOD_input = external_CBOD_input
-
-    def phytoplankton_cbod(self):
-        """Calculate CBOD_PHY: CBOD generated by phytoplankton death"""
-        if 'phytoplankton_cbod' in self.cache:
-            return self.cache['phytoplankton_cbod']
-
-        OC = self.get_parameter('OC')[0]
-        DPP = self.phytoplankton.phy_loss_rate()
-        CBOD_PHY = [OC * dpp for dpp in DPP]
-
-        self.cache['phytoplankton_cbod'] = CBOD_PHY
-        return CBOD_PHY
-
-    def zooplankton_cbod(self):
-        """Calculate CBOD_ZOO: CBOD generated by zooplankton metabolism and death"""
-        if 'zooplankton_cbod' in self.cache:
-            return self.cache['zooplankton_cbod']
-
-        OC = self.get_parameter('OC')[0]
-        EFF = self.get_parameter('EFF')[0]
-        GRZ = self.zooplankton.grazing_rate()
-        DZ = self.zooplankton.phy_loss_rate()
-
-        CBOD_ZOO = [(1 - EFF) * grz * OC + dz * OC for grz, dz in zip(GRZ, DZ)]
-
-        self.cache['zooplankton_cbod'] = CBOD_ZOO
-        return CBOD_ZOO
-
-    def macroalgal_cbod(self):
-        """Calculate CBOD_MA: CBOD generated by macroalgal metabolism and death"""
-        if 'macroalgal_cbod' in self.cache:
-            return self.cache['macroalgal_cbod']
-
-        DMA = self.macroalgal.calculate_loss_rate()
-        A_MA = self.macroalgal.A_MA
-        QC_MA = self.get_parameter('DC_MA')[0]
-        OC = self.get_parameter('OC')[0]
-
-        CBOD_MA = [dma * a_ma * QC_MA * OC / v for dma, a_ma, v in zip(DMA, A_MA, self.V)]
-
-        self.cache['macroalgal_cbod'] = CBOD_MA
-        return CBOD_MA
-
-    def shellfish_cbod(self):
-        """Calculate CBOD_SH: CBOD generated by shellfish metabolism and death"""
-        if 'shellfish_cbod' in self.cache:
-            return self.cache['shellfish_cbod']
-
-        DSH = self.shellfish.DSH
-        N_SH = self.shellfish.N_SH
-        mu_V_SH = self.get_parameter('mu_V_SH')[0]
-        E_SH = self.shellfish.E_SH
-        E_R_SH = self.shellfish.E_R_SH
-        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
-        V_SH = self.shellfish.V_SH
-        OC = self.get_parameter('OC')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-
-        # Death CBOD release (mgO₂/L)
-        DC_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * OC / mu_CJ / v
-                 for n_sh, v_sh, e_sh, e_r_sh, v in zip(N_SH, V_SH, E_SH, E_R_SH, self.V)]
-
-        # Feces CBOD release (mgO₂/L)
-        k_SH_T = self.shellfish.temperature_effect()
-        U_SH = self.get_parameter('U_SH')[0]
-        PHY = self.shellfish.PHY
-        p_A_SH = self.shellfish.energy_assimilation_rate()
-
-        FaeceC_SH = [OC * (k_SH_T * U_SH * phy * v_sh ** (2 / 3) - p_a_sh / mu_CJ) * n_sh / v_sh / v
-                     for phy, v_sh, p_a_sh, n_sh, v in zip(PHY, V_SH, p_A_SH, N_SH, self.V)]
-
-        CBOD_SH = [dc_sh + faecec_sh for dc_sh, faecec_sh in zip(DC_SH, FaeceC_SH)]
-
-        self.cache['shellfish_cbod'] = CBOD_SH
-        return CBOD_SH
-
-    def fish_cbod(self):
-        """Calculate CBOD_F: CBOD generated by fish metabolism and death"""
-        if 'fish_cbod' in self.cache:
-            return self.cache['fish_cbod']
-
-        DF = self.fish.DF
-        N_F = self.fish.N_F
-        mu_V_F = self.get_parameter('mu_V_F')[0]
-        E_F = self.fish.E_F
-        E_R_F = self.fish.E_R_F
-        kappa_R_F = self.get_parameter('kappa_R_F')[0]
-        V_F = self.fish.V_F
-        OC = self.get_parameter('OC')[0]
-        mu_CJ = self.get_parameter('mu_CJ')[0]
-
-        # Death CBOD release (mgO₂/L)
-        DC_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * OC / mu_CJ / v
-                for n_f, v_f, e_f, e_r_f, v in zip(N_F, V_F, E_F, E_R_F, self.V)]
-
-        # Feces CBOD release (mgO₂/L)
-        k_F_T = self.fish.temperature_effect()  # Temperature effect on fish
-        U_F = self.get_parameter('U_F')[0]  # Maximum feeding rate
-        p_A_F = self.fish.energy_assimilation_rate()
-
-        FaeceC_F = [OC * (k_F_T * U_F * v_f ** (2 / 3) - p_a_f / mu_CJ) * n_f / v_f /v
-                    for v_f, p_a_f, n_f, v in zip(V_F, p_A_F, N_F, self.V)]
-
-        CBOD_F = [dc_f + faecec_f for dc_f, faecec_f in zip(DC_F, FaeceC_F)]
-
-        self.cache['fish_cbod'] = CBOD_F
-        return CBOD_F
-
-    def cbod_oxidation(self):
-        """Calculate OX: CBOD oxidation rate"""
-        if 'cbod_oxidation' in self.cache:
-            return self.cache['cbod_oxidation']
-
-        OX = [self.KDC * (self.KDT ** (t - 20)) * cbod * (do / (do + self.KBOD))
-              for cbod, do, t in zip(self.CBOD, self.DO, self.macroalgal.T)]
-
-        self.cache['cbod_oxidation'] = OX
-        return OX
-
-    def cbod_denitrification(self):
-        """Calculate CBOD_Den: CBOD removal by denitrification"""
-        if 'cbod_denitrification' in self.cache:
-            return self.cache['cbod_denitrification']
-
-        DenN = self.nitrate.denitrification()  # Nitrate denitrification rate (mgN/L)
-        CBOD_Den = [(5 / 4) * (32 / 14) * den_n for den_n in DenN]
-
-        self.cache['cbod_denitrification'] = CBOD_Den
-        return CBOD_Den
-
-    def update_CBOD(self):
-        """Update the CBOD concentration in water"""
-        if 'update_CBOD' in self.cache:
-            return self.cache['update_CBOD']
-
-        CBOD_PHY = self.phytoplankton_cbod()
-        CBOD_MA = self.macroalgal_cbod()
-        CBOD_ZOO = self.zooplankton_cbod()
-        CBOD_SH = self.shellfish_cbod()
-        CBOD_F = self.fish_cbod()
-        OX = self.cbod_oxidation()
-        CBOD_Den = self.cbod_denitrification()
-
-        dCBOD_dt = [cbod_phy + cbod_ma + cbod_zoo + cbod_sh + cbod_f + feed_cbod - ox - cbod_den + ex_cbod
-                    for cbod_phy, cbod_ma, cbod_zoo, cbod_sh, cbod_f, feed_cbod, ox, cbod_den, ex_cbod in
-                    zip(CBOD_PHY, CBOD_MA, CBOD_ZOO, CBOD_SH, CBOD_F, self.FEED_CBOD, OX, CBOD_Den, self.external_CBOD_input)]
-
-        self.CBOD = [cbod + dcbod for cbod, dcbod in zip(self.CBOD, dCBOD_dt)]
-
-        self.cache['update_CBOD'] = self.CBOD
-        return self.CBOD
-
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
-
-class DissolvedOxygen:
-    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish, ammonium, cbod):
-        self.parameter_loader = parameter_loader
-        self.cache = {}  # Cache for computed values
-
-        # Load initial DO concentration from 'Initial Conditions' tab
-        self.DO = self.get_parameter('DO')
-        self.T = self.get_parameter('T')
-        self.H = self.get_parameter('H')
-        self.S = self.get_parameter('S')
-        self.W = self.get_parameter('W')
-        self.v = self.get_parameter('v')
-        self.V = self.get_parameter('V')
-        self.SOD = self.get_parameter('SOD')[0]
-        self.SODT = self.get_parameter('K_T')[0]
-        self.FEED_CBOD = self.get_parameter('FEED_CBOD')[0]
-
-        # Constants for atmospheric exchange
-        self.KAT = self.get_parameter('K_T')[0]
-        self.a = self.get_parameter('a')[0]
-        self.b = self.get_parameter('b')[0]
-        self.c = self.get_parameter('c')[0]
-        self.d = self.get_parameter('d')[0]
-
-        # Model components
-        self.phytoplankton = phytoplankton
-        self.macroalgal = macroalgal
-        self.zooplankton = zooplankton
-        self.shellfish = shellfish
-        self.fish = fish
-        self.ammonium = ammonium
-        self.cbod = cbod
-
-        # External inputs
-        self.external_DO_input = None
-
-    def get_parameter(self, name):
-        return self.parameter_loader.get_parameter(name)
-
-    def set_external_input(self, external_DO_input):
-        self.external_DO_input = external_DO_input
-
-    def do_atmospheric_exchange(self):
-        """Calculate DO_atm: Atmospheric exchange"""
-        if 'do_atmospheric_exchange' in self.cache:
-            return self.cache['do_atmospheric_exchange']
-
-        # Saturation oxygen concentration (mgO₂/L)
-        O_sat = [14.621 * math.exp(-0.0134 * t) / (1 + 0.028 * s) for t, s in zip(self.T, self.S)]
-
-        # O'Connor-Dobbins reaeration coefficient at 20°C (1/day)
-        KA_20 = [(3.93 * (v ** 0.5) / min(5,h) ** 1.5) / 24 for v, h in zip(self.v, self.H)]
-
-        # Temperature-adjusted reaeration coefficient
-        KA = [ka_20 * (1.024 ** (t - 20)) for ka_20, t in zip(KA_20, self.T)]
-
-        # Atmospheric exchange flux (mgO₂/L/day)
-        DO_atm = [ka * (o_sat - max(do, 0)) for ka, o_sat, do in zip(KA, O_sat, self.DO)]
-
-        self.cache['do_atmospheric_exchange'] = DO_atm
-        return DO_atm
-
-    def do_phytoplankton_production(self):
-        """Calculate DO_PHY: Oxygen production by phytoplankton"""
-        if 'do_phytoplankton_production' in self.cache:
-            return self.cache['do_phytoplankton_production']
-
-        GPP = self.phytoplankton.phy_growth_rate()
-        PN_PHY = self.ammonium.phytoplankton_ammonium_absorption()[1]
-        OC = self.get_parameter('OC')[0]
-        NC = self.get_parameter('NC_PHY')[0]
-
-        DO_PHY_NH4 = [pn_phy * gpp * OC for pn_phy, gpp in zip([PN_PHY] * len(GPP), GPP)]
-        DO_PHY_NO3 = [(1 - PN_PHY) * gpp * 32 * (1 / 12 + 1.5 * (NC / 14)) for gpp in GPP]
-
-        DO_PHY = [do_phy_nh4 + do_phy_no3 for do_phy_nh4, do_phy_no3 in zip(DO_PHY_NH4, DO_PHY_NO3)]
-
-        self.cache['do_phytoplankton_production'] = DO_PHY
-        return DO_PHY
-
-    def do_macroalgal_production(self):
-        """Calculate DO_MA: Oxygen production by macroalgal"""
-        if 'do_macroalgal_production' in self.cache:
-            return self.cache['do_macroalgal_production']
-
-        GMA = self.macroalgal.calculate_GMA()
-        A_MA = self.macroalgal.A_MA
-        ROC = self.get_parameter('ROC_MA')[0]
-        ADC = self.get_parameter('DC_MA')[0]
-        PN_MA = self.ammonium.macroalgal_ammonium_absorption()[1]
-        ANC = self.get_parameter('NC_MA')[0]
-
-        DO_MA_NH4 = [gma * a_ma * ROC / ADC * PN_MA for gma, a_ma in zip(GMA, A_MA)]
-        DO_MA_NO3 = [gma * a_ma * ANC / ADC * (1 - PN_MA) * (3 / 2) * (32 / 14) for gma, a_ma in zip(GMA, A_MA)]
-
-        DO_MA = [(do_ma_nh4 + do_ma_no3) / v for do_ma_nh4, do_ma_no3, v in zip(DO_MA_NH4, DO_MA_NO3, self.V)]
-
-        self.cache['do_macroalgal_production'] = DO_MA
-        return DO_MA
-
-    def do_phytoplankton_respiration(self):
-        """Calculate DO_res_PHY: Oxygen consumption by phytoplankton respiration"""
-        if 'do_phytoplankton_respiration' in self.cache:
-            return self.cache['do_phytoplankton_respiration']
-
-        PHY = self.phytoplankton.PHY
-        KR_PHY = self.get_parameter('KR_PHY')[0]
-        KR_T = self.get_parameter('K_T')[0]
-        OC = self.get_parameter('OC')[0]
-
-        RES_PHY = [KR_PHY * (KR_T ** (t - 20)) for t in self.T]
-        DO_res_PHY = [phy * res_phy * OC for phy, res_phy in zip(PHY, RES_PHY)]
-
-        self.cache['do_phytoplankton_respiration'] = DO_res_PHY
-        return DO_res_PHY
-
-    def do_macroalgal_respiration(self):
-        """Calculate DO_res_MA: Oxygen consumption by macroalgal respiration"""
-        if 'do_macroalgal_respiration' in self.cache:
-            return self.cache['do_macroalgal_respiration']
-
-        MA = self.macroalgal.MA
-        A_MA = self.macroalgal.A_MA
-        KR_MA = self.get_parameter('KR_MA')[0]
-        KR_T = self.get_parameter('K_T')[0]
-        OC = self.get_parameter('OC')[0]
-
-        RES_MA = [KR_MA * (KR_T ** (t - 20)) for t in self.T]
-        DO_res_MA = [ma * a_ma * res_ma * OC / v for ma, a_ma, res_ma, v in zip(MA, A_MA, RES_MA, self.V)]
-
-        self.cache['do_macroalgal_respiration'] = DO_res_MA
-        return DO_res_MA
-
-    def do_shellfish_respiration(self, HSH):
-        """Calculate DO_res_SH: Oxygen consumption by shellfish respiration"""
-        if 'do_shellfish_respiration' in self.cache:
-            return self.cache['do_shellfish_respiration']
-
-        N_SH = self.shellfish.population_dynamics(HSH)
-        p_C_SH = self.shellfish.catabolic_rate()
-
-        DO_res_SH = [n_sh * p_c_sh / 14.31 / v for n_sh, p_c_sh, v in zip(N_SH, p_C_SH, self.V)]
-
-        self.cache['do_shellfish_respiration'] = DO_res_SH
-        return DO_res_SH
-
-    def do_fish_respiration(self, HF):
-        """Calculate DO_res_F: Oxygen consumption by fish respiration"""
-        if 'do_fish_respiration' in self.cache:
-            return self.cache['do_fish_respiration']
-
-        N_F = self.fish.population_dynamics(HF)
-        p_C_F = self.fish.catabolic_rate()
-
-        DO_res_F = [n_f * p_c_f / 14.31 / v for n_f, p_c_f, v in zip(N_F, p_C_F, self.V)]
-
-        self.cache['do_fish_respiration'] = DO_res_F
-        return DO_res_F
-
-    def do_nitrification(self):
-        """Calculate DO_Nit: Oxygen consumption by nitrification"""
-        if 'do_nitrification' in self.cache:
-            return self.cache['do_nitrification']
-
-        NitN = self.ammonium.nitrification()
-        DO_Nit = [(64 / 14) * nit_n for nit_n in NitN]
-
-        self.cache['do_nitrification'] = DO_Nit
-        return DO_Nit
-
-    def do_cbod_oxidation(self):
-        """Calculate DO_CBOD: Oxygen consumption by CBOD oxidation"""
-        return self.cbod.cbod_oxidation()
-
-    def do_sediment_oxygen_demand(self):
-        """Calculate DO_SOD: Oxygen consumption by sediment oxygen demand"""
-        if 'do_sediment_oxygen_demand' in self.cache:
-            return self.cache['do_sediment_oxygen_demand']
-
-        DO_SOD = [(self.SOD / h) * (self.SODT ** (t - 20)) for h, t in zip(self.H, self.T)]
-
-        self.cache['do_sediment_oxygen_demand'] = DO_SOD
-        return DO_SOD
-
-    def update_DO(self, HSH, HF):
-        """Update the dissolved oxygen concentration in water"""
-        if 'update_DO' in self.cache:
-            return self.cache['update_DO']
-
-        DO_atm = self.do_atmospheric_exchange()
-        DO_PHY = self.do_phytoplankton_production()
-        DO_MA = self.do_macroalgal_production()
-        DO_res_PHY = self.do_phytoplankton_respiration()
-        DO_res_MA = self.do_macroalgal_respiration()
-        DO_res_SH = self.do_shellfish_respiration(HSH)
-        DO_res_F = self.do_fish_respiration(HF)
-        DO_Nit = self.do_nitrification()
-        DO_CBOD = self.do_cbod_oxidation()
-        DO_SOD = self.do_sediment_oxygen_demand()
-
-        dDO_dt = [
-            do_atm + do_phy + do_ma - do_res_phy - do_res_ma - do_res_sh - do_res_f - do_nit - do_cbod - do_sod + ex_do
-            for do_atm, do_phy, do_ma, do_res_phy, do_res_ma, do_res_sh, do_res_f, do_nit, do_cbod, do_sod, ex_do
-            in
-            zip(DO_atm, DO_PHY, DO_MA, DO_res_PHY, DO_res_MA, DO_res_SH, DO_res_F, DO_Nit, DO_CBOD, DO_SOD, self.external_DO_input)]
-
-        i = 4
-        change = abs(DO_atm[i]) + abs(DO_PHY[i]) + abs(DO_MA[i]) + abs(DO_res_PHY[i]) + abs(DO_res_MA[i]) + abs(DO_res_SH[i]) + abs(DO_res_F[i]) + abs(DO_Nit[i]) + abs(DO_CBOD[i]) + abs(DO_SOD[i]) + abs(self.external_DO_input[i])
-        print(f"dDO_dt: {dDO_dt[i]}, change: {change}, DO_atm:{DO_atm[i] / change}, DO_PHY:{DO_PHY[i] / change}, DO_MA:{DO_MA[i] / change}, DO_res_PHY:{DO_res_PHY[i] / change}, DO_res_MA:{DO_res_MA[i] / change}, DO_res_SH:{DO_res_SH[i] / change}, DO_res_F:{DO_res_F[i] / change}, DO_nit:{DO_Nit[i] / change}, DO_cbod:{DO_CBOD[i] / change}, DO_sod:{DO_SOD[i] / change}, ex_do:{self.external_DO_input[i] / change}")
-
-        self.DO = [do + ddo for do, ddo in zip(self.DO, dDO_dt)]
+        for name in ['A', 'V', 'H', 'C_SPM', 'NH4', 'NO3', 'ON', 'PO4', 'OP', 'PP', 'CBOD', 'DO']:
+            setattr(self, name, get(name))
+        with np.errstate(divide='ignore'):
+            self.H_PP = self.V / self.A  # 颗粒磷沉降用水深（V/A）
+        self.FEED = get('N_F') * get('M_F')[0] * get('FCR_F')[0]
+
+    def feed(self, substance, volume):
+        """Feed-derived load per step (mg/L)."""
+        return (0.8 * self.FEED_FRACTIONS[substance] * self.FEED / (24 * 30 * 12) / 1000) / volume
+
+    def theta(self, T_ref=20):
+        """Temperature correction K_T^(T - T_ref) shared by the first-order transformations."""
+        return self.environment.theta(self.K_T, T_ref)
+
+    def ammonium_preference(self, K):
+        """Fraction of DIN uptake drawn from ammonium for half-saturation constant K."""
+        NH4, NO3 = self.NH4, self.NO3
+        return (NH4 * NO3) / ((NH4 + K) * (NO3 + K)) + (NH4 * K) / ((NH4 + K) * (NO3 + K))
+
+    def excretion(self, population, food_quota):
+        """Ammonium excreted per individual (DEB catabolism minus growth and reproduction)."""
+        c = self.release[population]
+        p_C = population.catabolic_rate()
+        p_A = population.energy_assimilation_rate()
+        _, dE_R = population.reproductive_energy_storage_rate()
+        dV = population.growth_volume()
+        return ((p_C - (1 - c['kappa_R']) * dE_R - c['mu_V'] * dV) * c['NC'] +
+                p_A * max(food_quota - c['NC'], 0)) / self.mu_CJ
+
+    def death_and_faeces(self, population, quota, faeces_quota, prey=None):
+        """Death and faecal release of one element per zone (before dividing by the zone volume)."""
+        c = self.release[population]
+        N, V = population.abundance, population.volume
+        death = population.D * N * (c['mu_V'] * V + population.reserve + population.reproduction * c['kappa_R']) * \
+            quota / self.mu_CJ
+        ingestion = population.temperature_effect() * c['U']
+        if prey is not None:
+            ingestion = ingestion * prey
+        faeces = faeces_quota * (ingestion * V ** (2 / 3) - population.energy_assimilation_rate() / self.mu_CJ) * N / V
+        return death, faeces
+
+    def fluxes(self, volume, external_inputs, phy_growth_rate, phy_loss_rate, zoo_grazing_rate, zoo_loss_rate):
+        """Evaluate every process of CYCLE_BUDGETS for this step into the shared FluxTable."""
+        table, V = self.table, self.V
+        phy, macro, shellfish, fish = self.phytoplankton, self.macroalgal, self.shellfish, self.fish
+        theta = self.theta()
+        phy_growth = phy_growth_rate * phy.PHY
+        zoo_release = (1 - self.EFF) * zoo_grazing_rate + zoo_loss_rate
+
+        # 大型藻类内部配额（缓存元组）与释放比例
+        F_U, F_E, F_D, q_N = macro.update_internal_quotas()[:4]
+        A_MA = self.A * 0.01
+        PN_PHY = self.ammonium_preference(self.KN_PHY)
+        PN_MA = self.ammonium_preference(self.KN_MA)
+        f_ON_dissolved = np.minimum(1, (self.NC_MA / self.DC_MA) / (q_N / 1000))
+        f_ON_organic = np.maximum(1, (self.NC_MA / self.DC_MA) / (macro.q_N / 1000))
+        f_OP = (self.PC_MA / self.DC_MA) / (macro.q_P * 1e-3)
+
+        # 一阶转化过程
+        NitN = self.KC_nit * theta * self.NH4 * (self.DO / (self.DO + self.K_nit))
+        DenN = self.KC_den * theta * self.NO3 * (self.K_den / (self.DO + self.K_den))
+        MinN = self.KNC_min * theta * self.ON
+        MinP = self.KPC_min * theta * self.OP
+        with np.errstate(divide='ignore', invalid='ignore'):
+            PP_ads = self.K_ads * self.C_SPM * theta * (1 - self.PP / (self.Q_max * self.C_SPM)) * self.PO4
+            PP_set = self.V_set * self.PP / self.H_PP
+        ads_des = PP_ads - self.K_des * theta * self.PP
+        OX = self.KDC * theta * self.CBOD * (self.DO / (self.DO + self.K_BOD))
+
+        # 3.1 氨氮
+        table['ammonia', 'external_input'] = external_inputs['NH4']
+        table['ammonia', 'phy_release'] = self.NC_PHY * (1 - self.FON_PHY) * phy_loss_rate * phy.PHY
+        table['ammonia', 'phy_absorption'] = -(PN_PHY * self.NC_PHY) * phy_growth_rate * phy.PHY
+        table['ammonia', 'ma_release'] = ((F_E + F_D) * (1 - f_ON_dissolved) * A_MA) / V
+        table['ammonia', 'ma_absorption'] = -(F_U * PN_MA * A_MA / V)
+        table['ammonia', 'sh_excretion'] = self.excretion(shellfish, self.NC_PHY) * shellfish.N_SH / (volume * 1000)
+        table['ammonia', 'f_excretion'] = self.excretion(fish, self.NC_FEED) * fish.N_F / (volume * 1000)
+        table['ammonia', 'nitrification'] = -NitN
+        table['ammonia', 'mineralization_NH4'] = MinN
+        table['ammonia', 'feed'] = self.feed('NH3', volume)
+
+        # 3.2 硝氮
+        table['nitrate', 'external_input'] = external_inputs['NO3']
+        table['nitrate', 'nitrification'] = NitN
+        table['nitrate', 'phy_absorption'] = -((1 - PN_PHY) * self.NC_PHY) * phy_growth_rate * phy.PHY
+        table['nitrate', 'ma_absorption'] = -(F_U * (1 - PN_MA) * A_MA / V)
+        table['nitrate', 'denitrification'] = -DenN
+        table['nitrate', 'feed'] = self.feed('NO3', volume)
+
+        # 3.3 有机氮（贝类粪便按水柱浮游植物浓度计）
+        sh_death, sh_faeces = self.death_and_faeces(shellfish, self.release[shellfish]['NC'],
+                                                    self.release[shellfish]['NC'], prey=shellfish.PHY)
+        f_death, f_faeces = self.death_and_faeces(fish, self.release[fish]['NC'], self.release[fish]['NC'])
+        table['organic_ammonia', 'external_input'] = external_inputs['ON']
+        table['organic_ammonia', 'phy_release'] = self.NC_PHY * self.FON_PHY * phy_loss_rate * phy.PHY
+        table['organic_ammonia', 'zoo_release'] = zoo_release * self.NC_PHY
+        table['organic_ammonia', 'ma_release'] = (F_D + F_E) * macro.A_MA * f_ON_organic * (1 - self.mu_ON_sink) / V
+        table['organic_ammonia', 'sh_release'] = (sh_death + sh_faeces) * (1 - self.mu_ON_sink) / (V * 1000)
+        table['organic_ammonia', 'f_release'] = (f_death + f_faeces) * (1 - self.mu_ON_sink) / (V * 1000)
+        table['organic_ammonia', 'mineralization_ON'] = -MinN
+        table['organic_ammonia', 'feed'] = self.feed('ON', volume)
+
+        # 3.4 无机磷（与氮共用大型藻类释放/吸收通量）
+        table['inorganic_phosphorus', 'external_input'] = external_inputs['PO4']
+        table['inorganic_phosphorus', 'phy_release'] = self.PC_PHY * (1 - self.FOP_PHY) * phy_loss_rate * phy.PHY
+        table['inorganic_phosphorus', 'phy_absorption'] = -(self.PC_PHY * phy_growth_rate * phy.PHY)
+        table['inorganic_phosphorus', 'ma_release'] = (F_E + F_D) * (1 - f_OP) * macro.A_MA / V
+        table['inorganic_phosphorus', 'ma_absorption'] = -(F_U * macro.A_MA / V)
+        table['inorganic_phosphorus', 'mineralization_PO4'] = MinP
+        table['inorganic_phosphorus', 'particulate_ads_des'] = -(ads_des if self.lagged_ads_des is None
+                                                                 else self.lagged_ads_des)
+        table['inorganic_phosphorus', 'feed'] = self.feed('PO4', volume)
+
+        # 3.5 / 3.6 有机磷与颗粒磷（贝类、鱼类粪便与死亡按 f_PP 分配）
+        sh_death, sh_faeces = self.death_and_faeces(shellfish, self.release[shellfish]['PC'], self.PC_PHY,
+                                                    prey=shellfish.PHY)
+        f_death, f_faeces = self.death_and_faeces(fish, self.release[fish]['PC'], self.release[fish]['PC'])
+        sh_phosphorus = sh_death / V + sh_faeces / V
+        f_phosphorus = f_death / V + f_faeces / V
+        table['organic_phosphorus', 'external_input'] = external_inputs['OP']
+        table['organic_phosphorus', 'phy_release'] = self.PC_PHY * self.FOP_PHY * phy_loss_rate * phy.PHY
+        table['organic_phosphorus', 'zoo_release'] = ((1 - self.f_fec) * (1 - self.EFF) * zoo_grazing_rate +
+                                                      zoo_loss_rate) * self.PC_PHY
+        table['organic_phosphorus', 'ma_release'] = (F_D * (1 - self.mu_OP_sink) + F_E) * macro.A_MA * f_OP / V
+        table['organic_phosphorus', 'sh_release'] = sh_phosphorus * (1 - self.f_PP)
+        table['organic_phosphorus', 'f_release'] = f_phosphorus * (1 - self.f_PP)
+        table['organic_phosphorus', 'mineralization_OP'] = -MinP
+        table['organic_phosphorus', 'feed'] = self.feed('OP', volume)
+
+        table['particulate_phosphorus', 'zoo_release'] = (self.f_fec * (1 - self.EFF) * zoo_grazing_rate +
+                                                          zoo_loss_rate) * self.PC_PHY
+        table['particulate_phosphorus', 'sh_release'] = sh_phosphorus * self.f_PP
+        table['particulate_phosphorus', 'f_release'] = f_phosphorus * self.f_PP
+        table['particulate_phosphorus', 'ads_des'] = ads_des
+        self.lagged_ads_des = ads_des
+        table['particulate_phosphorus', 'set_resus'] = -(PP_set - self.PP * self.K_resus)
+        table['particulate_phosphorus', 'feed'] = self.feed('PP', volume)
+
+        # CBOD（以 mgO2/L 计）
+        sh_death, sh_faeces = self.death_and_faeces(shellfish, self.OC, self.OC, prey=shellfish.PHY)
+        f_death, f_faeces = self.death_and_faeces(fish, self.OC, self.OC)
+        table['cbod', 'external_input'] = external_inputs['CBOD']
+        table['cbod', 'phy_release'] = self.OC * phy_loss_rate * phy.PHY
+        table['cbod', 'zoo_release'] = zoo_release * self.OC
+        table['cbod', 'ma_release'] = macro.calculate_loss_rate() * macro.MA * macro.A_MA * self.DC_MA * self.OC / V
+        table['cbod', 'sh_release'] = sh_death / V + sh_faeces / V
+        table['cbod', 'f_release'] = f_death / V + f_faeces / V
+        table['cbod', 'oxidation'] = -OX
+        table['cbod', 'denitrification'] = -(5 / 4) * (32 / 14) * DenN
+        table['cbod', 'feed'] = self.feed('CBOD', volume)
+
+        # 溶解氧：复氧（饱和度与复氧系数见 EnvironmentFactors）、光合产氧与各项耗氧
+        O_sat, KA = self.environment['oxygen_saturation'], self.environment['reaeration']
+        GMA = macro.calculate_GMA() * macro.MA * macro.A_MA
+        table['oxygen', 'external_input'] = external_inputs['DO']
+        table['oxygen', 'atmospheric_exchange'] = KA * (O_sat - np.maximum(self.DO, 0))
+        table['oxygen', 'phy_production'] = (PN_PHY * phy_growth * self.OC +
+                                             (1 - PN_PHY) * phy_growth * 32 * (1 / 12 + 1.5 * (self.NC_PHY / 14)))
+        table['oxygen', 'ma_production'] = (GMA * self.ROC_MA / self.DC_MA * PN_MA +
+                                            GMA * self.NC_MA / self.DC_MA * (1 - PN_MA) * (3 / 2) * (32 / 14)) / V
+        table['oxygen', 'phy_respiration'] = -(phy.PHY * self.KR_PHY * theta * self.OC)
+        table['oxygen', 'ma_respiration'] = -(macro.MA * A_MA * self.KR_MA * theta * self.OC / V)
+        table['oxygen', 'sh_respiration'] = -(shellfish.N_SH * shellfish.catabolic_rate() / 14.31 / V)
+        table['oxygen', 'f_respiration'] = -(fish.N_F * fish.catabolic_rate() / 14.31 / V)
+        table['oxygen', 'nitrification'] = -(64 / 14) * NitN
+        table['oxygen', 'cbod_oxidation'] = -OX
+        table['oxygen', 'sediment_demand'] = -(self.SOD / self.H) * theta
+        return table
+
+class Forcing:
+    """Hydrodynamic and external-load forcing, loaded once and shared by many runs.
+
+    Wraps a WaterExchange and an ExternalInput. Both only read the zone volumes
+    V from parameter_loader while loading, so one Forcing can drive any number
+    of Simulation runs with the same zoning; with_multipliers() derives a load
+    scenario and with_time_step() the forcing at another time step, both
+    sharing the already loaded data.
+    """
+    def __init__(self, parameter_loader, exchange_data_file, outer_sea_conc_file, river_flow_file, input_files,
+                 outer_sea_scaling=None, input_multipliers=None, time_step=1, cache_dir=None):
+        self.water_exchange = WaterExchange(
+            parameter_loader=parameter_loader,
+            exchange_data_file=exchange_data_file,
+            outer_sea_conc_file=outer_sea_conc_file,
+            river_flow_file=river_flow_file,
+            outer_sea_scaling=outer_sea_scaling,
+            time_step=time_step,
+            cache_dir=cache_dir
+        )
+        self.external_input = ExternalInput(parameter_loader=parameter_loader, waterexchange=self.water_exchange,
+                                            input_files=input_files, input_multipliers=input_multipliers,
+                                            cache_dir=cache_dir)
+
+    def with_multipliers(self, input_multipliers):
+        scenario = copy.copy(self)
+        scenario.external_input = self.external_input.with_multipliers(input_multipliers)
+        return scenario
+
+    def with_time_step(self, time_step):
+        """The same forcing at another time step, aggregated from the hourly prefix sums without reloading."""
+        derived = copy.copy(self)
+        derived.water_exchange = self.water_exchange.with_time_step(time_step)
+        derived.external_input = self.external_input.with_time_step(derived.water_exchange)
+        return derived
+
+    def cache_key(self):
+        # 驱动内容键：输运数据（含时间步长与初始水量）、已载入的外海浓度与外部输入及各自的缩放倍率
+        water_exchange, external_input = self.water_exchange, self.external_input
+        digest = hashlib.sha256(water_exchange.transport_cache_key().encode())
+        for substance, values in sorted(water_exchange.outer_sea_concentrations.items()):
+            digest.update(substance.encode('utf-8'))
+            digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        for values in (external_input.river_data, external_input.static_data, external_input.weights):
+            digest.update(np.ascontiguousarray(values).tobytes())
+        digest.update(json.dumps(water_exchange.outer_sea_scaling, sort_keys=True).encode())
+        return digest.hexdigest()[:32]
+
+class ResultsRecorder:
+    """Preallocated (steps, zones) series of a declared variable list, one row per step.
+
+    record() copies the declared rows of the shared SimulationState (or of a
+    name -> zone array mapping) with a single gather, so every state variable
+    can be recorded at negligible cost. The rows go to one (variables, steps,
+    zones) float64 block; when the horizon exceeds memory_budget bytes only a
+    chunk of chunk_steps steps is held in memory, each full chunk is written
+    to one .npy file per variable under directory (a new temporary directory
+    when None), and series() returns memory maps of those files.
+
+    windows maps a name to an aggregation window in steps (e.g. {'weekly':
+    168}); every row is also written to a buffer holding the current window,
+    which is reduced to mean, min, max and variance as soon as it is full,
+    and aggregates() returns the complete windows (a trailing partial window
+    is left out, as in the block means of the analysis scripts). With
+    keep_series=False only the aggregates are kept.
+    The newest row is folded when the next one arrives, so it can still be
+    rewritten (record(values, index=count - 1)).
+    """
+    def __init__(self, variables, n_zones, num_steps, memory_budget=1 << 30, directory=None, chunk_steps=24 * 30,
+                 windows=None, keep_series=True):
+        self.variables = list(variables)
+        self.n_zones = n_zones
+        self.num_steps = num_steps
+        self.count = 0
+        self.folded = 0  # 已计入聚合的行数（最新一行在下一次记录时计入）
+        self.rows = None  # 状态块中各变量的行号，首次记录 SimulationState 时确定
+        self.last = np.zeros((len(self.variables), n_zones))
+        self.windows = dict(windows or {})
+        for name, steps in self.windows.items():
+            if steps < 1 or steps != int(steps):
+                raise ValueError(f"aggregation window {name!r} must be a whole number of steps, got {steps}")
+        self.partial = {name: np.zeros((steps, len(self.variables), n_zones)) for name, steps in self.windows.items()}
+        self.aggregated = {name: np.zeros((num_steps // steps, len(AGGREGATE_STATISTICS), len(self.variables), n_zones))
+                           for name, steps in self.windows.items()}
+        self.directory = None
+        self.values, self.files, self.chunk_start = None, None, 0
+        if not keep_series:
+            return
+        size = len(self.variables) * num_steps * n_zones * 8
+        if size <= memory_budget:
+            self.values = np.empty((len(self.variables), num_steps, n_zones))
+        else:
+            self.directory = tempfile.mkdtemp(prefix='benmo_records_') if directory is None else directory
+            os.makedirs(self.directory, exist_ok=True)
+            self.values = np.empty((len(self.variables), chunk_steps, n_zones))
+            self.files = [np.lib.format.open_memmap(os.path.join(self.directory, f"{name}.npy"), mode='w+',
+                                                    shape=(num_steps, n_zones)) for name in self.variables]
+
+    def record(self, values, index=None):
+        """写入第 index 步（缺省为下一步）的记录；values 为 SimulationState 或 {变量: 海区数组}"""
+        if index is None:
+            self.fold()
+            index = self.count
+            self.count += 1
+        if index == self.count - 1 and self.folded < self.count:
+            row = self.last
+        elif self.windows:
+            raise ValueError(f"step {index} is already aggregated and can no longer be rewritten")
+        else:
+            row = np.empty_like(self.last)
+        if isinstance(values, SimulationState):
+            if self.rows is None:
+                self.rows = np.array([values.index[name] for name in self.variables])
+            np.take(values.buffer[:, :self.n_zones], self.rows, axis=0, out=row)
+        else:
+            for i, name in enumerate(self.variables):
+                row[i] = values[name][:self.n_zones]
+        if self.values is None:
+            return
+        if self.files is not None and index < self.chunk_start:
+            for series, values in zip(self.files, row):
+                series[index] = values
+            return
+        self.values[:, index - self.chunk_start] = row
+        if self.files is not None and index - self.chunk_start == self.values.shape[1] - 1:
+            self.flush()
+
+    def fold(self):
+        """把尚未计入的最新一行写入各聚合窗口，窗口满时求出均值、最小值、最大值与方差"""
+        if self.folded == self.count:
+            return
+        for name, steps in self.windows.items():
+            k = self.folded % steps  # 本行在窗口内的序号
+            window = self.partial[name]
+            window[k] = self.last
+            if k == steps - 1:
+                self.aggregated[name][self.folded // steps] = (window.mean(axis=0), window.min(axis=0),
+                                                               window.max(axis=0), window.var(axis=0))
+        self.folded += 1
+
+    def flush(self):
+        """把内存中的分块写入各变量的 .npy 文件（仅分块存储时）"""
+        if self.files is None:
+            return
+        rows = self.count - self.chunk_start
+        for series, chunk in zip(self.files, self.values):
+            series[self.chunk_start:self.count] = chunk[:rows]
+            series.flush()
+        self.chunk_start = self.count
+
+    def series(self):
+        """已记录的各变量序列 {变量: (步数, 海区数)}，分块存储时为只读内存映射"""
+        if self.values is None:
+            return {}
+        if self.files is None:
+            return {name: self.values[i, :self.count] for i, name in enumerate(self.variables)}
+        self.flush()
+        return {name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')[:self.count]
+                for name in self.variables}
+
+    def aggregates(self):
+        """各窗口已完成的聚合 {窗口: {统计量: {变量: (窗口数, 海区数)}}}；最新一行随之计入，此后不可改写"""
+        self.fold()
+        return {name: {statistic: {variable: self.aggregated[name][:self.folded // self.windows[name], j, i]
+                                   for i, variable in enumerate(self.variables)}
+                       for j, statistic in enumerate(AGGREGATE_STATISTICS)}
+                for name in self.windows}
+
+    def state_arrays(self):
+        """记录器的完整状态（检查点用）：计数、最新一行、各窗口当前的部分行与已完成的聚合、已记录的序列"""
+        arrays = {'count': np.array([self.count, self.folded]), 'last': self.last}
+        for name in self.windows:
+            arrays[f'partial_{name}'] = self.partial[name]
+            arrays[f'aggregated_{name}'] = self.aggregated[name][:self.folded // self.windows[name]]
+        for name, series in self.series().items():
+            arrays[f'series_{name}'] = series
+        return arrays
+
+    def restore(self, arrays):
+        """由 state_arrays() 的结果恢复记录器，之后的记录与未中断时逐位一致"""
+        self.count, self.folded = (int(value) for value in arrays['count'])
+        self.last[:] = arrays['last']
+        for name in self.windows:
+            self.partial[name][:] = arrays[f'partial_{name}']
+            done = len(arrays[f'aggregated_{name}'])
+            self.aggregated[name][:done] = arrays[f'aggregated_{name}']
+        if self.values is None:
+            return
+        if self.files is None:
+            for i, name in enumerate(self.variables):
+                self.values[i, :self.count] = arrays[f'series_{name}']
+        else:
+            for name, series in zip(self.variables, self.files):
+                series[:self.count] = arrays[f'series_{name}']
+                series.flush()
+            self.chunk_start = self.count
+
+class SimulationResults:
+    """In-memory output of Simulation.run().
+
+    concentrations and biomass map a variable name to a (steps, zones) array
+    and series holds every variable recorded by the run's ResultsRecorder;
+    aggregates maps each aggregation window to {statistic: {variable:
+    (windows, zones) array}} for the complete windows. ledger is the run's
+    ContributionLedger with the cumulative mass (mg) of every budget term per
+    zone, also exposed as contributions ({nutrient: {process: zones}}), and
+    transport the TransportLedger of the mass carried along every edge, from
+    which exported_mass / imported_mass give the exchange with the outer sea.
+    integration counts the reaction solver's accepted steps, right-hand-side
+    and Jacobian evaluations (one step and one evaluation per hour for Euler),
+    and step_sizes holds the adaptive solvers' accepted step sizes (hours).
+    """
+    def __init__(self, concentrations, biomass, ledger, transport, sea_areas, integration=None, series=None,
+                 aggregates=None, step_sizes=None):
+        self.concentrations = concentrations
+        self.biomass = biomass
+        self.series = series or {**concentrations, **biomass}
+        self.aggregates = aggregates or {}
+        self.ledger = ledger
+        self.contributions = ledger.as_dict()
+        self.transport = transport
+        exported, imported = transport.outer_exchange()
+        columns = [transport.substances.index(species) for species, _ in NUTRIENT_BUDGETS.values()]
+        self.exported_mass = dict(zip(NUTRIENT_BUDGETS, exported[columns].tolist()))
+        self.imported_mass = dict(zip(NUTRIENT_BUDGETS, imported[columns].tolist()))
+        self.sea_areas = sea_areas
+        self.integration = integration or {}
+        self.step_sizes = np.asarray(step_sizes if step_sizes is not None else [], dtype=np.float64)
+
+    def step_size_distribution(self, time_step=1):
+        """自适应积分接受步长（小时）的最小值、中位数、90% 分位数、最大值与长于 time_step 的比例"""
+        sizes = self.step_sizes
+        if not len(sizes):
+            return {}
+        return {'min': sizes.min(), 'median': np.median(sizes), 'p90': np.percentile(sizes, 90),
+                'max': sizes.max(), 'above_step': float(np.mean(sizes > time_step))}
+
+    def contributions_table(self):
+        """Cumulative contributions in the cumulative_contributions_3y.csv layout."""
+        return self.ledger.table(self.sea_areas)
+
+    def window_contributions_table(self):
+        """Per-window contributions (config budget_window) in the same layout, led by a Window column."""
+        totals = self.ledger.window_totals()
+        frame = pd.concat([self.ledger.table(self.sea_areas, values) for values in totals] or
+                          [self.ledger.table(self.sea_areas).iloc[:0]], ignore_index=True)
+        frame.insert(0, 'Window', np.repeat(np.arange(len(totals)), len(self.ledger.labels)))
+        return frame
+
+    def transport_table(self):
+        """Net mass (mg) carried along every transport edge per substance over the run."""
+        return self.transport.table()
+
+    def window_transport_table(self):
+        """Per-window edge transport (config budget_window), led by a Window column."""
+        totals = self.transport.window_totals()
+        frame = pd.concat([self.transport.table(values) for values in totals] or [self.transport.table().iloc[:0]],
+                          ignore_index=True)
+        frame.insert(0, 'Window', np.repeat(np.arange(len(totals)), len(self.transport.edges)))
+        return frame
+
+    def net_export_table(self):
+        """Outer-sea mass balance in the net_export_to_outer_sea.csv layout."""
+        rows = []
+        for nutrient, out_mg in self.exported_mass.items():
+            in_mg = self.imported_mass[nutrient]
+            net_mg = out_mg - in_mg
+            rows.append({
+                'Nutrient': nutrient,
+                'Exported_mass_mg': out_mg,
+                'Imported_mass_mg': in_mg,
+                'Net_export_mg': net_mg,
+                'Exported_t': out_mg / 1e9,
+                'Imported_t': in_mg / 1e9,
+                'Net_export_t': net_mg / 1e9
+            })
+        return pd.DataFrame(rows)
+
+def trajectory_config(config):
+    """SIMULATION_DEFAULTS overridden by config, without RESUMABLE_CONFIG_KEYS, normalised through JSON."""
+    config = {key: value for key, value in dict(SIMULATION_DEFAULTS, **(config or {})).items()
+              if key not in RESUMABLE_CONFIG_KEYS}
+    return json.loads(json.dumps(config, sort_keys=True))
+
+class Simulation:
+    """Headless BENMO run: Simulation(params, forcing, config).run() -> SimulationResults.
+
+    params is a ParameterStore (advanced in place), a mapping of parameter
+    overrides, a parameters.json path, or None for the defaults. forcing is a
+    Forcing built for the same zone volumes. config overrides
+    SIMULATION_DEFAULTS. run() only writes to disk when checkpoints are
+    enabled or the recorded series exceed record_memory_budget.
+    """
+    def __init__(self, params, forcing, config=None):
+        self.store = ParameterStore.from_params(params)
+        self.state = self.store.state
+        self.forcing = forcing
+        self.water_exchange = forcing.water_exchange
+        self.external_input = forcing.external_input
+        if not np.array_equal(self.water_exchange.V[:self.state.n_zones], self.state.V):
+            raise ValueError("forcing was loaded for different zone volumes V than params")
+
+        self.config = dict(SIMULATION_DEFAULTS, **(config or {}))
+        seed = self.config['seed']
+        self.rng = np.random if seed is None else np.random.RandomState(seed)
+        self.time_step = self.config['time_step']
+        self.num_steps = self.config['sim_days'] * 24 // self.time_step
+        if self.config['integrator'] not in REACTION_INTEGRATORS:
+            raise ValueError(f"unknown integrator {self.config['integrator']!r}; use one of {REACTION_INTEGRATORS}")
+        if self.time_step != self.water_exchange.time_step:
+            raise ValueError(f"config time_step {self.time_step} h does not match the forcing time step "
+                             f"{self.water_exchange.time_step} h")
+        if self.config['integrator'] == 'mprk' and self.time_step > MPRK_MAX_TIME_STEP:
+            raise ValueError(f"mprk time_step {self.time_step} h exceeds MPRK_MAX_TIME_STEP ({MPRK_MAX_TIME_STEP} h); "
+                             f"coarser steps are stable but deviate more than {MPRK_DEVIATION:.0%} from hourly steps")
+        self.substeps = None
+        if self.config['substeps'] is not None:
+            self.substeps = dict({'transport': self.time_step, 'kinetics': self.time_step, 'deb': self.time_step},
+                                 **self.config['substeps'])
+            if self.config['integrator'] != 'mprk':
+                raise ValueError("substeps require the 'mprk' integrator (sub-steps of several hours)")
+            if self.substeps['transport'] != self.time_step:
+                raise ValueError(f"transport sub-step must equal the forcing time step {self.time_step} h")
+            if self.substeps['kinetics'] % self.time_step or self.substeps['deb'] % self.substeps['kinetics']:
+                raise ValueError(f"sub-steps must be nested multiples: transport | kinetics | deb, got {self.substeps}")
+            if self.num_steps * self.time_step % self.substeps['deb']:
+                raise ValueError(f"run length must be a whole number of deb sub-steps ({self.substeps['deb']} h)")
+
+        app = self.store
+        self.environment = EnvironmentFactors(parameter_loader=app)
+        environment = self.environment
+        self.phy = Phytoplankton(parameter_loader=app, environment=environment)
+        self.zoo = Zooplankton(parameter_loader=app)
+        self.macro_phy = Macroalgal(parameter_loader=app, environment=environment)
+        self.deb = DEBCommunity(app, environment)  # 贝类、鱼类为同一 DEB 引擎的两行，每次求值一并计算
+        self.shellfish = Shellfish(parameter_loader=app, environment=environment, community=self.deb)
+        self.fish = Fish(parameter_loader=app, environment=environment, community=self.deb)
+        self.cycle = BiogeochemistryEngine(parameter_loader=app, phytoplankton=self.phy, zooplankton=self.zoo,
+                                           macroalgal=self.macro_phy, shellfish=self.shellfish, fish=self.fish,
+                                           environment=environment)
+        self.components = (self.phy, self.zoo, self.macro_phy, self.shellfish, self.fish, self.cycle)
+
+        n = self.state.n_zones
+        budget_window = self.config['budget_window']
+        if budget_window is not None and budget_window % self.time_step:
+            raise ValueError(f"budget window ({budget_window} h) is not a multiple of the time step")
+        budget_window = budget_window and budget_window // self.time_step
+        self.ledger = ContributionLedger(n, self.num_steps, budget_window)
+        self.transport = TransportLedger(self.water_exchange, TRANSPORTED_SUBSTANCES, self.num_steps, budget_window)
+        variables = self.config['record_variables']
+        if variables is None:
+            variables = [species for species, _ in NUTRIENT_BUDGETS.values()] + RECORDED_BIOMASS
+        elif variables == 'all':
+            variables = STATE_VARIABLES
+        windows = {}
+        for name, hours in (self.config['aggregation_windows'] or {}).items():
+            if hours % self.time_step:
+                raise ValueError(f"aggregation window {name!r} ({hours} h) is not a multiple of the time step")
+            windows[name] = hours // self.time_step
+        self.recorder = ResultsRecorder(variables, n, self.num_steps, self.config['record_memory_budget'],
+                                        self.config['record_directory'], windows=windows,
+                                        keep_series=self.config['record_series'])
+        self.magnitudes = FluxTable(n)  # 本步各过程变化量的绝对值（mg/L），用于累计贡献
+        self.integration = {'steps': 0, 'rhs_evaluations': 0, 'jacobian_evaluations': 0}
+        self.solver_step = float(self.time_step)  # 自适应积分上一时段末的建议步长（小时）
+        self.segment = None  # 自适应积分当前时段的稠密输出，由 adaptive_step 逐步取出
+        self.step_sizes = []  # 自适应积分各接受步的步长（小时）
+        self.start_step = 0  # run() 的起始时间步，由 load_checkpoint 设置
+
+        # 保正格式的项布局：BIOLOGY_TERMS 之后接过程通量表各行，成对转移的支出行记为接收行的镜像
+        variables = {name: i for i, name in enumerate(REACTION_STATE)}
+        rows = {label: len(BIOLOGY_TERMS) + row for label, row in self.magnitudes.index.items()}
+        target = [variables[name] for name, _ in BIOLOGY_TERMS]
+        target += [variables[CYCLE_BUDGETS[budget][0]] for budget, _ in self.magnitudes.labels]
+        source, mirror = np.full(len(target), -1), np.full(len(target), -1)
+        for receiving, paying in CONSERVATIVE_TRANSFERS:
+            source[rows[receiving]] = variables[CYCLE_BUDGETS[paying[0]][0]]
+            mirror[rows[paying]] = rows[receiving]
+        self.patankar = PatankarSystem(len(REACTION_STATE), target, source, mirror)
+        self.deb_terms = np.array([row for row, (name, _) in enumerate(BIOLOGY_TERMS) if name in DEB_STATE])
+        self.no_inputs = {sub: np.zeros(n) for sub in self.external_input.substances}
+
+    def generate_external_inputs(self, t):
+        """生成动态环境参数（示例随机扰动），直接写入共享状态块"""
+        state = self.state
+        n = state.n_zones
+        state.T[:] = 20 + 5 * np.sin(t / 24 * 2 * np.pi) + self.rng.normal(0, 1, n)
+        state.I[:] = 700000 + 100000 * np.sin(t / 12 * np.pi)
+        state.DO[:] = 6.65 * (1 + 0.1 * self.rng.randn(n))
+
+    @staticmethod
+    def update_water_depth(V, A, H):
+        """按当前水量原地更新水深 H（面积为 0 的海区保持原值）"""
+        V = np.asarray(V)[:len(A)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            H[:] = np.where(A > 0, np.maximum(0.1, V / A), H)
+
+    def cycle_boundary(self, t, period):
+        """第 t 步起点之前的一个时间步内是否经过周期（小时）的整数倍"""
+        return t * self.time_step % period < self.time_step
+
+    def harvest_and_restock(self, t):
+        """收获与放养跳变（贝类半年、鱼类一年、大型藻类三个月一个周期），作用于时段末状态"""
+        state, config = self.state, self.config
+        if self.cycle_boundary(t + 1, 24 * 30 * 3):
+            state.MA *= 1 - 0.8
+        if self.cycle_boundary(t + 1, 24 * 30 * 6):
+            state.N_SH[:] = 0
+        if self.cycle_boundary(t, 24 * 30 * 6):
+            state.V_SH[:] = config['V_SH_initial']
+            state.N_SH[:] = config['N_SH_initial']
+        if self.cycle_boundary(t + 1, 24 * 30 * 12):
+            state.N_F[:] = 0
+        if self.cycle_boundary(t, 24 * 30 * 12):
+            state.V_F[:] = config['V_F_initial']
+            state.N_F[:] = config['N_F_initial']
+
+    def step(self, t):
+        """推进一个时间步（第 t 步覆盖 t·dt 至 (t+1)·dt 小时）"""
+        if self.substeps is not None:
+            return self.split_step(t)
+        if self.config['integrator'] in ADAPTIVE_INTEGRATORS:
+            return self.adaptive_step(t)
+        state, n = self.state, self.state.n_zones
+        water_exchange = self.water_exchange
+        phy, zoo, macro_phy, shellfish, fish = self.phy, self.zoo, self.macro_phy, self.shellfish, self.fish
+        config, dt = self.config, self.time_step
+
+        # 1. 注入外部环境参数（外部输入按每步质量给出，换算为每小时速率）
+        self.generate_external_inputs(t * dt)
+        external_inputs = {sub: values / dt for sub, values in self.external_input.get_external_inputs(t).items()}
+        self.environment.update()  # 温度/光照/盐度/复氧因子每步只计算一次，各过程共享
+        for component in self.components:
+            component.reload_parameters()  # 重新绑定共享状态视图（无拷贝），丢弃上一步的临时量
+        volume = np.array(water_exchange.calculate_volume(t)[:n])
+
+        # 2-3. 生物与化学反应：显式欧拉（原实现）或保正的 MPRK，得到交换前浓度
+        if config['integrator'] == 'euler':
+            reacted = self.euler_reactions(t, volume, external_inputs)
+        else:
+            reacted = self.mprk_reactions(t, volume, external_inputs)
+        self.ledger.accumulate(self.magnitudes, volume)
 
-        self.cache['update_DO'] = self.DO
-        return self.DO
+        # 3.7 CBOD 与溶解氧仅作本地反应更新（溶解氧下一步由环境扰动重新给定）
+        np.maximum(0, reacted['CBOD'], out=state.CBOD)
+        np.maximum(0, reacted['DO'], out=state.DO)
 
-    def reset_cache(self):
-        """Clear the cache at the end of each timestep"""
-        self.cache.clear()
+        # 4. 水交换模拟（输运核同时累计各边搬运的质量，含与外海的交换）
+        water_exchange_params = {'PHY': phy.PHY, 'ZOO': zoo.ZOO}
+        water_exchange_params.update({species: reacted[species] for species, _ in NUTRIENT_BUDGETS.values()})
+        exchanged = water_exchange.exchange(water_exchange_params, t, self.transport)
 
+        # 4.1 按当前水量更新水深（H）
+        self.update_water_depth(water_exchange.calculate_volume(t), self.store.get_parameter('A'), state.H)
 
+        # 4.2 更新交换后状态（向量裁剪，原地写入共享状态块）；MPRK 反应步保正且输运传播子非负，直接写回
+        if config['integrator'] == 'mprk':
+            for name in water_exchange_params:
+                state[name][:] = exchanged[name][:n]
+        else:
+            for name, (lower, upper) in CONCENTRATION_BOUNDS.items():
+                np.clip(exchanged[name][:n], lower, upper, out=state[name])
+        state.MA[:] = macro_phy.MA
+        state.N_SH[:] = shellfish.N_SH
+        state.V_SH[:] = shellfish.V_SH
+        state.N_F[:] = fish.N_F
+        state.V_F[:] = fish.V_F
+
+        # 5. 记录结果（全部海区）
+        self.recorder.record(state)
+
+    def euler_reactions(self, t, volume, external_inputs):
+        """显式欧拉：先依次更新生物量，再由更新后的生物量计算化学通量（原实现），返回交换前浓度"""
+        n = self.state.n_zones
+        phy, zoo, macro_phy, shellfish, fish = self.phy, self.zoo, self.macro_phy, self.shellfish, self.fish
+        config, dt = self.config, self.time_step
+
+        # 2.1 执行贝类生长计算（各速率为计算图派生量，读取时按当前状态求值，状态更新后自动失效）
+        shellfish_rates = shellfish.catabolic_rate(), shellfish.growth_volume()  # 生长前的分解代谢率与体积增长率
+        shellfish_V_growth = dt * np.array(shellfish.growth_volume())
+        shellfish.V_SH = shellfish.V_SH + shellfish_V_growth  # 原实现 growth_volume() 内先累加一次体积
+        shellfish_grs = np.array(shellfish.GRS_PHY())  # 计算贝类对浮游生物的捕食率
+        shellfish.V_SH = shellfish.V_SH + shellfish_V_growth
+        if self.cycle_boundary(t, 24 * 30 * 6):
+            shellfish.V_SH = np.full(n, config['V_SH_initial'])
+        harvest_rate = 1.0 if self.cycle_boundary(t + 1, 24 * 30 * 6) else 0.0
+        shellfish.N_SH = np.maximum(0, shellfish.N_SH * (1 - dt * shellfish.DSH - harvest_rate))
+        if self.cycle_boundary(t, 24 * 30 * 6):
+            shellfish.N_SH = np.array(config['N_SH_initial'], dtype=np.float64)
+
+        # 2.2 执行鱼类生长计算
+        fish_rates = fish.catabolic_rate(), fish.growth_volume()
+        fish_V_growth = dt * np.array(fish.growth_volume())
+        fish.V_F = fish.V_F + fish_V_growth  # 与贝类相同，体积增量累加两次（原实现）
+        fish.V_F = fish.V_F + fish_V_growth
+        if self.cycle_boundary(t, 24 * 30 * 12):
+            fish.V_F = np.full(n, config['V_F_initial'])
+        harvest_rate = 1.0 if self.cycle_boundary(t + 1, 24 * 30 * 12) else 0.0
+        fish.N_F = np.maximum(0, fish.N_F * (1 - dt * fish.DF - harvest_rate))
+        if self.cycle_boundary(t, 24 * 30 * 12):
+            fish.N_F = np.array(config['N_F_initial'], dtype=np.float64)
+
+        # 2.2.1 化学通量沿用原实现的 DEB 求值顺序：分解代谢率与体积增长率取生长前的值，同化与成熟维持按
+        # 更新后的体积计算，繁殖缓存先累加本步的繁殖能量，死亡释放读取累加后的缓存（不写回状态）
+        for population, (p_C, dV) in ((shellfish, shellfish_rates), (fish, fish_rates)):
+            population.graph.hold('catabolic_rate', p_C)
+            population.graph.hold('growth_volume', dV)
+            population.reproduction, _ = population.reproductive_energy_storage_rate()
+
+        # 2.3 执行浮游动物生长计算
+        zoo_grazing_rate = np.array(zoo.grazing_rate())
+        zoo_growth_rate = np.array(zoo.growth_rate())
+        zoo_loss_rate = np.array(zoo.loss_rate())
+        delta_ZOO = zoo_growth_rate - zoo_loss_rate - shellfish_grs
+        zoo.ZOO = np.maximum(1e-12, zoo.ZOO * (1 + dt * delta_ZOO))
+
+        # 2.4 执行浮游植物生长计算
+        phy_growth_rate = np.real_if_close(np.array(phy.growth_rate()), tol=1e-13)
+        phy_loss_rate = np.real_if_close(np.array(phy.loss_rate()), tol=1e-13)
+        delta_PHY = phy_growth_rate - phy_loss_rate - zoo_grazing_rate - shellfish_grs
+        phy.PHY = np.maximum(1e-12, phy.PHY * (1 + dt * delta_PHY))
+
+        # 2.5 执行大型藻类生长计算（内部配额通量首次求值后冻结，按生长前的生物量计算）
+        first_quotas = 'update_internal_quotas' not in macro_phy.graph.values
+        quotas = macro_phy.update_internal_quotas()
+        if first_quotas:
+            macro_phy.q_N, macro_phy.q_P = quotas[3], quotas[7]  # 原实现首次求值时改写本步的配额（不写回状态）
+        macro_phy_growth_rate = np.array(macro_phy.calculate_GMA())
+        macro_phy_loss_rate = np.array(macro_phy.calculate_loss_rate())
+        harvest_rate = 0.8 if self.cycle_boundary(t + 1, 24 * 30 * 3) else 0.0
+        delta_MA = dt * (macro_phy_growth_rate - macro_phy_loss_rate) - harvest_rate
+        macro_phy.MA = np.maximum(1e-12, macro_phy.MA * (1 + delta_MA))
+        macro_phy.graph.hold('calculate_GMA', macro_phy_growth_rate)  # 产氧按生长前的生物量计算（原实现）
+
+        # 3. 氮、磷、CBOD 与溶解氧过程通量（一次向量化计算，得到 (过程, 海区) 通量表）
+        fluxes = self.cycle.fluxes(volume, external_inputs, phy_growth_rate, phy_loss_rate,
+                                   zoo_grazing_rate, zoo_loss_rate)
+        np.abs(fluxes.values, out=self.magnitudes.values)
+        self.magnitudes.values *= dt
+        self.integration['steps'] += 1
+        self.integration['rhs_evaluations'] += 1
+        return {species: self.state[species][:n] + dt * fluxes.net(budget)
+                for budget, (species, _) in CYCLE_BUDGETS.items()}
+
+    def reaction_terms(self, y, volume, external_inputs):
+        """(变量, 海区) 形状的 REACTION_STATE 状态下各反应项的每小时速率：BIOLOGY_TERMS 各项与过程通量表
+
+        生物与化学各项均在同一状态下求值；贝类、鱼类体积增量与欧拉格式一致按两倍计。
+        """
+        state = self.state
+        phy, zoo, macro_phy, shellfish, fish = self.phy, self.zoo, self.macro_phy, self.shellfish, self.fish
+        for name, values in zip(REACTION_STATE, y):
+            state[name][:] = values
+        for component in self.components:
+            component.reload_parameters()  # 重新绑定状态视图，计算图随之失效
+
+        shellfish_grs = shellfish.GRS_PHY()
+        zoo_grazing_rate, zoo_loss_rate = zoo.grazing_rate(), zoo.loss_rate()
+        phy_growth_rate = np.real_if_close(np.array(phy.growth_rate()), tol=1e-13)
+        phy_loss_rate = np.real_if_close(np.array(phy.loss_rate()), tol=1e-13)
+        biology = np.array([
+            phy.PHY * phy_growth_rate, -phy.PHY * phy_loss_rate, -phy.PHY * zoo_grazing_rate, -phy.PHY * shellfish_grs,
+            zoo.ZOO * zoo.growth_rate(), -zoo.ZOO * zoo_loss_rate, -zoo.ZOO * shellfish_grs,
+            macro_phy.MA * macro_phy.calculate_GMA(), -macro_phy.MA * macro_phy.calculate_loss_rate(),
+            *self.deb_rates(),
+        ], dtype=np.float64)
+        fluxes = self.cycle.fluxes(volume, external_inputs, phy_growth_rate, phy_loss_rate,
+                                   zoo_grazing_rate, zoo_loss_rate)
+        return biology, fluxes
+
+    def deb_rates(self):
+        """BIOLOGY_TERMS 中 DEB_STATE 各项（贝类、鱼类死亡与体积增长）的每小时速率"""
+        shellfish, fish = self.shellfish, self.fish
+        return [-shellfish.DSH * shellfish.N_SH, 2 * shellfish.growth_volume(), -fish.DF * fish.N_F,
+                2 * fish.growth_volume()]
+
+    def reaction_rates(self, y, volume, external_inputs):
+        """反应项对 REACTION_STATE 状态向量（按海区排列）的时间导数（每小时），与本次求值的过程通量表"""
+        n = self.state.n_zones
+        biology, fluxes = self.reaction_terms(y.reshape(n, -1).T, volume, external_inputs)
+        derivative = np.zeros((len(REACTION_STATE), n))
+        np.add.at(derivative, self.patankar.target[:len(BIOLOGY_TERMS)], biology)
+        for budget, (species, _) in CYCLE_BUDGETS.items():
+            derivative[REACTION_STATE.index(species)] = fluxes.net(budget)
+        return derivative.T.ravel(), fluxes
+
+    def mprk_reactions(self, t, volume, external_inputs):
+        """二阶修正 Patankar-Runge-Kutta（MPRK22）：一个时间步内求解反应项，返回交换前浓度
+
+        各项按 PatankarSystem 的生产-消耗形式更新：任意步长下浓度与生物量保持非负，因而无需裁剪。
+        CONSERVATIVE_TRANSFERS 中的成对过程按单一转移处理，在两池之间精确守恒；其余吸收、释放与外部输入
+        不成对，氮、磷总量不由格式保证守恒。步长不超过 MPRK_MAX_TIME_STEP（更粗的步长由 __init__ 拒绝）。过程贡献取各项在本步的实际变化量。
+        """
+        state, n = self.state, self.state.n_zones
+        self.macro_phy.update_internal_quotas()  # 配额通量首次求值后冻结（与欧拉格式一致，按初始状态计算）
+        biology_terms = len(BIOLOGY_TERMS)
+
+        def rates(y):
+            biology, fluxes = self.reaction_terms(y, volume, external_inputs)
+            return np.concatenate([biology, fluxes.values])
+
+        y = np.stack([state[name][:n] for name in REACTION_STATE])
+        y, changes = self.patankar.step(y, rates, self.time_step)
+        for name, values in zip(REACTION_STATE, y):
+            state[name][:] = values
+        np.abs(changes[biology_terms:], out=self.magnitudes.values)
+        self.integration['steps'] += 1
+        self.integration['rhs_evaluations'] += 2
+
+        self.harvest_and_restock(t)
+        for component in self.components:
+            component.reload_parameters()
+        return {species: state[species][:n].copy() for species, _ in CYCLE_BUDGETS.values()}
+
+    def harvest_step(self, t):
+        """第 t 步末 harvest_and_restock 是否施加收获或放养跳变"""
+        return (any(self.cycle_boundary(t + 1, period) for period in (24 * 30 * 3, 24 * 30 * 6, 24 * 30 * 12)) or
+                any(self.cycle_boundary(t, period) for period in (24 * 30 * 6, 24 * 30 * 12)))
+
+    def segment_end(self, t):
+        """自第 t 步起的积分时段终点（不含）：止于下一次收获/放养跳变或检查点间隔
+
+        无论是否写检查点都在检查点间隔处分段，续算与不间断运行的时段划分因而一致。
+        """
+        checkpoint_interval = self.config['checkpoint_interval']
+        for end in range(t + 1, self.num_steps):
+            if self.harvest_step(end - 1) or self.cycle_boundary(end, checkpoint_interval):
+                return end
+        return self.num_steps
+
+    def integrate_segment(self, t):
+        """自第 t 步起用 scipy 自适应积分器一次求解到下一次收获/放养跳变（可跨越多个驱动时段）
+
+        右端项包含反应项与输运：温度、光照、溶解氧、水深、水量、外部输入、外海浓度与逐步输运传播子
+        均以各步起点的逐时值为节点作 Catmull-Rom 插值（时段最后一步保持常值，不预取下一时段的随机驱动），
+        输运取 (P_k - I)/dt 作用于含外海边界行的浓度。溶解氧与逐时格式一样由各步的环境扰动给定，
+        其状态分量只积分反应引起的累计变化。逐时格式在各步末把输运物质裁剪到 CONCENTRATION_BOUNDS，
+        连续积分中改为在界限内侧 20% 下限宽度内把指向界外的导数线性减至 0（CBOD 不设界限，
+        记录与时段重启时取不低于 0）；吸附/解吸通量不再滞后一步。积分器按稠密输出在各步末取值，
+        各过程变化量的绝对值作为附加积分量随状态一同积分（不参与步长控制）。
+        结果存入 self.segment，由 adaptive_step 逐步取出。
+        """
+        from scipy import integrate, sparse
+        state, n, config, dt = self.state, self.state.n_zones, self.config, self.time_step
+        water_exchange = self.water_exchange
+        end = self.segment_end(t)
+        steps = np.arange(t, end)
+        hours = len(steps)
+
+        # 各步起点的驱动节点（随机驱动按步依次生成，与逐时格式的随机数序列一致）
+        T, I, DO, loads = np.empty((hours, n)), np.empty((hours, n)), np.empty((hours, n)), {}
+        for j, k in enumerate(steps):
+            self.generate_external_inputs(k * dt)
+            T[j], I[j], DO[j] = state.T, state.I, state.DO
+            for sub, values in self.external_input.get_external_inputs(k).items():
+                loads.setdefault(sub, np.empty((hours, n)))[j] = values / dt
+        volume = np.array([water_exchange.calculate_volume(k)[:n] for k in steps])
+        H = np.empty((hours, n))
+        H[0] = state.H
+        for j in range(1, hours):
+            H[j] = H[j - 1]
+            self.update_water_depth(water_exchange.calculate_volume(steps[j] - 1), self.store.get_parameter('A'), H[j])
+        boundary = np.array([water_exchange.outer_sea_boundary(TRANSPORTED_SUBSTANCES, k) for k in steps])
+        generator = np.array([water_exchange.step_propagator(k) for k in steps])
+        generator[:, np.arange(n + 1), np.arange(n + 1)] -= 1.0
+        generator /= dt
+
+        num_vars = len(REACTION_STATE)
+        size = n * num_vars
+        transported = np.array([REACTION_STATE.index(name) for name in TRANSPORTED_SUBSTANCES])
+        oxygen = REACTION_STATE.index('DO')
+        lower, upper = np.full(num_vars, -np.inf), np.full(num_vars, np.inf)
+        for name, bounds in CONCENTRATION_BOUNDS.items():
+            lower[REACTION_STATE.index(name)], upper[REACTION_STATE.index(name)] = bounds
+        ramp = np.where(np.isfinite(lower), 0.2 * lower, 1.0)  # 界限内侧的过渡宽度，使右端项在界限处连续
+        t_start = float(t * dt)
+
+        def node(table, tau):
+            # 第 k 步节点与第 k+1 步节点之间按 Catmull-Rom 三次 Hermite 插值（一阶导数连续；最后一步保持常值）
+            position = min(max((tau - t_start) / dt, 0.0), hours)
+            k = min(int(position), hours - 1)
+            w = position - k if k + 1 < hours else 0.0
+            if w == 0.0:
+                return table[k]
+            slope_k = (table[k + 1] - table[max(k - 1, 0)]) / (2 if k > 0 else 1)
+            slope_next = (table[min(k + 2, hours - 1)] - table[k]) / (2 if k + 2 < hours else 1)
+            w2, w3 = w * w, w * w * w
+            return ((2 * w3 - 3 * w2 + 1) * table[k] + (w3 - 2 * w2 + w) * slope_k +
+                    (3 * w2 - 2 * w3) * table[k + 1] + (w3 - w2) * slope_next)
+
+        def rhs(tau, y):
+            state.T[:], state.I[:], state.H[:] = node(T, tau), node(I, tau), node(H, tau)
+            self.environment.update()
+            self.cycle.lagged_ads_des = None
+            concentrations = y[:size].reshape(n, num_vars).copy()
+            concentrations[:, oxygen] = node(DO, tau)
+            derivative, fluxes = self.reaction_rates(concentrations.ravel(), node(volume, tau),
+                                                     {sub: node(values, tau) for sub, values in loads.items()})
+            derivative = derivative.reshape(n, num_vars)
+            C = np.vstack([concentrations[:, transported], node(boundary, tau)])
+            derivative[:, transported] += (node(generator, tau) @ C)[:n]
+            derivative *= np.where(derivative < 0, np.clip((concentrations - lower) / ramp, 0, 1),
+                                   np.clip((upper - concentrations) / ramp, 0, 1))
+            self.integration['rhs_evaluations'] += 1
+            return np.concatenate([derivative.ravel(), np.abs(fluxes.values).ravel()])
+
+        self.macro_phy.update_internal_quotas()  # 配额通量首次求值后冻结（与逐时欧拉一致）
+        y = np.stack([state[name][:n] for name in REACTION_STATE], axis=1)
+        y[:, oxygen] = 0.0  # 溶解氧分量为反应引起的累计变化
+        y = np.concatenate([y.ravel(), np.zeros(self.magnitudes.values.size)])
+        atol = np.concatenate([np.full(size, config['atol']), np.full(y.size - size, 1e30)])  # 附加积分量不控误差
+        t_end = float(end * dt)
+        options = {'rtol': config['rtol'], 'atol': atol, 'first_step': min(self.solver_step, t_end - t_start)}
+        if config['integrator'] == 'BDF':
+            # 反应只耦合同一海区的变量，输运只耦合不同海区的同一输运物质；附加积分量只依赖本海区状态
+            index = np.arange(size)
+            zone, variable = index // num_vars, index % num_vars
+            coupled = (zone[:, None] == zone[None, :]) | \
+                ((variable[:, None] == variable[None, :]) & np.isin(variable, transported)[:, None])
+            quadrature_zone = np.arange(y.size - size) % n
+            options['jac_sparsity'] = sparse.vstack([
+                sparse.hstack([sparse.csc_matrix(coupled), sparse.csc_matrix((size, y.size - size))]),
+                sparse.hstack([sparse.csc_matrix(quadrature_zone[:, None] == zone[None, :]),
+                               sparse.csc_matrix((y.size - size, y.size - size))])], format='csc')
+        solver = getattr(integrate, config['integrator'])(rhs, t_start, y, t_end, **options)
+
+        # 稠密输出在各步末取值：outputs[j] 为第 t + j 步起点的状态与附加积分量
+        outputs = np.empty((hours + 1, y.size))
+        outputs[0] = y
+        filled = 1
+        while solver.status == 'running':
+            message = solver.step()
+            if solver.status == 'failed':
+                raise RuntimeError(f"{config['integrator']} failed in the segment starting at step {t}: {message}")
+            self.integration['steps'] += 1
+            self.step_sizes.append(solver.step_size)
+            reached = min(int(np.floor((solver.t - t_start) / dt + 1e-9)), hours)
+            if reached >= filled:
+                dense = solver.dense_output()
+                for j in range(filled, reached + 1):
+                    outputs[j] = solver.y if j == hours else dense(t_start + j * dt)
+                filled = reached + 1
+        outputs[hours] = solver.y
+        self.integration['jacobian_evaluations'] += int(getattr(solver, 'njev', 0))
+        self.solver_step = getattr(solver, 'h_abs', None) or solver.step_size
+        self.segment = {'start': t, 'end': end, 'outputs': outputs, 'T': T, 'I': I, 'DO': DO, 'boundary': boundary,
+                        'volume': volume}
+
+    def adaptive_step(self, t):
+        """自适应积分的一个时间步：必要时求解新的积分时段，再按稠密输出写入第 t 步末的状态与收支"""
+        if self.segment is None or not self.segment['start'] <= t < self.segment['end']:
+            self.integrate_segment(t)
+        segment, state, n = self.segment, self.state, self.state.n_zones
+        water_exchange = self.water_exchange
+        j = t - segment['start']
+        size = n * len(REACTION_STATE)
+        start, end = segment['outputs'][j], segment['outputs'][j + 1]
+
+        # 过程贡献：附加积分量在本步内的增量
+        self.magnitudes.values[:] = (end[size:] - start[size:]).reshape(self.magnitudes.values.shape)
+        self.ledger.accumulate(self.magnitudes, segment['volume'][j])
+
+        # 输运质量：按本步起点的浓度（含外海边界行）累计各边搬运的质量
+        transported = [REACTION_STATE.index(name) for name in TRANSPORTED_SUBSTANCES]
+        C = np.vstack([start[:size].reshape(n, -1)[:, transported], segment['boundary'][j]])
+        self.transport.accumulate(water_exchange.edge_flux[t], C)
+
+        # 本步末状态：生物量取下限，时段末施加收获与放养；驱动取本步节点值，水深按本步水量更新
+        for name, values in zip(REACTION_STATE, end[:size].reshape(n, -1).T):
+            state[name][:] = values
+        state.T[:], state.I[:] = segment['T'][j], segment['I'][j]
+        state.DO[:] = segment['DO'][j] + end[:size].reshape(n, -1)[:, REACTION_STATE.index('DO')] - \
+            start[:size].reshape(n, -1)[:, REACTION_STATE.index('DO')]
+        np.maximum(1e-12, state.PHY, out=state.PHY)
+        np.maximum(1e-12, state.ZOO, out=state.ZOO)
+        np.maximum(1e-12, state.MA, out=state.MA)
+        np.maximum(0, state.CBOD, out=state.CBOD)
+        np.maximum(0, state.DO, out=state.DO)
+        if t + 1 == segment['end']:
+            self.harvest_and_restock(t)
+            self.segment = None
+        np.maximum(0, state.N_SH, out=state.N_SH)
+        np.maximum(0, state.N_F, out=state.N_F)
+        self.update_water_depth(water_exchange.calculate_volume(t), self.store.get_parameter('A'), state.H)
+        for component in self.components:
+            component.reload_parameters()
+        self.recorder.record(state)
+
+    def split_reactions(self, group, hours, volume):
+        """分裂格式中一个过程组的反应子步（MPRK），变化量累加到 self.magnitudes
+
+        'kinetics' 组为浮游生物、大型藻类与氮磷/CBOD/溶解氧过程（外部负荷归入输运组），
+        'deb' 组为贝类、鱼类的死亡与体积增长；子步内另一组的状态保持不变。
+        """
+        state, n = self.state, self.state.n_zones
+        biology_terms = len(BIOLOGY_TERMS)
+
+        def kinetics_rates(y):
+            biology, fluxes = self.reaction_terms(y, volume, self.no_inputs)
+            biology[self.deb_terms] = 0.0
+            return np.concatenate([biology, fluxes.values])
+
+        def deb_rates(y):
+            for name, values in zip(REACTION_STATE, y):
+                state[name][:] = values
+            self.shellfish.reload_parameters()
+            self.fish.reload_parameters()
+            rates = np.zeros((len(self.patankar.target), n))
+            rates[self.deb_terms] = self.deb_rates()
+            return rates
+
+        if group == 'kinetics':
+            self.macro_phy.update_internal_quotas()
+        y = np.stack([state[name][:n] for name in REACTION_STATE])
+        y, changes = self.patankar.step(y, kinetics_rates if group == 'kinetics' else deb_rates, hours)
+        for name, values in zip(REACTION_STATE, y):
+            state[name][:] = values
+        self.magnitudes.values += np.abs(changes[biology_terms:])
+        self.integration['steps'] += 1
+        self.integration['rhs_evaluations'] += 2
+        for component in self.components:
+            component.reload_parameters()
+
+    def split_step(self, t):
+        """多速率 Strang 分裂的一个输运步：慢过程组在外层，相邻的半步合并
+
+        一个 DEB 周期内的顺序为 D(½) [K(½) T … T K(½)] … D(½)：反应子步在周期边界处执行，
+        其间逐步输运，外部负荷随输运逐步注入，收获与放养仍按小时判断。
+        """
+        state, n = self.state, self.state.n_zones
+        water_exchange = self.water_exchange
+        kinetics, deb = self.substeps['kinetics'], self.substeps['deb']
+        hour = t * self.time_step
+
+        # 1. 注入外部环境参数
+        self.generate_external_inputs(hour)
+        loads = self.external_input.get_external_inputs(t)
+        self.environment.update()
+        for component in self.components:
+            component.reload_parameters()
+        volume = np.array(water_exchange.calculate_volume(t)[:n])
+
+        # 2. 周期边界上的反应子步
+        self.magnitudes.values[:] = 0.0
+        if hour == 0:
+            self.split_reactions('deb', deb / 2, volume)
+            self.split_reactions('kinetics', kinetics / 2, volume)
+        elif hour % deb == 0:
+            self.split_reactions('kinetics', kinetics / 2, volume)
+            self.split_reactions('deb', deb, volume)
+            self.split_reactions('kinetics', kinetics / 2, volume)
+        elif hour % kinetics == 0:
+            self.split_reactions('kinetics', kinetics, volume)
+        self.harvest_and_restock(t)
+        for budget, (species, processes) in CYCLE_BUDGETS.items():
+            if 'external_input' in processes:
+                state[species][:] += loads[species]
+                self.magnitudes[budget, 'external_input'] += loads[species]
+        for component in self.components:
+            component.reload_parameters()
+        self.ledger.accumulate(self.magnitudes, volume)
+
+        # 3. 输运（传播子非负，直接写回，同时累计各边搬运的质量）与水深
+        exchanged = water_exchange.exchange({name: state[name][:n] for name in TRANSPORTED_SUBSTANCES}, t,
+                                            self.transport)
+        for name, values in exchanged.items():
+            state[name][:] = values[:n]
+        self.update_water_depth(water_exchange.calculate_volume(t), self.store.get_parameter('A'), state.H)
+
+        self.recorder.record(state)
+
+    def finish_split(self):
+        """模拟末尾补齐最后的半步 K(½) D(½)，计入末步的过程贡献（含末窗口快照）并改写末步记录
+
+        收尾不属于续算轨迹：检查点在收尾之前写入，从中继续的模拟与不间断运行逐位一致。
+        """
+        state, n = self.state, self.state.n_zones
+        volume = np.array(self.water_exchange.calculate_volume(self.num_steps - 1)[:n])
+        self.magnitudes.values[:] = 0.0
+        self.split_reactions('kinetics', self.substeps['kinetics'] / 2, volume)
+        self.split_reactions('deb', self.substeps['deb'] / 2, volume)
+        self.ledger.accumulate(self.magnitudes, volume)
+        if self.ledger.window and self.num_steps % self.ledger.window == 0:
+            self.ledger.snapshot(replace=True)
+        self.recorder.record(state, index=self.recorder.count - 1)
+
+    def run(self):
+        """运行全部时间步（从检查点恢复时从 start_step 继续），按设置定期写检查点，返回内存中的结果"""
+        timesteps = range(self.start_step, self.num_steps)
+        if self.config['progress']:
+            from tqdm import tqdm
+            timesteps = tqdm(timesteps, desc="模拟进度", ncols=100, initial=self.start_step, total=self.num_steps)
+        checkpoint_path = self.config['checkpoint_path']
+        budget_window = self.ledger.window
+        for t in timesteps:
+            self.step(t)
+            if budget_window and (t + 1) % budget_window == 0:
+                self.ledger.snapshot()
+                self.transport.snapshot()
+            if checkpoint_path and self.cycle_boundary(t + 1, self.config['checkpoint_interval']):
+                self.save_checkpoint(checkpoint_path, t + 1)
+        if self.substeps is not None:
+            self.finish_split()
+        return self.results()
+
+    def checkpoint_config(self):
+        """决定模拟轨迹的设置（JSON 规范化），续算时必须与检查点一致"""
+        return trajectory_config(self.config)
+
+    def save_checkpoint(self, path, t):
+        """把第 t 步开始前的完整模型状态写入 .npz 检查点（同目录临时文件落盘后原子替换）
+
+        包括共享状态块（全部状态与驱动变量，含水深 H）、累计贡献与各边输运质量及其窗口快照、结果记录器（已记录的序列
+        与各聚合窗口的累积量）、随机数状态、积分计数，以及跨步保留的量（冻结的大型藻类配额通量与光限制参考生物量、
+        滞后一步的吸附/解吸通量、自适应积分的建议步长）。
+        """
+        rng_name, rng_keys, rng_position, rng_has_gauss, rng_gauss = self.rng.get_state()
+        arrays = {
+            'version': np.array(CHECKPOINT_VERSION),
+            'time_index': np.array(t),
+            'config': np.array(json.dumps(self.checkpoint_config(), sort_keys=True)),
+            'buffer': self.state.buffer,
+            'contributions': self.ledger.values,
+            'contribution_snapshots': self.ledger.snapshots[:self.ledger.count],
+            'transport': self.transport.values,
+            'transport_snapshots': self.transport.snapshots[:self.transport.count],
+            'integration': np.array([self.integration[key] for key in self.integration]),
+            'solver_step': np.array(self.solver_step),
+            'step_sizes': np.array(self.step_sizes, dtype=np.float64),
+            'rng_name': np.array(rng_name),
+            'rng_keys': rng_keys,
+            'rng_position': np.array([rng_position, rng_has_gauss]),
+            'rng_gauss': np.array(rng_gauss),
+        }
+        for name, values in self.recorder.state_arrays().items():
+            arrays[f'recorder_{name}'] = values
+        if self.cycle.lagged_ads_des is not None:
+            arrays['lagged_ads_des'] = self.cycle.lagged_ads_des
+        quotas = self.macro_phy.graph.values.get('update_internal_quotas')
+        if quotas is not None:
+            arrays['internal_quotas'] = np.array(quotas)
+        if hasattr(self.macro_phy, 'initial_MA'):
+            arrays['initial_MA'] = self.macro_phy.initial_MA
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_checkpoint_', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_checkpoint(self, path, warm_start=False):
+        """从检查点恢复模型状态，run() 随后从检查点所在时间步继续，结果与不间断运行逐位一致
+
+        warm_start=True 用于以另一组参数从该状态热启动：本次运行的静态驱动（S、C_SPM、A、V、A_max）
+        保持不变，冻结的大型藻类配额通量与冷启动一样按本次参数在初始状态上求出；状态变量的初始值由检查点取代。
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != CHECKPOINT_VERSION:
+                raise ValueError(f"checkpoint {path} has format version {int(data['version'])}, "
+                                 f"expected {CHECKPOINT_VERSION}")
+            saved = json.loads(str(data['config']))
+            current = self.checkpoint_config()
+            if saved != current:
+                differing = sorted(key for key in set(saved) | set(current) if saved.get(key) != current.get(key))
+                raise ValueError(f"checkpoint {path} was written with different settings: {differing}")
+            if data['buffer'].shape != self.state.buffer.shape:
+                raise ValueError(f"checkpoint state has shape {data['buffer'].shape}, "
+                                 f"expected {self.state.buffer.shape}")
+            t = int(data['time_index'])
+            if warm_start:
+                self.freeze_internal_quotas()
+                for name in self.state.state_variables + DYNAMIC_FORCING:
+                    self.state[name] = data['buffer'][self.state.index[name]]
+            else:
+                self.state.restore(data['buffer'])
+            for ledger, name, snapshots in [(self.ledger, 'contributions', 'contribution_snapshots'),
+                                            (self.transport, 'transport', 'transport_snapshots')]:
+                ledger.values[:] = data[name]
+                ledger.count = len(data[snapshots])
+                ledger.snapshots[:ledger.count] = data[snapshots]
+            self.integration.update(zip(self.integration, data['integration'].tolist()))
+            self.solver_step = float(data['solver_step'])
+            self.step_sizes = data['step_sizes'].tolist()
+            position, has_gauss = data['rng_position'].tolist()
+            self.rng.set_state((str(data['rng_name']), data['rng_keys'], position, has_gauss,
+                                float(data['rng_gauss'])))
+            self.recorder.restore({key[len('recorder_'):]: data[key] for key in data.files if key.startswith('recorder_')})
+            self.cycle.lagged_ads_des = data['lagged_ads_des'] if 'lagged_ads_des' in data else None
+            if 'internal_quotas' in data and not warm_start:
+                self.macro_phy.graph.values['update_internal_quotas'] = tuple(data['internal_quotas'])
+            elif not warm_start:
+                self.macro_phy.reset_internal_quotas_cache()  # 热启动保留上面按本次参数在初始状态上求出的配额通量
+            if 'initial_MA' in data:
+                self.macro_phy.initial_MA = data['initial_MA']
+            elif hasattr(self.macro_phy, 'initial_MA'):
+                del self.macro_phy.initial_MA
+        for component in self.components:
+            component.reload_parameters()
+        self.start_step = t
+        return t
+
+    def freeze_internal_quotas(self):
+        """在初始状态上求出并冻结大型藻类配额通量（与冷启动第 0 步开始时相同）"""
+        self.generate_external_inputs(0)
+        self.environment.update()
+        for component in self.components:
+            component.reload_parameters()
+        self.macro_phy.update_internal_quotas()
+
+    def results(self):
+        n = self.state.n_zones
+        series = self.recorder.series()
+        return SimulationResults(
+            concentrations={species: series[species] for species, _ in NUTRIENT_BUDGETS.values() if species in series},
+            biomass={name: series[name] for name in RECORDED_BIOMASS if name in series},
+            ledger=copy.deepcopy(self.ledger),
+            transport=copy.deepcopy(self.transport),
+            sea_areas=self.store.get_sea_areas()[:n],
+            integration=dict(self.integration),
+            step_sizes=self.step_sizes,
+            series=series,
+            aggregates=self.recorder.aggregates()
+        )
+
+    def cache_statistics(self):
+        """各组件计算图的命中/未命中次数（未命中即实际求值次数）"""
+        rows = [(type(component).__name__, quantity, hits, misses)
+                for component in self.components if hasattr(component, 'graph')
+                for quantity, (hits, misses) in component.graph.statistics().items()]
+        return pd.DataFrame(rows, columns=['Component', 'Quantity', 'Hits', 'Misses'])
+
+class SpinupCache:
+    """基准预热状态缓存：基准参数运行一次至平衡日并写入检查点，敏感性与情景成员由此热启动（可供并行进程共享）"""
+    def __init__(self, params, forcing, config=None, cache_dir='./cache'):
+        store = ParameterStore.from_params(params)
+        self.parameters = {name: values.copy() for name, values in store.values.items()}
+        self.fingerprint = store.fingerprint()
+        self.forcing = forcing
+        self.forcing_key = forcing.cache_key()
+        self.config = dict(config or {}, progress=False, checkpoint_path=None)
+        self.trajectory = json.dumps(trajectory_config(self.config), sort_keys=True)
+        self.cache_dir = os.path.join(cache_dir, 'spinup')
+
+    def key(self, days):
+        # 缓存键：驱动内容、基准参数、决定轨迹的设置、平衡天数及检查点格式版本
+        digest = hashlib.sha256(self.forcing_key.encode())
+        digest.update(self.fingerprint.encode())
+        digest.update(f"{self.trajectory};days={days};version={CHECKPOINT_VERSION}".encode())
+        return digest.hexdigest()[:32]
+
+    def path(self, days):
+        return os.path.join(self.cache_dir, f"spinup_{days}d_{self.key(days)}.npz")
+
+    def spin_up(self, *days):
+        """确保各平衡天数的基准状态已缓存；缺失时只运行一次基准模拟，途经各天时写入检查点"""
+        missing = sorted({day for day in days if day > 0 and not os.path.isfile(self.path(day))})
+        if not missing:
+            return
+        simulation = Simulation(dict(self.parameters), self.forcing, dict(self.config, sim_days=missing[-1]))
+        checkpoints = {day * 24 // simulation.time_step: day for day in missing}
+        for t in range(simulation.num_steps):
+            simulation.step(t)
+            if t + 1 in checkpoints:
+                simulation.save_checkpoint(self.path(checkpoints[t + 1]), t + 1)
+
+    def reequilibration_days(self, parameters, days):
+        """参数与基准不同时的缺省重新平衡天数：REEQUILIBRATION_DAYS，改变 DEB 参数时提前至该物种此前最近一次放养"""
+        changed = {name for name, values in parameters.items()
+                   if name not in self.parameters or not np.array_equal(values, self.parameters[name])}
+        if not changed:
+            return 0
+        start_day = max(days - REEQUILIBRATION_DAYS, 0)
+        for species, period in RESTOCKING_DAYS.items():
+            if changed & {name for name in DEB_SPECIES[species].values() if isinstance(name, str)}:
+                start_day = start_day // period * period
+        return days - start_day
+
+    def warm_start(self, simulation, days, reequilibration_days=None):
+        """把第 days - reequilibration_days 天（缺省按参数类别）的基准状态载入 simulation，返回起始时间步"""
+        if reequilibration_days is None:
+            reequilibration_days = self.reequilibration_days(simulation.store.values, days)
+        start_day = days - reequilibration_days
+        if not 0 <= start_day <= days:
+            raise ValueError(f"reequilibration_days must lie in [0, {days}], got {reequilibration_days}")
+        if start_day == 0:
+            return 0  # 重新平衡覆盖整个预热期，即冷启动
+        self.spin_up(start_day)
+        return simulation.load_checkpoint(self.path(start_day),
+                                          warm_start=simulation.store.fingerprint() != self.fingerprint)
+
+    @staticmethod
+    def deviation(results, reference, start_step):
+        """第 start_step 步之后各营养盐浓度相对 reference 的最大偏差（按 reference 的海区均值归一）"""
+        return max((np.abs(values[start_step:] - reference.concentrations[species][start_step:]) /
+                    reference.concentrations[species][start_step:].mean()).max()
+                   for species, values in results.concentrations.items())
+
+    def convergence(self, params, days, reequilibration_days=None, check_days=30):
+        """热启动收敛检验：平衡日之后 check_days 天内，返回 (热启动偏差, 扰动效应, 重新平衡 r 天的热启动结果)
+
+        偏差随重新平衡天数近似按指数衰减，r 天热启动相对冷启动的偏差由其相对 2r 天热启动（2r 不短于 days 时即冷启动）
+        的偏差估计；扰动效应为 2r 天热启动相对基准的偏差，基准由缓存续算。除热启动本身外，检验只多运行 2r 天热启动
+        与 check_days 天基准，不需要冷启动。
+        """
+        config = dict(self.config, sim_days=days + check_days)
+
+        def run(parameters, reequilibration):
+            simulation = Simulation(dict(parameters), self.forcing, config)
+            self.warm_start(simulation, days, reequilibration)
+            return simulation.run()
+
+        values = {name: array.copy() for name, array in ParameterStore.from_params(params).values.items()}
+        if reequilibration_days is None:
+            reequilibration_days = self.reequilibration_days(values, days)
+        warm = run(values, reequilibration_days)
+        reference = run(values, min(2 * reequilibration_days, days))
+        baseline = run(self.parameters, 0)
+        start_step = days * 24 // self.forcing.water_exchange.time_step
+        return self.deviation(warm, reference, start_step), self.deviation(reference, baseline, start_step), warm
 
 if __name__ == '__main__':
     root = tk.Tk()
@@ -2991,30 +3574,6 @@ if __name__ == '__main__':
     exchange_data_file = r'./database/Waterexchange_1h.csv'
     river_flow_file = r'./database/Riverflow_1h.csv'
     outer_sea_conc_file = r'./database/Outersea_1h.csv'
-    water_exchange = WaterExchange(parameter_loader=app, exchange_data_file=exchange_data_file,
-                                   outer_sea_conc_file=outer_sea_conc_file, river_flow_file=river_flow_file)
-
-    # Model components
-    phy = Phytoplankton(parameter_loader=app)
-    zoo = Zooplankton(parameter_loader=app)
-    macroalgal = Macroalgal(parameter_loader=app)
-    shellfish = Shellfish(parameter_loader=app)
-    fish = Fish(parameter_loader=app)
-    ammonium = AmmoniumNitrogen(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal,
-                                zooplankton=zoo, shellfish=shellfish, fish=fish)
-    nitrate = NitrateNitrogen(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal)
-    organic_nitrogen = OrganicNitrogen(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal,
-                                       zooplankton=zoo, shellfish=shellfish, fish=fish)
-    inorganic_phosphorus = InorganicPhosphorus(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal)
-    organic_phosphorus = OrganicPhosphorus(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal,
-                                           zooplankton=zoo, shellfish=shellfish, fish=fish,
-                                           inorganic_phosphorus=inorganic_phosphorus)
-    particulate_phosphorus = ParticulatePhosphorus(parameter_loader=app, phytoplankton=phy, zooplankton=zoo,
-                                                   shellfish=shellfish, fish=fish)
-    cbod = CBOD(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal,
-                zooplankton=zoo, shellfish=shellfish, fish=fish, nitrate=nitrate)
-    do = DissolvedOxygen(parameter_loader=app, phytoplankton=phy, macroalgal=macroalgal,
-                          zooplankton=zoo, shellfish=shellfish, fish=fish, ammonium=ammonium, cbod=cbod)
 
     # Other inputs
     input_files = {
@@ -3024,166 +3583,15 @@ if __name__ == '__main__':
         'pond': r'./database/Pondinput_1h.csv',
         'atmosphere': r'./database/Atmosphereinput_1h.csv'
     }
+    forcing = Forcing(parameter_loader=app.store, exchange_data_file=exchange_data_file,
+                      outer_sea_conc_file=outer_sea_conc_file, river_flow_file=river_flow_file,
+                      input_files=input_files)
 
-    external_input = ExternalInput(parameter_loader=app, input_files=input_files, waterexchange=water_exchange)
-
-
-    # Resets all caches at the end of each time step
-    def reset_all_caches():
-        phy.reset_cache()
-        zoo.reset_cache()
-        macroalgal.reset_internal_quotas_cache()
-        macroalgal.reset_cache()
-        shellfish.reset_cache()
-        fish.reset_cache()
-        ammonium.reset_cache()
-        nitrate.reset_cache()
-        organic_nitrogen.reset_cache()
-        inorganic_phosphorus.reset_cache()
-        organic_phosphorus.reset_cache()
-        particulate_phosphorus.reset_cache()
-        cbod.reset_cache()
-        do.reset_cache()
-
-    # Initialize empty lists for each metric to store results over time
-    time_steps = []  # Stores each time step
-    metrics_data = {
-        'PHY': [[] for _ in range(20)],
-        'ZOO': [[] for _ in range(20)],
-        'MA': [[] for _ in range(20)],
-        'V_SH': [[] for _ in range(20)],
-        'V_F': [[] for _ in range(20)],
-        'NH4': [[] for _ in range(20)],
-        'NO3': [[] for _ in range(20)],
-        'ON': [[] for _ in range(20)],
-        'PO4': [[] for _ in range(20)],
-        'OP': [[] for _ in range(20)],
-        'PP': [[] for _ in range(20)],
-        'CBOD': [[] for _ in range(20)],
-        'DO': [[] for _ in range(20)]
-    }
-
-    # Main loop
-    for timestep in range(24*12*30):  # Assuming 100 time steps
-        print(f"Timestep: {timestep}")
-        # print(f"Timestep: {timestep} - Initial NO3: {nitrate.NO3}")
-        GRZ = zoo.grazing_rate()
-        MAS = [0 for _ in macroalgal.MA]
-        HMA = [0.8 if (timestep + 1) % (24*30*3) == 0 else 0 for _ in macroalgal.MA]
-        HSH = [0 for _ in shellfish.N_SH]
-        HF = [0 for _ in fish.N_F]
-
-        # External inputs
-        external_inputs = external_input.get_external_inputs(timestep)
-
-        # print(f"Timestep: {timestep} - External inputs: {external_inputs['NO3']}")
-
-        # Update the internal nitrogen and phosphorus concentrations
-        new_qP = macroalgal.update_internal_quotas()[7]
-        new_qN = macroalgal.update_internal_quotas()[3]
-        print(f"Timestep {timestep} - q_N: {new_qN}")
-
-        ammonium.set_external_input(external_inputs['NH4'])
-        nitrate.set_external_input(external_inputs['NO3'])
-        organic_nitrogen.set_external_input(external_inputs['ON'])
-        inorganic_phosphorus.set_external_input(external_inputs['PO4'])
-        organic_phosphorus.set_external_input(external_inputs['OP'])
-        cbod.set_external_input(external_inputs['CBOD'])
-        do.set_external_input(external_inputs['DO'])
-
-        # Update the parameters with the new external inputs
-        new_V = water_exchange.calculate_volume(timestep)
-        new_N_SH, new_V_SH, new_E_SH, new_E_R_SH, GRS_PHY = shellfish.update_shellfish(HSH)
-        new_N_F, new_V_F, new_E_F, new_E_R_F = fish.update_fish(HF)
-        new_PHY = phy.update_PHY(GRZ, GRS_PHY)
-        new_ZOO = zoo.update_ZOO()
-        new_MA = macroalgal.update_MA(MAS, HMA)
-        new_NH4 = ammonium.update_NH4()
-        new_NO3 = nitrate.update_NO3()
-        new_ON = organic_nitrogen.update_ON()
-        new_PO4 = inorganic_phosphorus.update_PO4()
-        new_OP = organic_phosphorus.update_OP()
-        new_PP = particulate_phosphorus.update_PP()
-        new_CBOD = cbod.update_CBOD()
-        new_DO = do.update_DO(HSH, HF)
-
-        # Water exchange
-        water_exchange_params = {
-            'PHY': new_PHY,
-            'ZOO': new_ZOO,
-            'NH4': new_NH4,
-            'NO3': new_NO3,
-            'ON': new_ON,
-            'PO4': new_PO4,
-            'OP': new_OP,
-            'PP': new_PP,
-            'CBOD': new_CBOD,
-            'DO': new_DO
-        }
-
-        direct_update_params = {
-            'V': new_V,
-            'V_SH': new_V_SH,
-            'N_SH': new_N_SH,
-            'E_SH': new_E_SH,
-            'E_R_SH': new_E_R_SH,
-            'N_F': new_N_F,
-            'V_F': new_V_F,
-            'E_F': new_E_F,
-            'E_R_F': new_E_R_F,
-            'MA': new_MA,
-            'qP': new_qP,
-            'qN': new_qN
-        }
-
-        updated_concentrations = water_exchange.exchange(water_exchange_params, timestep + 1)
-
-        # Update the parameters with the new concentrations
-        app.update_initial_values(direct_update_params)
-        app.update_initial_values(updated_concentrations)
-
-        time_steps.append(timestep)
-
-        # Store values for each area in the 20-element vector for each metric
-        for i in range(20):  # Loop through each sea area
-            metrics_data['PHY'][i].append(new_PHY[i])
-            metrics_data['ZOO'][i].append(new_ZOO[i])
-            metrics_data['MA'][i].append(new_MA[i])
-            metrics_data['V_SH'][i].append(new_N_SH[i])
-            metrics_data['V_F'][i].append(new_N_F[i])
-            metrics_data['NH4'][i].append(new_NH4[i])
-            metrics_data['NO3'][i].append(new_NO3[i])
-            metrics_data['ON'][i].append(new_ON[i])
-            metrics_data['PO4'][i].append(new_PO4[i])
-            metrics_data['OP'][i].append(new_OP[i])
-            metrics_data['PP'][i].append(new_PP[i])
-            metrics_data['CBOD'][i].append(new_CBOD[i])
-            metrics_data['DO'][i].append(new_DO[i])
-
-        # print(f"Timestep: {timestep}")
-        # print(f"Updated V: {new_V} m³")
-        # print(f"Updated PHY: {new_PHY} mgC/L")
-        # print(f"Updated ZOO: {new_ZOO} mgC/L")
-        # print(f"Updated MA: {new_MA} gD/m^2")
-        # print(f"Updated N_SH: {new_N_SH} individuals")
-        # print(f"Updated V_SH: {new_V_SH} cm³")
-        # print(f"Updated E_SH: {new_E_SH} J")
-        # print(f"Updated E_R_SH: {new_E_R_SH} J")
-        # print(f"Updated N_F: {new_N_F} individuals")
-        # print(f"Updated V_F: {new_V_F} cm³")
-        # print(f"Updated E_F: {new_E_F} J")
-        # print(f"Updated E_R_F: {new_E_R_F} J")
-        # print(f"Updated NH4: {new_NH4} mgN/L")
-        # print(f"Updated NO3: {new_NO3} mgN/L")
-        # print(f"Updated ON: {new_ON} mgN/L")
-        # print(f"Updated PO4: {new_PO4} mgP/L")
-        # print(f"Updated OP: {new_OP} mgP/L")
-        # print(f"Updated CBOD: {new_CBOD} mgO₂/L")
-        # print(f"Updated DO: {new_DO} mgO₂/L")
-
-        # print(f"Timestep: {timestep} - Updated NO3: {new_NO3}")
-        reset_all_caches()  # Reset all caches at the end of each time step
-
+    # Main loop: one year of hourly steps with the vectorised process engine
+    metrics = ['PHY', 'ZOO', 'MA', 'V_SH', 'V_F', 'NH4', 'NO3', 'ON', 'PO4', 'OP', 'PP', 'CBOD', 'DO']
+    simulation = Simulation(app.store, forcing, config={'sim_days': 12 * 30, 'progress': True,
+                                                         'record_variables': metrics})
+    results = simulation.run()
 
     def plot_metric_with_subplots(time_steps, metric_values, metric_name):
         fig, axes = plt.subplots(4, 6, figsize=(15, 10), sharex=True, sharey=False)
@@ -3205,6 +3613,7 @@ if __name__ == '__main__':
         plt.show()
 
     # Call the plotting function for each metric after the simulation loop
-    for metric, values in metrics_data.items():
-        plot_metric_with_subplots(time_steps, values, metric)
+    for metric, values in results.series.items():
+        time_steps = np.arange(len(values))
+        plot_metric_with_subplots(time_steps, values.T, metric)
 
@@ -0,0 +1,3000 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+BENMO 性能基准
+用法：python benchmark_20.py [--days 365] [--exchange-file 路径] [--steps 200] [--only volume ...] [--check-only]
+
+未提供水交换文件（或文件不存在）时，自动生成合成的逐时水交换数据，仅用于计时，不代表真实水动力。
+每项基准先用原实现（legacy_*）与当前实现逐步核对结果，再分别给出单次调用耗时；--check-only 只做核对与断言，
+跳过计时循环（用作回归检查）。
+"""
+import argparse
+import glob
+import math
+import os
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from BENMO_20 import (ParameterStore, WaterExchange, InputCache, ExternalInput, Phytoplankton, Zooplankton, Macroalgal,
+                      Shellfish, Fish, DEBEngine, DEBCommunity, BiogeochemistryEngine,
+                      EnvironmentFactors, Forcing, Simulation, SpinupCache, ResultsRecorder, ContributionLedger, FluxTable,
+                      TransportLedger,
+                      DEB_SPECIES, EXCHANGE_COLUMNS, EDGE_EXCHANGE_COLUMNS, NUTRIENT_BUDGETS, STATE_VARIABLES,
+                      MPRK_MAX_TIME_STEP, MPRK_DEVIATION, SPLITTING_SUBSTEPS, SPLITTING_DEVIATION, SPINUP_TOLERANCE,
+                      REEQUILIBRATION_DAYS, RESTOCKING_DAYS)
+
+CHECK_ONLY = False  # --check-only：只做结果核对与断言，跳过计时循环和耗时报告
+
+# --------------------------
+# 数据准备
+# --------------------------
+def make_synthetic_exchange(path, num_hours, seed=0):
+    """生成带潮汐周期的合成水交换数据（列与 EXCHANGE_COLUMNS 一致）"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_hours)[:, None]
+    amplitude = rng.uniform(2e5, 3e6, len(EXCHANGE_COLUMNS))
+    phase = rng.uniform(0, 2 * np.pi, len(EXCHANGE_COLUMNS))
+    data = amplitude * np.sin(2 * np.pi * t / 12.42 + phase) + rng.normal(0, 1e5, (num_hours, len(EXCHANGE_COLUMNS)))
+    index = pd.date_range('2016-01-01', periods=num_hours, freq='h')
+    pd.DataFrame(data, columns=EXCHANGE_COLUMNS, index=index).to_csv(path)
+    return path
+
+
+def make_synthetic_river_input(path, num_hours, seed=1):
+    """生成合成的逐时河流输入（zone1、zone15 两个入河口，列与 Riverinput_1h_20.csv 一致）"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2016-01-01', periods=num_hours, freq='h')
+    frames = [pd.DataFrame(rng.uniform(0, 1e5, (num_hours, 7)), columns=['NH4', 'NO3', 'ON', 'PO4', 'OP', 'CBOD', 'DO'])
+              .assign(date=index, Zone=zone) for zone in ('zone1', 'zone15')]
+    data = pd.concat(frames).sort_values('date', kind='stable')
+    data[['date', 'Zone', 'NH4', 'NO3', 'ON', 'PO4', 'OP', 'CBOD', 'DO']].to_csv(path, index=False)
+    return path
+
+
+def build_water_exchange(args, tmp_dir, cache_dir=None, time_step=1):
+    exchange_file = args.exchange_file
+    if exchange_file is None or not os.path.exists(exchange_file):
+        exchange_file = os.path.join(tmp_dir, 'Waterexchange_1h.csv')
+        if not os.path.exists(exchange_file):
+            make_synthetic_exchange(exchange_file, args.days * 24)
+    return WaterExchange(
+        parameter_loader=ParameterStore(),
+        exchange_data_file=exchange_file,
+        outer_sea_conc_file="./database/Outersea_1h_new.csv",
+        river_flow_file="./database/Riverflow_1h.csv",
+        outer_sea_scaling={'NO3': 10.0, 'NH4': 20.0, 'PO4': 10.0},
+        time_step=time_step,
+        cache_dir=cache_dir,
+    )
+
+
+INPUT_FILES = {
+    'river': './database/Riverinput_1h_20.csv',
+    'groundwater': './database/Groundwaterinput_1h_20.csv',
+    'point_source': './database/Pointinput_1h_20.csv',
+    'pond': './database/Pondinput_1h_20.csv',
+    'atmosphere': './database/Atmosphereinput_1h_20.csv',
+}
+
+
+FORCINGS = {}
+
+
+def load_forcing(water_exchange, time_step=1):
+    """从文件构建与基准水交换数据相同的驱动（缺少河流输入文件时使用合成数据）"""
+    input_files = dict(INPUT_FILES)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not os.path.exists(input_files['river']):
+            input_files['river'] = make_synthetic_river_input(os.path.join(tmp_dir, 'Riverinput_1h_20.csv'),
+                                                              water_exchange.num_time_points)
+        return Forcing(ParameterStore(), water_exchange.exchange_data_file, water_exchange.outer_sea_conc_file,
+                       water_exchange.river_flow_file, input_files, water_exchange.outer_sea_scaling,
+                       time_step=time_step)
+
+
+def build_forcing(water_exchange, time_step=1):
+    """各基准共用的驱动：1 小时驱动只读取一次，其他步长由其前缀和索引导出"""
+    key = (id(water_exchange), time_step)
+    if key not in FORCINGS:
+        if time_step == 1:
+            FORCINGS[key] = load_forcing(water_exchange)
+        else:
+            FORCINGS[key] = build_forcing(water_exchange).with_time_step(time_step)
+    return FORCINGS[key]
+
+
+def simulation_config(args, **options):
+    """模拟类基准的共同配置：--integrator-days 天、固定随机种子"""
+    return dict({'sim_days': args.integrator_days, 'seed': 0}, **options)
+
+
+def run_simulation(forcing, config, params=None):
+    """运行一次模拟，返回结果与耗时"""
+    start = time.perf_counter()
+    results = Simulation(params, forcing, config).run()
+    return results, time.perf_counter() - start
+
+
+def state_series(results):
+    """浓度与生物量逐时序列（名称 -> (步数, 海区)）"""
+    return {**results.concentrations, **results.biomass}
+
+
+def lowest_value(results):
+    return min(values.min() for values in state_series(results).values())
+
+
+def time_per_call(func, steps):
+    if CHECK_ONLY:
+        return math.nan
+    start = time.perf_counter()
+    for t in steps:
+        func(t)
+    return (time.perf_counter() - start) / len(steps)
+
+
+def best_of(func, repeat=3):
+    """多次运行取最短耗时，减少文件系统抖动的影响（--check-only 时只运行一次）"""
+    if CHECK_ONLY:
+        repeat = 1
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(name, legacy_seconds, new_seconds, calls_per_step=1):
+    if CHECK_ONLY:
+        return
+    print(f"{name:<24s} 原实现 {legacy_seconds * 1e6:10.1f} µs/次   当前 {new_seconds * 1e6:10.1f} µs/次   "
+          f"加速 {legacy_seconds / new_seconds:8.1f}x   每步约节省 {(legacy_seconds - new_seconds) * calls_per_step * 1e3:.3f} ms")
+
+
+def check_close(name, expected, actual, rtol=1e-12):
+    if not np.allclose(expected, actual, rtol=rtol, atol=0.0):
+        raise AssertionError(f"{name} 与原实现不一致")
+
+
+def check_identical(name, expected, actual):
+    if not np.array_equal(expected, actual):
+        raise AssertionError(f"{name} 不一致（应逐位相同）")
+
+# --------------------------
+# 原稠密水交换张量
+# --------------------------
+def legacy_water_exchange_matrix(water_exchange):
+    """原实现：由边数据构建稠密 (21, 21, T) 张量，并逐时间点用 Python 循环设置对角线"""
+    area_index_map = {area: idx for idx, area in enumerate(water_exchange.sea_areas)}
+    outer_sea_index = water_exchange.sea_areas.index('OuterSea')
+    matrix = np.zeros((water_exchange.num_areas, water_exchange.num_areas, water_exchange.num_time_points))
+    for edge_name, (area_from, area_to) in water_exchange.edges.items():
+        matrix[area_index_map[area_from], area_index_map[area_to], :] = water_exchange.water_exchange_values[edge_name]
+    for t in range(water_exchange.num_time_points):
+        for i in range(water_exchange.num_areas):
+            if i == outer_sea_index:
+                continue
+            matrix[i, i, t] = -np.sum(matrix[i, :, t])
+    matrix *= 0.5
+    return matrix
+
+
+def bench_matrix(water_exchange, steps, args):
+    if CHECK_ONLY:
+        return  # 只计时，无核对项
+    start = time.perf_counter()
+    legacy_water_exchange_matrix(water_exchange)
+    legacy_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    water_exchange.calculate_water_exchange_matrices()
+    new_seconds = time.perf_counter() - start
+    dense_bytes = water_exchange.num_areas ** 2 * water_exchange.num_time_points * 8
+    edge_bytes = water_exchange.transport_coefficients.nbytes
+    print(f"{'构建水交换矩阵':<20s} 原实现 {legacy_seconds:8.2f} s   当前 {new_seconds:8.3f} s   "
+          f"内存 {dense_bytes / 2 ** 20:8.1f} MB -> {edge_bytes / 2 ** 20:6.1f} MB")
+
+# --------------------------
+# 水量计算 calculate_volume
+# --------------------------
+def legacy_calculate_volume(water_exchange, current_time_step):
+    """原实现：每次调用都对整个 (21, 21, T) 交换张量求和，并用 iloc 查河流流量"""
+    water_volume_all = np.sum(water_exchange.legacy_matrix, axis=0).T
+    water_volume = water_volume_all[current_time_step, :]
+    river_flow = water_exchange.river_flow_data.iloc[current_time_step, :]
+    water_volume[14] += river_flow.iloc[1]
+    water_volume[0] += river_flow.iloc[2]
+    return water_exchange.V + water_volume
+
+
+def bench_volume(water_exchange, steps, args):
+    for t in steps:
+        check_close(f"calculate_volume（第 {t} 步）", legacy_calculate_volume(water_exchange, t),
+                    water_exchange.calculate_volume(t))
+    legacy_seconds = time_per_call(lambda t: legacy_calculate_volume(water_exchange, t), steps)
+    new_seconds = time_per_call(water_exchange.calculate_volume, steps)
+    # main_20.py 每步调用 5 次（exchange 2 次、外部输入 1 次、主循环 2 次）
+    report('calculate_volume', legacy_seconds, new_seconds, calls_per_step=5)
+
+
+# --------------------------
+# 输运核 transport
+# --------------------------
+def bench_transport(water_exchange, steps, args):
+    rng = np.random.default_rng(1)
+    conc = rng.uniform(0.01, 1.0, water_exchange.num_areas)
+    matrix = water_exchange.legacy_matrix
+    for t in steps:
+        check_close(f"transport（第 {t} 步）", np.dot(matrix[:, :, t], conc), water_exchange.transport(conc, t))
+    # 单次调用仅数微秒，取 5 轮中最短的一轮以减少抖动
+    legacy_seconds = min(time_per_call(lambda t: np.dot(matrix[:, :, t], conc), steps) for _ in range(5))
+    new_seconds = min(time_per_call(lambda t: water_exchange.transport(conc, t), steps) for _ in range(5))
+    report('transport', legacy_seconds, new_seconds, calls_per_step=8)
+
+
+# --------------------------
+# 多物质水交换 exchange
+# --------------------------
+EXCHANGE_SUBSTANCES = ['PHY', 'ZOO', 'NH4', 'NO3', 'ON', 'PO4', 'OP', 'PP']
+
+
+def legacy_exchange(water_exchange, concentrations, current_time_step, V_array_old, V_array_new):
+    """原实现：逐物质补外海值、各做一次稠密矩阵-向量乘并转换为列表（水量由调用方给出）"""
+    current_matrix = water_exchange.legacy_matrix[:, :, current_time_step]
+    outer_sea_index = water_exchange.sea_areas.index('OuterSea')
+    updated_concentrations = {}
+    for substance, conc in concentrations.items():
+        raw_conc = water_exchange.outer_sea_concentrations.get(substance, [0.0])
+        outer_conc = raw_conc[min(current_time_step, len(raw_conc) - 1)] * water_exchange.outer_sea_scaling.get(substance, 1.0)
+        conc_array = np.append(np.array(conc, dtype=np.float64), outer_conc)
+        exchanged_mass = np.dot(current_matrix, conc_array)
+        new_conc = (conc_array * V_array_old + exchanged_mass) / V_array_new
+        new_conc[outer_sea_index] = outer_conc
+        updated_concentrations[substance] = new_conc.tolist()
+    return updated_concentrations
+
+
+def per_substance_exchange(water_exchange, concentrations, current_time_step):
+    """批量化之前的实现：稀疏边列表输运，但仍逐物质各做一次 transport 与稀释并转换为列表"""
+    V_array_old = water_exchange.calculate_volume(current_time_step - 1)
+    V_array_new = water_exchange.calculate_volume(current_time_step)
+    outer_sea_index = water_exchange.sea_areas.index('OuterSea')
+    updated_concentrations = {}
+    for substance, conc in concentrations.items():
+        raw_conc = water_exchange.outer_sea_concentrations.get(substance, [0.0])
+        outer_conc = raw_conc[min(current_time_step, len(raw_conc) - 1)] * water_exchange.outer_sea_scaling.get(substance, 1.0)
+        conc_array = np.append(np.array(conc, dtype=np.float64), outer_conc)
+        exchanged_mass = water_exchange.transport(conc_array, current_time_step)
+        new_conc = (conc_array * V_array_old + exchanged_mass) / V_array_new
+        new_conc[outer_sea_index] = outer_conc
+        updated_concentrations[substance] = new_conc.tolist()
+    return updated_concentrations
+
+
+def bench_exchange(water_exchange, steps, args):
+    rng = np.random.default_rng(2)
+    concentrations = {sub: rng.uniform(0.005, 0.5, water_exchange.num_areas - 1).tolist() for sub in EXCHANGE_SUBSTANCES}
+    C = np.vstack([np.array(list(concentrations.values())).T, np.zeros(len(EXCHANGE_SUBSTANCES))])
+    for t in steps:
+        expected = legacy_exchange(water_exchange, concentrations, t, legacy_calculate_volume(water_exchange, t - 1),
+                                   legacy_calculate_volume(water_exchange, t))
+        actual = water_exchange.exchange_batch(C, t, EXCHANGE_SUBSTANCES)
+        check_close(f"exchange（第 {t} 步）", np.array(list(expected.values())).T, actual)
+        check_close(f"逐物质 exchange（第 {t} 步）", np.array(list(per_substance_exchange(water_exchange, concentrations, t).values())).T,
+                    actual)
+    # 计时时原实现直接使用查表水量（稠密求和的开销已计入 calculate_volume 基准），只比较输运部分
+    volume = water_exchange.calculate_volume
+    legacy_seconds = time_per_call(lambda t: legacy_exchange(water_exchange, concentrations, t, volume(t - 1), volume(t)),
+                                   steps)
+    per_substance_seconds = time_per_call(lambda t: per_substance_exchange(water_exchange, concentrations, t), steps)
+    new_seconds = time_per_call(lambda t: water_exchange.exchange_batch(C, t, EXCHANGE_SUBSTANCES), steps)
+    report('exchange（8 种物质）', legacy_seconds, new_seconds)
+    # 批量化本身的收益：与同为稀疏输运的逐物质实现比较（不含水量计算，两者均查表）
+    report('exchange（对逐物质稀疏）', per_substance_seconds, new_seconds)
+
+
+# --------------------------
+# 输运传播子缓存
+# --------------------------
+def bench_propagator_cache(water_exchange, steps, args):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tmp_dir = os.path.dirname(water_exchange.exchange_data_file)
+        start = time.perf_counter()
+        cold = build_water_exchange(args, tmp_dir, cache_dir)
+        cold_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        warm = build_water_exchange(args, tmp_dir, cache_dir)
+        warm_seconds = time.perf_counter() - start
+        if not isinstance(warm.propagator_edges, np.memmap):
+            raise AssertionError("第二次构建未命中输运缓存")
+        rng = np.random.default_rng(3)
+        C = rng.uniform(0.005, 0.5, (water_exchange.num_areas, len(EXCHANGE_SUBSTANCES)))
+        for t in steps:
+            if not np.array_equal(cold.exchange_batch(C, t, EXCHANGE_SUBSTANCES), warm.exchange_batch(C, t, EXCHANGE_SUBSTANCES)):
+                raise AssertionError(f"缓存输运结果在第 {t} 步与直接计算不一致")
+        if not CHECK_ONLY:
+            print(f"{'WaterExchange 构建':<20s} 读 CSV 计算 {cold_seconds:8.3f} s   映射缓存 {warm_seconds:8.3f} s   "
+                  f"加速 {cold_seconds / warm_seconds:8.1f}x")
+
+
+# --------------------------
+# CSV 输入二进制缓存
+# --------------------------
+def bench_input_cache(water_exchange, steps, args):
+    paths = [water_exchange.exchange_data_file, "./database/Riverflow_1h.csv", "./database/Outersea_1h_new.csv"]
+    paths += sorted(glob.glob("./database/*input_1h_20.csv"))
+    parsed = [InputCache().load(path) for path in paths]
+    parse_seconds = best_of(lambda: [InputCache().load(path) for path in paths])
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = InputCache(cache_dir)
+        for path in paths:
+            cache.load(path)  # 首次加载写入缓存
+        mapped = [cache.load(path) for path in paths]
+        mapped_seconds = best_of(lambda: [cache.load(path) for path in paths])
+        for path, expected, actual in zip(paths, parsed, mapped):
+            if list(expected) != list(actual) or not all(np.array_equal(expected[k], actual[k], equal_nan=expected[k].dtype.kind == 'f')
+                                                       for k in expected):
+                raise AssertionError(f"{path} 缓存内容与 CSV 不一致")
+    if not CHECK_ONLY:
+        print(f"{f'读取 {len(paths)} 个 CSV':<20s} pandas 解析 {parse_seconds:8.3f} s   映射缓存 {mapped_seconds:8.4f} s   "
+              f"加速 {parse_seconds / mapped_seconds:8.1f}x")
+
+
+# --------------------------
+# 外部输入 ExternalInput
+# --------------------------
+def legacy_read_river_data(external_input, file_path):
+    """原实现：iterrows 逐行累加到嵌套 defaultdict"""
+    df = pd.read_csv(file_path)
+    df['date'] = pd.to_datetime(df['date'])
+    time_map = {t: i for i, t in enumerate(sorted(df['date'].unique()))}
+    df['timestep'] = df['date'].map(time_map)
+    river_inputs = defaultdict(lambda: defaultdict(lambda: {sub: 0.0 for sub in external_input.substances}))
+    for _, row in df.iterrows():
+        zone_index = int(row['Zone'][4:]) - 1
+        if 0 <= zone_index < external_input.num_zones:
+            for sub in external_input.substances:
+                multiplier = external_input.input_multipliers['river'].get(sub, 1.0)
+                river_inputs[row['timestep']][row['Zone']][sub] += multiplier * row[sub]
+    return river_inputs
+
+
+def legacy_external_inputs(external_input, river_data, current_time_step):
+    """原实现：按区域名逐项相加，再用列表推导逐元素除以水量"""
+    substances, num_zones = external_input.substances, external_input.num_zones
+    V_sea = external_input.waterexchange.calculate_volume(current_time_step)
+    total_mass = {sub: np.zeros(num_zones) for sub in substances}
+    if current_time_step in river_data:
+        for zone, values in river_data[current_time_step].items():
+            for sub in substances:
+                total_mass[sub][int(zone[4:]) - 1] += values[sub]
+    for j, sub in enumerate(substances):
+        total_mass[sub] += external_input.static_inputs[:, j]
+    return {sub: [mass / vol if vol > 0 else 0.0 for mass, vol in zip(total_mass[sub], V_sea[:num_zones])]
+            for sub in substances}
+
+
+def bench_external_input(water_exchange, steps, args):
+    input_files = dict(INPUT_FILES)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        if not os.path.exists(input_files['river']):
+            input_files['river'] = make_synthetic_river_input(os.path.join(cache_dir, 'Riverinput_1h_20.csv'),
+                                                              water_exchange.num_time_points)
+        start = time.perf_counter()
+        external_input = ExternalInput(water_exchange.parameter_loader, water_exchange, input_files, cache_dir=cache_dir)
+        new_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        river_data = legacy_read_river_data(external_input, input_files['river'])
+        legacy_seconds = time.perf_counter() - start
+        if not CHECK_ONLY:
+            print(f"{'读取河流输入':<20s} 原实现 {legacy_seconds:8.2f} s   当前 {new_seconds:8.3f} s   "
+                  f"加速 {legacy_seconds / new_seconds:8.1f}x")
+
+        # 倍率情景：重新构建（重读并聚合 CSV）对比共享原始数据只换权重
+        rng = np.random.default_rng(4)
+        multipliers = {src: {sub: rng.uniform(0.5, 2.0) for sub in external_input.substances} for src in INPUT_FILES}
+        start = time.perf_counter()
+        rebuilt = ExternalInput(water_exchange.parameter_loader, water_exchange, input_files, multipliers, cache_dir=cache_dir)
+        rebuild_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        scenario = external_input.with_multipliers(multipliers)
+        scenario_seconds = time.perf_counter() - start
+        for t in steps:
+            expected, actual = rebuilt.get_external_inputs(t), scenario.get_external_inputs(t)
+            for sub in external_input.substances:
+                check_close(f"倍率情景 {sub}（第 {t} 步）", expected[sub], actual[sub])
+        if not CHECK_ONLY:
+            print(f"{'切换倍率情景':<20s} 重新读取 {rebuild_seconds:8.3f} s   共享数据 {scenario_seconds * 1e3:8.3f} ms   "
+                  f"加速 {rebuild_seconds / scenario_seconds:8.1f}x")
+    for t in steps:
+        expected = legacy_external_inputs(external_input, river_data, t)
+        actual = external_input.get_external_inputs(t)
+        for sub in external_input.substances:
+            check_close(f"外部输入 {sub}（第 {t} 步）", np.array(expected[sub]), actual[sub])
+    legacy_seconds = time_per_call(lambda t: legacy_external_inputs(external_input, river_data, t), steps)
+    new_seconds = time_per_call(external_input.get_external_inputs, steps)
+    report('get_external_inputs', legacy_seconds, new_seconds)
+
+
+WINDOW_ARRAYS = ['edge_flux', 'diagonal', 'volume_table', 'volume_before_start', 'propagator_diagonal', 'propagator_edges']
+
+
+def bench_windows(water_exchange, steps, args):
+    """前缀和索引：任意小时窗口的交换量与逐时求和一致；由 1 小时驱动导出的 3 小时驱动与重新读取的结果一致，
+    记录长度不是步长整数倍时给出警告
+    """
+    hourly = build_forcing(water_exchange)
+    exchange = hourly.water_exchange
+    rng = np.random.default_rng(5)
+    t0 = rng.integers(0, exchange.num_time_points - 48, len(steps))
+    t1 = t0 + rng.integers(1, 48, len(steps))
+    net = np.stack([exchange.exchange_index.hourly[a:b].sum(axis=0) for a, b in zip(t0, t1)])
+    check_close('窗口交换量', np.maximum(np.concatenate([net, -net], axis=1), 0), exchange.window_exchange(t0, t1),
+                rtol=1e-9)
+    flows = np.stack([exchange.river_flow_index.hourly[a:b].sum(axis=0) for a, b in zip(t0, t1)])
+    check_close('窗口河流流量', flows, exchange.window_river_flow(t0, t1), rtol=1e-9)
+
+    time_step = 3
+    reload_seconds = best_of(lambda: load_forcing(water_exchange, time_step))
+    derive_seconds = best_of(lambda: hourly.with_time_step(time_step))
+    expected, actual = load_forcing(water_exchange, time_step), hourly.with_time_step(time_step)
+    for name in WINDOW_ARRAYS:
+        check_close(f"dt={time_step} h {name}", getattr(expected.water_exchange, name),
+                    getattr(actual.water_exchange, name), rtol=1e-9)
+    for name in ('river_data', 'static_data', 'static_inputs'):
+        check_close(f"dt={time_step} h {name}", getattr(expected.external_input, name),
+                    getattr(actual.external_input, name), rtol=1e-9)
+    if not CHECK_ONLY:
+        print(f"{'另一时间步长的驱动':<18s} 重新读取 {reload_seconds:8.3f} s   前缀和导出 {derive_seconds * 1e3:8.3f} ms   "
+              f"加速 {reload_seconds / derive_seconds:8.1f}x")
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        hourly.with_time_step(7)
+    if exchange.num_time_points % 7 and not any('舍去末尾' in str(w.message) for w in caught):
+        raise AssertionError("记录长度不是步长整数倍时未给出警告")
+
+
+# --------------------------
+# 原逐区域列表实现（仅用于核对与计时）
+# --------------------------
+class LegacyCache:
+    """原实现的逐类结果字典缓存（每步由调用方 reset_cache() 清空）"""
+
+    def __init__(self, *args, **kwargs):
+        self.cache = {}
+        self.internal_quotas_cache = None
+        super().__init__(*args, **kwargs)
+
+    def reset_cache(self):
+        self.cache.clear()
+
+    def reset_internal_quotas_cache(self):
+        self.internal_quotas_cache = None
+
+
+class LegacyPhytoplankton(LegacyCache, Phytoplankton):
+    """原浮游植物实现：逐区域列表推导 + math.exp"""
+
+    def __init__(self, parameter_loader, environment=None):
+        super().__init__(parameter_loader, environment)
+        self.KE_P = self.get_parameter('K_E')[0]
+        self.KE_MA = 0.00
+
+    def nutrient_limitation(self):
+        NH4_NO3 = [max(nh4 + no3, 0) for nh4, no3 in zip(self.NH4, self.NO3)]
+        X_N = [min((nh4_no3) / (self.KN_PHY + nh4_no3), 1) for nh4_no3 in NH4_NO3]
+        PO4_non_neg = [max(po4, 0) for po4 in self.PO4]
+        X_P = [min(po4 / (self.KP_PHY / self.F_PO4 + po4), 1) for po4 in PO4_non_neg]
+        result = [min(max(min(xn, xp), 0), 1) for xn, xp in zip(X_N, X_P)]
+        self.cache['nutrient_limitation'] = result
+        return result
+
+    def temperature_limitation(self, method=1):
+        if 'temperature_limitation' in self.cache:
+            return self.cache['temperature_limitation']
+        if method == 1:
+            result = [self.KT ** (t - self.T_opt) for t in self.T]
+        else:
+            result = [math.exp(-self.kappa_1 * (t - self.T_opt) ** 2) if t <= self.T_opt
+                      else math.exp(-self.kappa_2 * (t - self.T_opt) ** 2) for t in self.T]
+        self.cache['temperature_limitation'] = result
+        return result
+
+    def light_limitation(self):
+        if 'light_limitation' in self.cache:
+            return self.cache['light_limitation']
+
+        KE = self.KE_P + self.KE_MA * sum(self.MA) * (sum(self.A) / sum(self.V))
+
+        # Adjust the h/2 value with the limit (Assume 5m is a reasonable limit)
+        adjusted_h = [min(h / 2, 5) for h in self.H]
+
+        # Calculate the light factor with the adjusted h values
+        light_factor = [(i / 1200000) * math.exp(-KE * adj_h) for i, adj_h in zip(self.I, adjusted_h)]
+
+        # Calculate the result and multiply by 2/adjusted_h
+        result = [lf * math.exp(1 - lf) for lf in light_factor]
+
+        self.cache['light_limitation'] = result
+
+        return result
+
+    def growth_rate(self):
+        phi_N_PHY = self.nutrient_limitation()
+        phi_T_PHY = self.temperature_limitation()
+        phi_L_PHY = self.light_limitation()
+
+        GP_PHY = [self.KC_PHY * min(pn, 1) * min(pt, 1) * min(pl, 1) for pn, pt, pl in
+                  zip(phi_N_PHY, phi_T_PHY, phi_L_PHY)]
+        result = [max(gp, 0) * phy for gp, phy in zip(GP_PHY, self.PHY)]
+        self.cache['growth_rate'] = result
+
+        return GP_PHY
+
+    def loss_rate(self):
+        """
+        Dynamically selects the best `loss_rate` calculation method for each region (each index),
+        based on the closest match to `growth_rate` at that index.
+        """
+        # Check if the result is already cached
+        if 'loss_rate' in self.cache and 'loss_rate_method' in self.cache:
+            return self.cache['loss_rate']
+
+        # Compute `growth_rate` for all regions
+        growth_rate = self.growth_rate()
+
+        # Pre-calculate RES_PHY (common to both methods)
+        RES_PHY = [self.KR_PHY * (self.KR_T ** (t - self.T_opt)) for t in self.T]
+
+        # Method 1: Simple
+        DPP_PHY_simple = self.KD_PHY
+        DP_PHY_simple = [res + DPP_PHY_simple for res in RES_PHY]
+        loss_rate_simple = [dp * phy for dp, phy in zip(DP_PHY_simple, self.PHY)]
+
+        # Method 2: Detailed
+        DPP_PHY_detailed = [
+            self.KD_PHY + self.M_max_PHY / (1 + (self.K_PHY / max(phy, 1e-12)) ** (self.KC_PHY * 11)) for phy in self.PHY
+        ]
+        DP_PHY_detailed = [res + dpp for res, dpp in zip(RES_PHY, DPP_PHY_detailed)]
+        loss_rate_detailed = [dp * phy for dp, phy in zip(DP_PHY_detailed, self.PHY)]
+
+        # Initialize results and method tracking
+        selected_loss_rate = []
+        selected_methods = []
+
+        # Compare `growth_rate[i]` with `loss_rate_simple[i]` and `loss_rate_detailed[i]` for each region
+        for i in range(len(growth_rate)):
+            diff_simple = abs(loss_rate_simple[i] - growth_rate[i])
+            diff_detailed = abs(loss_rate_detailed[i] - growth_rate[i])
+
+            if diff_simple <= diff_detailed:
+                selected_loss_rate.append(loss_rate_simple[i])
+                selected_methods.append('simple')
+            else:
+                selected_loss_rate.append(loss_rate_detailed[i])
+                selected_methods.append('detailed')
+
+        # Cache the result and the selected methods for each region
+        self.cache['loss_rate'] = selected_loss_rate
+        self.cache['loss_rate_method'] = selected_methods
+
+        return DP_PHY_detailed
+
+
+class LegacyZooplankton(LegacyCache, Zooplankton):
+    """原浮游动物实现"""
+
+    def grazing_rate(self):
+        """Calculate the grazing rate of zooplankton."""
+        if 'grazing_rate' in self.cache:
+            return self.cache['grazing_rate']
+
+        grazing_rate = [self.K_GRZ * (phy / (phy + self.K_PZ)) for phy in self.PHY]
+
+        self.cache['grazing_rate'] = grazing_rate
+
+        return grazing_rate
+
+    def growth_rate(self):
+        """Calculate the growth rate of zooplankton based on grazing efficiency."""
+        if 'growth_rate' in self.cache:
+            return self.cache['growth_rate']
+
+        GRZ = self.grazing_rate()
+        growth_rate = [self.EFF * grz for grz in GRZ]
+        self.cache['growth_rate'] = growth_rate
+        return growth_rate
+
+    def loss_rate(self):
+        """Calculate the loss rate of zooplankton (death rate)."""
+        if 'loss_rate' in self.cache:
+            return self.cache['loss_rate']
+
+        loss_rate = [self.K_DZ * zoo for zoo in self.ZOO]
+        self.cache['loss_rate'] = loss_rate
+        return [loss_rate/zoo for loss_rate, zoo in zip(loss_rate, self.ZOO)]
+
+
+class LegacyMacroalgal(LegacyCache, Macroalgal):
+    """原大型藻类实现（光照、盐度分支为逐区域 if/else）"""
+
+    def temperature_limitation(self, method=1):
+        """Temperature limitation function with optional method selection."""
+        if 'temperature_limitation' in self.cache:
+            return self.cache['temperature_limitation']
+
+        if method == 1:
+            result = [1 / (1 + math.exp(-self.KT * (t - self.T_opt) / 1.5)) for t in self.T]
+        else:
+            result = [math.exp(-self.kappa_1 * (t - self.T_opt) ** 2) if t <= self.T_opt
+                      else math.exp(-self.kappa_2 * (t - self.T_opt) ** 2) for t in self.T]
+
+        self.cache['temperature_limitation'] = result
+        return result
+
+    def light_limitation(self):
+        """Light limitation function."""
+        if 'light_limitation' in self.cache:
+            return self.cache['light_limitation']
+
+        # 确保初始 MA 只在第一次读取后存储
+        if not hasattr(self, 'initial_MA'):
+            self.initial_MA = self.get_parameter('MA').copy()  # 存储初始生物量列表（MA 为共享状态视图，需拷贝）
+
+        H_0 = 0.2  # 初始基础深度
+        k = 0.005  # 与生物量相关的比例因子
+
+        # 动态计算深度，基于 MA 和初始值
+        dynamic_H = [H_0 + k * (ma - ma_0) for ma, ma_0 in zip(self.MA, self.initial_MA)]
+
+        K_MA = [self.K_E + 0.0004 * (max(h / self.z, 1) / min(h, self.z)) for h in dynamic_H]
+
+        light_factor = []
+        for i, h, ma, initial_ma, k_ma in zip(self.I, dynamic_H, self.MA, self.initial_MA, K_MA):
+            # 确保初始光照限制因子为1，生物量和深度增加导致限制逐渐降低
+            if ma <= initial_ma:
+                lf = 1.0  # 初始因子为 1
+            else:
+                lf = (math.e / (k_ma * h)) * (math.exp(-i * math.exp(-k_ma * h) / self.I_s) - math.exp(-i / self.I_s))
+
+            light_factor.append(lf)
+
+        self.cache['light_limitation'] = light_factor
+        return light_factor
+
+    def space_limitation(self):
+        """Space limitation function based on maximum macroalgal capacity."""
+        if 'space_limitation' in self.cache:
+            return self.cache['space_limitation']
+
+        result = [1 - (ma / self.MA_max) ** 2 for ma in self.MA]
+        self.cache['space_limitation'] = result
+        return result
+
+    def salinity_limitation(self, S_opt):
+        """Salinity limitation function."""
+        if 'salinity_limitation' in self.cache:
+            return self.cache['salinity_limitation']
+
+        result = [math.exp(-self.kappa_1_S * (s - S_opt) ** 2) if s <= S_opt
+                  else math.exp(-self.kappa_2_S * (s - S_opt) ** 2) for s in self.S]
+
+        self.cache['salinity_limitation'] = result
+        return result
+
+    def nutrient_limitation(self):
+        """Nutrient limitation function based on nitrogen and phosphorus quotas."""
+        if 'nutrient_limitation' in self.cache:
+            return self.cache['nutrient_limitation']
+
+        result = [min(1 - self.q0_N / qn, 1 - self.q0_P / qp) for qn, qp in zip(self.q_N, self.q_P)]
+        self.cache['nutrient_limitation'] = result
+        return result
+
+    def update_internal_quotas(self):
+        """Update the internal quotas for nitrogen and phosphorus."""
+        if self.internal_quotas_cache is not None:
+            return self.internal_quotas_cache
+
+        # Nitrogen quotas
+        F_UN_MA = [10**-3 * self.F_UP_N * ((nh4 + no3) / (self.KN_MA + nh4 + no3)) *
+                   (self.Kq_N / (self.Kq_N + (q_n - self.q0_N))) * ma
+                   for nh4, no3, q_n, ma in zip(self.NH4, self.NO3, self.q_N, self.MA)]
+        F_EN_MA = [10**-3 * self.K_E_MA_20 * (self.theta_E_MA ** (t - 20)) * q_n * ma
+                   for q_n, ma, t in zip(self.q_N, self.MA, self.T)]
+        F_DN_MA = [10**-3 * dma * q_n for dma, q_n in zip(self.calculate_DMA(), self.q_N)]
+        dq_N_dt = [fun - fen - fdn for fun, fen, fdn in zip(F_UN_MA, F_EN_MA, F_DN_MA)]
+
+        self.q_N = [max(0, qn + dq) for qn, dq in zip(self.q_N, dq_N_dt)]  # Ensure non-negative quotas
+
+
+        # Phosphorus quotas
+        F_UP_MA = [10**-3 * self.F_UP_P * ((po4) / (self.KP + po4)) *
+                   (self.Kq_P / (self.Kq_P + (q_p - self.q0_P))) * ma
+                   for po4, q_p, ma in zip(self.PO4, self.q_P, self.MA)]
+        F_EP_MA = [10**-3 * self.K_E_MA_20 * (self.theta_E_MA ** (t - 20)) * q_p * ma
+                   for q_p, ma, t in zip(self.q_P, self.MA, self.T)]
+        F_DP_MA = [10**-3 * dma * q_p for dma, q_p in zip(self.calculate_DMA(), self.q_P)]
+        dq_P_dt = [fup - fep - fdp for fup, fep, fdp in zip(F_UP_MA, F_EP_MA, F_DP_MA)]
+
+        self.q_P = [max(0, qp + dq) for qp, dq in zip(self.q_P, dq_P_dt)]  # Ensure non-negative quotas
+
+        self.internal_quotas_cache = (F_UN_MA, F_EN_MA, F_DN_MA, self.q_N, F_UP_MA, F_EP_MA, F_DP_MA, self.q_P)
+        return self.internal_quotas_cache
+
+    def calculate_GMA(self):
+        """Calculate the growth of macroalgae."""
+        if 'calculate_GMA' in self.cache:
+            return self.cache['calculate_GMA']
+
+        phi_T_MA = self.temperature_limitation()
+        phi_L_MA = self.light_limitation()
+        phi_S_MA = self.space_limitation()
+        phi_Sal_MA = self.salinity_limitation(S_opt=self.get_parameter('S_opt')[0])
+        self.update_internal_quotas()
+        phi_N_MA = self.nutrient_limitation()
+
+        GP_MA = [self.KC_MA * phi_t * phi_l * phi_s * phi_sal * phi_n
+                 for phi_t, phi_l, phi_s, phi_sal, phi_n in zip(phi_T_MA, phi_L_MA, phi_S_MA, phi_Sal_MA, phi_N_MA)]
+
+
+        result = [gp * ma for gp, ma in zip(GP_MA, self.MA)]
+
+        self.cache['calculate_GMA'] = result
+        return GP_MA
+
+    def calculate_DMA(self):
+        """Calculate the death rate of macroalgae."""
+        if 'calculate_DMA' in self.cache:
+            return self.cache['calculate_DMA']
+
+        DEA_MA = [self.KD_MA * (self.KR_T ** (t - self.T_opt)) for t in self.T]
+
+        result = [dp * ma for dp, ma in zip(DEA_MA, self.MA)]
+
+        self.cache['calculate_DMA'] = result
+        return result
+
+    def calculate_loss_rate(self):
+        """Calculate the loss rate of macroalgae (mortality rate)."""
+        if 'loss_rate' in self.cache:
+            return self.cache['loss_rate']
+
+        RES_MA = [self.KR_MA * (self.KR_T ** (t - self.T_opt)) for t in self.T]
+        DEA_MA = [self.KD_MA * (self.KR_T ** (t - self.T_opt)) for t in self.T]
+        loss_rate = [res + dea for res, dea in zip(RES_MA, DEA_MA)]
+
+        result = [dp * ma for dp, ma in zip(loss_rate, self.MA)]
+        self.cache['loss_rate'] = result
+        return loss_rate
+
+
+# --------------------------
+# 浮游植物 / 浮游动物 / 大型藻类过程（回归核对）
+# --------------------------
+BIOLOGY_METHODS = {
+    'Phytoplankton': ['nutrient_limitation', 'temperature_limitation', 'light_limitation', 'growth_rate', 'loss_rate'],
+    'Zooplankton': ['grazing_rate', 'growth_rate', 'loss_rate'],
+    'Macroalgal': ['temperature_limitation', 'light_limitation', 'space_limitation', 'nutrient_limitation',
+                   'update_internal_quotas', 'calculate_GMA', 'calculate_DMA', 'calculate_loss_rate'],
+}
+
+
+def randomize_state(store, rng):
+    """随机生成一组状态，覆盖各分支（高/低盐度、生物量高于/低于初始值等）"""
+    n = store.state.n_zones
+    S_opt = store.get_parameter('S_opt')[0]
+    store.update_initial_values({
+        'T': rng.uniform(5, 32, n), 'I': rng.uniform(0, 1.5e6, n), 'H': rng.uniform(0.5, 15, n),
+        'S': S_opt + rng.uniform(-8, 8, n), 'PHY': rng.uniform(1e-4, 0.1, n), 'ZOO': rng.uniform(0.005, 0.1, n),
+        'MA': rng.uniform(0, 300, n), 'qN': rng.uniform(20, 60, n), 'qP': rng.uniform(2, 8, n),
+        'NH4': rng.uniform(0.005, 0.2, n), 'NO3': rng.uniform(1e-3, 1.5, n), 'PO4': rng.uniform(0.005, 0.15, n),
+    })
+
+
+def biology_outputs(components, initial_MA):
+    phy, zoo, macroalgal = components
+    macroalgal.initial_MA = initial_MA
+    outputs = {}
+    for component in components:
+        for method in BIOLOGY_METHODS[type(component).__name__.replace('Legacy', '')]:
+            outputs[f"{type(component).__name__.replace('Legacy', '')}.{method}"] = getattr(component, method)()
+    outputs['Phytoplankton.loss_rate_method'] = (phy.cache['loss_rate_method'] if isinstance(phy, LegacyCache)
+                                                 else phy.loss_rate_method())
+    return outputs
+
+
+def bench_biology(water_exchange, steps, args):
+    store = ParameterStore()
+    rng = np.random.default_rng(5)
+    new_classes = (Phytoplankton, Zooplankton, Macroalgal)
+    legacy_classes = (LegacyPhytoplankton, LegacyZooplankton, LegacyMacroalgal)
+    for trial in range(20):
+        randomize_state(store, rng)
+        initial_MA = store.get_parameter('MA') * rng.uniform(0.8, 1.2, store.state.n_zones)
+        expected = biology_outputs([cls(store) for cls in legacy_classes], initial_MA)
+        actual = biology_outputs([cls(store) for cls in new_classes], initial_MA)
+        for name, value in expected.items():
+            if name.endswith('_method'):
+                if list(value) != list(actual[name]):
+                    raise AssertionError(f"{name}（第 {trial} 组）与原实现不一致")
+            elif isinstance(value, tuple):
+                for i, (e, a) in enumerate(zip(value, actual[name])):
+                    check_close(f"{name}[{i}]（第 {trial} 组）", e, a)
+            else:
+                check_close(f"{name}（第 {trial} 组）", value, actual[name])
+
+    def step_time(classes):
+        components = [cls(store) for cls in classes]
+        initial_MA = store.get_parameter('MA').copy()
+
+        def step(t):
+            for component in components:
+                if isinstance(component, LegacyCache):
+                    component.reset_cache()
+                else:
+                    component.reload_parameters()  # 重新绑定状态即令计算图失效
+            components[2].reset_internal_quotas_cache()
+            biology_outputs(components, initial_MA)
+        return time_per_call(step, steps)
+    report('浮游植物/动物/大型藻类', step_time(legacy_classes), step_time(new_classes))
+
+
+class LegacyShellfish:
+    """原贝类 DEB 实现（逐区域列表推导，作为独立类维护）"""
+    def __init__(self, parameter_loader):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache for computed values
+
+        self.DSH = float(self.get_parameter('DSH')[0])  # Mortality rate (1/day)
+        self.U_SH = self.get_parameter('U_SH')[0]  # Maximum specific surface area feeding rate (m³/cm²/day)
+        self.kappa_SH = self.get_parameter('kappa_SH')[0]  # Energy allocation to growth and maintenance
+        self.E_m_SH = self.get_parameter('[E_m_SH]')[0]  # Maximum storage energy per unit volume (J/cm³)
+        self.E_G_SH = self.get_parameter('[E_G_SH]')[0]  # Energy cost per unit volume for growth (J/cm³)
+        self.V_p_SH = self.get_parameter('V_p_SH')[0]  # Volume at maturity (cm³)
+        self.H_SH = self.get_parameter('H_SH')[0]  # Half-saturation constant for feeding (mgC/m³)
+        self.p_A_SH_max = self.get_parameter('{p_A_SH}')[0]  # Maximum specific assimilation rate (J/cm²/day)
+        self.p_M_SH_param = self.get_parameter('[p_M_SH]')[0]
+
+        # Temperature-related constants
+        self.T_SH_0 = self.get_parameter('T_0_SH')[0]
+        self.T_SH_A = self.get_parameter('T_A_SH')[0]
+        self.T_SH_AL = self.get_parameter('T_AL_SH')[0]
+        self.T_SH_AH = self.get_parameter('T_AH_SH')[0]
+        self.T_SH_L = self.get_parameter('T_L_SH')[0]
+        self.T_SH_H = self.get_parameter('T_H_SH')[0]
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.T = get('T') + 273.15
+        self.PHY = get("PHY")
+        self.ZOO = get("ZOO")
+        self.V = get("V")
+        self.H = get("H")
+        self.N_SH = get("N_SH")
+        self.V_SH = get("V_SH")
+        self.E_SH = get("E_SH")
+        self.E_R_SH = get("E_R_SH")
+
+    def temperature_effect(self):
+        """Calculate the temperature effect on shellfish metabolic processes."""
+        if 'temperature_effect' in self.cache:
+            return self.cache['temperature_effect']
+
+        T = self.T[0]  # Assume a constant temperature for simplicity
+        k_SH_T = (math.exp(self.T_SH_A / self.T_SH_0 - self.T_SH_A / T) /
+                  (1 + math.exp(self.T_SH_AL / T - self.T_SH_AL / self.T_SH_L) +
+                   math.exp(self.T_SH_AH / self.T_SH_H - self.T_SH_AH / T)))
+
+        self.cache['temperature_effect'] = k_SH_T
+        return k_SH_T
+
+    def functional_response(self):
+        """Calculate the functional response for shellfish feeding."""
+        if 'functional_response' in self.cache:
+            return self.cache['functional_response']
+
+        f_SH = [phy + zoo / (phy + zoo + self.H_SH) for phy, zoo in zip(self.PHY, self.ZOO)]
+        self.cache['functional_response'] = f_SH
+        return f_SH
+
+    def energy_assimilation_rate(self):
+        """Calculate the energy assimilation rate for shellfish."""
+        if 'energy_assimilation_rate' in self.cache:
+            return self.cache['energy_assimilation_rate']
+
+        k_SH_T = self.temperature_effect()
+        f_SH = self.functional_response()
+        p_A_SH = [k_SH_T * f * self.p_A_SH_max * v_sh ** (2 / 3) for f, v_sh in zip(f_SH, self.V_SH)]
+
+        self.cache['energy_assimilation_rate'] = p_A_SH
+        return p_A_SH
+
+    def maintenance_rate(self):
+        """Calculate the maintenance rate for shellfish."""
+        if 'maintenance_rate' in self.cache:
+            return self.cache['maintenance_rate']
+
+        k_SH_T = self.temperature_effect()
+        p_M_SH = [k_SH_T * self.p_M_SH_param * v_sh for v_sh in self.V_SH]
+
+        self.cache['maintenance_rate'] = p_M_SH
+        return p_M_SH
+
+    def maturity_maintenance_rate(self):
+        """Calculate the maturity maintenance rate for shellfish."""
+        if 'maturity_maintenance_rate' in self.cache:
+            return self.cache['maturity_maintenance_rate']
+
+        p_J_SH = [min(v_sh, self.V_p_SH) * self.p_M_SH_param * (1 - self.kappa_SH) / self.kappa_SH for v_sh in self.V_SH]
+
+        self.cache['maturity_maintenance_rate'] = p_J_SH
+        return p_J_SH
+
+    def catabolic_rate(self):
+        """Calculate the catabolic rate for shellfish."""
+        if 'catabolic_rate' in self.cache:
+            return self.cache['catabolic_rate']
+
+        k_SH_T = self.temperature_effect()
+        E_SH_per_V_SH = [e_sh / v_sh for e_sh, v_sh in zip(self.E_SH, self.V_SH)]
+        p_C_SH = [(e_sh_v / (self.E_G_SH + self.kappa_SH * e_sh_v)) *
+                  (self.E_G_SH * self.p_A_SH_max * v_sh ** (2 / 3) / self.E_m_SH + k_SH_T * self.p_M_SH_param * v_sh)
+                  for e_sh_v, v_sh in zip(E_SH_per_V_SH, self.V_SH)]
+
+        self.cache['catabolic_rate'] = p_C_SH
+        return p_C_SH
+
+    def reproductive_energy_storage_rate(self):
+        """Calculate the reproductive energy storage rate for shellfish."""
+        if 'reproductive_energy_storage_rate' in self.cache:
+            return self.cache['reproductive_energy_storage_rate']
+
+        p_C_SH = self.catabolic_rate()
+        p_J_SH = self.maturity_maintenance_rate()
+        dE_R_SH_dt = [(1 - self.kappa_SH) * p_c - p_j for p_c, p_j in zip(p_C_SH, p_J_SH)]
+        self.E_R_SH = [e_r_sh + de_r_sh for e_r_sh, de_r_sh in zip(self.E_R_SH, dE_R_SH_dt)]
+
+        self.cache['reproductive_energy_storage_rate'] = (self.E_R_SH, dE_R_SH_dt)
+        return self.E_R_SH, dE_R_SH_dt
+
+    def growth_volume(self):
+        """Calculate the growth in volume for shellfish."""
+        if 'growth_volume' in self.cache:
+            return self.cache['growth_volume']
+
+        p_C_SH = self.catabolic_rate()
+        p_M_SH = self.maintenance_rate()
+
+        dV_SH_dt = [max((self.kappa_SH * p_c - p_m) / self.E_G_SH, 0) for p_c, p_m in zip(p_C_SH, p_M_SH)]
+        self.V_SH = [v_sh + dv_sh for v_sh, dv_sh in zip(self.V_SH, dV_SH_dt)]
+
+        self.cache['growth_volume'] = (self.V_SH, dV_SH_dt)
+        return dV_SH_dt
+
+    def population_dynamics(self, HSH):
+        """Update shellfish population dynamics."""
+        if 'population_dynamics' in self.cache:
+            return self.cache['population_dynamics']
+
+        dN_SH_dt = [-self.DSH * n_sh - h_sh * n_sh for n_sh, h_sh in zip(self.N_SH, HSH)]
+        self.N_SH = [n_sh + dn_sh for n_sh, dn_sh in zip(self.N_SH, dN_SH_dt)]
+
+        self.cache['population_dynamics'] = self.N_SH
+        return dN_SH_dt
+
+    def storage_energy(self):
+        """Update shellfish storage energy."""
+        if 'storage_energy' in self.cache:
+            return self.cache['storage_energy']
+
+        p_A_SH = self.energy_assimilation_rate()
+        p_C_SH = self.catabolic_rate()
+        dE_SH = [p_a - p_c for p_a, p_c in zip(p_A_SH, p_C_SH)]
+        self.E_SH = [e_sh + de_sh for e_sh, de_sh in zip(self.E_SH, dE_SH)]
+
+        self.cache['storage_energy'] = self.E_SH
+        return self.E_SH
+
+    def GRS_PHY(self):
+        """Calculate the grazing rate of phytoplankton by shellfish."""
+        if 'GRS_PHY' in self.cache:
+            return self.cache['GRS_PHY']
+
+        k_SH_T = self.temperature_effect()
+        N_SH = self.N_SH
+        GRS_PHY = [k_SH_T * self.U_SH * v_sh ** (2 / 3) * n_sh / V for v_sh, n_sh, V in zip(self.V_SH, N_SH, self.V)]
+
+        self.cache['GRS_PHY'] = GRS_PHY
+        return GRS_PHY
+
+    def update_shellfish(self, HSH):
+        """Update the shellfish biomass, energy, and population."""
+        if 'update_shellfish' in self.cache:
+            return self.cache['update_shellfish']
+
+        self.population_dynamics(HSH)
+        self.V_SH, _ = self.growth_volume()
+        self.storage_energy()
+        self.E_R_SH, _ = self.reproductive_energy_storage_rate()
+        grs_phy = [self.GRS_PHY() * phy for phy in self.PHY]
+
+        self.cache['update_shellfish'] = (self.N_SH, self.V_SH, self.E_SH, self.E_R_SH, grs_phy)
+
+        return self.N_SH, self.V_SH, self.E_SH, self.E_R_SH, grs_phy
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep."""
+        self.cache.clear()
+
+
+class LegacyFish:
+    """原鱼类 DEB 实现（逐区域列表推导，作为独立类维护）"""
+    def __init__(self, parameter_loader):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache for computed values
+
+        self.DF = float(self.get_parameter('DF')[0])
+        self.kappa_F = self.get_parameter('kappa_F')[0]
+        self.E_m_F = self.get_parameter('[E_m_F]')[0]
+        self.E_G_F = self.get_parameter('[E_G_F]')[0]
+        self.V_p_F = self.get_parameter('V_p_F')[0]
+        self.H_F = self.get_parameter('H_F')[0]
+        self.p_A_F_max = self.get_parameter('{p_A_F}')[0]
+        self.p_M_F_param = self.get_parameter('[p_M_F]')[0]
+
+        # Temperature-related constants
+        self.T_F_0 = self.get_parameter('T_0_F')[0]
+        self.T_F_A = self.get_parameter('T_A_F')[0]
+        self.T_F_AL = self.get_parameter('T_AL_F')[0]
+        self.T_F_AH = self.get_parameter('T_AH_F')[0]
+        self.T_F_L = self.get_parameter('T_L_F')[0]
+        self.T_F_H = self.get_parameter('T_H_F')[0]
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.T = get('T') + 273.15
+        self.PHY = get("PHY")
+        self.ZOO = get("ZOO")
+        self.A = get("A")
+        self.V = get("V")
+        self.H = get("H")
+        self.N_F = get("N_F")
+        self.V_F = get("V_F")
+        self.E_F = get("E_F")
+        self.E_R_F = get("E_R_F")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] / 365 * 24 for nf in
+                     get('N_F')]
+
+    def temperature_effect(self):
+        """Calculate the temperature effect on fish metabolic processes."""
+        if 'temperature_effect' in self.cache:
+            return self.cache['temperature_effect']
+
+        T = self.T[0]  # Assume a constant temperature for simplicity
+        k_F_T = (math.exp(self.T_F_A / self.T_F_0 - self.T_F_A / T) /
+                 (1 + math.exp(self.T_F_AL / T - self.T_F_AL / self.T_F_L) +
+                  math.exp(self.T_F_AH / self.T_F_H - self.T_F_AH / T)))
+
+        self.cache['temperature_effect'] = k_F_T
+        return k_F_T
+
+    def functional_response(self):
+        """Calculate the functional response for fish feeding."""
+        if 'functional_response' in self.cache:
+            return self.cache['functional_response']
+
+        f_F = [feed / (feed + self.H_F) for feed in self.FEED]
+        self.cache['functional_response'] = f_F
+        return f_F
+
+    def energy_assimilation_rate(self):
+        """Calculate the energy assimilation rate for fish."""
+        if 'energy_assimilation_rate' in self.cache:
+            return self.cache['energy_assimilation_rate']
+
+        k_F_T = self.temperature_effect()
+        f_F = self.functional_response()
+        p_A_F = [k_F_T * f * self.p_A_F_max * v_f ** (2 / 3) for f, v_f in zip(f_F, self.V_F)]
+
+        self.cache['energy_assimilation_rate'] = p_A_F
+        return p_A_F
+
+    def maintenance_rate(self):
+        """Calculate the maintenance rate for fish."""
+        if 'maintenance_rate' in self.cache:
+            return self.cache['maintenance_rate']
+
+        k_F_T = self.temperature_effect()
+        p_M_F = [k_F_T * self.p_M_F_param * v_f for v_f in self.V_F]
+
+        self.cache['maintenance_rate'] = p_M_F
+        return p_M_F
+
+    def maturity_maintenance_rate(self):
+        """Calculate the maturity maintenance rate for fish."""
+        if 'maturity_maintenance_rate' in self.cache:
+            return self.cache['maturity_maintenance_rate']
+
+        p_J_F = [min(v_f, self.V_p_F) * self.p_M_F_param * (1 - self.kappa_F) / self.kappa_F for v_f in self.V_F]
+
+        self.cache['maturity_maintenance_rate'] = p_J_F
+        return p_J_F
+
+    def catabolic_rate(self):
+        """Calculate the catabolic rate for fish."""
+        if 'catabolic_rate' in self.cache:
+            return self.cache['catabolic_rate']
+
+        k_F_T = self.temperature_effect()
+        p_M_F = self.maintenance_rate()
+        E_F_per_V_F = [e_f / v_f for e_f, v_f in zip(self.E_F, self.V_F)]
+        p_C_F = [k_F_T * (e_f_v / (self.E_G_F + self.kappa_F * e_f_v)) *
+                 (self.E_G_F * self.p_A_F_max * v_f ** (2 / 3) / self.E_m_F + p_m)
+                 for e_f_v, v_f, p_m in zip(E_F_per_V_F, self.V_F, p_M_F)]
+
+        self.cache['catabolic_rate'] = p_C_F
+        return p_C_F
+
+    def reproductive_energy_storage_rate(self):
+        """Calculate the reproductive energy storage rate for fish."""
+        if 'reproductive_energy_storage_rate' in self.cache:
+            return self.cache['reproductive_energy_storage_rate']
+
+        p_C_F = self.catabolic_rate()
+        p_J_F = self.maturity_maintenance_rate()
+        dE_R_F_dt = [(1 - self.kappa_F) * p_c - p_j for p_c, p_j in zip(p_C_F, p_J_F)]
+        self.E_R_F = [e_r_f + de_r_f for e_r_f, de_r_f in zip(self.E_R_F, dE_R_F_dt)]
+
+        self.cache['reproductive_energy_storage_rate'] = (self.E_R_F, dE_R_F_dt)
+        return self.E_R_F, dE_R_F_dt
+
+    def growth_volume(self):
+        """Calculate the growth in volume for fish."""
+        if 'growth_volume' in self.cache:
+            return self.cache['growth_volume']
+
+        p_C_F = self.catabolic_rate()
+        p_M_F = self.maintenance_rate()
+        dV_F_dt = [max((self.kappa_F * p_c - p_m) / self.E_G_F, 0) for p_c, p_m in zip(p_C_F, p_M_F)]
+        self.V_F = [v_f + dv_f for v_f, dv_f in zip(self.V_F, dV_F_dt)]
+
+        self.cache['growth_volume'] = (self.V_F, dV_F_dt)
+        return dV_F_dt
+
+    def population_dynamics(self, HF):
+        """Update fish population dynamics."""
+        if 'population_dynamics' in self.cache:
+            return self.cache['population_dynamics']
+
+        dN_F_dt = [-self.DF * n_f - hf * n_f for n_f, hf in zip(self.N_F, HF)]
+        self.N_F = [n_f + dn_f for n_f, dn_f in zip(self.N_F, dN_F_dt)]
+
+        self.cache['population_dynamics'] = self.N_F
+        return self.N_F
+
+    def storage_energy(self):
+        """Update fish storage energy."""
+        if 'storage_energy' in self.cache:
+            return self.cache['storage_energy']
+
+        p_A_F = self.energy_assimilation_rate()
+        p_C_F = self.catabolic_rate()
+        dE_F = [p_a - p_c for p_a, p_c in zip(p_A_F, p_C_F)]
+        self.E_F = [e_f + de_f for e_f, de_f in zip(self.E_F, dE_F)]
+
+        self.cache['storage_energy'] = self.E_F
+        return self.E_F
+
+    def update_fish(self, HF):
+        """Update the fish biomass, energy, and population."""
+        if 'update_fish' in self.cache:
+            return self.cache['update_fish']
+
+        self.population_dynamics(HF)
+        self.V_F, _ = self.growth_volume()
+        self.storage_energy()
+        self.E_R_F, _ = self.reproductive_energy_storage_rate()
+
+        self.cache['update_fish'] = (self.N_F, self.V_F, self.E_F, self.E_R_F)
+
+        return self.N_F, self.V_F, self.E_F, self.E_R_F
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep."""
+        self.cache.clear()
+
+
+# --------------------------
+# 贝类 / 鱼类 DEB（回归核对）
+# --------------------------
+DEB_METHODS = ['temperature_effect', 'functional_response', 'energy_assimilation_rate', 'maintenance_rate',
+               'maturity_maintenance_rate', 'catabolic_rate', 'reproductive_energy_storage_rate', 'growth_volume',
+               'storage_energy']
+
+
+def randomize_deb_state(store, rng):
+    n = store.state.n_zones
+    store.update_initial_values({
+        'T': rng.uniform(5, 32, n), 'PHY': rng.uniform(1e-4, 0.1, n), 'ZOO': rng.uniform(0.005, 0.1, n),
+        'N_SH': rng.uniform(0, 1e9, n), 'V_SH': rng.uniform(0.1, 20, n), 'E_SH': rng.uniform(10, 5000, n),
+        'E_R_SH': rng.uniform(0, 100, n), 'N_F': rng.uniform(0, 1e8, n), 'V_F': rng.uniform(1, 500, n),
+        'E_F': rng.uniform(100, 1e5, n), 'E_R_F': rng.uniform(0, 1000, n),
+    })
+
+
+def deb_outputs(population, harvest):
+    # 捕食率先求值：原实现的 growth_volume / population_dynamics 会原地修改体积与数量
+    outputs = {'GRS_PHY': population.GRS_PHY()} if hasattr(population, 'GRS_PHY') else {}
+    outputs.update({method: getattr(population, method)() for method in DEB_METHODS})
+    outputs['population_dynamics'] = population.population_dynamics(harvest)
+    return outputs
+
+
+def bench_deb(water_exchange, steps, args):
+    store = ParameterStore()
+    rng = np.random.default_rng(6)
+    n = store.state.n_zones
+    pairs = [(LegacyShellfish, Shellfish), (LegacyFish, Fish)]
+    for trial in range(20):
+        randomize_deb_state(store, rng)
+        # 原实现各海区统一取第一个海区的温度，逐项核对时令各海区温度相同
+        store.update_initial_values({'T': np.full(n, store.get_parameter('T')[0])})
+        harvest = rng.choice([0.0, 1.0], n)
+        for legacy_cls, cls in pairs:
+            expected, actual = deb_outputs(legacy_cls(store), harvest), deb_outputs(cls(store), harvest)
+            for name, value in expected.items():
+                if isinstance(value, tuple):
+                    for i, (e, a) in enumerate(zip(value, actual[name])):
+                        check_close(f"{cls.__name__}.{name}[{i}]（第 {trial} 组）", e, a)
+                else:
+                    check_close(f"{cls.__name__}.{name}（第 {trial} 组）", value, actual[name])
+
+    # 同一 DEBCommunity 的两行：各海区按本海区温度校正，结果与单物种引擎逐项计算一致
+    randomize_deb_state(store, rng)
+    environment = EnvironmentFactors(store)
+    community = DEBCommunity(store, environment)
+    populations = [Shellfish(store, environment, community), Fish(store, environment, community)]
+    for population in populations:
+        engine = DEBEngine(store, [population.species])
+        k_T = engine.temperature_effect(store.get_parameter('T') + 273.15)
+        V, E = population.volume, population.reserve
+        check_close(f"{population.species} 逐海区温度校正", k_T[0], population.temperature_effect())
+        check_close(f"{population.species} p_C", engine.catabolic_rate(k_T, E, V)[0], population.catabolic_rate())
+        p_M = engine.maintenance_rate(k_T, V)
+        check_close(f"{population.species} dV", engine.growth_rate(engine.catabolic_rate(k_T, E, V), p_M)[0],
+                    population.growth_volume())
+    if community.evaluations != 1:
+        raise AssertionError(f"两个物种求值 DEB 引擎 {community.evaluations} 次，应为 1 次")
+
+    # 模拟中每次速率求值（欧拉：生长前与生长后各一次；MPRK：每个阶段一次）只调用一次引擎
+    forcing = build_forcing(water_exchange)
+    for integrator, expected in [('euler', 2), ('mprk', 2)]:
+        simulation = Simulation(None, forcing, simulation_config(args, sim_days=1, integrator=integrator))
+        simulation.run()
+        per_step = simulation.deb.evaluations / simulation.num_steps
+        if per_step > expected:
+            raise AssertionError(f"{integrator} 每步调用 DEB 引擎 {per_step:.1f} 次，应不超过 {expected} 次")
+        print(f"{'DEB 引擎调用（' + integrator + '）':<24} 每步 {per_step:.1f} 次（贝类、鱼类两行一并计算）")
+
+    f = np.stack([p.functional_response() for p in populations])
+    V = np.stack([p.volume for p in populations])
+    E = np.stack([p.reserve for p in populations])
+    engine = community.engine
+    legacy_populations = [legacy_cls(store) for legacy_cls, _ in pairs]
+
+    def legacy_step(t):
+        for population in legacy_populations:
+            population.reset_cache()
+            deb_outputs(population, np.zeros(n))
+
+    def new_step(t):
+        engine.rates(engine.temperature_effect(store.get_parameter('T') + 273.15), f, V, E)
+    legacy_seconds = time_per_call(legacy_step, steps)
+    new_seconds = time_per_call(new_step, steps)
+    report('DEB 贝类+鱼类（一次调用）', legacy_seconds, new_seconds)
+
+
+# --------------------------
+# 原逐营养盐类过程通量（仅用于核对与计时，CBOD/溶解氧的原实现已随 BiogeochemistryEngine 移除）
+# --------------------------
+class LegacyAmmoniumNitrogen:
+    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache for computed values
+
+        # Biological constants from the 'Ammonium Nitrogen' tab
+        self.KC_nit = self.get_parameter('KC_nit')[0]
+        self.KT_nit = self.get_parameter('K_T')[0]
+        self.K_nit = self.get_parameter('K_nit')[0]
+        self.KNC_min = self.get_parameter('KNC_min')[0]
+        self.KNT_min = self.get_parameter('K_T')[0]
+
+        # Model components
+        self.phytoplankton = phytoplankton
+        self.macroalgal = macroalgal
+        self.zooplankton = zooplankton
+        self.shellfish = shellfish
+        self.fish = fish
+
+        # External inputs
+        self.external_NH4_input = None
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.T = get("T")
+        self.A = get("A")
+        self.V = get("V")
+        self.H = get("H")
+        self.NH4 = get("NH4")
+        self.NO3 = get("NO3")
+        self.ON = get("ON")
+        self.DO = get("DO")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf in get('N_F')]
+        self.FEED_NH3 = [0.2 * get('FEED_NH3')[0] * m / (v * 1000) for m, a, v in
+                         zip(self.FEED, get('A'), get('V'))]
+
+    def set_external_input(self, external_input):
+        self.external_input = external_input
+        return self.external_input
+
+    def phytoplankton_ammonium_release(self):
+        """Calculate N1_PHY: Phytoplankton death ammonium release"""
+        if 'phytoplankton_ammonium_release' in self.cache:
+            return self.cache['phytoplankton_ammonium_release']
+
+        NC_PHY = self.get_parameter('NC_PHY')[0]
+        FON_PHY = self.get_parameter('FON_PHY')[0]
+        # DPP = self.phytoplankton.loss_rate()
+        # N1_PHY = [NC_PHY * dpp * (1 - FON_PHY) for dpp in DPP]
+        # self.cache['phytoplankton_ammonium_release'] = N1_PHY
+        return [NC_PHY * (1 - FON_PHY)] * 20
+
+    def phytoplankton_ammonium_absorption(self):
+        """Calculate Abs1_PHY: Phytoplankton ammonium absorption"""
+        if 'phytoplankton_ammonium_absorption' in self.cache:
+            return self.cache['phytoplankton_ammonium_absorption']
+
+        NC_PHY = self.get_parameter('NC_PHY')[0]
+        KN_PHY = self.get_parameter('KN_PHY')[0]
+        GPP = self.phytoplankton.growth_rate()
+        PN_PHY = [(nh4 * no3) / ((nh4 + KN_PHY) * (no3 + KN_PHY)) + (nh4 * KN_PHY) / ((nh4 + KN_PHY) * (no3 + KN_PHY))
+                  for nh4, no3 in zip(self.NH4, self.NO3)]
+        Abs1_PHY = [gpp * pn * NC_PHY for gpp, pn in zip(GPP, PN_PHY)]
+
+        self.cache['phytoplankton_ammonium_absorption'] = Abs1_PHY
+        return [pn * NC_PHY for pn in PN_PHY], PN_PHY
+
+    def macroalgal_ammonium_release(self):
+        """Calculate N1_MA: Macroalgal death ammonium release"""
+        if 'macroalgal_ammonium_release' in self.cache:
+            return self.cache['macroalgal_ammonium_release']
+
+        NC_MA = self.get_parameter('NC_MA')[0]
+        DC_MA = self.get_parameter('DC_MA')[0]
+        F_EN_MA = self.macroalgal.update_internal_quotas()[1]
+        F_DN_MA = self.macroalgal.update_internal_quotas()[2]
+        q_N_MA = self.macroalgal.update_internal_quotas()[3]
+        f_ON_MA = [min(1,(NC_MA / DC_MA) / (q_n_ma / 1000)) for q_n_ma in q_N_MA]
+        A_MA = [a * 0.01 for a in self.get_parameter('A')]
+        N1_MA = [((f_en + f_dn) * (1 - f_on_ma) * a_ma ) / v
+                 for f_en, f_dn, f_on_ma, a_ma, v in zip(F_EN_MA, F_DN_MA, f_ON_MA, A_MA, self.V)]
+
+        # i = 4
+        # print(f'N1_MA: {N1_MA[i]}, F_EN_MA: {F_EN_MA[i]}, F_DN_MA: {F_DN_MA[i]}, f_ON_MA: {f_ON_MA[i]}')
+
+        self.cache['macroalgal_ammonium_release'] = N1_MA
+        return N1_MA
+
+    def macroalgal_ammonium_absorption(self):
+        """Calculate Abs1_MA: Macroalgal ammonium absorption"""
+        if 'macroalgal_ammonium_absorption' in self.cache:
+            return self.cache['macroalgal_ammonium_absorption']
+
+        KN_MA = self.get_parameter('KN_MA')[0]
+        F_UN_MA, _, _, _, _, _, _, _ = self.macroalgal.update_internal_quotas()
+        PN_MA = [(nh4 * no3) / ((nh4 + KN_MA) * (no3 + KN_MA)) + (nh4 * KN_MA) / ((nh4 + KN_MA) * (no3 + KN_MA))
+                 for nh4, no3 in zip(self.NH4, self.NO3)]
+        A_MA = [a * 0.01 for a in self.get_parameter('A')]
+        Abs1_MA = [f_un * pn * a_ma / v  for f_un, pn, a_ma, v in zip(F_UN_MA, PN_MA, A_MA, self.V)]
+
+        # i = 4
+        # print(f'Abs1_MA: {Abs1_MA[i]}, F_UN_MA: {F_UN_MA[i]}, PN_MA: {PN_MA[i]}, A_MA: {A_MA[i]}, V: {self.V[i]}')
+
+        self.cache['macroalgal_ammonium_absorption'] = Abs1_MA
+        return Abs1_MA, PN_MA
+
+    def shellfish_ammonium_excretion(self):
+        """Calculate Ex1_SH: Shellfish ammonium excretion"""
+        if 'shellfish_ammonium_excretion' in self.cache:
+            return self.cache['shellfish_ammonium_excretion']
+
+        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
+        mu_V_SH = self.get_parameter('mu_V_SH')[0]
+        NC_PHY = self.get_parameter('NC_PHY')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        NC_SH = self.get_parameter('NC_SH')[0]
+
+        p_C_SH = self.shellfish.catabolic_rate()
+        p_A_SH = self.shellfish.energy_assimilation_rate()
+        _, dE_R_SH_dt = self.shellfish.reproductive_energy_storage_rate()
+        dV_SH_dt = self.shellfish.growth_volume()
+
+        Excr_SH = [
+            ((p_c - (1 - kappa_R_SH) * de_r_sh - mu_V_SH * dv_sh) * NC_SH + p_a * max(NC_PHY - NC_SH, 0)) / mu_CJ
+            for p_c, p_a, de_r_sh, dv_sh in zip(p_C_SH, p_A_SH, dE_R_SH_dt, dV_SH_dt)
+        ]
+
+        Ex1_SH = [n_sh * excr_sh / (v * 1000) for n_sh, excr_sh, v in zip(self.shellfish.N_SH, Excr_SH, self.V)]
+        self.cache['shellfish_ammonium_excretion'] = Ex1_SH
+        return Excr_SH
+
+    def fish_ammonium_excretion(self):
+        """Calculate Ex1_F: Fish ammonium excretion"""
+        if 'fish_ammonium_excretion' in self.cache:
+            return self.cache['fish_ammonium_excretion']
+
+        kappa_R_F = self.get_parameter('kappa_R_F')[0]
+        mu_V_F = self.get_parameter('mu_V_F')[0]
+        NC_F = self.get_parameter('NC_F')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        NC_FEED = self.get_parameter('NC_FEED')[0]
+
+        p_C_F = self.fish.catabolic_rate()
+        p_A_F = self.fish.energy_assimilation_rate()
+        _, dE_R_F_dt = self.fish.reproductive_energy_storage_rate()
+        dV_F_dt = self.fish.growth_volume()
+
+        Excr_F = [
+            ((p_c - (1 - kappa_R_F) * de_r_f - mu_V_F * dv_f) * NC_F + p_a * max(NC_FEED - NC_F, 0)) / mu_CJ
+            for p_c, p_a, de_r_f, dv_f in zip(p_C_F, p_A_F, dE_R_F_dt, dV_F_dt)
+        ]
+
+        Ex1_F = [n_f * excr_f / (v * 1000) for n_f, excr_f, v in zip(self.fish.N_F, Excr_F, self.V)]
+        self.cache['fish_ammonium_excretion'] = Ex1_F
+        return Excr_F
+
+    def nitrification(self):
+        """Calculate NitN: Ammonium nitrification"""
+        if 'nitrification' in self.cache:
+            return self.cache['nitrification']
+
+        NitN = [self.KC_nit * (self.KT_nit ** (t - 20)) * nh4 * (do / (do + self.K_nit))
+                for nh4, do, t in zip(self.NH4, self.DO, self.T)]
+
+        self.cache['nitrification'] = NitN
+        return NitN
+
+    def mineralization(self):
+        """Calculate MinN: Organic nitrogen mineralization"""
+        if 'mineralization' in self.cache:
+            return self.cache['mineralization']
+
+        MinN = [self.KNC_min * (self.KNT_min ** (t - 20)) * on for on, t in zip(self.ON, self.T)]
+
+        self.cache['mineralization'] = MinN
+        return MinN
+
+    def update_NH4(self):
+        """Calculate the ammonium concentration change in the water"""
+        if 'update_NH4' in self.cache:
+            return self.cache['update_NH4']
+
+        N1_PHY = self.phytoplankton_ammonium_release()
+        N1_MA = self.macroalgal_ammonium_release()
+        Ex1_SH = self.shellfish_ammonium_excretion()
+        Ex1_F = self.fish_ammonium_excretion()
+        MinN = self.mineralization()
+        NitN = self.nitrification()
+        Abs1_PHY = self.phytoplankton_ammonium_absorption()[0]
+        Abs1_MA = self.macroalgal_ammonium_absorption()[0]
+
+        dNH4_dt = [n1_phy + n1_ma + ex1_sh + ex1_f + min_n + feed_nh3 - nit_n - abs1_phy - abs1_ma + ex_nh4
+                   for n1_phy, n1_ma, ex1_sh, ex1_f, min_n, feed_nh3, nit_n, abs1_phy, abs1_ma, ex_nh4 in
+                   zip(N1_PHY, N1_MA, Ex1_SH, Ex1_F, MinN, self.FEED_NH3, NitN, Abs1_PHY, Abs1_MA, self.external_NH4_input)]
+
+        # # Debugging
+        # i = 4
+        # change = abs(N1_PHY[i]) + abs(N1_MA[i]) + abs(Ex1_SH[i]) + abs(Ex1_F[i]) + abs(MinN[i]) + abs(self.FEED_NH3[i]) + abs(NitN[i])+ abs(Abs1_PHY[i]) + abs(Abs1_MA[i]) + abs(self.external_NH4_input[i])
+        # print(f"dNH4_dt: {dNH4_dt[i]}; change: {change}; n1_phy: {N1_PHY[i] / change}; n1_ma: {N1_MA[i] / change}; ex1_sh: {Ex1_SH[i] / change}; ex1_f: {Ex1_F[i] / change}; min_n: {MinN[i] / change}; feed: {self.FEED_NH3[i] / change}; Abs1_PHY: {Abs1_PHY[i] / change}; Abs1_MA: {Abs1_MA[i] / change}; NitN: {NitN[i] / change}; ex_nh4: {self.external_NH4_input[i]/ change}")
+
+        dNH4_dt = np.real_if_close(dNH4_dt, tol=1e-9)
+
+        self.NH4 = [max(0, nh4 + dnh4) for nh4, dnh4 in zip(self.NH4, dNH4_dt)]
+
+        self.cache['update_NH4'] = self.NH4
+        return self.NH4
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep."""
+        self.cache.clear()
+
+class LegacyNitrateNitrogen:
+    def __init__(self, parameter_loader, phytoplankton, macroalgal):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache dictionary to store calculated results
+
+        # Biological constants from the 'Nitrogen' tab
+        self.KC_den = self.get_parameter('KC_den')[0]
+        self.KT_den = self.get_parameter('K_T')[0]
+        self.K_den = self.get_parameter('K_den')[0]
+
+        # Model components
+        self.phytoplankton = phytoplankton
+        self.macroalgal = macroalgal
+
+        # External inputs
+        self.external_NO3_input = None
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.T = get("T")
+        self.A = get("A")
+        self.V = get("V")
+        self.H = get("H")
+        self.NO3 = get("NO3")
+        self.NH4 = get("NH4")
+        self.DO = get("DO")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in zip(get('N_F'), self.A)]
+        self.FEED_NO3 = [0.2 * get('FEED_NO3')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
+                         zip(self.FEED, self.A, self.V)]
+
+    def set_external_input(self, external_input):
+        self.external_input = external_input
+        return self.external_input
+
+    def phytoplankton_nitrate_absorption(self):
+        """Calculate Abs2_PHY: Phytoplankton nitrate absorption"""
+        if 'phytoplankton_nitrate_absorption' in self.cache:
+            return self.cache['phytoplankton_nitrate_absorption']
+
+        NC_PHY = self.get_parameter('NC_PHY')[0]
+        # GPP = self.phytoplankton.phy_growth_rate()
+        KN_PHY = self.get_parameter('KN_PHY')[0]
+        PN_PHY = [(nh4 * no3) / ((nh4 + KN_PHY) * (no3 + KN_PHY)) + (nh4 * KN_PHY) / ((nh4 + KN_PHY) * (no3 + KN_PHY))
+                  for nh4, no3 in zip(self.NH4, self.NO3)]
+        # Abs2_PHY = [gpp * (1 - pn) * NC_PHY for gpp, pn in zip(GPP, PN_PHY)]
+
+        # self.cache['phytoplankton_nitrate_absorption'] = Abs2_PHY
+        return [(1 - pn) * NC_PHY for pn in PN_PHY]
+
+    def macroalgal_nitrate_absorption(self):
+        """Calculate Abs2_MA: Macroalgal nitrate absorption"""
+        if 'macroalgal_nitrate_absorption' in self.cache:
+            return self.cache['macroalgal_nitrate_absorption']
+
+        KN_MA = self.get_parameter('KN_MA')[0]
+        F_UN_MA = self.macroalgal.update_internal_quotas()[0]
+        PN_MA = [(nh4 * no3) / ((nh4 + KN_MA) * (no3 + KN_MA)) + (nh4 * KN_MA) / ((nh4 + KN_MA) * (no3 + KN_MA))
+                 for nh4, no3 in zip(self.NH4, self.NO3)]
+        A_MA = [a * 0.01 for a in self.get_parameter('A')]
+        V = self.get_parameter('V')
+        Abs2_MA = [f_un * (1 - pn) * a_ma / v for f_un, pn, a_ma, v in zip(F_UN_MA, PN_MA, A_MA, V)]
+
+        self.cache['macroalgal_nitrate_absorption'] = Abs2_MA
+        return Abs2_MA
+
+    def denitrification(self):
+        """Calculate DenN: Denitrification"""
+        if 'denitrification' in self.cache:
+            return self.cache['denitrification']
+
+        DenN = [self.KC_den * (self.KT_den ** (t - 20)) * no3 * (self.K_den / (do + self.K_den))
+                for no3, do, t in zip(self.NO3, self.DO, self.T)]
+
+        self.cache['denitrification'] = DenN
+        return DenN
+
+    def update_NO3(self):
+        """Calculate the nitrate concentration change in the water"""
+        if 'update_NO3' in self.cache:
+            return self.cache['update_NO3']
+
+        NitN = ammonium.nitrification()  # Use the nitrification rate from AmmoniumNitrogen class
+        Abs2_PHY = self.phytoplankton_nitrate_absorption()
+        Abs2_MA = self.macroalgal_nitrate_absorption()
+        DenN = self.denitrification()
+
+        dNO3_dt = [nit_n + feed_no3 - abs2_phy - abs2_ma - den_n + ex_no3
+                   for nit_n, feed_no3, abs2_phy, abs2_ma, den_n, ex_no3 in zip(NitN, self.FEED_NO3, Abs2_PHY, Abs2_MA, DenN, self.external_NO3_input)]
+
+        # Debugging
+        i = 8
+        change = abs(NitN[i]) + abs(self.FEED_NO3[i]) + abs(Abs2_PHY[i]) + abs(Abs2_MA[i]) + abs(DenN[i]) + abs(self.external_NO3_input[i])
+        print(f"dNO3_dt: {dNO3_dt[i]}; change: {change}; NitN: {NitN[i] / change}; feed: {self.FEED_NO3[i] / change}; Abs2_PHY: {Abs2_PHY[i] / change}; Abs2_MA: {Abs2_MA[i] / change}; DenN: {DenN[i] / change}; ex_no3: {self.external_NO3_input[i]  / change}")
+
+        self.NO3 = [max(1e-12, no3 + dno3) for no3, dno3 in zip(self.NO3, dNO3_dt)]
+
+        self.cache['update_NO3'] = self.NO3
+        return self.NO3
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep"""
+        self.cache.clear()
+
+class LegacyOrganicNitrogen:
+    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache dictionary to store calculated results
+
+        # Biological constants for mineralization
+        self.KNC_min = self.get_parameter('KNC_min')[0]
+        self.KNT_min = self.get_parameter('K_T')[0]
+
+        # Model components
+        self.phytoplankton = phytoplankton
+        self.macroalgal = macroalgal
+        self.zooplankton = zooplankton
+        self.shellfish = shellfish
+        self.fish = fish
+
+        # External inputs
+        self.external_ON_input = None
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.A = get("A")
+        self.V = get("V")
+        self.H = get("H")
+        self.ON = get("ON")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
+                     zip(get('N_F'), get('A'))]
+        self.FEED_ON = [0.2 * get('FEED_ON')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
+                        zip(self.FEED, get('A'), get('V'))]
+
+    def set_external_input(self, external_input):
+        self.external_input = external_input
+        return self.external_input
+
+    def phytoplankton_on_release(self):
+        """Calculate N2_PHY: Phytoplankton death organic nitrogen release"""
+        if 'phytoplankton_on_release' in self.cache:
+            return self.cache['phytoplankton_on_release']
+
+        NC_PHY = self.get_parameter('NC_PHY')[0]
+        FON_PHY = self.get_parameter('FON_PHY')[0]
+        # DPP = self.phytoplankton.phy_loss_rate()
+        # N2_PHY = [NC_PHY * dpp * FON_PHY for dpp in DPP]
+
+        # self.cache['phytoplankton_on_release'] = N2_PHY
+        return [NC_PHY * FON_PHY] * 20
+
+    def macroalgal_on_release(self):
+        """Calculate N2_MA: Macroalgal death and metabolism organic nitrogen release"""
+        if 'macroalgal_on_release' in self.cache:
+            return self.cache['macroalgal_on_release']
+
+        F_DN_MA = self.macroalgal.update_internal_quotas()[2]
+        F_EN_MA = self.macroalgal.update_internal_quotas()[1]
+        A_MA = self.macroalgal.A_MA
+        f_ON_MA = [max(1, (self.get_parameter('NC_MA')[0] / self.get_parameter('DC_MA')[0]) /
+                   (q_n_ma / 1000)) for q_n_ma in self.macroalgal.q_N]
+        mu_sink = self.get_parameter('mu_ON_sink')[0]
+
+        N2_MA = [(f_dn + f_en) * a_ma * f_on_ma * (1 - mu_sink) / v
+                 for f_dn, f_en, f_on_ma, a_ma, v in zip(F_DN_MA, F_EN_MA, f_ON_MA, A_MA, self.V)]
+
+        self.cache['macroalgal_on_release'] = N2_MA
+        return N2_MA
+
+    def zooplankton_on_release(self):
+        """Calculate N2_ZOO: Zooplankton metabolism and death organic nitrogen release"""
+        if 'zooplankton_on_release' in self.cache:
+            return self.cache['zooplankton_on_release']
+
+        NC_PHY = self.get_parameter('NC_PHY')[0]
+        EFF = self.get_parameter('EFF')[0]
+        GRZ = self.zooplankton.grazing_rate()
+        DZ = self.zooplankton.phy_loss_rate()
+        N2_ZOO = [(1 - EFF) * grz + dz * NC_PHY for grz, dz in zip(GRZ, DZ)]
+
+        self.cache['zooplankton_on_release'] = N2_ZOO
+        return N2_ZOO
+
+    def shellfish_on_release(self):
+        """Calculate N2_SH: Shellfish metabolism and death organic nitrogen release"""
+        if 'shellfish_on_release' in self.cache:
+            return self.cache['shellfish_on_release']
+
+        DSH = self.shellfish.DSH
+        N_SH = self.shellfish.N_SH
+        mu_V_SH = self.get_parameter('mu_V_SH')[0]
+        V_SH = self.shellfish.V_SH
+        E_SH = self.shellfish.E_SH
+        E_R_SH = self.shellfish.E_R_SH
+        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
+        NC_SH = self.get_parameter('NC_SH')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        PHY = self.get_parameter('PHY')
+        k_SH_T = self.shellfish.temperature_effect()[0]  # 原实现为标量（取第一个海区的温度）
+        U_SH = self.get_parameter('U_SH')[0]
+        p_A_SH = self.shellfish.energy_assimilation_rate()
+        mu_sink = self.get_parameter('mu_ON_sink')[0]
+
+        # Death nitrogen loss
+        DN2_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * NC_SH / mu_CJ
+                  for n_sh, v_sh, e_sh, e_r_sh in zip(N_SH, V_SH, E_SH, E_R_SH)]
+
+        # Fecal nitrogen loss
+        FaeceN_SH = [NC_SH * ((k_SH_T * U_SH * phy * v_sh ** (2 / 3)) - p_a_sh / mu_CJ) * n_sh / v_sh
+                     for phy, v_sh, p_a_sh, n_sh in zip(PHY, V_SH, p_A_SH, N_SH)]
+
+        N2_SH = [(dn2_sh + faece_n_sh) * (1 - mu_sink) / (v * 1000)
+                 for dn2_sh, faece_n_sh, v in zip(DN2_SH, FaeceN_SH, self.V)]
+
+        self.cache['shellfish_on_release'] = N2_SH
+        return N2_SH
+
+    def fish_on_release(self):
+        """Calculate N2_F: Fish metabolism and death organic nitrogen release"""
+        if 'fish_on_release' in self.cache:
+            return self.cache['fish_on_release']
+
+        DF = self.get_parameter('DF')[0]
+        N_F = self.fish.N_F
+        mu_V_F = self.get_parameter('mu_V_F')[0]
+        V_F = self.fish.V_F
+        E_F = self.fish.E_F
+        E_R_F = self.fish.E_R_F
+        kappa_R_F = self.get_parameter('kappa_R_F')[0]
+        Q_N_F = self.get_parameter('NC_F')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        k_F_T = self.fish.temperature_effect()[0]  # 原实现为标量（取第一个海区的温度）
+        U_F = self.get_parameter('U_F')[0]
+        p_A_F = self.fish.energy_assimilation_rate()
+        mu_sink = self.get_parameter('mu_ON_sink')[0]
+
+        # Death nitrogen loss
+        DN2_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * Q_N_F / mu_CJ
+                 for n_f, v_f, e_f, e_r_f in zip(N_F, V_F, E_F, E_R_F)]
+
+        # Fecal nitrogen loss
+        FaeceN_F = [Q_N_F * ((k_F_T * U_F * v_f ** (2 / 3)) - p_a_f / mu_CJ) * n_f / v_f
+                    for v_f, p_a_f, n_f in zip(V_F, p_A_F, N_F)]
+
+        N2_F = [(dn2_f + faece_n_f) * (1 - mu_sink) / (v * 1000)
+                for dn2_f, faece_n_f, v in zip(DN2_F, FaeceN_F, self.V)]
+
+        self.cache['fish_on_release'] = N2_F
+        return N2_F
+
+    def mineralization(self):
+        """Calculate MinN: Organic nitrogen mineralization"""
+        if 'mineralization' in self.cache:
+            return self.cache['mineralization']
+
+        MinN = [self.KNC_min * (self.KNT_min ** (t - 20)) * on for on, t in zip(self.ON, self.macroalgal.T)]
+        self.cache['mineralization'] = MinN
+        return MinN
+
+    def update_ON(self):
+        """Calculate the organic nitrogen concentration change in the water"""
+        if 'update_ON' in self.cache:
+            return self.cache['update_ON']
+
+        N2_PHY = self.phytoplankton_on_release()
+        N2_MA = self.macroalgal_on_release()
+        N2_ZOO = self.zooplankton_on_release()
+        N2_SH = self.shellfish_on_release()
+        N2_F = self.fish_on_release()
+        MinN = self.mineralization()
+
+        dON_dt = [n2_phy + n2_ma + n2_zoo + n2_sh + n2_f + feed_on - min_n + ex_on
+                  for n2_phy, n2_ma, n2_zoo, n2_sh, n2_f, feed_on, min_n, ex_on in zip(N2_PHY, N2_MA, N2_ZOO, N2_SH, N2_F, self.FEED_ON, MinN, self.external_ON_input)]
+
+        i = 4
+        change = abs(N2_PHY[i]) + abs(N2_MA[i]) + abs(N2_ZOO[i]) + abs(N2_SH[i]) + abs(N2_F[i]) + abs(self.FEED_ON[i]) + abs(MinN[i]) + abs(self.external_ON_input[i])
+        print(f"dON_dt: {dON_dt[i]}; change: {change}; N2_PHY: {N2_PHY[i] / change}; N2_MA: {N2_MA[i] / change}; N2_ZOO: {N2_ZOO[i] / change}; N2_SH: {N2_SH[i] / change}; N2_F: {N2_F[i] / change}; feed_on: {self.FEED_ON[i] / change}; MinN: {MinN[i] / change}; ex_on: {self.external_ON_input[i] / change}")
+
+        dON_dt = np.real_if_close(dON_dt, tol=1e-9)
+
+        self.ON = [max(0, on + don) for on, don in zip(self.ON, dON_dt)]
+
+        self.cache['update_ON'] = self.ON
+        return self.ON
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep"""
+        self.cache.clear()
+
+class LegacyInorganicPhosphorus:
+    def __init__(self, parameter_loader, phytoplankton, macroalgal):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache to store computed values
+
+        # Biological constants for mineralization
+        self.KPC_min = self.get_parameter('KPC_min')[0]
+        self.KPT_min = self.get_parameter('K_T')[0]
+        self.KT_ads = self.get_parameter('K_T')[0]
+        self.KT_des = self.get_parameter('K_T')[0]
+        self.K_des = self.get_parameter('K_des')[0]
+        self.K_ads = self.get_parameter('K_ads')[0]
+        self.Q_max = self.get_parameter('Q_max')[0]
+
+        # Phytoplankton and macroalgal components
+        self.phytoplankton = phytoplankton
+        self.macroalgal = macroalgal
+
+        # External inputs
+        self.external_PO4_input = None
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.T = get("T")
+        self.A = get("A")
+        self.V = get("V")
+        self.H = get("H")
+        self.PO4 = get("PO4")
+        self.OP = get("OP")
+        self.DO = get("DO")
+        self.PP = get("PP")
+        self.C_SPM = get("C_SPM")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
+                     zip(get('N_F'), self.A)]
+        self.FEED_PO4 = [0.2 * get('FEED_PO4')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
+                         zip(self.FEED, get('A'), get('V'))]
+
+
+    def set_external_input(self, external_input):
+        self.external_input = external_input
+        return self.external_input
+
+    def phytoplankton_phosphate_release(self):
+        """Calculate P1_PHY: Phytoplankton death releasing inorganic phosphorus"""
+        if 'phytoplankton_phosphate_release' in self.cache:
+            return self.cache['phytoplankton_phosphate_release']
+
+        PC = self.get_parameter('PC_PHY')[0]
+        FOP = self.get_parameter('FOP_PHY')[0]
+        # DPP = self.phytoplankton.phy_loss_rate()
+        # P1_PHY = [PC * dpp * (1 - FOP) for dpp in DPP]
+        #
+        # self.cache['phytoplankton_phosphate_release'] = P1_PHY
+        return [PC * (1 - FOP)] * 20
+
+    def macroalgal_phosphate_release(self):
+        """Calculate P1_MA: Macroalgal metabolism and death releasing inorganic phosphorus"""
+        if 'macroalgal_phosphate_release' in self.cache:
+            return self.cache['macroalgal_phosphate_release']
+
+        F_EP_MA = self.macroalgal.update_internal_quotas()[1]
+        F_DP_MA = self.macroalgal.update_internal_quotas()[2]
+        f_OP_MA = [(self.get_parameter('PC_MA')[0] / self.get_parameter('DC_MA')[0]) / (q_p * 1e-3)
+                   for q_p in self.macroalgal.q_P]
+        A_MA = self.macroalgal.A_MA
+        P1_MA = [(f_ep_ma + f_dp_ma) * (1 - f_op_ma) * a_ma / v
+                 for f_ep_ma, f_dp_ma, f_op_ma, a_ma, v in zip(F_EP_MA, F_DP_MA, f_OP_MA, A_MA, self.V)]
+
+        self.cache['macroalgal_phosphate_release'] = P1_MA
+        return P1_MA
+
+    def phosphate_mineralization(self):
+        """Calculate MinP: Organic phosphorus mineralization"""
+        if 'phosphate_mineralization' in self.cache:
+            return self.cache['phosphate_mineralization']
+
+        MinP = [self.KPC_min * (self.KPT_min ** (t - 20)) * op for op, t in zip(self.OP, self.macroalgal.T)]
+
+        self.cache['phosphate_mineralization'] = MinP
+        return MinP
+
+    def phytoplankton_phosphate_absorption(self):
+        """Calculate Abs3_PHY: Phytoplankton absorbing inorganic phosphorus"""
+        if 'phytoplankton_phosphate_absorption' in self.cache:
+            return self.cache['phytoplankton_phosphate_absorption']
+
+        PC = self.get_parameter('PC_PHY')[0]
+        GPP = self.phytoplankton.phy_growth_rate()
+        Abs3_PHY = [gpp * PC for gpp in GPP]
+
+        self.cache['phytoplankton_phosphate_absorption'] = Abs3_PHY
+        return Abs3_PHY
+
+    def macroalgal_phosphate_absorption(self):
+        """Calculate Abs3_MA: Macroalgal absorbing inorganic phosphorus"""
+        if 'macroalgal_phosphate_absorption' in self.cache:
+            return self.cache['macroalgal_phosphate_absorption']
+
+        F_UP_MA = self.macroalgal.update_internal_quotas()[0]  # Phosphorus absorption rate (gP/m²/day)
+        A_MA = self.macroalgal.A_MA  # Area of macroalgal cultivation (m²)
+        Abs3_MA = [f_up_ma * a_ma / v for f_up_ma, a_ma, v in zip(F_UP_MA, A_MA, self.V)]
+
+        self.cache['macroalgal_phosphate_absorption'] = Abs3_MA
+        return Abs3_MA
+
+    def particle_phosphorus_adsorption_desorption(self):
+        if 'particle_phosphorus_adsorption_desorption' in self.cache:
+            return self.cache['particle_phosphorus_adsorption_desorption']
+
+        # PP_ads = [self.K_ads * (self.KT_ads ** (t - 20)) * po4 for t, po4 in zip(self.T, self.PO4)]
+        PP_ads = [self.K_ads * c_spm * (self.KT_ads ** (t - 20)) * (1 - pp / (self.Q_max * c_spm)) * po4 for
+                  c_spm, t, pp, po4 in zip(self.C_SPM, self.T, self.PP, self.PO4)]
+        PP_des = [self.K_des * (self.KT_des ** (t - 20)) * pp for t, pp in zip(self.T, self.PP)]
+
+        PP_ads_des = [pp_ads - pp_des for pp_ads, pp_des in zip(PP_ads, PP_des)]
+
+        self.cache['particle_phosphorus_desorption'] = PP_ads_des
+        return PP_ads_des
+
+    def update_PO4(self):
+        """Calculate the phosphate concentration change in the water"""
+        if 'update_PO4' in self.cache:
+            return self.cache['update_PO4']
+
+        MinP = self.phosphate_mineralization()
+        P1_PHY = self.phytoplankton_phosphate_release()
+        P1_MA = self.macroalgal_phosphate_release()
+        Abs3_PHY = self.phytoplankton_phosphate_absorption()
+        Abs3_MA = self.macroalgal_phosphate_absorption()
+        PP_ads_des = self.particle_phosphorus_adsorption_desorption()
+
+        dPO4_dt = [minp + p1_phy + p1_ma + feed_po4 - abs3_phy - abs3_ma + ex_po4 - pp_ads_des
+                   for minp, p1_phy, p1_ma, feed_po4, abs3_phy, abs3_ma, ex_po4, pp_ads_des in zip(MinP, P1_PHY, P1_MA, self.FEED_PO4, Abs3_PHY, Abs3_MA, self.external_PO4_input, PP_ads_des)]
+
+        self.PO4 = [po4 + dpo4 for po4, dpo4 in zip(self.PO4, dPO4_dt)]
+
+        self.cache['update_PO4'] = self.PO4
+        return self.PO4
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep"""
+        self.cache.clear()
+
+class LegacyOrganicPhosphorus:
+    def __init__(self, parameter_loader, phytoplankton, macroalgal, zooplankton, shellfish, fish, inorganic_phosphorus):
+        self.parameter_loader = parameter_loader
+        self.reload_parameters()
+        self.cache = {}  # Cache to store computed values
+
+        # Model components
+        self.phytoplankton = phytoplankton
+        self.macroalgal = macroalgal
+        self.zooplankton = zooplankton
+        self.shellfish = shellfish
+        self.fish = fish
+        self.inorganic_phosphorus = inorganic_phosphorus
+
+        # External inputs
+        self.external_OP_input = None
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.A = get("A")
+        self.V = get("V")
+        self.H = get("H")
+        self.OP = get("OP")
+        self.DO = get("DO")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
+                     zip(get('N_F'), self.A)]
+        self.FEED_OP = [0.2 * get('FEED_OP')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
+                        zip(self.FEED, self.A, get('V'))]
+
+    def set_external_input(self, external_input):
+        self.external_input = external_input
+        return self.external_input
+
+    def phytoplankton_op_release(self):
+        """Calculate P2_PHY: Phytoplankton death releasing organic phosphorus"""
+        if 'phytoplankton_op_release' in self.cache:
+            return self.cache['phytoplankton_op_release']
+
+        PC = self.get_parameter('PC_PHY')[0]
+        FOP = self.get_parameter('FOP_PHY')[0]
+        # DPP = self.phytoplankton.phy_loss_rate()
+        # P2_PHY = [PC * dpp * FOP for dpp in DPP]
+        #
+        # self.cache['phytoplankton_op_release'] = P2_PHY
+        return [PC * FOP] * 20
+
+    def macroalgal_op_release(self):
+        """Calculate P2_MA: Macroalgal metabolism and death releasing organic phosphorus"""
+        if 'macroalgal_op_release' in self.cache:
+            return self.cache['macroalgal_op_release']
+
+        F_DP_MA = self.macroalgal.update_internal_quotas()[2]
+        F_EP_MA = self.macroalgal.update_internal_quotas()[1]
+        f_OP_MA = [(self.get_parameter('PC_MA')[0] / self.get_parameter('DC_MA')[0]) / (q_p * 1e-3)
+                   for q_p in self.macroalgal.q_P]
+        A_MA = self.macroalgal.A_MA
+        mu_sink = self.get_parameter('mu_OP_sink')[0]
+
+        P2_MA = [(f_dp_ma * (1 - mu_sink) + f_ep_ma) * a_ma * f_op_ma / v
+                 for f_dp_ma, f_ep_ma, f_op_ma, a_ma, v in zip(F_DP_MA, F_EP_MA, f_OP_MA, A_MA, self.V)]
+
+        self.cache['macroalgal_op_release'] = P2_MA
+        return P2_MA
+
+    def zooplankton_op_release(self):
+        """Calculate P2_ZOO: Zooplankton metabolism and death releasing organic phosphorus"""
+        if 'zooplankton_op_release' in self.cache:
+            return self.cache['zooplankton_op_release']
+
+        PC = self.get_parameter('PC_PHY')[0]
+        EFF = self.get_parameter('EFF')[0]
+        GRZ = self.zooplankton.grazing_rate()
+        DZ = self.zooplankton.phy_loss_rate()
+        f_fec = self.get_parameter('f_fec')[0]
+
+        P2_ZOO = [((1 - EFF) * grz * PC + dz * PC) * (1 - f_fec) for grz, dz in zip(GRZ, DZ)]
+
+        self.cache['zooplankton_op_release'] = P2_ZOO
+        return P2_ZOO
+
+    def shellfish_op_release(self):
+        """Calculate P2_SH: Shellfish metabolism and death releasing organic phosphorus"""
+        if 'shellfish_op_release' in self.cache:
+            return self.cache['shellfish_op_release']
+
+        DSH = self.shellfish.DSH
+        N_SH = self.shellfish.N_SH
+        mu_V_SH = self.get_parameter('mu_V_SH')[0]
+        E_SH = self.shellfish.E_SH
+        E_R_SH = self.shellfish.E_R_SH
+        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
+        V_SH = self.shellfish.V_SH
+        QP_SH = self.get_parameter('PC_SH')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        f_PP = self.get_parameter('f_PP')[0]
+
+        # Death phosphorus loss (mgP/L)
+        DP2_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * QP_SH / mu_CJ /v
+                  for n_sh, v_sh, e_sh, e_r_sh, v in zip(N_SH, V_SH, E_SH, E_R_SH, self.V)]
+
+        # Feces phosphorus loss (mgP/L)
+        PC = self.get_parameter('PC_PHY')[0]
+        k_SH_T = self.shellfish.temperature_effect()[0]  # 原实现为标量（取第一个海区的温度）
+        U_SH = self.get_parameter('U_SH')[0]
+        PHY = self.shellfish.PHY
+        p_A_SH = self.shellfish.energy_assimilation_rate()
+
+        FaeceP_SH = [PC * (k_SH_T * U_SH * phy * v_sh ** (2 / 3) - p_a_sh / mu_CJ) * n_sh / v_sh / v
+                     for phy, v_sh, p_a_sh, n_sh, v in zip(PHY, V_SH, p_A_SH, N_SH, self.V)]
+
+        P2_SH = [(dp2_sh + faecep_sh) * (1 - f_PP) for dp2_sh, faecep_sh in zip(DP2_SH, FaeceP_SH)]
+
+        self.cache['shellfish_op_release'] = P2_SH
+        return P2_SH
+
+    def fish_op_release(self):
+        """Calculate P2_F: Fish metabolism and death releasing organic phosphorus"""
+        if 'fish_op_release' in self.cache:
+            return self.cache['fish_op_release']
+
+        DF = self.fish.DF
+        N_F = self.fish.N_F
+        mu_V_F = self.get_parameter('mu_V_F')[0]
+        E_F = self.fish.E_F
+        E_R_F = self.fish.E_R_F
+        kappa_R_F = self.get_parameter('kappa_R_F')[0]
+        V_F = self.fish.V_F
+        QP_F = self.get_parameter('PC_F')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        f_PP = self.get_parameter('f_PP')[0]
+
+        # Death phosphorus loss (mgP/L)
+        DP2_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * QP_F / mu_CJ / v
+                 for n_f, v_f, e_f, e_r_f, v in zip(N_F, V_F, E_F, E_R_F, self.V)]
+
+        # Feces phosphorus loss (mgP/L)
+        k_F_T = self.fish.temperature_effect()[0]  # 原实现为标量（取第一个海区的温度）
+        U_F = self.get_parameter('U_F')[0]
+        p_A_F = self.fish.energy_assimilation_rate()
+
+        FaeceP_F = [QP_F * (k_F_T * U_F * v_f ** (2 / 3) - p_a_f / mu_CJ) * n_f / v_f / v
+                    for v_f, p_a_f, n_f, v in zip(V_F, p_A_F, N_F, self.V)]
+
+        P2_F = [(dp2_f + faecep_f) * (1 - f_PP) for dp2_f, faecep_f in zip(DP2_F, FaeceP_F)]
+
+        self.cache['fish_op_release'] = P2_F
+        return P2_F
+
+    def phosphate_mineralization(self):
+        """Calculate MinP: Organic phosphorus mineralization"""
+        if 'phosphate_mineralization' in self.cache:
+            return self.cache['phosphate_mineralization']
+
+        MinP = self.inorganic_phosphorus.phosphate_mineralization()
+
+        self.cache['phosphate_mineralization'] = MinP
+        return MinP
+
+    def update_OP(self):
+        """Update the organic phosphorus concentration in water"""
+        if 'update_OP' in self.cache:
+            return self.cache['update_OP']
+
+        P2_PHY = self.phytoplankton_op_release()
+        P2_MA = self.macroalgal_op_release()
+        P2_ZOO = self.zooplankton_op_release()
+        P2_SH = self.shellfish_op_release()
+        P2_F = self.fish_op_release()
+        MinP = self.phosphate_mineralization()
+
+        dOP_dt = [p2_phy + p2_ma + p2_zoo + p2_sh + p2_f + feed_op - min_p + ex_op
+                  for p2_phy, p2_ma, p2_zoo, p2_sh, p2_f, feed_op, min_p, ex_op in zip(P2_PHY, P2_MA, P2_ZOO, P2_SH, P2_F, self.FEED_OP, MinP, self.external_OP_input)]
+
+        self.OP = [op + dop for op, dop in zip(self.OP, dOP_dt)]
+
+        self.cache['update_OP'] = self.OP
+        return self.OP
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep"""
+        self.cache.clear()
+
+class LegacyParticulatePhosphorus:
+    def __init__(self, parameter_loader, phytoplankton, zooplankton, shellfish, fish):
+        self.parameter_loader = parameter_loader
+        self.cache = {}  # Cache for computed values
+
+        # Model components
+        self.phytoplankton = phytoplankton
+        self.zooplankton = zooplankton
+        self.shellfish = shellfish
+        self.fish = fish
+
+        # External inputs
+        self.external_PP_input = None
+
+        # Constants for PP
+        self.K_ads = self.get_parameter('K_ads')[0]  # Adsorption constant for PP
+        self.K_des = self.get_parameter('K_des')[0]  # Desorption constant for PP
+        self.V_set  = self.get_parameter('V_set')[0]  # Settling velocity for PP
+        self.K_resus = self.get_parameter('K_resus')[0]  # Resuspension constant for PP
+        self.KT_ads = self.get_parameter('K_T')[0]  # Temperature effect on adsorption for PP
+        self.KT_des = self.get_parameter('K_T')[0]  # Temperature effect on desorption for PP
+        self.Q_max = self.get_parameter('Q_max')[0]  # Maximum adsorbed quantity for PP
+
+    def get_parameter(self, name):
+        return self.parameter_loader.get_parameter(name)
+
+    def reload_parameters(self):
+        get = self.parameter_loader.get_parameter
+        self.T = get("T")
+        self.V = get("V")
+        self.A = get("A")
+        self.H = [v / a for v, a in zip(self.V, self.A)]
+        self.PO4 = get("PO4")
+        self.PP = get("PP")
+        self.C_SPM = get("C_SPM")
+        self.FEED = [nf * get('M_F')[0] * get('FCR_F')[0] for nf, a in
+                     zip(get('N_F'), self.A)]
+        self.FEED_PP = [0.2 * get('FEED_PP')[0] * m * a * 0.01 / (v * 1000) for m, a, v in
+                         zip(self.FEED, get('A'), get('V'))]
+
+    def zooplankton_pp_release(self):
+        if 'zooplankton_op_release' in self.cache:
+            return self.cache['zooplankton_op_release']
+
+        PC = self.get_parameter('PC_PHY')[0]
+        EFF = self.get_parameter('EFF')[0]
+        GRZ = self.zooplankton.grazing_rate()
+        DZ = self.zooplankton.loss_rate()
+        f_fec = self.get_parameter('f_fec')[0]
+
+        PP_ZOO = [((1 - EFF) * grz * PC + dz * PC) * f_fec for grz, dz in zip(GRZ, DZ)]
+
+        self.cache['zooplankton_op_release'] = PP_ZOO
+        return PP_ZOO
+
+    def shellfish_pp_release(self):
+        if 'shellfish_op_release' in self.cache:
+            return self.cache['shellfish_op_release']
+
+        DSH = self.shellfish.DSH
+        N_SH = self.shellfish.N_SH
+        mu_V_SH = self.get_parameter('mu_V_SH')[0]
+        E_SH = self.shellfish.E_SH
+        E_R_SH = self.shellfish.E_R_SH
+        kappa_R_SH = self.get_parameter('kappa_R_SH')[0]
+        V_SH = self.shellfish.V_SH
+        QP_SH = self.get_parameter('PC_SH')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        f_PP = self.get_parameter('f_PP')[0]
+
+        # Death phosphorus loss (mgP/L)
+        DP2_SH = [DSH * n_sh * (mu_V_SH * v_sh + e_sh + e_r_sh * kappa_R_SH) * QP_SH / mu_CJ /v
+                  for n_sh, v_sh, e_sh, e_r_sh, v in zip(N_SH, V_SH, E_SH, E_R_SH, self.V)]
+
+        # Feces phosphorus loss (mgP/L)
+        PC = self.get_parameter('PC_PHY')[0]
+        k_SH_T = self.shellfish.temperature_effect()[0]  # 原实现为标量（取第一个海区的温度）
+        U_SH = self.get_parameter('U_SH')[0]
+        PHY = self.shellfish.PHY
+        p_A_SH = self.shellfish.energy_assimilation_rate()
+
+        FaeceP_SH = [PC * (k_SH_T * U_SH * phy * v_sh ** (2 / 3) - p_a_sh / mu_CJ) * n_sh / v_sh / v
+                     for phy, v_sh, p_a_sh, n_sh, v in zip(PHY, V_SH, p_A_SH, N_SH, self.V)]
+
+        PP_SH = [(dp2_sh + faecep_sh) * f_PP for dp2_sh, faecep_sh in zip(DP2_SH, FaeceP_SH)]
+
+        self.cache['shellfish_op_release'] = PP_SH
+        return PP_SH
+
+    def fish_pp_release(self):
+        if 'fish_op_release' in self.cache:
+            return self.cache['fish_op_release']
+
+        DF = self.fish.DF
+        N_F = self.fish.N_F
+        mu_V_F = self.get_parameter('mu_V_F')[0]
+        E_F = self.fish.E_F
+        E_R_F = self.fish.E_R_F
+        kappa_R_F = self.get_parameter('kappa_R_F')[0]
+        V_F = self.fish.V_F
+        QP_F = self.get_parameter('PC_F')[0]
+        mu_CJ = self.get_parameter('mu_CJ')[0]
+        f_PP = self.get_parameter('f_PP')[0]
+
+        # Death phosphorus loss (mgP/L)
+        DP2_F = [DF * n_f * (mu_V_F * v_f + e_f + e_r_f * kappa_R_F) * QP_F / mu_CJ / v
+                 for n_f, v_f, e_f, e_r_f, v in zip(N_F, V_F, E_F, E_R_F, self.V)]
+
+        # Feces phosphorus loss (mgP/L)
+        k_F_T = self.fish.temperature_effect()[0]  # 原实现为标量（取第一个海区的温度）
+        U_F = self.get_parameter('U_F')[0]
+        p_A_F = self.fish.energy_assimilation_rate()
+
+        FaeceP_F = [QP_F * (k_F_T * U_F * v_f ** (2 / 3) - p_a_f / mu_CJ) * n_f / v_f / v
+                    for v_f, p_a_f, n_f, v in zip(V_F, p_A_F, N_F, self.V)]
+
+        PP_F = [(dp2_f + faecep_f) * f_PP for dp2_f, faecep_f in zip(DP2_F, FaeceP_F)]
+
+        self.cache['fish_op_release'] = PP_F
+        return PP_F
+
+    def adsorption_and_desorption(self):
+        if 'adsorption_and_desorption' in self.cache:
+            return self.cache['adsorption_and_desorption']
+
+        # PP_ads = [self.K_ads * (self.KT_ads ** (t - 20)) * po4 for t, po4 in zip(self.T, self.PO4)]
+        PP_ads = [self.K_ads * c_spm * (self.KT_ads ** (t - 20)) * (1 - pp / (self.Q_max * c_spm)) * po4 for c_spm, t, pp, po4 in zip(self.C_SPM, self.T, self.PP, self.PO4)]
+        PP_des = [self.K_des * (self.KT_des ** (t - 20)) * pp for t, pp in zip(self.T, self.PP)]
+
+        PP_ads_des = [pp_ads - pp_des for pp_ads, pp_des in zip(PP_ads, PP_des)]
+
+        self.cache['adsorption_and_desorption'] = PP_ads_des
+        return PP_ads_des
+
+    def sink_and_resuspension(self):
+        if 'PP_sink_and_resuspension' in self.cache:
+            return self.cache['PP_sink_and_resuspension']
+
+        PP_set = [self.V_set * pp / h for pp, h in zip(self.PP, self.H)]
+        PP_resus = [pp * self.K_resus for pp in self.PP]
+
+        PP_set_resus = [pp_set - pp_resus for pp_set, pp_resus in zip(PP_set, PP_resus)]
+
+        self.cache['PP_sink_and_resuspension'] = PP_set_resus
+        return PP_set_resus
+
+    def update_PP(self):
+        """Update the particulate phosphorus concentration in water"""
+        if 'update_PP' in self.cache:
+            return self.cache['update_PP']
+
+        PP_ZOO = self.zooplankton_pp_release()
+        PP_SH = self.shellfish_pp_release()
+        PP_F = self.fish_pp_release()
+        PP_ads_des = self.adsorption_and_desorption()
+        PP_set_resus = self.sink_and_resuspension()
+
+        dPP_dt = [pp_zoo + pp_sh + pp_f + pp_ads_des - pp_set_resus
+                  for pp_zoo, pp_sh, pp_f, pp_ads_des, pp_set_resus in zip(PP_ZOO, PP_SH, PP_F, PP_ads_des, PP_set_resus)]
+
+        self.PP = [pp + dp for pp, dp in zip(self.PP, dPP_dt)]
+
+        self.cache['update_PP'] = self.PP
+        return self.PP
+
+    def reset_cache(self):
+        """Clear the cache at the end of each timestep"""
+        self.cache.clear()
+
+
+def randomize_cycle_state(store, rng):
+    n = store.state.n_zones
+    randomize_state(store, rng)
+    randomize_deb_state(store, rng)
+    store.update_initial_values({
+        'ON': rng.uniform(1e-3, 0.5, n), 'OP': rng.uniform(0.005, 0.15, n), 'PP': rng.uniform(0.005, 0.15, n),
+        'C_SPM': rng.uniform(5, 50, n), 'DO': rng.uniform(4, 9, n), 'CBOD': rng.uniform(0.5, 3, n),
+    })
+
+
+def cycle_components(store):
+    phy, zoo, macroalgal = Phytoplankton(store), Zooplankton(store), Macroalgal(store)
+    shellfish, fish = Shellfish(store), Fish(store)
+    macroalgal.initial_MA = store.get_parameter('MA').copy()
+    rates = (phy.growth_rate(), phy.loss_rate(), zoo.grazing_rate(), zoo.loss_rate())
+    macroalgal.calculate_GMA()
+    macroalgal.calculate_loss_rate()
+    shellfish.growth_volume()
+    shellfish.GRS_PHY()
+    fish.growth_volume()
+    return (phy, zoo, macroalgal, shellfish, fish), rates
+
+
+def legacy_cycle(store, components):
+    phy, zoo, macroalgal, shellfish, fish = components
+    inorganic_phosphorus = LegacyInorganicPhosphorus(store, phy, macroalgal)
+    return (LegacyAmmoniumNitrogen(store, phy, macroalgal, zoo, shellfish, fish),
+            LegacyNitrateNitrogen(store, phy, macroalgal),
+            LegacyOrganicNitrogen(store, phy, macroalgal, zoo, shellfish, fish), inorganic_phosphorus,
+            LegacyOrganicPhosphorus(store, phy, macroalgal, zoo, shellfish, fish, inorganic_phosphorus),
+            LegacyParticulatePhosphorus(store, phy, zoo, shellfish, fish))
+
+
+def legacy_cycle_fluxes(store, nutrients, components, rates, volume, inputs):
+    """原 main_20.py 第 3 步：各营养盐类逐项组装贡献字典"""
+    phy, zoo, macroalgal, shellfish, fish = components
+    phy_growth_rate, phy_loss_rate, zoo_grazing_rate, zoo_loss_rate = rates
+    get = store.get_parameter
+    EFF, f_fec, NC_PHY, PC_PHY = get('EFF')[0], get('f_fec')[0], get('NC_PHY')[0], get('PC_PHY')[0]
+    FEED = {sub: get(f'FEED_{sub}')[0] for sub in ['NH3', 'NO3', 'ON', 'PO4', 'OP', 'PP']}
+
+    def feed(nutrient, component):
+        return (0.8 * FEED[nutrient] * np.array(component.FEED) / (24 * 30 * 12) / 1000) / volume
+
+    ammonia, nitrate, organic_ammonia, inorganic_phosphorus, organic_phosphorus, particulate_phosphorus = nutrients
+    for nutrient in nutrients:
+        nutrient.reload_parameters()
+        nutrient.reset_cache()
+    data = {}
+    data['ammonia'] = {
+        'external_input': np.array(inputs['NH4']),
+        'phy_release': np.array(ammonia.phytoplankton_ammonium_release()) * phy_loss_rate * phy.PHY,
+        'phy_absorption': -np.array(ammonia.phytoplankton_ammonium_absorption()[0]) * phy_growth_rate * phy.PHY,
+        'ma_release': np.array(ammonia.macroalgal_ammonium_release()),
+        'ma_absorption': -np.array(ammonia.macroalgal_ammonium_absorption()[0]),
+        'sh_excretion': np.array(ammonia.shellfish_ammonium_excretion()) * shellfish.N_SH / (volume * 1000),
+        'f_excretion': np.array(ammonia.fish_ammonium_excretion()) * fish.N_F / (volume * 1000),
+        'nitrification': -np.array(ammonia.nitrification()),
+        'mineralization_NH4': np.array(ammonia.mineralization()),
+        'feed': feed('NH3', ammonia)
+    }
+    data['nitrate'] = {
+        'external_input': np.array(inputs['NO3']),
+        'nitrification': -data['ammonia']['nitrification'],
+        'phy_absorption': -np.array(nitrate.phytoplankton_nitrate_absorption()) * phy_growth_rate * phy.PHY,
+        'ma_absorption': -np.array(nitrate.macroalgal_nitrate_absorption()),
+        'denitrification': -np.array(nitrate.denitrification()),
+        'feed': feed('NO3', nitrate)
+    }
+    data['organic_ammonia'] = {
+        'external_input': np.array(inputs['ON']),
+        'phy_release': np.array(organic_ammonia.phytoplankton_on_release()) * phy_loss_rate * phy.PHY,
+        'zoo_release': ((1 - EFF) * zoo_grazing_rate + zoo_loss_rate) * NC_PHY,
+        'ma_release': np.array(organic_ammonia.macroalgal_on_release()),
+        'sh_release': np.array(organic_ammonia.shellfish_on_release()),
+        'f_release': np.array(organic_ammonia.fish_on_release()),
+        'mineralization_ON': -np.array(organic_ammonia.mineralization()),
+        'feed': feed('ON', organic_ammonia)
+    }
+    data['inorganic_phosphorus'] = {
+        'external_input': np.array(inputs['PO4']),
+        'phy_release': np.array(inorganic_phosphorus.phytoplankton_phosphate_release()) * phy_loss_rate * phy.PHY,
+        'phy_absorption': -(PC_PHY * phy_growth_rate * phy.PHY),
+        'ma_release': np.array(inorganic_phosphorus.macroalgal_phosphate_release()),
+        'ma_absorption': -np.array(inorganic_phosphorus.macroalgal_phosphate_absorption()),
+        'mineralization_PO4': np.array(inorganic_phosphorus.phosphate_mineralization()),
+        'particulate_ads_des': -np.array(particulate_phosphorus.adsorption_and_desorption()),
+        'feed': feed('PO4', inorganic_phosphorus)
+    }
+    data['organic_phosphorus'] = {
+        'external_input': np.array(inputs['OP']),
+        'phy_release': np.array(organic_phosphorus.phytoplankton_op_release()) * phy_loss_rate * phy.PHY,
+        'zoo_release': ((1 - f_fec) * (1 - EFF) * zoo_grazing_rate + zoo_loss_rate) * PC_PHY,
+        'ma_release': np.array(organic_phosphorus.macroalgal_op_release()),
+        'sh_release': np.array(organic_phosphorus.shellfish_op_release()),
+        'f_release': np.array(organic_phosphorus.fish_op_release()),
+        'mineralization_OP': -np.array(organic_phosphorus.phosphate_mineralization()),
+        'feed': feed('OP', organic_phosphorus)
+    }
+    particulate_phosphorus.reset_cache()
+    data['particulate_phosphorus'] = {
+        'zoo_release': (f_fec * (1 - EFF) * zoo_grazing_rate + zoo_loss_rate) * PC_PHY,
+        'sh_release': np.array(particulate_phosphorus.shellfish_pp_release()),
+        'f_release': np.array(particulate_phosphorus.fish_pp_release()),
+        'ads_des': np.array(particulate_phosphorus.adsorption_and_desorption()),
+        'set_resus': -np.array(particulate_phosphorus.sink_and_resuspension()),
+        'feed': feed('PP', particulate_phosphorus)
+    }
+    return data
+
+
+def bench_cycle(water_exchange, steps, args):
+    store = ParameterStore()
+    rng = np.random.default_rng(7)
+    n = store.state.n_zones
+    substances = ['NH4', 'NO3', 'ON', 'PO4', 'OP', 'CBOD', 'DO']
+    for trial in range(20):
+        randomize_cycle_state(store, rng)
+        store.update_initial_values({'T': np.full(n, store.get_parameter('T')[0])})  # 原实现的 DEB 温度校正取第一个海区
+        volume = store.get_parameter('V') * rng.uniform(0.9, 1.1, n)
+        inputs = {sub: rng.uniform(0, 1e-3, n) for sub in substances}
+        components, rates = cycle_components(store)
+        expected = legacy_cycle_fluxes(store, legacy_cycle(store, components), components, rates, volume, inputs)
+        components, rates = cycle_components(store)
+        engine = BiogeochemistryEngine(store, *components)
+        table = engine.fluxes(volume, inputs, *rates)
+        for nutrient, terms in expected.items():
+            for process, value in terms.items():
+                check_close(f"{nutrient}.{process}（第 {trial} 组）", value, table[nutrient, process])
+            check_close(f"{nutrient} 净变化（第 {trial} 组）", sum(terms.values()), table.net(nutrient))
+        if not np.isfinite(table.values).all():
+            raise AssertionError(f"CBOD/溶解氧通量出现非有限值（第 {trial} 组）")
+
+    legacy_components, legacy_rates = cycle_components(store)
+    components, rates = cycle_components(store)
+    engine = BiogeochemistryEngine(store, *components)
+    inputs = {sub: np.full(n, 1e-4) for sub in substances}
+    volume = store.get_parameter('V').copy()
+    nutrients = legacy_cycle(store, legacy_components)
+    legacy_seconds = time_per_call(lambda t: legacy_cycle_fluxes(store, nutrients, legacy_components, legacy_rates,
+                                                                 volume, inputs), steps)
+    new_seconds = time_per_call(lambda t: engine.fluxes(volume, inputs, *rates), steps)
+    report('氮磷 + CBOD/溶解氧过程通量表', legacy_seconds, new_seconds)
+
+
+def legacy_environment_terms(store, deb_engines):
+    """原实现中各过程各自重算的温度/光照/盐度/复氧因子（逐次调用，名称 -> 结果）"""
+    get = store.get_parameter
+    T, I, S, H = get('T'), get('I'), get('S'), get('H')
+    K_T, T_opt, S_opt = get('K_T')[0], get('T_opt')[0], get('S_opt')[0]
+    kappa_1_S, kappa_2_S = get('kappa_1_MA_S')[0], get('kappa_2_MA_S')[0]
+    n = len(T)
+    velocity = np.pad(get('v')[:n], (0, n - len(get('v')[:n])), mode='edge')
+    terms = []
+    # 浮游植物：温度限制、呼吸；大型藻类：温度、盐度、排泄 N/P、死亡、损失
+    terms.append(('theta_opt', K_T ** (T - T_opt)))
+    terms.append(('theta_opt', K_T ** (T - T_opt)))
+    terms.append(('ma_temperature', 1 / (1 + np.exp(-K_T * (T - T_opt) / 1.5))))
+    dS = S - S_opt
+    terms.append(('ma_salinity', np.where(S <= S_opt, np.exp(-kappa_1_S * dS ** 2), np.exp(-kappa_2_S * dS ** 2))))
+    terms += [('theta_20', K_T ** (T - 20)) for _ in range(2)]
+    terms += [('theta_opt', K_T ** (T - T_opt)) for _ in range(2)]
+    light_factor = (I / 1200000) * np.exp(-get('K_E')[0] * np.minimum(H / 2, 5))
+    terms.append(('phy_light', light_factor * np.exp(1 - light_factor)))
+    # DEB：两个物种各自的 Arrhenius 校正
+    for species, engine in deb_engines.items():
+        terms.append((f'arrhenius_{species}', engine.temperature_effect(T + 273.15)[0]))
+    # 营养盐与溶解氧：硝化、反硝化、矿化（N、P）、吸附/解吸（PO4、PP 各一次）、CBOD 氧化、呼吸、底泥耗氧
+    terms += [('theta_20', K_T ** (T - 20)) for _ in range(13)]
+    terms.append(('oxygen_saturation', 14.621 * np.exp(-0.0134 * T) / (1 + 0.028 * S)))
+    terms.append(('reaeration', (3.93 * velocity ** 0.5 / np.minimum(5, H) ** 1.5) / 24 * (1.024 ** (T - 20))))
+    return terms
+
+
+def bench_environment(water_exchange, steps, args):
+    store = ParameterStore()
+    rng = np.random.default_rng(8)
+    environment = EnvironmentFactors(store)
+    deb_engines = {species: DEBEngine(store, [species]) for species in DEB_SPECIES}
+    for trial in range(20):
+        randomize_state(store, rng)
+        environment.update()
+        for name, value in legacy_environment_terms(store, deb_engines):
+            check_close(f"{name}（第 {trial} 组）", value, environment[name])
+
+    legacy_seconds = time_per_call(lambda t: legacy_environment_terms(store, deb_engines), steps)
+    new_seconds = time_per_call(lambda t: environment.update(), steps)
+    report('温度/光照/盐度/复氧因子', legacy_seconds, new_seconds)
+
+def graph_step(components, environment, engine, volume, inputs):
+    """模拟主循环一步：刷新环境与状态绑定，按主循环顺序读取生物速率与过程通量"""
+    phy, zoo, macroalgal, shellfish, fish = components
+    environment.update()
+    for component in components + (engine,):
+        component.reload_parameters()
+    shellfish.growth_volume()
+    shellfish.GRS_PHY()
+    fish.growth_volume()
+    rates = (phy.growth_rate(), phy.loss_rate(), zoo.grazing_rate(), zoo.loss_rate())
+    macroalgal.update_internal_quotas()
+    macroalgal.calculate_GMA()
+    macroalgal.calculate_loss_rate()
+    return engine.fluxes(volume, inputs, *rates)
+
+
+def bench_graph(water_exchange, steps, args):
+    store = ParameterStore()
+    rng = np.random.default_rng(9)
+    n = store.state.n_zones
+    randomize_cycle_state(store, rng)
+    environment = EnvironmentFactors(store)
+    components = (Phytoplankton(store, environment), Zooplankton(store), Macroalgal(store, environment),
+                  Shellfish(store, environment), Fish(store, environment))
+    components[2].initial_MA = store.get_parameter('MA').copy()
+    engine = BiogeochemistryEngine(store, *components, environment=environment)
+    volume = store.get_parameter('V').copy()
+    inputs = {sub: np.full(n, 1e-4) for sub in ['NH4', 'NO3', 'ON', 'PO4', 'OP', 'CBOD', 'DO']}
+
+    def statistics():
+        return {(type(component).__name__, quantity): counts for component in components
+                for quantity, counts in component.graph.statistics().items()}
+
+    for t in range(5):
+        before = statistics()
+        graph_step(components, environment, engine, volume, inputs)
+        for key, (hits, misses) in statistics().items():
+            evaluations = misses - before.get(key, (0, 0))[1]
+            if evaluations > 1:
+                raise AssertionError(f"{key[0]}.{key[1]} 在第 {t} 步求值 {evaluations} 次")
+
+    seconds = time_per_call(lambda t: graph_step(components, environment, engine, volume, inputs), steps)
+    if CHECK_ONLY:
+        return
+    totals = np.array(list(statistics().values()))
+    print(f"{'计算图（生物速率 + 过程通量）':<24} 派生量 {len(totals):3d} 个   命中 {totals[:, 0].sum():6d}   "
+          f"求值 {totals[:, 1].sum():6d}   每步 {seconds * 1e6:8.1f} µs")
+
+def bench_integrator(water_exchange, steps, args):
+    """逐时欧拉与自适应积分的代价/精度：以 DOP853（rtol=1e-10）为参考解"""
+    forcing = build_forcing(water_exchange)
+
+    def run(integrator, **tolerances):
+        return run_simulation(forcing, simulation_config(args, integrator=integrator, **tolerances))
+
+    def deviation(results, reference):
+        concentrations = max(np.max(np.abs(results.concentrations[species] - reference.concentrations[species]) /
+                                    np.abs(reference.concentrations[species]))
+                             for species, _ in NUTRIENT_BUDGETS.values())
+        contributions = max(np.max(np.abs(results.contributions[nutrient][process] - values) /
+                                   np.maximum(np.abs(values).max(), 1e-300))
+                            for nutrient, processes in reference.contributions.items()
+                            for process, values in processes.items())
+        return concentrations, contributions
+
+    reference, _ = run('DOP853', rtol=1e-10, atol=1e-13)
+    for integrator, tolerances in [('euler', {}), ('RK23', {}), ('RK45', {}), ('DOP853', {}), ('BDF', {}),
+                                   ('RK45', {'rtol': 1e-6}), ('RK45', {'rtol': 1e-3})]:
+        results, seconds = run(integrator, **tolerances)
+        concentrations, contributions = deviation(results, reference)
+        counts = results.integration
+        label = integrator + (f" rtol={tolerances['rtol']:.0e}" if tolerances else '')
+        print(f"{label:<16s} {args.integrator_days} 天   步数 {counts['steps']:7d}   右端项求值 {counts['rhs_evaluations']:7d}   "
+              f"雅可比 {counts['jacobian_evaluations']:4d}   耗时 {seconds:7.2f} s   "
+              f"浓度偏差 {concentrations:9.2e}   贡献偏差 {contributions:9.2e}")
+        distribution = results.step_size_distribution()
+        if distribution:
+            # 自适应积分连续跨越逐时驱动，只在收获/放养跳变处重启：步长受驱动的逐时变化限制
+            print(f"{'':16s} 接受步长 最小 {distribution['min']:7.3g} h   中位数 {distribution['median']:7.3g} h   "
+                  f"90% 分位 {distribution['p90']:7.3g} h   最大 {distribution['max']:7.3g} h   "
+                  f"长于 1 h {distribution['above_step']:6.1%}")
+
+def bench_mprk(water_exchange, steps, args):
+    """MPRK 保正格式：MPRK_MAX_TIME_STEP 及以下各步长逐步检查非负、各项变化量闭合与成对转移守恒，并与 1 小时步长结果比较
+
+    前三天内相对 1 小时结果的偏差（按海区均值归一）须不超过 MPRK_DEVIATION；更粗的步长须被 Simulation 拒绝。
+    """
+    for time_step in [MPRK_MAX_TIME_STEP + 1, 6]:
+        try:
+            Simulation(None, build_forcing(water_exchange, time_step), simulation_config(args, time_step=time_step,
+                                                                                        integrator='mprk'))
+        except ValueError:
+            continue
+        raise AssertionError(f"mprk dt={time_step} h 超过 MPRK_MAX_TIME_STEP 却未被拒绝")
+    outputs = {}
+    for time_step in range(1, MPRK_MAX_TIME_STEP + 1):
+        simulation = Simulation(None, build_forcing(water_exchange, time_step),
+                                simulation_config(args, time_step=time_step, integrator='mprk'))
+        patankar_step = simulation.patankar.step
+        worst = {'negative': 0.0, 'closure': 0.0, 'transfer': 0.0}
+
+        def checked_step(y, rates, dt):
+            y_new, changes = patankar_step(y, rates, dt)
+            summed, throughput = np.zeros_like(y), np.zeros_like(y)
+            np.add.at(summed, simulation.patankar.target, changes)
+            np.add.at(throughput, simulation.patankar.target, np.abs(changes))
+            scale = np.maximum(np.maximum(np.abs(y), throughput), 1e-300)  # 相对于池量与本步经过的流量
+            worst['negative'] = min(worst['negative'], y_new.min())
+            worst['closure'] = max(worst['closure'], np.max(np.abs(summed - (y_new - y)) / scale))
+            mirrored = simulation.patankar.mirrored
+            pair_sum = changes[mirrored] + changes[simulation.patankar.mirror[mirrored]]
+            worst['transfer'] = max(worst['transfer'], np.abs(pair_sum).max())
+            return y_new, changes
+
+        simulation.patankar.step = checked_step
+        start = time.perf_counter()
+        results = simulation.run()
+        seconds = time.perf_counter() - start
+        outputs[time_step] = results
+        lowest = lowest_value(results)
+        assert worst['negative'] >= 0 and lowest >= 0, f"dt={time_step} h 出现负值"
+        assert worst['closure'] < 1e-10 and worst['transfer'] == 0, f"dt={time_step} h 各项变化量不闭合"
+        deviations = []
+        for hours in [72, args.integrator_days * 24]:
+            records = hours // time_step
+            deviations.append(max(np.max(np.abs(results.concentrations[species][:records] -
+                                                outputs[1].concentrations[species][time_step - 1:hours:time_step]) /
+                                         outputs[1].concentrations[species][time_step - 1:hours:time_step].mean())
+                                  for species, _ in NUTRIENT_BUDGETS.values()))
+        assert deviations[0] <= MPRK_DEVIATION, f"dt={time_step} h 前三天相对 1 h 偏差 {deviations[0]:.2e} 超过 {MPRK_DEVIATION}"
+        print(f"mprk dt={time_step} h  步数 {results.integration['steps']:6d}   耗时 {seconds:6.2f} s   "
+              f"最小值 {lowest:9.2e}   闭合误差 {worst['closure']:9.2e}   "
+              f"相对 1 h 偏差 前三天 {deviations[0]:9.2e}   全程 {deviations[1]:9.2e}")
+
+def bench_splitting(water_exchange, steps, args):
+    """多速率 Strang 分裂：各子步长组合相对全部逐时（输运、动力学、DEB 均为 1 小时）的耗时与偏差
+
+    默认子步长 SPLITTING_SUBSTEPS 的最大偏差（按海区均值归一）须不超过 SPLITTING_DEVIATION。
+    """
+    forcing = build_forcing(water_exchange)
+
+    def run(substeps):
+        return run_simulation(forcing, simulation_config(args, integrator='mprk', substeps=substeps))
+
+    reference, reference_seconds = run({'kinetics': 1, 'deb': 1})
+    print(f"逐时参考   {args.integrator_days} 天   反应子步 {reference.integration['steps']:6d}   耗时 {reference_seconds:6.2f} s")
+    for kinetics, deb in [(1, 6), (1, 12), (1, 24), (2, 24), (3, 24), (6, 24)]:
+        results, seconds = run({'kinetics': kinetics, 'deb': deb})
+        lowest = lowest_value(results)
+        assert lowest >= 0, f"kinetics={kinetics} h 出现负值"
+        deviation = {species: np.abs(values - reference.concentrations[species]) /
+                     reference.concentrations[species].mean() for species, values in results.concentrations.items()}
+        worst = max(values.max() for values in deviation.values())
+        mean = max(values.mean() for values in deviation.values())
+        if {'kinetics': kinetics, 'deb': deb} == SPLITTING_SUBSTEPS:
+            assert worst <= SPLITTING_DEVIATION, f"默认子步长最大偏差 {worst:.2e} 超过 {SPLITTING_DEVIATION}"
+        print(f"动力学 {kinetics} h / DEB {deb} h   反应子步 {results.integration['steps']:6d}   耗时 {seconds:6.2f} s   "
+              f"节省 {1 - seconds / reference_seconds:6.1%}   最大偏差 {worst:9.2e}   平均偏差 {mean:9.2e}")
+
+def bench_checkpoint(water_exchange, steps, args):
+    """检查点：前半程写检查点后另起模拟续算，结果须与不间断运行逐位一致；报告写入耗时与文件大小"""
+    forcing = build_forcing(water_exchange)
+    days = max(2, args.integrator_days)
+    for integrator, substeps in [('euler', None), ('mprk', None), ('mprk', {'kinetics': 3, 'deb': 24}), ('RK45', None)]:
+        # 检查点落在聚合窗口中途；自适应积分在检查点间隔处分段，不间断运行须使用相同的间隔
+        config = simulation_config(args, sim_days=days, integrator=integrator, substeps=substeps,
+                                   aggregation_windows={'5h': 5}, checkpoint_interval=days // 2 * 24)
+        reference, _ = run_simulation(forcing, config)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.npz')
+            first = Simulation(None, forcing, dict(config, sim_days=days // 2, checkpoint_path=path))
+            first.run()
+            size = os.path.getsize(path)
+            timing_path = os.path.join(tmp_dir, 'timing.npz')  # 收尾后的状态另存，不覆盖续算用的检查点
+            seconds = best_of(lambda: first.save_checkpoint(timing_path, first.num_steps))
+            resumed = Simulation(None, forcing, config)
+            start_step = resumed.load_checkpoint(path)
+            results = resumed.run()
+        for name, values in state_series(reference).items():
+            check_identical(f"{integrator} 续算后 {name} 与不间断运行", values, state_series(results)[name])
+        for statistic, variables in reference.aggregates['5h'].items():
+            for name, values in variables.items():
+                check_identical(f"{integrator} 续算后 {name} 的 5 小时{statistic}与不间断运行", values,
+                                results.aggregates['5h'][statistic][name])
+        if not (reference.contributions_table().equals(results.contributions_table()) and
+                reference.net_export_table().equals(results.net_export_table())):
+            raise AssertionError(f"{integrator} 续算后收支与不间断运行不一致")
+        label = integrator if substeps is None else f"{integrator}+分裂"
+        print(f"{label:<12s} 第 {start_step:5d} 步续算逐位一致   检查点 {size / 1e6:7.2f} MB   写入 {seconds * 1e3:8.2f} ms")
+
+def bench_spinup(water_exchange, steps, args):
+    """预热缓存：基准参数热启动须与不间断基准逐位一致；各类参数的扰动成员按缺省重新平衡天数热启动，相对完整冷启动须收敛
+
+    偏差不超过 SPINUP_TOLERANCE 倍扰动效应时记为收敛；同时给出 SpinupCache.convergence 的估计（相对重新平衡加倍的热启动）
+    及其耗时。平衡日取第 480 天（鱼类放养后 REEQUILIBRATION_DAYS 天），数据较短时取数据末尾前 30 天；
+    不足 2 * REEQUILIBRATION_DAYS 天时跳过收敛部分（--days）。
+    """
+    forcing = build_forcing(water_exchange)
+    days = max(12, args.integrator_days)
+    spinup_days = days * 3 // 4
+    config = simulation_config(args, sim_days=days)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = SpinupCache(None, forcing, config, cache_dir=tmp_dir)
+        fill_seconds = best_of(lambda: cache.spin_up(spinup_days), repeat=1)
+        baseline, _ = run_simulation(forcing, config)
+        warm = Simulation(None, forcing, config)
+        hit_seconds = best_of(lambda: cache.warm_start(warm, spinup_days), repeat=1)  # 参数指纹须在载入前比较，只载入一次
+        results = warm.run()
+        for name, values in state_series(baseline).items():
+            check_identical(f"基准参数热启动后 {name} 与不间断运行", values, state_series(results)[name])
+        print(f"预热 {spinup_days} 天   写入缓存 {fill_seconds:6.2f} s   命中载入 {hit_seconds * 1e3:7.2f} ms   基准热启动逐位一致")
+
+        check_days = 30
+        spinup_days = min(water_exchange.num_time_points // 24 - check_days,
+                          RESTOCKING_DAYS['fish'] + REEQUILIBRATION_DAYS)
+        if spinup_days < 2 * REEQUILIBRATION_DAYS:
+            print(f"水交换数据不足 {2 * REEQUILIBRATION_DAYS + check_days} 天，跳过热启动收敛检验")
+            return
+        config = simulation_config(args, sim_days=spinup_days + check_days)
+        start_step = spinup_days * 24
+        baseline, _ = run_simulation(forcing, config)
+        cache = SpinupCache(None, forcing, config, cache_dir=tmp_dir)
+        members = {name: {name: ParameterStore().get_parameter(name) * 1.1}
+                   for name in ['KC_PHY', 'F_UP_N', 'K_ads', 'kappa_SH', 'DF']}  # 浮游植物、大型藻类、磷吸附、贝类与鱼类 DEB
+        lengths = {name: cache.reequilibration_days(ParameterStore.from_params(params).values, spinup_days)
+                   for name, params in members.items()}
+        start_days = {spinup_days - multiple * length for length in lengths.values() for multiple in (0, 1, 2)}
+        fill_seconds = best_of(lambda: cache.spin_up(*start_days), repeat=1)  # 热启动与收敛检验各次运行的起始日
+        print(f"预热 {spinup_days} 天   写入缓存 {fill_seconds:6.2f} s")
+        for name, params in members.items():
+            cold, cold_seconds = run_simulation(forcing, config, params)
+            start = time.perf_counter()
+            simulation = Simulation(params, forcing, config)
+            cache.warm_start(simulation, spinup_days)
+            results = simulation.run()
+            seconds = time.perf_counter() - start
+            deviation = SpinupCache.deviation(results, cold, start_step)
+            effect = SpinupCache.deviation(cold, baseline, start_step)
+            start = time.perf_counter()
+            estimate, estimated_effect, _ = cache.convergence(params, spinup_days, check_days=check_days)
+            check_seconds = time.perf_counter() - start
+            print(f"{name:<9s} ×1.1  重新平衡 {lengths[name]:3d} 天   "
+                  f"冷启动 {cold_seconds:6.2f} s   热启动 {seconds:6.2f} s   节省 {1 - seconds / cold_seconds:6.1%}   "
+                  f"偏差/扰动效应 {deviation / effect:6.3f}   "
+                  f"检验估计 {estimate / estimated_effect:6.3f}（{check_seconds:6.2f} s）")
+            if deviation > SPINUP_TOLERANCE * effect:
+                raise AssertionError(f"{name} 按缺省重新平衡天数热启动未收敛")
+            if estimate > SPINUP_TOLERANCE * estimated_effect:
+                raise AssertionError(f"{name} 的收敛检验拒绝了已收敛的热启动")
+
+def legacy_record(records, state):
+    """原实现：每步向各变量的列表追加一份拷贝，结束时再转换为数组"""
+    for name, series in records.items():
+        series.append(state[name].copy())
+
+
+def bench_recorder(water_exchange, steps, args):
+    """结果记录：逐列表追加与预分配 ResultsRecorder（内存/分块落盘）记录全部状态变量的每步耗时；模拟结果须逐位一致"""
+    state = ParameterStore().state
+    num_steps = 24 * 365
+    start = time.perf_counter()
+    records = {name: [] for name in STATE_VARIABLES}
+    for _ in range(num_steps):
+        legacy_record(records, state)
+    legacy = {name: np.array(values) for name, values in records.items()}
+    legacy_seconds = (time.perf_counter() - start) / num_steps
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, budget in [('内存', 1 << 30), ('分块落盘', 0)]:
+            start = time.perf_counter()
+            recorder = ResultsRecorder(STATE_VARIABLES, state.n_zones, num_steps, budget,
+                                       os.path.join(tmp_dir, 'records'))
+            for _ in range(num_steps):
+                recorder.record(state)
+            series = recorder.series()
+            seconds = (time.perf_counter() - start) / num_steps
+            for name, values in legacy.items():
+                check_close(f"{label}记录 {name}", values, series[name], rtol=0)
+            report(f"记录 {len(STATE_VARIABLES)} 个变量（{label}）", legacy_seconds, seconds)
+
+        forcing = build_forcing(water_exchange)
+        config = simulation_config(args, record_variables='all')
+        reference, _ = run_simulation(forcing, dict(config, record_variables=None))
+        in_memory, _ = run_simulation(forcing, config)
+        on_disk, _ = run_simulation(forcing, dict(config, record_memory_budget=0,
+                                                  record_directory=os.path.join(tmp_dir, 'run')))
+        for name, values in in_memory.series.items():
+            check_identical(f"分块落盘的 {name} 与内存记录", values, on_disk.series[name])
+        for name, values in state_series(reference).items():
+            check_identical(f"记录全部变量后 {name} 与默认记录", values, in_memory.series[name])
+        print(f"模拟 {args.integrator_days} 天：全部 {len(in_memory.series)} 个状态变量的内存记录与分块落盘逐位一致")
+
+def bench_aggregation(water_exchange, steps, args):
+    """运行中聚合：逐时序列事后分块求统计量（分析脚本的做法）与 ResultsRecorder 在线累积的耗时与输出大小"""
+    n_zones, num_steps = 20, 24 * 365
+    rng = np.random.default_rng(0)
+    hourly = {name: rng.lognormal(0, 0.5, (num_steps, n_zones)) for name in STATE_VARIABLES}
+    rows = [{name: hourly[name][t] for name in STATE_VARIABLES} for t in range(num_steps)]
+    for label, hours in [('48 小时', 48), ('每周', 168)]:
+        start = time.perf_counter()
+        recorder = ResultsRecorder(STATE_VARIABLES, n_zones, num_steps, windows={label: hours}, keep_series=False)
+        for row in rows:
+            recorder.record(row)
+        aggregates = recorder.aggregates()[label]
+        online_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        recorder = ResultsRecorder(STATE_VARIABLES, n_zones, num_steps)
+        for row in rows:
+            recorder.record(row)
+        record_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        blocks = num_steps // hours
+        expected = {}
+        for name, values in recorder.series().items():
+            windows = values[:blocks * hours].reshape(blocks, hours, n_zones)
+            expected[name] = {'mean': windows.mean(axis=1), 'min': windows.min(axis=1),
+                              'max': windows.max(axis=1), 'variance': windows.var(axis=1)}
+        posthoc_seconds = time.perf_counter() - start
+        for name in STATE_VARIABLES:
+            for statistic, values in expected[name].items():
+                check_close(f"{label}{statistic} {name}", values, aggregates[statistic][name], rtol=1e-10)
+        size = sum(values.nbytes for variables in aggregates.values() for values in variables.values())
+        print(f"{label:<6s} 聚合 {len(STATE_VARIABLES)} 个变量   逐时记录 {record_seconds:6.2f} s + 事后分块 "
+              f"{posthoc_seconds:6.2f} s   在线聚合 {online_seconds:6.2f} s   输出 {num_steps * n_zones * 8 * len(STATE_VARIABLES) / 1e6:7.2f} MB → "
+              f"{size / 1e6:6.2f} MB（四个统计量）")
+
+    forcing = build_forcing(water_exchange)
+    config = simulation_config(args, aggregation_windows={'daily': 24})
+    hourly_run, _ = run_simulation(forcing, config)
+    aggregated_run, _ = run_simulation(forcing, dict(config, record_series=False))
+    for name, values in hourly_run.concentrations.items():
+        daily = values.reshape(-1, 24, values.shape[1]).mean(axis=1)
+        check_close(f"模拟日均 {name}", daily, aggregated_run.aggregates['daily']['mean'][name], rtol=1e-10)
+        check_identical(f"不保留逐时序列时 {name} 的日均值", hourly_run.aggregates['daily']['mean'][name],
+                        aggregated_run.aggregates['daily']['mean'][name])
+    print(f"模拟 {args.integrator_days} 天：只输出日聚合时与逐时序列的日均值一致，逐时序列 {len(aggregated_run.series)} 个")
+
+def legacy_contributions(contributions, magnitudes, volume):
+    """原实现：逐营养盐、逐过程把变化量乘以水量累加到字典中的数组"""
+    factor = volume * 1000.0
+    for nutrient, (_, processes) in NUTRIENT_BUDGETS.items():
+        for process, change in zip(processes, magnitudes.terms(nutrient)):
+            contributions[nutrient][process] += change * factor
+
+
+def bench_ledger(water_exchange, steps, args):
+    """过程贡献：逐过程字典累加与 ContributionLedger 单次乘加的每步耗时（结果须逐位一致），及逐月快照与累计值的一致性"""
+    n_zones, num_steps = 20, 24 * 365
+    rng = np.random.default_rng(0)
+    magnitudes = FluxTable(n_zones)
+    tables = rng.lognormal(-8, 1, (64,) + magnitudes.values.shape)
+    volumes = rng.lognormal(18, 1, (64, n_zones))
+    contributions = {nutrient: {process: np.zeros(n_zones) for process in processes}
+                     for nutrient, (_, processes) in NUTRIENT_BUDGETS.items()}
+    start = time.perf_counter()
+    for t in range(num_steps):
+        magnitudes.values = tables[t % 64]
+        legacy_contributions(contributions, magnitudes, volumes[t % 64])
+    legacy_seconds = (time.perf_counter() - start) / num_steps
+    ledger = ContributionLedger(n_zones, num_steps, window=24 * 30)
+    start = time.perf_counter()
+    for t in range(num_steps):
+        magnitudes.values = tables[t % 64]
+        ledger.accumulate(magnitudes, volumes[t % 64])
+        if (t + 1) % ledger.window == 0:
+            ledger.snapshot()
+    seconds = (time.perf_counter() - start) / num_steps
+    for nutrient, processes in contributions.items():
+        for process, values in processes.items():
+            check_close(f"累计贡献 {nutrient} {process}", values, ledger[nutrient, process], rtol=0)
+    report(f"累计 {len(ledger.labels)} 个过程贡献（含逐月快照）", legacy_seconds, seconds)
+    print(f"{num_steps} 步：{ledger.count} 个逐月窗口，窗口合计 {ledger.window_totals().nbytes / 1e6:.2f} MB")
+
+    forcing = build_forcing(water_exchange)
+    config = simulation_config(args, integrator='mprk', substeps={'kinetics': 3, 'deb': 24})
+    reference, _ = run_simulation(forcing, config)
+    daily, _ = run_simulation(forcing, dict(config, budget_window=24))
+    check_identical("开启逐日快照后累计贡献", reference.ledger.values, daily.ledger.values)
+    totals = daily.ledger.window_totals()
+    check_close("逐日贡献合计", reference.ledger.values, totals.sum(axis=0), rtol=1e-12)
+    table = daily.window_contributions_table()
+    if len(table) != len(totals) * len(daily.ledger.labels) or not table.columns[:3].tolist() == ['Window', 'Nutrient', 'Process']:
+        raise AssertionError("逐窗口贡献表布局错误")
+    print(f"模拟 {args.integrator_days} 天（分裂格式）：{len(totals)} 个逐日收支之和与累计贡献一致")
+
+def legacy_outer_exchange(water_exchange, C, t, exported, imported):
+    """原实现：由流向/来自外海的通量乘以交换前浓度与（未缩放的）外海浓度 ×2 近似外海交换质量"""
+    flux_to_outer, flux_from_outer = water_exchange.outer_sea_fluxes(t)
+    n = water_exchange.num_areas - 1
+    for j, species in enumerate(EXCHANGE_SUBSTANCES[2:], start=2):
+        outer_concentration = 0 if species == 'PP' else water_exchange.outer_sea_concentrations[species][t]
+        exported[j] += np.sum(flux_to_outer * C[:n, j] * 1000.0)
+        imported[j] += np.sum(flux_from_outer * 2 * outer_concentration * 1000.0)
+
+
+def bench_edges(water_exchange, steps, args):
+    """输运质量账户：各边搬运质量之和须逐区等于输运前后的质量变化；与事后近似外海交换的耗时对比"""
+    rng = np.random.default_rng(3)
+    C = rng.uniform(0.005, 0.5, (water_exchange.num_areas, len(EXCHANGE_SUBSTANCES)))
+    n = water_exchange.num_areas - 1
+    for t in steps:
+        ledger = TransportLedger(water_exchange, EXCHANGE_SUBSTANCES)
+        new_C = water_exchange.exchange_batch(C, t, EXCHANGE_SUBSTANCES, ledger)
+        before = C.copy()
+        before[n] = water_exchange.outer_sea_boundary(EXCHANGE_SUBSTANCES, t)
+        change = np.zeros_like(C)
+        np.add.at(change, ledger.edge_from, -ledger.net())
+        mass = (water_exchange.calculate_volume(t)[:, None] * new_C
+                - water_exchange.calculate_volume(t - 1 if t else -1)[:, None] * before) * 1000.0
+        scale = np.abs(water_exchange.calculate_volume(t)[:n, None] * before[:n] * 1000.0).max()
+        if np.abs(mass[:n] - change[:n]).max() > 1e-12 * scale:
+            raise AssertionError(f"第 {t} 步各边搬运质量与区域质量变化不一致")
+
+    exported, imported = np.zeros(len(EXCHANGE_SUBSTANCES)), np.zeros(len(EXCHANGE_SUBSTANCES))
+    ledger = TransportLedger(water_exchange, EXCHANGE_SUBSTANCES)
+    for t in steps:
+        water_exchange.exchange_batch(C, t, EXCHANGE_SUBSTANCES, ledger)
+        legacy_outer_exchange(water_exchange, C, t, exported, imported)
+    check_close("外海流出质量", exported[2:], ledger.outer_exchange()[0][2:], rtol=1e-12)
+    scratch = np.zeros((2, len(EXCHANGE_SUBSTANCES)))
+    legacy_seconds = time_per_call(lambda t: (water_exchange.exchange_batch(C, t, EXCHANGE_SUBSTANCES),
+                                              legacy_outer_exchange(water_exchange, C, t, *scratch)), steps)
+    timing_ledger = TransportLedger(water_exchange, EXCHANGE_SUBSTANCES)
+    new_seconds = time_per_call(lambda t: water_exchange.exchange_batch(C, t, EXCHANGE_SUBSTANCES, timing_ledger), steps)
+    report('输运 + 外海交换账户', legacy_seconds, new_seconds)
+    print(f"{len(ledger.edges)} 条边 × {len(EXCHANGE_SUBSTANCES)} 种物质：流出外海与原近似一致，"
+          f"流入外海（原实现 ×2 近似）{imported[2:].sum() / 1e9:.3f} t → {ledger.outer_exchange()[1][2:].sum() / 1e9:.3f} t"
+          f"（{ledger.outer_exchange()[1][2:].sum() / imported[2:].sum():.1f} 倍）")
+
+    forcing = build_forcing(water_exchange)
+    config = simulation_config(args)
+    reference, _ = run_simulation(forcing, config)
+    daily, _ = run_simulation(forcing, dict(config, budget_window=24))
+    for name, values in reference.concentrations.items():
+        check_identical(f"开启逐日快照后 {name}", values, daily.concentrations[name])
+    check_close("逐日输运合计", reference.transport.values, daily.transport.window_totals().sum(axis=0), rtol=1e-12)
+    table = daily.window_transport_table()
+    if len(table) != daily.transport.count * len(daily.transport.edges):
+        raise AssertionError("逐窗口输运表布局错误")
+    print(f"模拟 {args.integrator_days} 天：{daily.transport.count} 个逐日输运收支之和与累计值一致")
+
+BENCHMARKS = {
+    'matrix': bench_matrix,
+    'volume': bench_volume,
+    'transport': bench_transport,
+    'exchange': bench_exchange,
+    'cache': bench_propagator_cache,
+    'inputs': bench_input_cache,
+    'external': bench_external_input,
+    'windows': bench_windows,
+    'biology': bench_biology,
+    'deb': bench_deb,
+    'cycle': bench_cycle,
+    'environment': bench_environment,
+    'graph': bench_graph,
+    'integrator': bench_integrator,
+    'mprk': bench_mprk,
+    'splitting': bench_splitting,
+    'checkpoint': bench_checkpoint,
+    'spinup': bench_spinup,
+    'recorder': bench_recorder,
+    'aggregation': bench_aggregation,
+    'ledger': bench_ledger,
+    'edges': bench_edges,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=365, help='合成水交换数据的天数')
+    parser.add_argument('--exchange-file', default=None, help='逐时水交换数据文件（缺省时使用合成数据）')
+    parser.add_argument('--steps', type=int, default=200, help='参与计时的随机时间步数')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='只运行指定基准')
+    parser.add_argument('--integrator-days', type=int, default=3, help='积分器对比的模拟天数')
+    parser.add_argument('--check-only', action='store_true', help='只做结果核对与断言，跳过计时循环和耗时报告')
+    args = parser.parse_args()
+    CHECK_ONLY = args.check_only
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        water_exchange = build_water_exchange(args, tmp_dir)
+        water_exchange.legacy_matrix = legacy_water_exchange_matrix(water_exchange)
+        water_exchange.river_flow_data = pd.read_csv(water_exchange.river_flow_file)
+        rng = np.random.default_rng(0)
+        steps = rng.integers(1, water_exchange.num_time_points, args.steps)
+        print(f"时间点数 T = {water_exchange.num_time_points}，计时步数 = {len(steps)}")
+        for name in args.only or BENCHMARKS:
+            BENCHMARKS[name](water_exchange, steps, args)